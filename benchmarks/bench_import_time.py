@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# benchmarks/bench_import_time.py
+"""
+Cold import time of the gouai entry points, measured with `python -X importtime`.
+
+Each module is imported in a fresh interpreter (best of --repeat runs) and its cumulative
+import time is compared with IMPORT_TIME_BUDGETS_MS. The Google GenAI SDK is imported lazily
+by gouai_llm_api, so none of these modules may pull in the packages in SDK_MODULE_PREFIXES;
+tests/test_gouai_llm_api.py checks that for every module listed here (the time budgets are only
+reported, since wall-clock time depends on the machine).
+
+Usage (from the repository root):
+    python benchmarks/bench_import_time.py --repeat 5
+"""
+
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Cumulative import time per module, in milliseconds. Importing google.genai alone costs ~600 ms.
+IMPORT_TIME_BUDGETS_MS = {
+    "gouai_llm_api": 300,
+    "gouai": 300,
+    "gouai_context_handler": 150,
+}
+SDK_MODULE_PREFIXES = ("google.genai", "google.api_core")
+
+
+def measure_import(module_name: str, repeat: int = 3) -> tuple[float, set[str]]:
+    """Returns (best cumulative import time in ms, names of all modules the import loaded)."""
+    best_ms = None
+    loaded_modules: set[str] = set()
+    for _ in range(repeat):
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module_name}"],
+            cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        )
+        for line in completed.stderr.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            _, cumulative_us, imported = line[len("import time:"):].split("|")
+            loaded_modules.add(imported.strip())
+            if imported.strip() == module_name and not imported.startswith("  "):
+                cumulative_ms = int(cumulative_us) / 1000.0
+                best_ms = cumulative_ms if best_ms is None else min(best_ms, cumulative_ms)
+    if best_ms is None:
+        raise RuntimeError(f"No importtime record for {module_name}")
+    return best_ms, loaded_modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    over_budget = False
+    for module_name, budget_ms in IMPORT_TIME_BUDGETS_MS.items():
+        import_ms, loaded_modules = measure_import(module_name, args.repeat)
+        sdk_modules = sorted(name for name in loaded_modules if name.startswith(SDK_MODULE_PREFIXES))
+        within_budget = import_ms <= budget_ms and not sdk_modules
+        over_budget = over_budget or not within_budget
+        print(f"{module_name:<24} {import_ms:7.1f} ms   budget {budget_ms:4d} ms   "
+              f"{'ok' if within_budget else 'OVER'}{'   eager SDK imports: ' + ', '.join(sdk_modules[:3]) if sdk_modules else ''}")
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# benchmarks/bench_llm_client_pool.py
+"""
+Per-turn latency of gouai_llm_api._call_gemini_api with and without the pooled genai.Client.
+
+A local fake Gemini endpoint (HTTP/1.1, keep-alive, SSE streaming) stands in for the real API,
+so the numbers isolate client construction and connection setup from model latency.
+--connect-delay-ms adds a server-side pause on every *new* connection to model the
+TCP/TLS handshake round trips the real endpoint costs.
+
+Usage (from the repository root):
+    python benchmarks/bench_llm_client_pool.py --turns 50 --connect-delay-ms 30
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import gouai_llm_api  # noqa: E402
+
+FAKE_MODEL_NAME = "gemini-fake"
+
+
+class _FakeGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Required for keep-alive
+    connect_delay_s = 0.0
+    connections_opened = 0
+    _counter_lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with _FakeGeminiHandler._counter_lock:
+            _FakeGeminiHandler.connections_opened += 1
+        if self.connect_delay_s:
+            time.sleep(self.connect_delay_s)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        events = [
+            {"candidates": [{"content": {"role": "model", "parts": [{"text": "Hello "}]}}]},
+            {"candidates": [{"content": {"role": "model", "parts": [{"text": "from the fake endpoint."}]},
+                             "finishReason": "STOP"}],
+             "usageMetadata": {"promptTokenCount": 5, "candidatesTokenCount": 6, "totalTokenCount": 11}},
+        ]
+        body = "".join(f"data: {json.dumps(event)}\r\n\r\n" for event in events).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # Keep benchmark output clean
+
+
+def _run_turns(base_url: str, turns: int, pooled: bool) -> list[float]:
+    http_options = {"base_url": base_url}
+    latencies = []
+    gouai_llm_api._clear_client_pool()
+    for _ in range(turns):
+        if not pooled:
+            gouai_llm_api._clear_client_pool() # Reproduces the old one-client-per-call behaviour
+        start = time.perf_counter()
+        for _chunk in gouai_llm_api._call_gemini_api(
+            model_name=FAKE_MODEL_NAME, api_key="fake-key",
+            contents="Benchmark prompt", http_options=http_options
+        ):
+            pass
+        latencies.append((time.perf_counter() - start) * 1000.0)
+    gouai_llm_api._clear_client_pool()
+    return latencies
+
+
+def _summarize(label: str, latencies: list[float], connections: int) -> str:
+    ordered = sorted(latencies)
+    p95 = ordered[max(0, int(round(0.95 * len(ordered))) - 1)]
+    return (f"{label:<22} mean={statistics.mean(latencies):7.2f} ms  "
+            f"median={statistics.median(latencies):7.2f} ms  p95={p95:7.2f} ms  "
+            f"connections={connections}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pooled vs per-call genai.Client latency.")
+    parser.add_argument("--turns", type=int, default=30, help="Calls per mode (default: 30).")
+    parser.add_argument("--connect-delay-ms", type=float, default=0.0,
+                        help="Server-side delay per new connection, modelling handshake cost (default: 0).")
+    args = parser.parse_args()
+
+    _FakeGeminiHandler.connect_delay_s = args.connect_delay_ms / 1000.0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeGeminiHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    try:
+        _run_turns(base_url, 3, pooled=True) # Warm-up (imports, first-call overheads)
+        results = []
+        for label, pooled in (("per-call client (old)", False), ("pooled client (new)", True)):
+            _FakeGeminiHandler.connections_opened = 0
+            latencies = _run_turns(base_url, args.turns, pooled)
+            results.append(_summarize(label, latencies, _FakeGeminiHandler.connections_opened))
+    finally:
+        server.shutdown()
+
+    print(f"Fake endpoint: {base_url}  turns={args.turns}  connect_delay={args.connect_delay_ms} ms")
+    for line in results:
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
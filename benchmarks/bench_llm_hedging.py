@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# benchmarks/bench_llm_hedging.py
+"""
+Tail latency of generate_response_aggregated with and without hedged requests.
+
+An in-process backend draws each attempt's time-to-first-token from a heavy-tailed
+distribution (most attempts are fast, --slow_fraction of them stall for --slow_ms), which is
+the shape that makes long decomposition prompts occasionally hang. With hedging on, a
+duplicate request is sent once the first token is later than the observed p95 TTFT.
+
+Usage (from the repository root):
+    python benchmarks/bench_llm_hedging.py --calls 300 --slow_fraction 0.05 --slow_ms 800
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import gouai_llm_api  # noqa: E402
+
+
+class HeavyTailBackend(gouai_llm_api.LLMBackend):
+    name = "bench_heavy_tail"
+
+    def __init__(self, fast_ms: float, slow_ms: float, slow_fraction: float, seed: int):
+        self.fast_ms = fast_ms
+        self.slow_ms = slow_ms
+        self.slow_fraction = slow_fraction
+        self.random = random.Random(seed)
+
+    def stream(self, model_name, api_key, contents, generation_config_params, safety_settings_params, tools, settings):
+        slow = self.random.random() < self.slow_fraction
+        time.sleep((self.slow_ms if slow else self.fast_ms * self.random.uniform(0.8, 1.2)) / 1000.0)
+        yield {'text_chunk': "ok", 'parts_chunk': [], 'candidate_finish_reason': "STOP",
+               'candidate_safety_ratings': [], 'is_chunk': True}
+        yield {'usage_metadata': None, 'prompt_feedback': None, 'is_final_summary': True}
+
+
+def run(calls: int, hedge: bool, args) -> list[float]:
+    gouai_llm_api._TTFT_SAMPLES.clear()
+    gouai_llm_api.register_llm_backend(HeavyTailBackend(args.fast_ms, args.slow_ms, args.slow_fraction, args.seed))
+    settings = {
+        'default_model_name': "bench-model", 'api_key': None, 'llm_backend': HeavyTailBackend.name,
+        'retry_policy': {'hedge': hedge, 'hedge_min_samples': 20}
+    }
+    latencies_ms = []
+    with patch.object(gouai_llm_api, 'get_llm_provider_settings', return_value=settings), \
+         patch.object(gouai_llm_api, '_get_task_llm_log_path', return_value=None):
+        for i in range(calls):
+            start = time.perf_counter()
+            result = gouai_llm_api.generate_response_aggregated(None, "bench", "bench", prompt_text=f"prompt {i}")
+            latencies_ms.append((time.perf_counter() - start) * 1000)
+            assert result['error_info'] is None, result['error_info']
+    return latencies_ms
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--fast_ms", type=float, default=40.0)
+    parser.add_argument("--slow_ms", type=float, default=800.0)
+    parser.add_argument("--slow_fraction", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    for label, hedge in (("no hedging", False), ("hedging at p95 TTFT", True)):
+        latencies_ms = run(args.calls, hedge, args)
+        print(f"{label:<22} p50 {percentile(latencies_ms, 0.50):7.1f} ms   p95 {percentile(latencies_ms, 0.95):7.1f} ms   "
+              f"p99 {percentile(latencies_ms, 0.99):7.1f} ms   mean {statistics.mean(latencies_ms):7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# benchmarks/bench_pipeline_replay.py
+"""
+Times the decomposition pipeline end to end against recorded LLM cassettes, so the numbers
+measure GOUAI's own overhead (process start-up, imports, task discovery, parsing, file I/O)
+without network noise:
+
+    execute_gouai_p1p2.py -> make_gouai_subtasks.py -> gouai_compose_wsod.py
+
+Record the cassettes once against the real API (same project, same parent task):
+    GOUAI_LLM_MODE=record GOUAI_CASSETTE_DIR=/tmp/gouai_cassettes python benchmarks/bench_pipeline_replay.py \\
+        --project_root ./projects/MyProject --parent_task_id <ID> --cassette_dir /tmp/gouai_cassettes --live
+
+Then replay as often as needed (each run works on a fresh copy of the project):
+    python benchmarks/bench_pipeline_replay.py --project_root ./projects/MyProject --parent_task_id <ID> \\
+        --cassette_dir /tmp/gouai_cassettes --runs 5 [--speed 1.0] [--profile_dir /tmp/gouai_profiles]
+
+--speed 0 (default) replays instantly; 1.0 reproduces the recorded chunk timing.
+--profile_dir writes one cProfile file per stage and run (inspect with `python -m pstats`).
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from gouai_task_mgmt import find_task_dir_path_from_id  # noqa: E402
+
+
+def _stage_commands(project_root: Path, parent_task_id: str, parent_task_dir: Path) -> list[tuple[str, list[str]]]:
+    decomposition_doc_path = parent_task_dir / "decomposition_output.md"
+    return [
+        ("execute_gouai_p1p2", [
+            str(REPO_ROOT / "execute_gouai_p1p2.py"), "--parent_task_id", parent_task_id,
+            "--project_root_path", str(project_root), "--output_document_path", str(decomposition_doc_path), "--no-cache"
+        ]),
+        ("make_gouai_subtasks", [
+            str(REPO_ROOT / "make_gouai_subtasks.py"), "--document_path", str(decomposition_doc_path),
+            "--project_root_path", str(project_root), "--parent_task_id_for_new_tasks", parent_task_id
+        ]),
+        ("gouai_compose_wsod", [
+            str(REPO_ROOT / "gouai_compose_wsod.py"), "--parent_task_id", parent_task_id,
+            "--project_root", str(project_root), "--no-cache"
+        ]),
+    ]
+
+
+def run_pipeline_once(args, run_index: int, env: dict) -> dict[str, float]:
+    timings = {}
+    with tempfile.TemporaryDirectory(prefix="gouai_bench_") as temp_dir:
+        project_copy = Path(temp_dir) / Path(args.project_root).name
+        if args.live:
+            project_copy = Path(args.project_root).resolve() # Recording runs on the real project
+        else:
+            shutil.copytree(args.project_root, project_copy)
+        parent_task_dir = find_task_dir_path_from_id(project_copy, args.parent_task_id, project_copy)
+        if not parent_task_dir:
+            sys.exit(f"ERROR: parent task '{args.parent_task_id}' not found under {project_copy}")
+
+        for stage_name, stage_args in _stage_commands(project_copy, args.parent_task_id, parent_task_dir):
+            command = [sys.executable]
+            if args.profile_dir:
+                Path(args.profile_dir).mkdir(parents=True, exist_ok=True)
+                command += ["-m", "cProfile", "-o", str(Path(args.profile_dir) / f"{stage_name}.run{run_index}.prof")]
+            start = time.perf_counter()
+            process = subprocess.run(command + stage_args, env=env, capture_output=True, text=True, cwd=str(REPO_ROOT))
+            timings[stage_name] = time.perf_counter() - start
+            if process.returncode != 0:
+                sys.exit(f"ERROR: stage {stage_name} failed (exit {process.returncode}):\n{process.stderr.strip()}")
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the decomposition pipeline offline from LLM cassettes.")
+    parser.add_argument("--project_root", required=True, help="GOUAI project to run against (copied per run).")
+    parser.add_argument("--parent_task_id", required=True, help="Parent task to decompose and compose.")
+    parser.add_argument("--cassette_dir", required=True, help="Cassette directory (GOUAI_CASSETTE_DIR).")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--speed", type=float, default=0.0, help="Replay speed factor (GOUAI_CASSETTE_SPEED).")
+    parser.add_argument("--profile_dir", help="Write per-stage cProfile output here.")
+    parser.add_argument("--live", action="store_true", help="Record instead of replay (one run, real API).")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env["GOUAI_CASSETTE_DIR"] = str(Path(args.cassette_dir).resolve())
+    env["GOUAI_LLM_MODE"] = "record" if args.live else "replay"
+    env["GOUAI_CASSETTE_SPEED"] = str(args.speed)
+    runs = 1 if args.live else args.runs
+
+    all_timings = [run_pipeline_once(args, run_index, env) for run_index in range(runs)]
+
+    print(f"mode={env['GOUAI_LLM_MODE']} runs={runs} speed={args.speed}")
+    for stage_name in all_timings[0]:
+        samples_ms = [t[stage_name] * 1000 for t in all_timings]
+        print(f"  {stage_name:<22} mean {statistics.mean(samples_ms):8.1f} ms   min {min(samples_ms):8.1f} ms")
+    totals_ms = [sum(t.values()) * 1000 for t in all_timings]
+    print(f"  {'total':<22} mean {statistics.mean(totals_ms):8.1f} ms   min {min(totals_ms):8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# benchmarks/bench_project_tree.py
+"""
+Loading a synthetic project into a ProjectTree, and the HLG report built from it.
+
+Builds a project of --fanout^1 + ... + --fanout^--depth tasks in a temporary directory and reports:
+  tree load        -> one walk reading each task_definition.md frontmatter (ProjectTree(root))
+  memory           -> peak traced allocation of the loaded tree, per task
+  HLG report       -> compile_hlgs_and_outputs() (tree load plus one body read per reported task)
+  section reads    -> three TaskNode.section() calls on every task (one body read each, then cached)
+
+Usage (from the repository root):
+    python benchmarks/bench_project_tree.py --fanout 8 --depth 3
+"""
+
+import argparse
+import contextlib
+import io
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import gouai_project_tree  # noqa: E402
+from compile_gouai_hlgs import compile_hlgs_and_outputs  # noqa: E402
+
+
+def write_task(task_dir: Path, task_id: str, parent_task_id: str):
+    task_dir.mkdir(parents=True, exist_ok=True)
+    (task_dir / "task_definition.md").write_text(
+        f"---\ntask_id: {task_id}\nparent_task_id: {parent_task_id}\nstatus: \"Not Started\"\n"
+        f"task_type: \"full_GOUAI_task\"\nHLG_summary: \"Goal of {task_id}\"\nWSOD_summary: \"To be defined.\"\n---\n"
+        "## High-Level Goal(s) (HLG)\n\nGoal text\n" + "## WSOD Assessment (Initial)\n" + "Body line\n" * 200,
+        encoding='utf-8'
+    )
+    (task_dir / "outputs").mkdir(exist_ok=True)
+
+
+def build_tree(root: Path, fanout: int, depth: int) -> int:
+    write_task(root, "Bench_ROOT", "null")
+    task_count = 1
+    frontier = [(root, "Bench_ROOT", 0)]
+    while frontier:
+        task_dir, task_id, level = frontier.pop()
+        if level == depth:
+            continue
+        for index in range(1, fanout + 1):
+            child_name = f"ST{level + 1}-{index}"
+            write_task(task_dir / child_name, f"{task_id}_{child_name}", task_id)
+            task_count += 1
+            frontier.append((task_dir / child_name, f"{task_id}_{child_name}", level + 1))
+    return task_count
+
+
+def timed_ms(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--fanout", type=int, default=8)
+    parser.add_argument("--depth", type=int, default=3)
+    args = parser.parse_args()
+
+    root = Path(tempfile.mkdtemp(prefix="gouai_bench_tree_")).resolve()
+    try:
+        task_count = build_tree(root, args.fanout, args.depth)
+        load_ms = timed_ms(lambda: gouai_project_tree.ProjectTree(root))
+
+        tracemalloc.start()
+        project_tree = gouai_project_tree.ProjectTree(root)
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        with contextlib.redirect_stderr(io.StringIO()):
+            report_ms = timed_ms(lambda: compile_hlgs_and_outputs(root))
+        section_ms = timed_ms(lambda: [
+            node.section(heading)
+            for node in project_tree.tasks()
+            for heading in ("High-Level Goal(s) (HLG)", "WSOD Assessment (Initial)", "Phase 2: IE Uncertainty Overview")
+        ])
+
+        print(f"{task_count} tasks")
+        print(f"tree load                 {load_ms:9.2f} ms")
+        print(f"memory (peak, per task)   {peak_bytes / task_count:9.0f} B")
+        print(f"HLG report                {report_ms:9.2f} ms")
+        print(f"section reads (3 / task)  {section_ms:9.2f} ms")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
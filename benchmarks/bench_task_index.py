@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# benchmarks/bench_task_index.py
+"""
+Task lookup cost with the persistent task index (.gouai/index) on a synthetic project tree.
+
+Builds a project of --fanout^1 + ... + --fanout^--depth tasks in a temporary directory and times:
+  full scan       -> walking the tree and reading every task_definition.md head (what every lookup used to cost)
+  ID-derived      -> lookups with no index yet: the directory is read off the task ID (one stat + one read)
+  index build     -> indexing the whole project (TaskIndex.task_ids())
+  warm lookup     -> later lookups from the saved index
+  hand-edited     -> a task whose directory does not match its ID, created since the index was saved
+                     (rescans changed directories only)
+
+Usage (from the repository root):
+    python benchmarks/bench_task_index.py --fanout 6 --depth 3 --lookups 200
+"""
+
+import argparse
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import gouai_task_index  # noqa: E402
+
+
+def write_task(task_dir: Path, task_id: str, parent_task_id: str):
+    task_dir.mkdir(parents=True, exist_ok=True)
+    (task_dir / "task_definition.md").write_text(
+        f"---\ntask_id: {task_id}\nparent_task_id: {parent_task_id}\nstatus: \"Not Started\"\n---\n" + "Body line\n" * 200,
+        encoding='utf-8'
+    )
+    (task_dir / "outputs").mkdir(exist_ok=True)
+
+
+def build_tree(root: Path, fanout: int, depth: int) -> list[str]:
+    task_ids = ["Bench_ROOT"]
+    write_task(root, "Bench_ROOT", "null")
+    frontier = [(root, "Bench_ROOT", 0)]
+    while frontier:
+        task_dir, task_id, level = frontier.pop()
+        if level == depth:
+            continue
+        for index in range(1, fanout + 1):
+            child_name = f"ST{level + 1}-{index}"
+            child_id = f"{task_id}_{child_name}"
+            write_task(task_dir / child_name, child_id, task_id)
+            task_ids.append(child_id)
+            frontier.append((task_dir / child_name, child_id, level + 1))
+    return task_ids
+
+
+def full_scan(root: Path) -> int:
+    reads = 0
+    for task_def_path in root.rglob("task_definition.md"):
+        if any(gouai_task_index.is_skipped_dir(part) for part in task_def_path.relative_to(root).parts[:-1]):
+            continue
+        gouai_task_index.read_task_frontmatter(task_def_path)
+        reads += 1
+    return reads
+
+
+def timed_ms(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--fanout", type=int, default=6)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--lookups", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    root = Path(tempfile.mkdtemp(prefix="gouai_bench_index_")).resolve()
+    try:
+        task_ids = build_tree(root, args.fanout, args.depth)
+        rng = random.Random(args.seed)
+        targets = [rng.choice(task_ids) for _ in range(args.lookups)]
+
+        scan_ms = timed_ms(lambda: full_scan(root))
+        derived_index = gouai_task_index.TaskIndex(root)
+        derived_ms = timed_ms(lambda: [derived_index.find_task_dir(task_id) for task_id in targets]) / len(targets)
+        build_ms = timed_ms(lambda: gouai_task_index.TaskIndex(root).task_ids())
+        warm_index = gouai_task_index.TaskIndex(root)
+        warm_ms = timed_ms(lambda: [warm_index.find_task_dir(task_id) for task_id in targets]) / len(targets)
+        write_task(root / "ST1-1" / "renamed_by_hand", "Bench_ROOT_ST1-1_ST2-99", "Bench_ROOT_ST1-1")
+        edited_ms = timed_ms(lambda: warm_index.find_task_dir("Bench_ROOT_ST1-1_ST2-99"))
+
+        print(f"{len(task_ids)} tasks")
+        print(f"full scan (per lookup before) {scan_ms:9.2f} ms")
+        print(f"ID-derived lookup             {derived_ms:9.3f} ms")
+        print(f"index build                   {build_ms:9.2f} ms")
+        print(f"warm lookup                   {warm_ms:9.3f} ms")
+        print(f"hand-edited layout lookup     {edited_ms:9.2f} ms")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,50 +3,21 @@
 import argparse
 from pathlib import Path
 import re
-import yaml
 import datetime
 import sys
 import os
 
-# --- Helper Functions ---
-
-def _extract_yaml_and_content(file_path: Path) -> tuple[dict, str]:
-    """
-    Extracts YAML frontmatter and remaining Markdown content.
-    Returns (yaml_data_dict, markdown_body_str).
-    If no valid YAML frontmatter, returns ({}, full_file_content).
-    """
-    if not file_path.is_file():
-        return {}, ""
-    
-    content = file_path.read_text(encoding='utf-8')
-    
-    # Remove potential BOM and leading whitespace
-    if content.startswith('\ufeff'):
-        content = content[1:]
-    content_stripped = content.lstrip()
-
-    frontmatter_match = re.search(r"^(---)\s*\n(.*?)\n(---)\s*\n(.*)", content_stripped, re.DOTALL | re.MULTILINE)
-    
-    yaml_data = {}
-    markdown_body = content_stripped # Default to full content if no frontmatter
+from gouai_project_tree import TaskNode, get_project_tree
 
-    if frontmatter_match:
-        try:
-            yaml_data = yaml.safe_load(frontmatter_match.group(2))
-            markdown_body = frontmatter_match.group(4).strip() # The content after the second '---'
-        except yaml.YAMLError:
-            # If YAML is malformed, treat the whole file as markdown body
-            pass
-    return yaml_data, markdown_body
+# --- Helper Functions ---
 
-def _get_hlg_from_task_definition(task_def_path: Path) -> str:
+def _get_hlg_from_task_node(task_node: TaskNode) -> str:
     """
-    Extracts the most comprehensive HLG from a task_definition.md file.
+    Extracts the most comprehensive HLG of a task.
     Prioritizes the full HLG section content if available, falling back to 
     HLG_summary/one_line_description from YAML.
     """
-    yaml_data, markdown_body = _extract_yaml_and_content(task_def_path)
+    markdown_body = task_node.body()
     
     extracted_hlg_text = ""
 
@@ -67,13 +38,13 @@ def _get_hlg_from_task_definition(task_def_path: Path) -> str:
 
     # If the comprehensive HLG section wasn't found or didn't contain EUs/KIRQs,
     # fall back to the HLG_summary from YAML.
-    hlg_summary = yaml_data.get('HLG_summary')
+    hlg_summary = task_node.hlg_summary
     if hlg_summary and hlg_summary.strip() and hlg_summary.lower() != "to be defined.":
         return hlg_summary.strip()
 
     # If it's a simple task, check for 'one_line_description' in YAML
-    if yaml_data.get('task_type') == "simple_task":
-        one_line_desc = yaml_data.get('one_line_description')
+    if task_node.task_type == "simple_task":
+        one_line_desc = task_node.one_line_description
         if one_line_desc and one_line_desc.strip():
             return one_line_desc.strip()
         # Also check for 'Task Description' section in simple tasks
@@ -90,16 +61,6 @@ def _get_hlg_from_task_definition(task_def_path: Path) -> str:
         return extracted_hlg_text
     
     return "HLG not found or not explicitly defined."
-    
-def _get_task_id_from_task_definition(task_def_path: Path) -> str:
-    """Extracts the task_id from the YAML frontmatter of a task_definition.md file."""
-    yaml_data, _ = _extract_yaml_and_content(task_def_path)
-    return yaml_data.get('task_id', 'UNKNOWN_TASK_ID')
-
-def _get_task_status_from_task_definition(task_def_path: Path) -> str:
-    """Extracts the status from the YAML frontmatter of a task_definition.md file."""
-    yaml_data, _ = _extract_yaml_and_content(task_def_path)
-    return yaml_data.get('status', 'Unknown Status')
 
 
 def _summarize_outputs_folder(outputs_path: Path) -> list[str]:
@@ -156,44 +117,30 @@ def _gather_recent_output_files(project_root_path: Path, days: int) -> str:
 
 def compile_hlgs_and_outputs(project_root_path: Path) -> str:
     """
-    Traverses the project directory, extracts HLGs and output summaries,
+    Traverses the project tree, extracts HLGs and output summaries,
     and compiles them into a hierarchical Markdown string.
     """
     compiled_report_lines = []
+    project_tree = get_project_tree(project_root_path) # One frontmatter read per task; bodies only for the HLGs reported
     
     # Use a stack for depth-first traversal to maintain hierarchy
-    # Stack items: (path, current_depth)
-    stack = [(project_root_path, 0)]
-    
-    # Keep track of directories already processed to avoid infinite loops if symlinks create cycles
-    processed_dirs = set()
+    # Stack items: (node, current_depth)
+    stack = [(project_tree.root, 0)]
 
     while stack:
-        current_path, depth = stack.pop()
-
-        if current_path in processed_dirs:
-            continue
-        processed_dirs.add(current_path)
-
-        # Skip common non-task directories
-        if current_path.name in ["context_packages", "outputs", ".git", ".venv", "__pycache__"] or current_path.name.startswith('.'):
-            continue
-        
-        # Check if current_path is a task directory (contains task_definition.md)
-        task_def_path = current_path / "task_definition.md"
-        is_task_dir = task_def_path.is_file()
-
+        current_node, depth = stack.pop()
+        current_path = current_node.path
         prefix = "  " * depth
         
-        if is_task_dir:
-            task_status = _get_task_status_from_task_definition(task_def_path)
+        if current_node.is_task:
+            task_status = current_node.status or 'Unknown Status'
             if task_status.lower() == "completed":
                 # If the task is completed, skip it and all its subdirectories
                 print(f"INFO: Skipping completed task and its subtasks: {current_path.name}/ (Status: {task_status})", file=sys.stderr)
                 continue
             
-            task_id = _get_task_id_from_task_definition(task_def_path)
-            hlg = _get_hlg_from_task_definition(task_def_path)
+            task_id = current_node.task_id or 'UNKNOWN_TASK_ID'
+            hlg = _get_hlg_from_task_node(current_node)
             
             compiled_report_lines.append(f"{prefix}- **Directory:** `{current_path.name}/`")
             compiled_report_lines.append(f"{prefix}  **Task ID:** `{task_id}`")
@@ -209,15 +156,14 @@ def compile_hlgs_and_outputs(project_root_path: Path) -> str:
             compiled_report_lines.append("")
         else:
             # If not a task directory, still list it but without HLG/outputs
-            if current_path != project_root_path:
+            if current_node is not project_tree.root:
                 compiled_report_lines.append(f"{prefix}- **Directory:** `{current_path.name}/` (Not a GOUAI Task Directory)")
                 compiled_report_lines.append("")
 
         # Add subdirectories to the stack for further processing
         # Iterate in reverse to maintain alphabetical order when popping
-        sub_dirs = sorted([d for d in current_path.iterdir() if d.is_dir() and d not in processed_dirs], reverse=True)
-        for sub_dir in sub_dirs:
-            stack.append((sub_dir, depth + 1))
+        for child_node in reversed(current_node.children):
+            stack.append((child_node, depth + 1))
 
     return "\n".join(compiled_report_lines)
 
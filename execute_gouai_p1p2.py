@@ -4,8 +4,6 @@
 import argparse
 from pathlib import Path
 import sys
-import yaml # For PyYAML, used for parsing YAML frontmatter
-import re   # For regex operations, potentially for parsing Markdown sections
 import datetime # For generating unique session IDs
 
 # --- GOUAI Module Imports ---
@@ -19,7 +17,13 @@ except ImportError:
     # Add dummy or sys.exit(1) as per your project's error handling policy for missing dependencies
 
 try:
-    from gouai_llm_api import generate_response_aggregated, ConfigurationError, LLMAPICallError #
+    from gouai_frontmatter import load_frontmatter
+except ImportError:
+    print("CRITICAL ERROR: Could not import load_frontmatter from gouai_frontmatter.py.", file=sys.stderr)
+    sys.exit(1)
+
+try:
+    from gouai_llm_api import generate_response_aggregated, register_cacheable_prefix, ConfigurationError, LLMAPICallError, CACHE_POLICY_OFF, CACHE_POLICY_REFRESH #
     # generate_response_aggregated is used to make the LLM call.
     # ConfigurationError and LLMAPICallError are specific exceptions to handle.
 except ImportError:
@@ -246,20 +250,13 @@ def _load_and_parse_parent_task_def(parent_task_dir: Path) -> dict:
     if not task_def_file.is_file():
         raise FileNotFoundError(f"Parent task_definition.md not found at {task_def_file}")
 
-    content = task_def_file.read_text(encoding='utf-8')
     parent_task_data = {}
 
-    # Parse YAML Frontmatter (similar to _extract_yaml_frontmatter in gouai_context_handler.py
-    # or parts of _parse_parent_task_def in gouai_task_mgmt.py)
-    try:
-        yaml_match = re.search(r"^---\s*\n(.*?)\n---\s*\n", content, re.DOTALL | re.MULTILINE)
-        if yaml_match:
-            frontmatter_str = yaml_match.group(1)
-            parent_task_data['yaml_frontmatter'] = yaml.safe_load(frontmatter_str) or {}
-        else:
-            parent_task_data['yaml_frontmatter'] = {} # No YAML frontmatter found
-    except yaml.YAMLError as e:
-        raise ValueError(f"Error parsing YAML frontmatter in {task_def_file}: {e}")
+    # Parse YAML Frontmatter (with gouai_frontmatter, the reader shared with the other GOUAI tools)
+    frontmatter = load_frontmatter(task_def_file)
+    if frontmatter.error:
+        raise ValueError(f"Error parsing YAML frontmatter in {task_def_file}: {frontmatter.error}")
+    parent_task_data['yaml_frontmatter'] = dict(frontmatter.data) # {} if no YAML frontmatter found
 
     # Extract specified Markdown Body Sections (as per EU1.6)
     # This would involve extracting text under headings like "## High-Level Goal(s) (HLG)", etc.
@@ -295,6 +292,8 @@ def _load_and_parse_parent_task_def(parent_task_dir: Path) -> dict:
 def _construct_llm_prompt(parent_task_info: dict, gouai_protocol_text: str) -> str:
     """
     Constructs the full prompt to be sent to the LLM.
+    The prompt starts with the protocol text, which is identical for every task; main() registers it
+    with gouai_llm_api.register_cacheable_prefix so a provider prefix cache can serve that part.
     (KIRQ1.5 - "Construct and send the first prompt...")
     """
     print("INFO: Constructing LLM prompt.", file=sys.stderr)
@@ -370,6 +369,9 @@ def main():
     parser.add_argument("--parent_task_id", required=True, help="Full string ID of the parent GOUAI task.")
     parser.add_argument("--project_root_path", required=True, help="Path to the root directory of the GOUAI project.")
     parser.add_argument("--output_document_path", required=True, help="Full file path to save the generated Decomposition Document.")
+    cache_group = parser.add_mutually_exclusive_group()
+    cache_group.add_argument("--no-cache", action="store_true", help="Bypass the LLM response cache for this run (no lookup, no store).")
+    cache_group.add_argument("--refresh", action="store_true", help="Ignore cached LLM responses for this run, but store the fresh ones.")
     args = parser.parse_args()
 
     try:
@@ -396,6 +398,7 @@ def main():
 
         # 4. Construct LLM Prompt
         llm_prompt = _construct_llm_prompt(parent_task_data, gouai_protocol_text)
+        register_cacheable_prefix(gouai_protocol_text) # Same for every task: cacheable with the provider
 
         # 5. Execute LLM Call
         # (KIRQ1.5 - "...send the first prompt via gouai_llm_api.py", "...Receive and process the first response.")
@@ -406,7 +409,8 @@ def main():
             project_root=str(project_root),
             session_id=session_id,
             task_id=args.parent_task_id, # Used for logging context within gouai_llm_api.py
-            contents=llm_prompt
+            contents=llm_prompt,
+            cache_policy=CACHE_POLICY_OFF if args.no_cache else (CACHE_POLICY_REFRESH if args.refresh else None)
         ) #
 
         # 6. Process LLM Response
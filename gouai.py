@@ -22,6 +22,8 @@ GOUAI_COMPILE_HLGS_SCRIPT = str(SCRIPT_DIR / "compile_gouai_hlgs.py") # Add this
 try:
     from gouai_llm_api import (
         generate_response_stream,
+        ChatHistoryCompactor,
+        PRIORITY_INTERACTIVE,
         # We might need these if we want to handle specific errors from the API module
         # ConfigurationError as LLMConfigError, 
         # LLMAPICallError
@@ -75,8 +77,11 @@ def format_conversation_history_for_api_direct_call(history: list) -> list:
     # The history is already maintained in this format in handle_chat_session
     return history
 
-def handle_chat_session(task_id: str, project_root_str: str, session_id_override: str = None):
-    """Handles the interactive chat session for a GOUAI task by directly calling imported LLM API functions."""
+def handle_chat_session(task_id: str, project_root_str: str, session_id_override: str = None, compact: bool | None = None):
+    """
+    Handles the interactive chat session for a GOUAI task by directly calling imported LLM API functions.
+    compact=True/False forces history compaction on/off; None uses chat_compaction.enabled from the config.
+    """
     project_root = Path(project_root_str)
     if not project_root.is_dir():
         print(f"ERROR: Project root '{project_root}' not found or not a directory.", file=sys.stderr)
@@ -106,6 +111,10 @@ def handle_chat_session(task_id: str, project_root_str: str, session_id_override
 
     session_id = session_id_override or str(uuid.uuid4())
     print(f"INFO: Chat session ID: {session_id}")
+    # Sends the pinned prime + running summary + recent turns instead of the full history (when enabled)
+    compactor = ChatHistoryCompactor(str(project_root), session_id, task_id, enabled=compact)
+    if compactor.enabled:
+        print(f"INFO: History compaction on (summary refresh above ~{compactor.trigger_tokens} tokens, last {compactor.keep_last_turns} messages verbatim).")
     print("INFO: Type '/quit' or '/exit' to end the session. Type '/history' to view conversation log.")
     print("---")
 
@@ -126,7 +135,8 @@ def handle_chat_session(task_id: str, project_root_str: str, session_id_override
             project_root=str(project_root),
             session_id=session_id,
             task_id=task_id,
-            contents=conversation_history # Pass the Python list of dicts directly
+            contents=conversation_history, # Pass the Python list of dicts directly
+            priority=PRIORITY_INTERACTIVE # A person is waiting; never queue behind batch work
         ):
             sys.stdout.write('\r' + ' ' * 30 + '\r') # Clear "processing" message
             if print_llm_prefix:
@@ -154,6 +164,13 @@ def handle_chat_session(task_id: str, project_root_str: str, session_id_override
         return
 
     # Main interactive loop
+    try:
+        _run_chat_loop(task_id, project_root, session_id, conversation_history, compactor)
+    finally:
+        compactor.close()
+
+def _run_chat_loop(task_id: str, project_root: Path, session_id: str, conversation_history: list, compactor: ChatHistoryCompactor):
+    """The interactive You/LLM turn loop of handle_chat_session."""
     while True:
         try:
             user_input = input("\nYou: ").strip()
@@ -191,7 +208,8 @@ def handle_chat_session(task_id: str, project_root_str: str, session_id_override
                 project_root=str(project_root),
                 session_id=session_id,
                 task_id=task_id,
-                contents=conversation_history # Pass full history
+                contents=compactor.contents_for(conversation_history), # Full history, or compacted
+                priority=PRIORITY_INTERACTIVE
             ):
                 # Clear "LLM is thinking..." only once meaningful output starts
                 if print_llm_prefix_turn and (chunk_dict.get('is_chunk') or chunk_dict.get('is_error')):
@@ -219,6 +237,7 @@ def handle_chat_session(task_id: str, project_root_str: str, session_id_override
 
             if full_turn_response_text is not None and full_turn_response_text.strip():
                 conversation_history.append({"role": "model", "parts": [{"text": full_turn_response_text.strip()}]})
+                compactor.after_turn(conversation_history)
             elif full_turn_response_text is None: # Error occurred and was handled
                 pass
 
@@ -247,7 +266,14 @@ def main_cli():
     decompose_parser.add_argument("--parent_task_id", required=True, help="Full string ID of the parent GOUAI task.")
     decompose_parser.add_argument("--project_root_path", required=True, help="Path to the root directory of the GOUAI project.")
     decompose_parser.add_argument("--output_document_path", required=True, help="Full file path to save the generated Decomposition Document.")
-    decompose_parser.set_defaults(func=lambda args_ns: run_script_capture_stdout(GOUAI_EXECUTE_P1P2_SCRIPT, ["--parent_task_id", args_ns.parent_task_id, "--project_root_path", args_ns.project_root_path, "--output_document_path", args_ns.output_document_path]))
+    decompose_cache_group = decompose_parser.add_mutually_exclusive_group()
+    decompose_cache_group.add_argument("--no-cache", action="store_true", help="Bypass the LLM response cache for this run.")
+    decompose_cache_group.add_argument("--refresh", action="store_true", help="Ignore cached LLM responses, but store the fresh ones.")
+    decompose_parser.set_defaults(func=lambda args_ns: run_script_capture_stdout(
+        GOUAI_EXECUTE_P1P2_SCRIPT,
+        ["--parent_task_id", args_ns.parent_task_id, "--project_root_path", args_ns.project_root_path, "--output_document_path", args_ns.output_document_path] + \
+            (["--no-cache"] if args_ns.no_cache else []) + (["--refresh"] if args_ns.refresh else [])
+    ))
 
     # --- make-subtasks subcommand ---
     make_subtasks_parser = subparsers.add_parser("make-subtasks", help="Sub-task Review, Refinement & Instantiation (make_gouai_subtasks.py).")
@@ -261,7 +287,11 @@ def main_cli():
     chat_parser.add_argument("--task_id", required=True, help="The GOUAI task ID.")
     chat_parser.add_argument("--project_root", required=True, help="Path to the GOUAI project root.")
     chat_parser.add_argument("--session_id", help="Optional: specify a session ID to resume or use for the chat.")
-    chat_parser.set_defaults(func=lambda args_ns: handle_chat_session(args_ns.task_id, args_ns.project_root, args_ns.session_id))
+    chat_compact_group = chat_parser.add_mutually_exclusive_group()
+    chat_compact_group.add_argument("--compact", dest="compact", action="store_true", default=None,
+                                    help="Compact long histories: pinned prime, running summary, recent turns.")
+    chat_compact_group.add_argument("--no-compact", dest="compact", action="store_false", help="Always send the full history.")
+    chat_parser.set_defaults(func=lambda args_ns: handle_chat_session(args_ns.task_id, args_ns.project_root, args_ns.session_id, args_ns.compact))
 
     # --- compile-hlgs subcommand ---
     compile_hlgs_parser = subparsers.add_parser("compile-hlgs", help="Compiles HLGs and output summaries from a GOUAI project.")
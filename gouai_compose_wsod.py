@@ -15,6 +15,12 @@ except ImportError:
     print("CRITICAL ERROR: gouai_task_mgmt.py not found or importable.", file=sys.stderr)
     sys.exit(1)
 
+try:
+    from gouai_project_tree import load_task_node
+except ImportError:
+    print("CRITICAL ERROR: gouai_project_tree.py not found or importable.", file=sys.stderr)
+    sys.exit(1)
+
 try:
     from gouai_decomposition_parser import parse_decomposition_document, DecompositionParsingError
 except ImportError:
@@ -22,7 +28,7 @@ except ImportError:
     sys.exit(1)
 
 try:
-    from gouai_llm_api import generate_response_aggregated, LLMAPICallError, ConfigurationError
+    from gouai_llm_api import generate_response_aggregated, fit_prompt_sections, LLMAPICallError, ConfigurationError, CACHE_POLICY_OFF, CACHE_POLICY_REFRESH
 except ImportError:
     print("CRITICAL ERROR: gouai_llm_api.py not found or importable.", file=sys.stderr)
     sys.exit(1)
@@ -151,17 +157,15 @@ def get_subtask_output_content(
         # This simple function will just try to read the one file specified.
         # A more complex version would intelligently grab task_definition.md + files in outputs/.
         if subtask_type == "Recursive GOUAI Task":
-            # Let's try to get its task_definition.md content for its WSOD
-            gouai_subtask_def_path = subtask_dir_abs / "task_definition.md"
-            if gouai_subtask_def_path.is_file():
-                try:
-                    parsed_def = parse_decomposition_document(gouai_subtask_def_path.read_text(encoding='utf-8')) # Re-use parser
-                    sub_wsod = parsed_def.get("parent_task_details", {}).get("wsod", "Sub-task WSOD not found in its task_definition.md")
-                    content_parts.append(f"Sub-task Final WSOD:\n```\n{sub_wsod}\n```")
-                except Exception as e_parse:
-                    content_parts.append(f"Could not parse sub-task WSOD from {gouai_subtask_def_path}: {e_parse}")
+            # Its WSOD comes from its task_definition.md: the full statement once Phase 1 filled it in, else the summary
+            subtask_node = load_task_node(subtask_dir_abs)
+            if subtask_node.is_task:
+                sub_wsod = subtask_node.section("Workable Stated Output Descriptor (WSOD) - Full Statement")
+                if not sub_wsod or sub_wsod.startswith("(To be filled"): # Still the template placeholder
+                    sub_wsod = subtask_node.wsod_summary or "Sub-task WSOD not found in its task_definition.md"
+                content_parts.append(f"Sub-task Final WSOD:\n```\n{sub_wsod}\n```")
             else:
-                 content_parts.append(f"Sub-task task_definition.md not found at {gouai_subtask_def_path}")
+                 content_parts.append(f"Sub-task task_definition.md not found at {subtask_node.definition_path}")
             
             # Now also try to read the specified output_location_reference if different or if it's an actual file
             # The current output_ref for GOUAI tasks is generic.
@@ -216,6 +220,9 @@ def main():
         default=DEFAULT_OUTPUT_FILENAME, 
         help=f"Filename for the composed Final WSOD. Saved in parent task's 'outputs/' directory. Default: {DEFAULT_OUTPUT_FILENAME}"
     )
+    cache_group = parser.add_mutually_exclusive_group()
+    cache_group.add_argument("--no-cache", action="store_true", help="Bypass the LLM response cache for this run (no lookup, no store).")
+    cache_group.add_argument("--refresh", action="store_true", help="Ignore cached LLM responses for this run, but store the fresh ones.")
     args = parser.parse_args()
 
     project_root_path = Path(args.project_root).resolve()
@@ -265,13 +272,17 @@ def main():
 
     # 3. Aggregate Sub-task Outputs
     print(f"INFO: Aggregating outputs for {len(tracked_subtasks)} tracked sub-tasks...")
-    aggregated_subtask_outputs_str = ""
+    subtask_output_sections = [] # One prompt section per completed sub-task, so fitting trims them evenly
     completed_subtasks_count = 0
     for subtask_info in tracked_subtasks:
         if subtask_info.get("status", "").lower() == "complete" or "copied" in subtask_info.get("status", "").lower() : # Consider "Text Copied" as complete for aggregation
             print(f"  - Processing completed sub-task (Original Temp ID: {subtask_info.get('original_temp_id', 'N/A')})...")
             output_content = get_subtask_output_content(subtask_info, parent_task_dir, project_root_path)
-            aggregated_subtask_outputs_str += output_content + "\n\n"
+            subtask_output_sections.append({
+                'name': f"sub-task {subtask_info.get('original_temp_id', 'N/A')} output",
+                'text': output_content + "\n\n",
+                'priority': 0
+            })
             completed_subtasks_count += 1
         else:
             print(f"  - Skipping sub-task (Original Temp ID: {subtask_info.get('original_temp_id', 'N/A')}) - Status: {subtask_info.get('status', 'N/A')}")
@@ -296,20 +307,25 @@ def main():
         "- Resolve uncertainties mentioned in the initial parent WSOD if sub-tasks addressed them.",
         "- Be detailed enough to guide a potential GOUAI Phase 3 (Output Synthesis) for the parent task, or to stand as the definitive description of the completed work.",
         "- If sub-tasks indicate failures or unresolved critical issues, the Final WSOD should reflect this reality.",
-        "\n--- START OF PROVIDED INFORMATION ---",
-        f"\n**Parent Task Initial HLG:**\n{parent_initial_hlg}",
-        f"\n**Parent Task Initial WSOD (from pre-decomposition analysis):**\n{parent_initial_wsod}",
-        "\n**Aggregated Sub-task Outcomes & Outputs:**"
+        "\n--- START OF PROVIDED INFORMATION ---"
+    ]
+    # Sub-task outputs are fitted into the prompt token budget first, then the parent's HLG/WSOD;
+    # the instructions and section headers are never trimmed.
+    prompt_sections = [
+        {'name': "instructions", 'text': "\n".join(synthesis_prompt_parts), 'required': True},
+        {'name': "parent HLG", 'text': f"\n**Parent Task Initial HLG:**\n{parent_initial_hlg}", 'priority': 1},
+        {'name': "parent WSOD", 'text': f"\n**Parent Task Initial WSOD (from pre-decomposition analysis):**\n{parent_initial_wsod}", 'priority': 1},
+        {'name': "outputs header", 'text': "\n**Aggregated Sub-task Outcomes & Outputs:**", 'required': True}
     ]
-    if aggregated_subtask_outputs_str.strip():
-        synthesis_prompt_parts.append(aggregated_subtask_outputs_str)
+    if any(section['text'].strip() for section in subtask_output_sections):
+        prompt_sections.extend(subtask_output_sections)
     else:
-        synthesis_prompt_parts.append("No completed sub-task outputs were provided or found for aggregation.")
+        prompt_sections.append({'name': "no outputs", 'text': "No completed sub-task outputs were provided or found for aggregation.", 'required': True})
     
-    synthesis_prompt_parts.append("\n--- END OF PROVIDED INFORMATION ---")
-    synthesis_prompt_parts.append("\nPlease now generate the Final WSOD for the parent task based on all the information above.")
+    prompt_sections.append({'name': "end marker", 'text': "\n--- END OF PROVIDED INFORMATION ---", 'required': True})
+    prompt_sections.append({'name': "closing instruction", 'text': "\nPlease now generate the Final WSOD for the parent task based on all the information above.", 'required': True})
     
-    final_synthesis_prompt = "\n".join(synthesis_prompt_parts)
+    final_synthesis_prompt = "\n".join(fit_prompt_sections(prompt_sections, project_root=str(project_root_path), task_id=parent_task_id))
 
     # For debugging, print the prompt
     # print("\n--- LLM Synthesis Prompt ---")
@@ -325,7 +341,8 @@ def main():
             project_root=str(project_root_path),
             session_id=session_id,
             task_id=parent_task_id, # Log this under the parent task
-            contents=final_synthesis_prompt
+            contents=final_synthesis_prompt,
+            cache_policy=CACHE_POLICY_OFF if args.no_cache else (CACHE_POLICY_REFRESH if args.refresh else None)
         )
 
         if response_data.get('error_info'):
@@ -4,9 +4,7 @@
 import argparse
 from pathlib import Path
 import sys
-import yaml # For task_definition.md frontmatter
 from datetime import datetime
-import re
 import os # For path operations and reading file content
 
 # --- GOUAI Module Imports ---
@@ -39,6 +37,8 @@ except ImportError as e:
     SIMPLE_TASK_TYPE = "simple_task"         # Define if import fails
     # sys.exit(1) # In a real scenario, exit
 
+from gouai_project_tree import TaskNode, extract_md_section, load_task_node
+
 # --- Constants ---
 
 DIRECT_LLM2_PRIMING_INSTRUCTION_TEMPLATE_V1_0 = """
@@ -112,114 +112,26 @@ LIVING_DOC_LOG_LINES_TO_EXTRACT = 15 # Reduced for conciseness in direct dump
 def _debug_print(*args):
     print("DEBUG_CONTEXT_HANDLER:", *args, file=sys.stderr, flush=True)
 
-def _extract_yaml_frontmatter(file_path: Path) -> dict:
-    _debug_print(f"_extract_yaml_frontmatter: Attempting to read {file_path}")
-    try:
-        if not file_path.is_file():
-            _debug_print(f"_extract_yaml_frontmatter: File not found at {file_path}")
-            return {}
-            
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        _debug_print(f"_extract_yaml_frontmatter: Read {len(content)} chars from {file_path}")
-
-        # Remove potential BOM and leading whitespace
-        if content.startswith('\ufeff'):
-            content = content[1:]
-            _debug_print("_extract_yaml_frontmatter: Removed BOM")
-        content_stripped = content.lstrip()
-        
-        if not content_stripped.startswith("---"):
-            _debug_print(f"_extract_yaml_frontmatter: No '---' at the start of stripped content for {file_path}")
-            return {}
-        _debug_print(f"_extract_yaml_frontmatter: Found '---' at start of stripped content for {file_path}")
-
-        parts = content_stripped.split("---", 2)
-        _debug_print(f"_extract_yaml_frontmatter: Split into {len(parts)} parts for {file_path}")
-
-        if len(parts) >= 3: 
-            frontmatter_str = parts[1]
-            _debug_print(f"_extract_yaml_frontmatter: Extracted frontmatter_str (first 100 chars): '{frontmatter_str.strip()[:100]}...' for {file_path}")
-            
-            if not frontmatter_str.strip():
-                _debug_print(f"_extract_yaml_frontmatter: Extracted frontmatter string is EMPTY for {file_path}")
-                return {}
-
-            try:
-                loaded_yaml = yaml.safe_load(frontmatter_str)
-                _debug_print(f"_extract_yaml_frontmatter: yaml.safe_load result type: {type(loaded_yaml)} for {file_path}")
-                if isinstance(loaded_yaml, dict):
-                    _debug_print(f"_extract_yaml_frontmatter: Successfully parsed YAML dict with keys: {list(loaded_yaml.keys())} from {file_path}")
-                    return loaded_yaml
-                else:
-                    _debug_print(f"_extract_yaml_frontmatter: YAML in {file_path} did not parse as a dictionary. Parsed type: {type(loaded_yaml)}")
-                    return {}
-            except yaml.YAMLError as e:
-                _debug_print(f"_extract_yaml_frontmatter: YAML PARSING ERROR in {file_path}. Error: {e}")
-                _debug_print(f"                         Problematic frontmatter string snippet:\n---\n{frontmatter_str.strip()[:300]}\n---")
-                return {}
-        else:
-            _debug_print(f"_extract_yaml_frontmatter: Not enough '---' delimiters found (expected 3 parts from split). Parts found: {len(parts)} for {file_path}")
-            return {}
-
-    except FileNotFoundError: # Should be redundant due to is_file() check above, but good practice
-        _debug_print(f"_extract_yaml_frontmatter: FileNotFoundError (should have been caught by is_file): {file_path}")
-        return {}
-    except Exception as e:
-        _debug_print(f"_extract_yaml_frontmatter: UNEXPECTED ERROR extracting frontmatter from {file_path}: {type(e).__name__} - {e}")
-    return {}
-
-
 def _extract_md_section_content(file_path: Path, section_heading_text: str, exact_heading_level: str = "##") -> str:
     _debug_print(f"_extract_md_section_content: Reading section '{section_heading_text}' from {file_path} (level: {exact_heading_level})")
-    content_lines = []
     try:
         if not file_path.is_file():
             _debug_print(f"_extract_md_section_content: File not found: {file_path}")
             return ""
         with open(file_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-
-        in_section = False
-        normalized_heading_text = section_heading_text.strip()
-        start_re = re.compile(rf"^{re.escape(exact_heading_level)}\s*{re.escape(normalized_heading_text)}\s*$", re.IGNORECASE)
-        
-        level_num = len(exact_heading_level)
-        higher_or_same_markers = [f"^{re.escape('#'*i)}\\s+" for i in range(1, level_num + 1)]
-        end_re = re.compile(r"^(?:" + "|".join(higher_or_same_markers) + r")")
-
-        for i, line_text in enumerate(lines):
-            stripped_line_text = line_text.strip()
-            if not in_section:
-                if start_re.match(stripped_line_text):
-                    in_section = True
-                    _debug_print(f"_extract_md_section_content: Found start of section '{section_heading_text}' at line {i+1}")
-                    continue
-            if in_section:
-                is_another_target_start = start_re.match(stripped_line_text)
-                is_different_terminating_header = end_re.match(line_text) and not is_another_target_start
-
-                if is_another_target_start and content_lines: # Stop if same heading re-appears and we have content
-                    _debug_print(f"_extract_md_section_content: Found another start of '{section_heading_text}' at line {i+1}, stopping previous section.")
-                    break
-                if is_different_terminating_header:
-                    _debug_print(f"_extract_md_section_content: Found terminating header at line {i+1}, stopping section '{section_heading_text}'.")
-                    break
-                content_lines.append(line_text)
-        
-        final_content = "".join(content_lines).strip()
+            final_content = extract_md_section(f.read(), section_heading_text, exact_heading_level)
         _debug_print(f"_extract_md_section_content: Extracted for '{section_heading_text}' (len {len(final_content)}): '{final_content[:100]}...'")
         return final_content
     except Exception as e:
         _debug_print(f"_extract_md_section_content: UNEXPECTED ERROR extracting section '{section_heading_text}' from {file_path}: {type(e).__name__} - {e}")
-    return "".join(content_lines).strip()
+    return ""
 
 
-def _get_task_hlg_full_text(task_def_path: Path, task_type: str) -> str:
-    _debug_print(f"_get_task_hlg_full_text: task_type='{task_type}' for path {task_def_path}")
+def _get_task_hlg_full_text(task_node: TaskNode, task_type: str) -> str:
+    _debug_print(f"_get_task_hlg_full_text: task_type='{task_type}' for path {task_node.definition_path}")
     if task_type == SIMPLE_TASK_TYPE:
-        return _extract_md_section_content(task_def_path, "Task Description", exact_heading_level="##")
-    return _extract_md_section_content(task_def_path, "High-Level Goal(s) (HLG)", exact_heading_level="##")
+        return task_node.section("Task Description", heading_level="##")
+    return task_node.section("High-Level Goal(s) (HLG)", heading_level="##")
 
 
 def _parse_task_definition_md(task_def_path: Path) -> dict:
@@ -228,27 +140,27 @@ def _parse_task_definition_md(task_def_path: Path) -> dict:
         _debug_print(f"_parse_task_definition_md: File NOT FOUND at {task_def_path}")
         return {"error": f"task_definition.md not found at {task_def_path}", "task_type": "ERROR_NO_FILE"}
 
-    _debug_print(f"_parse_task_definition_md: File FOUND. Attempting to extract frontmatter.")
-    frontmatter = _extract_yaml_frontmatter(task_def_path)
-    _debug_print(f"_parse_task_definition_md: Extracted frontmatter: {frontmatter}")
+    _debug_print(f"_parse_task_definition_md: File FOUND. Loading its task node.")
+    task_node = load_task_node(task_def_path.parent) # Frontmatter now; the body once, on the first section read
+    _debug_print(f"_parse_task_definition_md: Loaded task node: {task_node!r}")
 
     data = {}
-    data['task_type'] = frontmatter.get('task_type', FULL_GOUAI_TASK_TYPE) # Default to full if not found
-    data['hlg_summary'] = frontmatter.get('HLG_summary', frontmatter.get('one_line_description', "Default HLG Summary - Not in YAML"))
-    data['wsod_summary'] = frontmatter.get('WSOD_summary', "Default WSOD Summary - Not in YAML" if data['task_type'] != SIMPLE_TASK_TYPE else "N/A for Simple Task")
-    data['status'] = frontmatter.get('status', "Default Status - Not in YAML")
-    data['parent_task_id'] = frontmatter.get('parent_task_id', "Default Parent ID - Not in YAML") # Keep as string
+    data['task_type'] = task_node.task_type or FULL_GOUAI_TASK_TYPE # Default to full if not found
+    data['hlg_summary'] = task_node.hlg_summary or task_node.one_line_description or "Default HLG Summary - Not in YAML"
+    data['wsod_summary'] = task_node.wsod_summary or ("Default WSOD Summary - Not in YAML" if data['task_type'] != SIMPLE_TASK_TYPE else "N/A for Simple Task")
+    data['status'] = task_node.status or "Default Status - Not in YAML"
+    data['parent_task_id'] = task_node.parent_task_id or "Default Parent ID - Not in YAML" # Keep as string
     
     _debug_print(f"_parse_task_definition_md: Parsed from YAML - task_type='{data['task_type']}', hlg_summary='{data['hlg_summary']}', parent_task_id='{data['parent_task_id']}'")
 
-    data['task_hlg_full_text'] = _get_task_hlg_full_text(task_def_path, data['task_type'])
+    data['task_hlg_full_text'] = _get_task_hlg_full_text(task_node, data['task_type'])
     if not data['task_hlg_full_text'] and data['hlg_summary'] != "Default HLG Summary - Not in YAML":
         data['task_hlg_full_text'] = data['hlg_summary'] # Fallback if section empty but summary exists
     _debug_print(f"_parse_task_definition_md: task_hlg_full_text (len {len(data['task_hlg_full_text'])}): '{data['task_hlg_full_text'][:100]}...'")
     
     if data['task_type'] != SIMPLE_TASK_TYPE:
-        data['wsod_assessment_initial'] = _extract_md_section_content(task_def_path, "WSOD Assessment (Initial)", "##")
-        data['ie_uncertainty_overview'] = _extract_md_section_content(task_def_path, "Phase 2: IE Uncertainty Overview", "##")
+        data['wsod_assessment_initial'] = task_node.section("WSOD Assessment (Initial)", "##")
+        data['ie_uncertainty_overview'] = task_node.section("Phase 2: IE Uncertainty Overview", "##")
     else:
         data['wsod_assessment_initial'] = "N/A for Simple Task"
         data['ie_uncertainty_overview'] = "N/A for Simple Task"
@@ -312,12 +224,25 @@ def _gather_context_from_files(context_packages_path: Path) -> tuple[str, str]:
     return text_content_output, non_text_files_list_str_formatted
 
 
+def _fit_prime_sections(task_id: str, project_root_path: Path | None, sections: list[dict]) -> list[str]:
+    """
+    Fits the prime's free-text sections into the project's prompt token budget.
+    gouai_llm_api is imported here rather than at module load so the context handler starts fast.
+    """
+    try:
+        from gouai_llm_api import fit_prompt_sections
+    except ImportError as e:
+        _debug_print(f"_fit_prime_sections: gouai_llm_api not importable ({e}); prime is not fitted to the token budget.")
+        return [section['text'] for section in sections]
+    return fit_prompt_sections(sections, project_root=str(project_root_path) if project_root_path else None, task_id=task_id)
+
 def _construct_direct_llm2_prime(
     task_id: str, 
     task_def_data: dict, 
     living_doc_data: dict, 
     files_context_str: str, 
-    non_text_files_list_str_param: str # Renamed to avoid conflict with any global
+    non_text_files_list_str_param: str, # Renamed to avoid conflict with any global
+    project_root_path: Path | None = None # Whose prompt_budget configuration applies
     ) -> str:
     _debug_print(f"_construct_direct_llm2_prime: Building prime for task_id '{task_id}'")
     _debug_print(f"  task_def_data used: { {k: (v[:50] + '...' if isinstance(v, str) and len(v) > 50 else v) for k,v in task_def_data.items()} }")
@@ -337,14 +262,22 @@ def _construct_direct_llm2_prime(
     parent_task_id_for_prompt = str(parent_task_id_value) if parent_task_id_value is not None else "N/A_IN_PRIME"
     prompt = prompt.replace("[PARENT_TASK_ID_PLACEHOLDER]", parent_task_id_for_prompt)
     
-    prompt = prompt.replace("[TASK_HLG_FULL_TEXT_PLACEHOLDER]", task_def_data.get('task_hlg_full_text', 'ERROR_HLG_FULL_TEXT_UNSET'))
-    prompt = prompt.replace("[WSOD_ASSESSMENT_PLACEHOLDER]", task_def_data.get('wsod_assessment_initial', 'ERROR_WSOD_ASSESS_UNSET'))
-    prompt = prompt.replace("[IE_UNCERTAINTY_PLACEHOLDER]", task_def_data.get('ie_uncertainty_overview', 'ERROR_IE_UNCERT_UNSET'))
-    
-    prompt = prompt.replace("[LIVING_DOC_QUESTIONS_PLACEHOLDER]", living_doc_data.get('key_questions_uncertainties', 'ERROR_LD_QUEST_UNSET'))
-    prompt = prompt.replace("[LIVING_DOC_LOG_PLACEHOLDER]", living_doc_data.get('recent_chrono_log', 'ERROR_LD_LOG_UNSET'))
-    
-    prompt = prompt.replace("[FILES_CONTEXT_STR_PLACEHOLDER]", files_context_str if files_context_str.strip() else "No text-based context files provided or found.")
+    # Free-text fields can be arbitrarily long: fit them into the prompt token budget before substituting.
+    # Lowest priority (trimmed first): context files, then the chronological log, then the rest.
+    fitted_placeholders = [ # (placeholder, section name, text, priority)
+        ("[TASK_HLG_FULL_TEXT_PLACEHOLDER]", "task HLG", task_def_data.get('task_hlg_full_text', 'ERROR_HLG_FULL_TEXT_UNSET'), 3),
+        ("[WSOD_ASSESSMENT_PLACEHOLDER]", "WSOD assessment", task_def_data.get('wsod_assessment_initial', 'ERROR_WSOD_ASSESS_UNSET'), 2),
+        ("[IE_UNCERTAINTY_PLACEHOLDER]", "IE uncertainty overview", task_def_data.get('ie_uncertainty_overview', 'ERROR_IE_UNCERT_UNSET'), 2),
+        ("[LIVING_DOC_QUESTIONS_PLACEHOLDER]", "living document questions", living_doc_data.get('key_questions_uncertainties', 'ERROR_LD_QUEST_UNSET'), 2),
+        ("[LIVING_DOC_LOG_PLACEHOLDER]", "living document log", living_doc_data.get('recent_chrono_log', 'ERROR_LD_LOG_UNSET'), 1),
+        ("[FILES_CONTEXT_STR_PLACEHOLDER]", "context files", files_context_str if files_context_str.strip() else "No text-based context files provided or found.", 0),
+    ]
+    prime_sections = [{'name': "prime template", 'text': prompt, 'required': True}] + [
+        {'name': name, 'text': text, 'priority': priority} for _, name, text, priority in fitted_placeholders
+    ]
+    fitted_texts = _fit_prime_sections(task_id, project_root_path, prime_sections)
+    for (placeholder, _, _, _), fitted_text in zip(fitted_placeholders, fitted_texts[1:]):
+        prompt = prompt.replace(placeholder, fitted_text)
     
     non_text_files_display_value = "None."
     if isinstance(non_text_files_list_str_param, list): # Should be string from _gather_context_from_files now
@@ -407,7 +340,8 @@ def main():
     
     priming_prompt_for_llm2 = _construct_direct_llm2_prime(
         task_id, current_task_def_data, living_doc_data,
-        files_context_str, non_text_files_list_str
+        files_context_str, non_text_files_list_str,
+        project_root_path
     )
     
     # The final output of this script is the priming prompt to stdout
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# gouai_frontmatter.py
+"""
+The one YAML frontmatter reader of the GOUAI tools.
+
+load_frontmatter() reads a Markdown file only up to the line closing its '---' frontmatter block
+(never the body), parses the block with the libyaml C loader when PyYAML was built with it, and
+caches the result keyed by (path, mtime_ns, size). A whole-project scan (the task index, the
+ProjectTree) therefore parses each task_definition.md once, and later reads in the same process
+cost one stat. Parsed mappings are shared by the cache: read_frontmatter() returns a copy, and
+callers of load_frontmatter() must not modify Frontmatter.data.
+"""
+
+import functools
+import os
+from pathlib import Path
+from typing import NamedTuple
+
+import yaml
+
+# --- Constants ---
+FRONTMATTER_MAX_LINES = 200 # A block not closed within this many lines is not frontmatter
+_HEAD_LINES = 15 # Kept for callers' fallbacks when a file has no usable frontmatter
+_FRONTMATTER_CACHE_SIZE = 4096
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader) # libyaml bindings, if PyYAML was built with them
+
+
+class Frontmatter(NamedTuple):
+    data: dict # The block's mapping; {} if there is no block or it is not a YAML mapping
+    found: bool # The file starts with a closed '---' block (after a BOM or blank lines)
+    error: str | None # Why a found block is not usable (YAML error, or not a mapping)
+    head: str # The lines read, when data is empty ("" otherwise)
+
+# --- Helper Functions ---
+
+def _parse_block(block_text: str) -> tuple[dict, str | None]:
+    try:
+        data = yaml.load(block_text, Loader=_YAML_LOADER)
+    except yaml.YAMLError as e:
+        return {}, f"Invalid YAML: {e}"
+    if data is None:
+        return {}, None # Empty block
+    if not isinstance(data, dict):
+        return {}, f"Frontmatter is a YAML {type(data).__name__}, not a mapping."
+    return data, None
+
+def _split_head(lines) -> tuple[list[str], int | None, int | None]:
+    """Reads lines up to the closing '---'; returns (lines read, opening index, closing index)."""
+    head_lines = []
+    opening_index = closing_index = None
+    for line in lines:
+        head_lines.append(line)
+        marker = line.lstrip('\ufeff').strip()
+        if opening_index is None:
+            if marker == '---':
+                opening_index = len(head_lines) - 1
+            elif marker:
+                break # Content before any '---': no frontmatter
+        elif marker == '---':
+            closing_index = len(head_lines) - 1
+            break
+        if len(head_lines) >= FRONTMATTER_MAX_LINES:
+            break
+    return head_lines, opening_index, closing_index
+
+def _frontmatter_from_head(head_lines: list[str], opening_index: int | None, closing_index: int | None) -> Frontmatter:
+    if closing_index is None:
+        return Frontmatter({}, False, None, "".join(head_lines))
+    data, error = _parse_block("".join(head_lines[opening_index + 1:closing_index]))
+    return Frontmatter(data, True, error, "" if data else "".join(head_lines))
+
+@functools.lru_cache(maxsize=_FRONTMATTER_CACHE_SIZE)
+def _load_frontmatter_cached(path_str: str, mtime_ns: int, size: int) -> Frontmatter:
+    """mtime_ns and size only key the cache."""
+    with open(path_str, 'r', encoding='utf-8') as f:
+        head_lines, opening_index, closing_index = _split_head(f)
+        if closing_index is None:
+            while len(head_lines) < _HEAD_LINES: # Enough of the top of the file for callers' fallbacks
+                line = f.readline()
+                if not line:
+                    break
+                head_lines.append(line)
+    return _frontmatter_from_head(head_lines, opening_index, closing_index)
+
+
+# --- Public API ---
+
+def load_frontmatter(path: Path | str) -> Frontmatter:
+    """
+    The frontmatter of a Markdown file, parsed at most once per (path, mtime_ns, size).
+    Raises OSError or UnicodeDecodeError if the file cannot be read.
+    """
+    path_stat = os.stat(path)
+    return _load_frontmatter_cached(os.fspath(path), path_stat.st_mtime_ns, path_stat.st_size)
+
+def read_frontmatter(path: Path | str) -> dict:
+    """A copy of the frontmatter mapping of a Markdown file; {} if it has none or cannot be read."""
+    try:
+        return dict(load_frontmatter(path).data)
+    except (OSError, UnicodeDecodeError):
+        return {}
+
+def strip_frontmatter(text: str) -> str:
+    """Markdown text without its leading '---' frontmatter block (the block is not parsed)."""
+    lines = text.splitlines(keepends=True)
+    _, _, closing_index = _split_head(lines)
+    return "".join(lines[closing_index + 1:]) if closing_index is not None else text.lstrip('\ufeff')
+
+def clear_frontmatter_cache():
+    _load_frontmatter_cached.cache_clear()
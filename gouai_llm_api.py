@@ -1,17 +1,60 @@
+from __future__ import annotations # SDK types in signatures stay unevaluated, so google.genai can load lazily
 import yaml
 from pathlib import Path
 import os
-from google import genai
-from google.genai import types 
-from google.genai.types import Content, GenerationConfig, SafetySetting, Part
-from google.genai.types import HarmCategory, HarmBlockThreshold # For parsing safety_settings_params
-import google.api_core.exceptions
-from typing import Iterable, Union, List, Dict, Any, Optional
+import importlib
+from typing import Iterable, AsyncIterator, Union, List, Dict, Any, Optional, NamedTuple, TYPE_CHECKING
 import sys # For _log_error_to_project placeholder
+import threading
+import concurrent.futures
+import asyncio
+import weakref
+import queue
+import random
+from collections import deque
+import http.client
+import urllib.parse
+import time
+import hashlib
+import gzip
+import shutil
+import re
+import stat
+import atexit
 from datetime import datetime
 from gouai_task_mgmt import find_task_dir_path_from_id
 import json
 
+if TYPE_CHECKING:
+    from google.genai.types import Content, Part
+
+# --- Lazy Google GenAI SDK Imports ---
+# google.genai and google.api_core take most of a second to import, and most gouai commands
+# (init, make-subtasks, compile-hlgs, ...) import this module without ever calling an LLM.
+# These module-level names are proxies that import the real module on first attribute access;
+# they remain ordinary module attributes, so @patch('gouai_llm_api.genai') keeps working.
+# benchmarks/bench_import_time.py measures the import cost and holds the budget tests enforce.
+class _LazyModule:
+    def __init__(self, module_name: str):
+        self._module_name = module_name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._module_name)
+        return self._module
+
+    def __getattr__(self, attribute: str):
+        return getattr(self._load(), attribute)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module '{self._module_name}' ({state})>"
+
+genai = _LazyModule("google.genai")
+types = _LazyModule("google.genai.types")
+_api_core_exceptions = _LazyModule("google.api_core.exceptions")
+
 # --- GOUAI API Configuration & Key Management (MVP_DEV_ST3.2 & MVP_DEV_ST3.3) ---
 
 class ConfigurationError(Exception):
@@ -35,12 +78,30 @@ def _get_user_config_file_path() -> Path:
     else:  # Linux, macOS, other POSIX
         return Path.home() / ".gouai" / "config.yaml"
 
+# Parsed config files are shared process-wide, keyed by path and revalidated by (mtime, size, inode),
+# so every caller (all CLI tools go through load_api_config_settings) parses each file at most once
+# until it changes.
+_CONFIG_FILE_CACHE: Dict[Path, tuple[tuple, dict, str]] = {}
+
+def _config_file_signature(file_path: Path) -> Optional[tuple]:
+    """(mtime_ns, size, inode) of a config file, or None if it does not exist."""
+    try:
+        file_stat = os.stat(file_path)
+    except OSError:
+        return None
+    return (file_stat.st_mtime_ns, file_stat.st_size, file_stat.st_ino)
+
 def _load_single_config_file(file_path: Path) -> tuple[dict, str]:
     """
     Loads and parses a single YAML configuration file.
     Returns (config_data, loaded_path_str) or ({}, "") if not found.
     Raises ConfigurationError for parsing or severe read issues.
     """
+    signature = _config_file_signature(file_path)
+    cached = _CONFIG_FILE_CACHE.get(file_path)
+    if signature is not None and cached is not None and cached[0] == signature:
+        return cached[1], cached[2]
+
     config_data = {}
     loaded_path_str = ""
     if file_path.is_file():
@@ -65,6 +126,8 @@ def _load_single_config_file(file_path: Path) -> tuple[dict, str]:
             raise ConfigurationError(
                 f"GOUAI Configuration Error: Could not read configuration file: {file_path}. Error: {e}"
             ) from e
+    if signature is not None and loaded_path_str:
+        _CONFIG_FILE_CACHE[file_path] = (signature, config_data, loaded_path_str)
     return config_data, loaded_path_str
 
 def load_api_config_settings(project_root_path_str: str | None = None) -> dict:
@@ -73,7 +136,8 @@ def load_api_config_settings(project_root_path_str: str | None = None) -> dict:
     Project-level config (<project_root>/.gouai_config.yaml) overrides user-level.
 
     Returns:
-        A dictionary containing the 'default_model_name'.
+        A dictionary containing the 'default_model_name' plus any optional
+        settings present in the merged configuration (e.g. 'http_options').
     Raises:
         ConfigurationError: If configuration is missing, malformed, or invalid.
     """
@@ -129,7 +193,7 @@ def load_api_config_settings(project_root_path_str: str | None = None) -> dict:
             f"Found: '{default_model_name}' (type: {type(default_model_name).__name__})\n"
             f"Please correct the value."
         )
-    return {'default_model_name': default_model_name.strip()}
+    return {**final_config, 'default_model_name': default_model_name.strip()}
 
 # --- MVP_DEV_ST3.3: Secure API Key Access ---
 
@@ -162,24 +226,52 @@ def _get_api_key_from_env() -> str:
     return api_key.strip()
 
 # --- Cached Configuration and API Key ---
-_CACHED_SETTINGS = None # Will store {'default_model_name': '...', 'api_key': '...'}
+# Settings are cached per resolved project root (None: user-level config only), so a long-lived process
+# serving several projects gets each project's own settings. Every call revalidates its entry against the
+# signatures of the user and project config files and the environment the settings depend on (API key,
+# GOUAI_LLM_MODE): a few stat() calls, and an edited config file is picked up without a restart.
+_CACHED_SETTINGS: Optional[Dict[Optional[str], tuple[tuple, dict]]] = None # {project root: (validation, settings)}
+_CACHED_SETTINGS_LOCK = threading.Lock()
+
+def _settings_validation(resolved_project_root: Optional[str]) -> tuple:
+    project_config_path = Path(resolved_project_root) / ".gouai_config.yaml" if resolved_project_root else None
+    return (
+        _config_file_signature(_get_user_config_file_path()),
+        _config_file_signature(project_config_path) if project_config_path else None,
+        os.getenv(_API_KEY_ENV_VAR),
+        os.getenv(LLM_MODE_ENV_VAR)
+    )
 
 def get_llm_provider_settings(project_root: str | None = None) -> dict:
     """
     Retrieves all necessary LLM provider settings (config file settings and API key).
-    Loads from file/env on first call for a given project_root context, then caches.
+    Loads from file/env on first call for a given project_root, then caches until a config file changes.
     """
     global _CACHED_SETTINGS
-    # This simple cache assumes project_root doesn't change often in one script run.
-    # For CLI tools, this is usually fine as it's per invocation.
-    if _CACHED_SETTINGS is None:
-        config_values = load_api_config_settings(project_root) # Handles 'default_model_name'
+    resolved_project_root = str(Path(project_root).resolve()) if project_root else None
+    validation = _settings_validation(resolved_project_root)
+    with _CACHED_SETTINGS_LOCK:
+        if _CACHED_SETTINGS is None:
+            _CACHED_SETTINGS = {}
+        cached = _CACHED_SETTINGS.get(resolved_project_root)
+    if cached is not None and cached[0] == validation:
+        return cached[1]
+
+    config_values = load_api_config_settings(project_root) # Handles 'default_model_name'
+    gemini_key_missing = not (os.getenv(_API_KEY_ENV_VAR) or "").strip()
+    if gemini_key_missing and _get_llm_mode() == LLM_MODE_REPLAY:
+        api_key = _REPLAY_PLACEHOLDER_API_KEY # Replay never reaches the API, so no key is required
+    elif gemini_key_missing and not _get_llm_backend(config_values).requires_gemini_api_key:
+        api_key = None # Only the gemini backend needs GEMINI_API_KEY
+    else:
         api_key = _get_api_key_from_env()
-        _CACHED_SETTINGS = {
-            'default_model_name': config_values['default_model_name'],
-            'api_key': api_key
-        }
-    return _CACHED_SETTINGS
+    settings = {
+        **config_values, # 'default_model_name' plus optional settings such as 'http_options'
+        'api_key': api_key
+    }
+    with _CACHED_SETTINGS_LOCK:
+        _CACHED_SETTINGS[resolved_project_root] = (validation, settings)
+    return settings
 
 def get_default_model(project_root: str | None = None) -> str:
     """Convenience function to get only the default_model_name."""
@@ -209,6 +301,71 @@ def _log_error_to_project(error_message: str, exception_obj: Optional[Exception]
     if exception_obj:
         print(f"[GOUAI Project Error Log] Original Exception: {type(exception_obj).__name__}: {exception_obj}", file=sys.stderr)
 
+# --- Pooled Gemini Client ---
+# One genai.Client per (api_key, http_options) for the whole process. The client owns an
+# httpx connection pool, so reusing it keeps HTTP/TLS connections alive across calls
+# instead of paying client construction and a fresh handshake on every chat turn.
+_CLIENT_POOL: Dict[tuple, Any] = {}
+_CLIENT_POOL_LOCK = threading.Lock()
+
+def _client_pool_key(api_key: str, http_options: Optional[Dict[str, Any]] = None) -> tuple:
+    """Builds a hashable pool key from the API key and client options."""
+    return (api_key, json.dumps(http_options or {}, sort_keys=True, default=str))
+
+def _get_pooled_client(api_key: str, http_options: Optional[Dict[str, Any]] = None):
+    """
+    Returns the process-wide genai.Client for (api_key, http_options), creating it on first use.
+    http_options is a plain dict of types.HttpOptions fields (e.g. base_url, timeout, api_version),
+    typically taken from the 'http_options' entry of .gouai_config.yaml.
+    Thread-safe: concurrent first calls for the same key construct exactly one client.
+    """
+    pool_key = _client_pool_key(api_key, http_options)
+    client = _CLIENT_POOL.get(pool_key)
+    if client is not None:
+        return client
+    with _CLIENT_POOL_LOCK:
+        client = _CLIENT_POOL.get(pool_key)
+        if client is None:
+            client_kwargs: Dict[str, Any] = {'api_key': api_key}
+            if http_options:
+                client_kwargs['http_options'] = types.HttpOptions(**http_options)
+            client = genai.Client(**client_kwargs)
+            _CLIENT_POOL[pool_key] = client
+    return client
+
+def _clear_client_pool():
+    """Closes and drops all pooled clients (used by tests and benchmarks)."""
+    with _CLIENT_POOL_LOCK:
+        clients = list(_CLIENT_POOL.values())
+        _CLIENT_POOL.clear()
+    for client in clients:
+        try:
+            client.close()
+        except Exception:
+            pass # Best effort; a client that fails to close is simply discarded
+    with _ASYNC_CLIENT_POOL_LOCK:
+        _ASYNC_CLIENT_POOL.clear()
+
+# The SDK's async transport binds its connections to the running event loop, so async callers get
+# one client per (event loop, api_key, http_options). Entries disappear with their loop.
+_ASYNC_CLIENT_POOL: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[tuple, Any]]" = weakref.WeakKeyDictionary()
+_ASYNC_CLIENT_POOL_LOCK = threading.Lock()
+
+def _get_pooled_async_client(api_key: str, http_options: Optional[Dict[str, Any]] = None):
+    """Returns the genai.Client whose .aio interface is reused by every call on the running event loop."""
+    loop = asyncio.get_running_loop()
+    pool_key = _client_pool_key(api_key, http_options)
+    with _ASYNC_CLIENT_POOL_LOCK:
+        loop_clients = _ASYNC_CLIENT_POOL.setdefault(loop, {})
+        client = loop_clients.get(pool_key)
+        if client is None:
+            client_kwargs: Dict[str, Any] = {'api_key': api_key}
+            if http_options:
+                client_kwargs['http_options'] = types.HttpOptions(**http_options)
+            client = genai.Client(**client_kwargs)
+            loop_clients[pool_key] = client
+    return client
+
 # --- Core Internal API Call Function ---
 def _call_gemini_api(
     model_name: str,
@@ -216,7 +373,8 @@ def _call_gemini_api(
     contents: Union[str, List[Content]],
     generation_config_params: Optional[Dict[str, Any]] = None,
     safety_settings_params: Optional[List[Dict[str, Any]]] = None,
-    tools: Optional[List[Any]] = None  # Tools might be handled differently with the Client API
+    tools: Optional[List[Any]] = None,  # Tools might be handled differently with the Client API
+    http_options: Optional[Dict[str, Any]] = None
 ) -> Iterable[Dict[str, Any]]:
     """
     Internal generator function to make a streaming call to the Gemini API
@@ -226,7 +384,7 @@ def _call_gemini_api(
         # Initialize the client
         # Assuming GEMINI_API_KEY environment variable is not automatically picked up by Client()
         # and api_key parameter needs to be passed. Adjust if Client() handles env var.
-        client = genai.Client(api_key=api_key) # As per user's example
+        client = _get_pooled_client(api_key, http_options) # Reused across calls (keep-alive)
 
         sdk_safety_settings_list = []
         if safety_settings_params:
@@ -235,10 +393,10 @@ def _call_gemini_api(
                     category_str = setting_dict.get('category')
                     threshold_str = setting_dict.get('threshold')
                     if category_str and threshold_str:
-                        harm_category = HarmCategory[category_str.upper()]
-                        harm_threshold = HarmBlockThreshold[threshold_str.upper()]
+                        harm_category = types.HarmCategory[category_str.upper()]
+                        harm_threshold = types.HarmBlockThreshold[threshold_str.upper()]
                         sdk_safety_settings_list.append(
-                            SafetySetting(harm_category=harm_category, threshold=harm_threshold)
+                            types.SafetySetting(harm_category=harm_category, threshold=harm_threshold)
                         )
                     else:
                         _log_error_to_project(f"Invalid safety setting dict (missing category/threshold): {setting_dict}")
@@ -258,7 +416,7 @@ def _call_gemini_api(
             final_gen_config.update(generation_config_params)
         
         # Constructing the config object as per user's example structure
-        generate_config_sdk = GenerationConfig(
+        generate_config_sdk = types.GenerationConfig(
             **final_gen_config, # Unpack temperature, top_p, top_k, max_output_tokens, candidate_count
             safety_settings=sdk_safety_settings_list if sdk_safety_settings_list else None,
             # TODO: Incorporate thinking_config if it becomes a direct parameter or via generation_config_params
@@ -377,7 +535,7 @@ def _call_gemini_api(
                 'is_final_summary': True
             }
 
-    except google.api_core.exceptions.GoogleAPICallError as e: # Keep this specific catch
+    except _api_core_exceptions.GoogleAPICallError as e: # Keep this specific catch
         error_message = f"Gemini API call failed (Client method): {type(e).__name__}: {e}"
         _log_error_to_project(error_message, e)
         yield {
@@ -400,52 +558,6 @@ def _call_gemini_api(
         raise LLMAPICallError(message=error_message, original_exception=e) from e
 
 
-def find_task_dir_path_from_id(project_root_path: Path, target_task_id: str, search_root_path: Path) -> Optional[Path]: # Placeholder
-    # This function is crucial for finding where to write the llm_conversation_log.md.
-    # In a real system, this would search the file system as per gouai_task_mgmt.py.
-    # For this example, let's assume a flat structure if project_root is given,
-    # or that task_id itself might be a path component if project_root is complex.
-    # This is a significant simplification for this standalone snippet.
-    print(f"DEBUG: Called find_task_dir_path_from_id: project_root_path={project_root_path}, target_task_id={target_task_id}")
-    if project_root_path and target_task_id:
-        # Simplistic assumption: task_id is a dir name under project_root_path / "tasks" / target_task_id
-        # Or if target_task_id is like "Project_ROOT_ST1-1", it's project_root_path / "ST1-1"
-        # This needs to match your actual task directory finding logic.
-        # For now, let's assume target_task_id might be a relative path from project_root or
-        # the find_task_dir_path_from_id correctly resolves it.
-        # Let's assume the task directory is simply project_root_path / task_id_as_folder_name
-        # This is a placeholder and would need your actual robust implementation from gouai_task_mgmt.py
-        parts = target_task_id.split('_')
-        task_dir_name = parts[-1] if len(parts) > 1 else target_task_id
-        if project_root_path.name == target_task_id : # It's the root task
-             return project_root_path
-        
-        # Simplified search for STx-y type subdirs
-        for item in project_root_path.rglob(f"*{task_dir_name}"):
-            if item.is_dir() and (item / "task_definition.md").exists():
-                # crude check, actual find_task_dir_path_from_id is more robust
-                return item
-        # Fallback: assume task_id is a direct subdirectory for placeholder
-        potential_path = project_root_path / task_dir_name
-        if potential_path.is_dir():
-            return potential_path
-        print(f"WARN: Task directory for {target_task_id} not found via placeholder logic under {project_root_path}.")
-        # If the task is the root project task, its directory is the project_root_path itself.
-        # This logic needs to be robust based on your task_id conventions.
-        # Example: if task_id is "MyProject_ROOT", dir is project_root_path.
-        # If task_id is "MyProject_ROOT_ST1-1_DoStuff", dir is project_root_path / "ST1-1_DoStuff" (or similar)
-        # The `find_task_dir_path_from_id` from `gouai_task_mgmt.py` does this properly.
-        # For this snippet, we'll just try a direct subfolder based on the last part of ID.
-        
-        # Let's try matching the full task_id as a directory relative to the project_root
-        # This requires a search. For now, we'll assume a simple structure for the placeholder.
-        # A more robust solution would be to actually invoke your 'find_task_dir_path_from_id'
-        # If the task ID refers to the project root itself:
-        if target_task_id.endswith("_ROOT") and project_root_path.name == target_task_id.replace("_ROOT", ""):
-            return project_root_path
-
-    return None # Placeholder couldn't find it easily.
-
 class LLMAPICallError(Exception):
     def __init__(self, message: str, original_exception: Optional[Exception] = None):
         super().__init__(message)
@@ -456,139 +568,239 @@ def _log_error_to_project(error_message: str, exception_obj: Optional[Exception]
     if exception_obj:
         print(f"[GOUAI Project Error Log] Original Exception: {type(exception_obj).__name__}: {exception_obj}", file=sys.stderr)
 
+def _gemini_chunk_to_dict(chunk) -> Dict[str, Any]:
+    """Converts one streamed GenerateContentResponse chunk into GOUAI's chunk dict."""
+    text_chunk_content = ""
+    parts_chunk_content = []
+    chunk_finish_reason = None
+    chunk_safety_ratings_simplified = []
+
+    if chunk.candidates:
+        candidate = chunk.candidates[0] # Focus on the first candidate
+        chunk_finish_reason = candidate.finish_reason.name if candidate.finish_reason else None
+        if candidate.safety_ratings:
+            for sr in candidate.safety_ratings:
+                chunk_safety_ratings_simplified.append({
+                    'category': sr.category.name if sr.category else 'UNKNOWN_CATEGORY',
+                    'probability': sr.probability.name if sr.probability else 'UNKNOWN_PROBABILITY'
+                })
+        if candidate.content and candidate.content.parts:
+            parts_chunk_content = list(candidate.content.parts)
+            for part_item in candidate.content.parts: # Changed 'part' to 'part_item' to avoid conflict
+                if hasattr(part_item, 'text') and part_item.text:
+                    text_chunk_content += part_item.text
+
+    return {
+        'text_chunk': text_chunk_content,
+        'parts_chunk': parts_chunk_content,
+        'candidate_finish_reason': chunk_finish_reason,
+        'candidate_safety_ratings': chunk_safety_ratings_simplified,
+        'is_chunk': True
+    }
+
+def _gemini_final_summary(metadata_source) -> Optional[Dict[str, Any]]:
+    """
+    Builds the 'is_final_summary' dict from whichever object carries usage_metadata / prompt_feedback
+    (the last streamed chunk, or the stream object itself). Returns None if there is nothing to report.
+    """
+    usage_metadata_dict = None
+    usage_metadata = getattr(metadata_source, 'usage_metadata', None)
+    if usage_metadata:
+        usage_metadata_dict = {
+            'prompt_token_count': usage_metadata.prompt_token_count,
+            'candidates_token_count': usage_metadata.candidates_token_count,
+            'total_token_count': usage_metadata.total_token_count
+        }
+
+    prompt_feedback_dict = None
+    prompt_feedback = getattr(metadata_source, 'prompt_feedback', None)
+    if prompt_feedback:
+        block_reason_str = None
+        if prompt_feedback.block_reason: # Check if it's not BlockReason.BLOCK_REASON_UNSPECIFIED or None
+            block_reason_str = prompt_feedback.block_reason.name
+
+        prompt_safety_ratings_simplified = []
+        if prompt_feedback.safety_ratings:
+            for sr in prompt_feedback.safety_ratings:
+                 prompt_safety_ratings_simplified.append({
+                    'category': sr.category.name if sr.category else 'UNKNOWN_CATEGORY',
+                    'probability': sr.probability.name if sr.probability else 'UNKNOWN_PROBABILITY'
+                })
+        # Only include prompt_feedback_dict if there's meaningful feedback
+        if block_reason_str or prompt_safety_ratings_simplified:
+            prompt_feedback_dict = {
+                'block_reason': block_reason_str,
+                'safety_ratings': prompt_safety_ratings_simplified
+            }
+
+    if not usage_metadata_dict and not prompt_feedback_dict:
+        return None
+    return {
+        'usage_metadata': usage_metadata_dict,
+        'prompt_feedback': prompt_feedback_dict,
+        'is_final_summary': True
+    }
+
+def _gemini_error_chunk(error_message: str, e: Exception) -> Dict[str, Any]:
+    return {
+        'error': error_message,
+        'original_exception_type': type(e).__name__,
+        'original_exception_message': str(e),
+        'is_error': True
+    }
+
+def _gemini_content_config(cached_content: Optional[str] = None) -> "types.GenerateContentConfig":
+    return types.GenerateContentConfig(
+          thinking_config=types.ThinkingConfig(
+            include_thoughts=True
+        ),
+        cached_content=cached_content # Handle from GeminiBackend.create_prefix_cache, if the prefix is cached
+    )
+
 def _call_gemini_api(
     model_name: str,
     api_key: str,
     contents: Union[str, List[Content]],
     generation_config_params: Optional[Dict[str, Any]] = None,
     safety_settings_params: Optional[List[Dict[str, Any]]] = None,
-    tools: Optional[List[Any]] = None
+    tools: Optional[List[Any]] = None,
+    http_options: Optional[Dict[str, Any]] = None
 ) -> Iterable[Dict[str, Any]]:
     try:
 
-        client = genai.Client(api_key=api_key)
+        client = _get_pooled_client(api_key, http_options)
         model = model_name # Add system_instruction here if needed
 
         response_stream = client.models.generate_content_stream(
             model=model,
             contents=contents,
-            config=types.GenerateContentConfig(
-                  thinking_config=types.ThinkingConfig(
-                    include_thoughts=True
-                )
-            )
+            config=_gemini_content_config((generation_config_params or {}).get('cached_content'))
         )
         processed_any_chunk = False
+        last_chunk = None
         for chunk in response_stream:
             processed_any_chunk = True
-            text_chunk_content = ""
-            parts_chunk_content = []
-            chunk_finish_reason = None
-            chunk_safety_ratings_simplified = []
+            last_chunk = chunk # The final chunk carries usage_metadata for the whole response
+            yield _gemini_chunk_to_dict(chunk)
 
-            if chunk.candidates:
-                candidate = chunk.candidates[0] # Focus on the first candidate
-                chunk_finish_reason = candidate.finish_reason.name if candidate.finish_reason else None
-                if candidate.safety_ratings:
-                    for sr in candidate.safety_ratings:
-                        chunk_safety_ratings_simplified.append({
-                            'category': sr.category.name if sr.category else 'UNKNOWN_CATEGORY',
-                            'probability': sr.probability.name if sr.probability else 'UNKNOWN_PROBABILITY'
-                        })
-                if candidate.content and candidate.content.parts:
-                    parts_chunk_content = list(candidate.content.parts)
-                    for part_item in candidate.content.parts: # Changed 'part' to 'part_item' to avoid conflict
-                        if hasattr(part_item, 'text'):
-                            text_chunk_content += part_item.text
-            
-            yield {
-                'text_chunk': text_chunk_content,
-                'parts_chunk': parts_chunk_content,
-                'candidate_finish_reason': chunk_finish_reason,
-                'candidate_safety_ratings': chunk_safety_ratings_simplified,
-                'is_chunk': True
-            }
-        
         # This part executes after the loop successfully completes or if the stream was empty.
-        usage_metadata_dict = None
-        if hasattr(response_stream, 'usage_metadata') and response_stream.usage_metadata:
-            usage_metadata_dict = {
-                'prompt_token_count': response_stream.usage_metadata.prompt_token_count,
-                'candidates_token_count': response_stream.usage_metadata.candidates_token_count,
-                'total_token_count': response_stream.usage_metadata.total_token_count
-            }
+        final_summary = _gemini_final_summary(last_chunk) or _gemini_final_summary(response_stream)
 
-        prompt_feedback_dict = None
-        if hasattr(response_stream, 'prompt_feedback') and response_stream.prompt_feedback:
-            block_reason_str = None
-            if response_stream.prompt_feedback.block_reason: # Check if it's not BlockReason.BLOCK_REASON_UNSPECIFIED or None
-                block_reason_str = response_stream.prompt_feedback.block_reason.name
-            
-            prompt_safety_ratings_simplified = []
-            if response_stream.prompt_feedback.safety_ratings:
-                for sr in response_stream.prompt_feedback.safety_ratings:
-                     prompt_safety_ratings_simplified.append({
-                        'category': sr.category.name if sr.category else 'UNKNOWN_CATEGORY',
-                        'probability': sr.probability.name if sr.probability else 'UNKNOWN_PROBABILITY'
-                    })
-            # Only include prompt_feedback_dict if there's meaningful feedback
-            if block_reason_str or prompt_safety_ratings_simplified:
-                prompt_feedback_dict = {
-                    'block_reason': block_reason_str,
-                    'safety_ratings': prompt_safety_ratings_simplified
-                }
-        
         # Yield final summary only if we processed any chunk or if there's metadata
-        if processed_any_chunk or usage_metadata_dict or prompt_feedback_dict:
-            yield {
-                'usage_metadata': usage_metadata_dict,
-                'prompt_feedback': prompt_feedback_dict,
-                'is_final_summary': True
-            }
+        if processed_any_chunk or final_summary:
+            yield final_summary or {'usage_metadata': None, 'prompt_feedback': None, 'is_final_summary': True}
 
-    except google.api_core.exceptions.GoogleAPICallError as e:
+    except _api_core_exceptions.GoogleAPICallError as e:
         error_message = f"Gemini API call failed: {type(e).__name__}: {e}"
         _log_error_to_project(error_message, e)
-        yield {
-            'error': error_message,
-            'original_exception_type': type(e).__name__,
-            'original_exception_message': str(e),
-            'is_error': True
-        }
+        yield _gemini_error_chunk(error_message, e)
         # Re-raise the wrapped exception to signal failure to the caller
         raise LLMAPICallError(message=error_message, original_exception=e) from e
-        
+
     except Exception as e:
         error_message = f"An unexpected error occurred during Gemini API call preparation or streaming: {type(e).__name__}: {e}"
         _log_error_to_project(error_message, e)
-        yield {
-            'error': error_message,
-            'original_exception_type': type(e).__name__,
-            'original_exception_message': str(e),
-            'is_error': True
-        }
+        yield _gemini_error_chunk(error_message, e)
+        raise LLMAPICallError(message=error_message, original_exception=e) from e
+
+async def _acall_gemini_api(
+    model_name: str,
+    api_key: str,
+    contents: Union[str, List[Content]],
+    generation_config_params: Optional[Dict[str, Any]] = None,
+    safety_settings_params: Optional[List[Dict[str, Any]]] = None,
+    tools: Optional[List[Any]] = None,
+    http_options: Optional[Dict[str, Any]] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """Async counterpart of _call_gemini_api: same yielded dicts and error semantics, on the SDK's aio client."""
+    try:
+        client = _get_pooled_async_client(api_key, http_options)
+
+        response_stream = await client.aio.models.generate_content_stream(
+            model=model_name,
+            contents=contents,
+            config=_gemini_content_config((generation_config_params or {}).get('cached_content'))
+        )
+        processed_any_chunk = False
+        last_chunk = None
+        async for chunk in response_stream:
+            processed_any_chunk = True
+            last_chunk = chunk
+            yield _gemini_chunk_to_dict(chunk)
+
+        final_summary = _gemini_final_summary(last_chunk)
+        if processed_any_chunk or final_summary:
+            yield final_summary or {'usage_metadata': None, 'prompt_feedback': None, 'is_final_summary': True}
+
+    except _api_core_exceptions.GoogleAPICallError as e:
+        error_message = f"Gemini API call failed: {type(e).__name__}: {e}"
+        _log_error_to_project(error_message, e)
+        yield _gemini_error_chunk(error_message, e)
+        raise LLMAPICallError(message=error_message, original_exception=e) from e
+
+    except Exception as e:
+        error_message = f"An unexpected error occurred during Gemini API call preparation or streaming: {type(e).__name__}: {e}"
+        _log_error_to_project(error_message, e)
+        yield _gemini_error_chunk(error_message, e)
         raise LLMAPICallError(message=error_message, original_exception=e) from e
 
 # --- End of copied _call_gemini_api ---
 
 
 # --- LLM Conversation Logging Helper (Simplified for MVP) ---
+# Task directories are resolved through the project's persistent task index (.gouai/index, see
+# gouai_task_index.py) and memoized per (project_root, task_id) for the life of the process, so a chat
+# session pays for the lookup once rather than once per turn. A cached entry is revalidated with one stat
+# of the directory: if it no longer exists, or a different directory now sits at that path (another
+# inode), the task has moved and is looked up again. Misses are not cached.
+_TASK_DIR_CACHE: Dict[tuple, tuple[Path, int]] = {}
+_TASK_DIR_CACHE_LOCK = threading.Lock()
+
+def _directory_inode(path: Path) -> Optional[int]:
+    try:
+        path_stat = os.stat(path)
+    except OSError:
+        return None
+    return path_stat.st_ino if stat.S_ISDIR(path_stat.st_mode) else None
+
+def _find_task_dir_cached(project_root_path: Path, task_id: str) -> Optional[Path]:
+    cache_key = (str(project_root_path), task_id)
+    with _TASK_DIR_CACHE_LOCK:
+        cached = _TASK_DIR_CACHE.get(cache_key)
+    if cached is not None:
+        cached_dir, cached_inode = cached
+        if _directory_inode(cached_dir) == cached_inode:
+            return cached_dir
+        invalidate_task_dir_cache(str(project_root_path), task_id)
+
+    task_dir = find_task_dir_path_from_id(project_root_path, task_id, project_root_path) # search_root_path is project_root_path
+    task_dir_inode = _directory_inode(task_dir) if task_dir else None
+    if task_dir_inode is None:
+        return None
+    with _TASK_DIR_CACHE_LOCK:
+        _TASK_DIR_CACHE[cache_key] = (task_dir, task_dir_inode)
+    return task_dir
+
+def invalidate_task_dir_cache(project_root: Optional[str] = None, task_id: Optional[str] = None):
+    """Forgets memoized task directories: one task, one project's tasks, or (no arguments) all of them."""
+    project_root_key = str(Path(project_root).resolve()) if project_root else None
+    with _TASK_DIR_CACHE_LOCK:
+        for cache_key in list(_TASK_DIR_CACHE):
+            if (project_root_key is None or cache_key[0] == project_root_key) and (task_id is None or cache_key[1] == task_id):
+                del _TASK_DIR_CACHE[cache_key]
+
 def _get_task_llm_log_path(project_root_str: Optional[str], task_id: str) -> Optional[Path]:
-    """
-    Placeholder: Gets the path to llm_conversation_log.md for a given task.
-    In a real system, this would use robust task directory discovery.
-    """
+    """Gets the path to llm_conversation_log.md for a given task, or None if the task cannot be found."""
     if not project_root_str: # Cannot resolve if project_root is not given
         _log_error_to_project(f"Cannot determine log path: project_root_str is None for task_id {task_id}")
         return None
         
     project_root_path = Path(project_root_str).resolve()
     
-    # Use the more robust find_task_dir_path_from_id (placeholder used here for now)
-    # The actual find_task_dir_path_from_id needs the project_root_path as the search root as well.
-    task_dir = find_task_dir_path_from_id(project_root_path, task_id, project_root_path) # search_root_path is project_root_path
+    # Resolved through the project's task index, memoized
+    task_dir = _find_task_dir_cached(project_root_path, task_id)
 
-    if task_dir and task_dir.is_dir():
+    if task_dir:
         return task_dir / "llm_conversation_log.md"
     else:
         _log_error_to_project(f"Task directory for task_id '{task_id}' not found under project '{project_root_str}'. Cannot write LLM log.")
@@ -601,7 +813,7 @@ def _format_prompt_content_for_log(contents: Union[str, List[Content]]) -> str:
     
     log_str_parts = []
     for content_item in contents: # Assuming contents is List[Content]
-        if isinstance(content_item, Content):
+        if isinstance(content_item, types.Content):
             role_prefix = f"Role: {content_item.role}\n" if content_item.role else ""
             log_str_parts.append(role_prefix)
             for part_item in content_item.parts:
@@ -615,6 +827,36 @@ def _format_prompt_content_for_log(contents: Union[str, List[Content]]) -> str:
     return "\n".join(log_str_parts)
 
 
+def _format_llm_log_turn(role: str, content_to_log: str, timestamp: str, turn_metadata: Optional[Dict[str, Any]] = None) -> str:
+    turn_entry = f"### {role}\n**Timestamp:** {timestamp}\n\n{content_to_log}\n"
+    if turn_metadata:
+        turn_entry += "\n**Turn Metadata:**\n"
+        for key, value in turn_metadata.items():
+            if value is not None:
+                turn_entry += f"  - **{key.replace('_', ' ').title()}:** {value}\n"
+    turn_entry += "\n---\n"
+    return turn_entry
+
+def _llm_log_header(
+    timestamp: str,
+    model_name_for_session: Optional[str],
+    session_id_for_session: Optional[str],
+    task_id_for_session: Optional[str]
+) -> str:
+    # Initial YAML frontmatter, based on 1.2_SystemArchitecture.txt
+    # and gouai_task_mgmt.py's _create_llm_conversation_log_md
+    initial_yaml = (
+        f"session_id: {session_id_for_session or 'null'}\n"
+        f"task_id: {task_id_for_session or 'null'}\n"
+        f"llm_model_used: {model_name_for_session or 'null'}\n" # Log model used for this session start
+        f"session_start_timestamp: \"{timestamp}\"\n"
+        f"api_request_id_initial: null\n" # Not easily available/relevant for all calls
+        f"total_tokens_used: 0\n" # MVP: Not updated dynamically here
+        f"total_cost_estimate: 0.0\n" # MVP: Not updated dynamically here
+    )
+    header = "## LLM Conversation Log\n\n"
+    return f"---\n{initial_yaml}---\n{header}"
+
 def _append_turn_to_llm_log(
     log_file_path: Path,
     role: str, # "User" or "Assistant"
@@ -622,45 +864,29 @@ def _append_turn_to_llm_log(
     model_name_for_session: Optional[str] = None, # For initial YAML if file is new, not for updating
     session_id_for_session: Optional[str] = None, # For initial YAML
     task_id_for_session: Optional[str] = None, # For initial YAML
-    turn_metadata: Optional[Dict[str, Any]] = None # For assistant: usage, finish_reason, safety
+    turn_metadata: Optional[Dict[str, Any]] = None, # For assistant: usage, finish_reason, safety
+    defer_write: bool = False, # Hand the write to the background log writer (request path)
+    log_settings: Optional["_ConversationLogSettings"] = None # The project's 'conversation_log' settings
 ):
     """
     Appends a turn to the llm_conversation_log.md.
     Simplified for MVP: Does NOT update YAML frontmatter for existing files.
     It will create the file with basic YAML if it doesn't exist.
+    With defer_write=True (and the background writer enabled) this only formats the turn and queues it.
+    Either way the turn is indexed and the log rotated into segments as configured (see below).
     """
+    log_settings = log_settings or _DEFAULT_CONVERSATION_LOG_SETTINGS
     try:
         timestamp = datetime.now().isoformat(sep=" ", timespec="seconds")
-        turn_entry = f"### {role}\n**Timestamp:** {timestamp}\n\n{content_to_log}\n"
+        turn_entry = _format_llm_log_turn(role, content_to_log, timestamp, turn_metadata)
+        header = _llm_log_header(timestamp, model_name_for_session, session_id_for_session, task_id_for_session)
 
-        if turn_metadata:
-            turn_entry += "\n**Turn Metadata:**\n"
-            for key, value in turn_metadata.items():
-                if value is not None:
-                    turn_entry += f"  - **{key.replace('_', ' ').title()}:** {value}\n"
-        
-        turn_entry += "\n---\n"
-
-        if not log_file_path.exists():
-            # Create file with initial YAML frontmatter
-            # Based on 1.2_SystemArchitecture.txt
-            # and gouai_task_mgmt.py's _create_llm_conversation_log_md
-            initial_yaml = (
-                f"session_id: {session_id_for_session or 'null'}\n"
-                f"task_id: {task_id_for_session or 'null'}\n"
-                f"llm_model_used: {model_name_for_session or 'null'}\n" # Log model used for this session start
-                f"session_start_timestamp: \"{timestamp}\"\n"
-                f"api_request_id_initial: null\n" # Not easily available/relevant for all calls
-                f"total_tokens_used: 0\n" # MVP: Not updated dynamically here
-                f"total_cost_estimate: 0.0\n" # MVP: Not updated dynamically here
-            )
-            header = "## LLM Conversation Log\n\n"
-            log_file_path.parent.mkdir(parents=True, exist_ok=True)
-            with open(log_file_path, "w", encoding="utf-8") as f:
-                f.write(f"---\n{initial_yaml}---\n{header}")
-        
-        with open(log_file_path, "a", encoding="utf-8") as f:
-            f.write(turn_entry)
+        turn_info = {'timestamp': timestamp, 'role': role, 'session_id': session_id_for_session}
+
+        if defer_write and log_settings.background_writer:
+            _LLM_LOG_WRITER.submit(log_file_path, header, turn_entry, turn_info, log_settings)
+        else:
+            _SYNC_LOG_WRITER.write_now(log_file_path, header, turn_entry, turn_info, log_settings)
 
     except IOError as e:
         _log_error_to_project(f"IOError appending to LLM log '{log_file_path}': {e}", e)
@@ -668,341 +894,3463 @@ def _append_turn_to_llm_log(
         _log_error_to_project(f"Unexpected error appending to LLM log '{log_file_path}': {e}", e)
 
 
-# --- Public API Functions ---
-def generate_response_stream(
-    project_root: Optional[str], # Needed for config and potentially log path finding
-    session_id: str,
-    task_id: str,
-    prompt_text: Optional[str] = None,
-    contents: Optional[Union[str, List[Content]]] = None,
-    override_model_name: Optional[str] = None,
-    override_generation_config: Optional[Dict[str, Any]] = None,
-    override_safety_settings: Optional[List[Dict[str, Any]]] = None,
-    override_tools: Optional[List[Any]] = None
-) -> Iterable[Dict[str, Any]]:
-    """
-    Public function to get a streaming response from the configured LLM (Gemini for MVP).
-    Handles configuration, API key, logging, and calls the core API function.
-    Logs user prompt before call, and assistant response after stream completion.
-    """
-    if not project_root and "~" not in str(Path().home()): # Check if we can even resolve user config without project root
-        # This check is a bit simplistic; load_api_config_settings handles None project_root
-        # by only trying user-level. But for logging path, project_root is more critical.
-        # If user-level config is the only source, and task_id implies a non-project specific context,
-        # logging path becomes ambiguous.
-        # For now, we'll proceed, but _get_task_llm_log_path might return None.
-        pass
+# --- Background Conversation-Log Writer ---
+# Turns logged from the request path (the User turn before a call, the Assistant turn after it, cache
+# hits) are queued to one per-process writer thread instead of being written inline. The thread keeps an
+# append handle open per log file (least recently used closed beyond max_open_files), writes whatever
+# has queued up as one batch, flushes it, and fsyncs according to the policy. Queued turns are written
+# at interpreter exit (atexit also runs after an unhandled exception); flush_llm_logs() waits for them.
+#
+# Conversation logs are segmented: llm_conversation_log.md is always the active segment, and once it
+# reaches max_segment_kb (or, with rotate_daily, when a turn arrives on a later day than the previous
+# one) it is moved to llm_conversation_log.segments/<NNNNN>.md, gzip-compressed if compress_segments.
+# Every turn also gets one line in llm_conversation_log.index.jsonl (segment number, byte offset and
+# length, timestamp, role, session_id), which read_llm_log_turns() uses to fetch the last N turns or
+# one session's turns without scanning the markdown.
+# Configured with the 'conversation_log' mapping in .gouai_config.yaml (defaults shown):
+#   conversation_log:
+#     background_writer: true
+#     fsync: none          # 'none' (leave it to the OS), 'batch' (after every batch), 'always' (after every turn)
+#     max_open_files: 64
+#     max_segment_kb: 1024 # 0 disables size-based rotation
+#     rotate_daily: false
+#     compress_segments: true
+# The settings are read per request and travel with each queued turn, so projects with different
+# settings can share the one writer: rotation, compression and fsync follow the project the turn is
+# logged for, and max_open_files caps the writer's handles when a turn opens a file.
+LOG_FSYNC_POLICIES = ("none", "batch", "always")
+_LOG_WRITER_MAX_BATCH = 256
+_LOG_WRITER_EXIT_TIMEOUT_S = 10.0
+_LOG_INDEX_TAIL_BLOCK_BYTES = 64 * 1024
 
-    log_file_path = _get_task_llm_log_path(project_root, task_id)
+class _ConversationLogSettings(NamedTuple):
+    background_writer: bool = True
+    fsync_policy: str = "none"
+    max_open_files: int = 64
+    max_segment_bytes: int = 1024 * 1024 # 0 disables size-based rotation
+    rotate_daily: bool = False
+    compress_segments: bool = True
 
+_DEFAULT_CONVERSATION_LOG_SETTINGS = _ConversationLogSettings()
+
+def _conversation_log_settings(log_config: Optional[Dict[str, Any]]) -> _ConversationLogSettings:
+    """Parses the 'conversation_log' mapping of a project's settings (defaults for anything missing)."""
+    if not isinstance(log_config, dict):
+        return _DEFAULT_CONVERSATION_LOG_SETTINGS
+    fsync_policy = str(log_config.get('fsync', "none")).lower()
+    return _ConversationLogSettings(
+        background_writer=bool(log_config.get('background_writer', True)),
+        fsync_policy=fsync_policy if fsync_policy in LOG_FSYNC_POLICIES else "none",
+        max_open_files=max(1, int(log_config.get('max_open_files', 64))),
+        max_segment_bytes=max(0, int(float(log_config.get('max_segment_kb', 1024)) * 1024)),
+        rotate_daily=bool(log_config.get('rotate_daily', False)),
+        compress_segments=bool(log_config.get('compress_segments', True))
+    )
+
+def _conversation_log_index_path(log_file_path: Path) -> Path:
+    return log_file_path.parent / f"{log_file_path.stem}.index.jsonl"
+
+def _conversation_log_segments_dir(log_file_path: Path) -> Path:
+    return log_file_path.parent / f"{log_file_path.stem}.segments"
+
+def _active_segment_number(log_file_path: Path) -> int:
+    """The active log is the segment after the highest-numbered archived one."""
     try:
-        settings = get_llm_provider_settings(project_root) #
-        api_key = settings.get('api_key')
-        if not api_key:
-            # This case should be handled by get_llm_provider_settings raising ConfigurationError
-            # for empty GEMINI_API_KEY
-            raise MockConfigurationError("API key not found in settings.") 
+        names = os.listdir(_conversation_log_segments_dir(log_file_path))
+    except OSError:
+        return 1
+    archived_numbers = [int(name.split('.', 1)[0]) for name in names if name.split('.', 1)[0].isdigit()]
+    return max(archived_numbers, default=0) + 1
 
-        actual_model_name = override_model_name or settings.get('default_model_name')
-        if not actual_model_name:
-            # This case should be handled by get_llm_provider_settings (via load_api_config_settings)
-            # raising ConfigurationError if default_model_name is missing
-            raise MockConfigurationError("LLM model name not configured.")
+def _archive_conversation_log_segment(log_file_path: Path, segment_number: int, compress: bool):
+    segments_dir = _conversation_log_segments_dir(log_file_path)
+    segments_dir.mkdir(parents=True, exist_ok=True)
+    archived_path = segments_dir / f"{segment_number:05d}.md"
+    os.replace(log_file_path, archived_path)
+    if compress:
+        compressed_path = segments_dir / f"{segment_number:05d}.md.gz"
+        tmp_path = compressed_path.with_name(compressed_path.name + ".tmp")
+        with open(archived_path, 'rb') as src, gzip.open(tmp_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(tmp_path, compressed_path)
+        os.remove(archived_path)
 
-        actual_contents: Union[str, List[Content]] # type: ignore # For linters if Content not fully defined here
-        if contents is not None:
-            if isinstance(contents, str):
-                try:
-                    # Attempt to parse as JSON representing List[Content-like dicts]
-                    # The dict structure should be like: {"role": "user", "parts": [{"text": "Hello"}]}
-                    parsed_json_contents = json.loads(contents)
-                    if isinstance(parsed_json_contents, list):
-                        # The Gemini SDK can often take a list of dicts directly for `contents`
-                        # if they match the expected structure.
-                        actual_contents = parsed_json_contents 
-                    else:
-                        # Not a list, treat as a single string prompt.
-                        actual_contents = contents 
-                except json.JSONDecodeError:
-                    # Not a valid JSON string, treat as a single string prompt.
-                    actual_contents = contents
-            else:
-                # `contents` is already not a string (e.g., perhaps List[Content] if called internally)
-                actual_contents = contents # type: ignore
-        elif prompt_text is not None:
-            actual_contents = prompt_text
-        else:
-            raise ValueError("Either 'prompt_text' or 'contents' must be provided.")
-
-                
-        # Log User Prompt
-        if log_file_path:
-            content_for_this_user_log_entry = ""
-            if isinstance(actual_contents, list) and actual_contents:
-                # The last item in the history is the current user's input (or the initial prime)
-                last_message = actual_contents[-1]
-                if isinstance(last_message, dict) and last_message.get("role") == "user":
-                    parts_data = last_message.get("parts", [])
-                    text_from_parts = []
-                    for part in parts_data:
-                        if isinstance(part, dict) and "text" in part:
-                            text_from_parts.append(part["text"])
-                        elif isinstance(part, str): # If parts can be just strings (less likely for Gemini standard)
-                            text_from_parts.append(part)
-                    content_for_this_user_log_entry = "\n".join(text_from_parts)
-                else:
-                    # Fallback: Should not happen if history is built correctly by gouai.py chat
-                    content_for_this_user_log_entry = "[Error: Could not extract last user message for log]"
-            elif isinstance(actual_contents, str):
-                # If actual_contents is just a string (e.g., first prime before being wrapped in dict)
-                content_for_this_user_log_entry = actual_contents
-            else:
-                content_for_this_user_log_entry = "[Error: Invalid format for actual_contents_for_api for logging]"
+class _OpenLogFile:
+    """An append handle plus what the writer tracks about the file: its size, segment number and last turn date."""
+    __slots__ = ('handle', 'size', 'segment', 'last_turn_date', 'fsync_policy')
 
-            _append_turn_to_llm_log(
-                log_file_path, 
-                "User", 
-                content_for_this_user_log_entry, # Log only the current user/system message
-                model_name_for_session=actual_model_name,
-                session_id_for_session=session_id,
-                task_id_for_session=task_id
-            )
+    def __init__(self, handle, size: int):
+        self.handle = handle
+        self.size = size
+        self.fsync_policy = "none" # Of the last turn written to the file
+        self.segment: Optional[int] = None # Set, with last_turn_date, on the first conversation turn written
+        self.last_turn_date: Optional[str] = None
 
-        response_iterator = _call_gemini_api(
-            model_name=actual_model_name,
-            api_key=api_key,
-            contents=actual_contents, # LLM gets full history
-            # ... other params
-        )
-        # ... rest of the function (iterating response_iterator, logging Assistant turn) ...
+class _LLMLogWriter:
+    def __init__(self):
+        self._reset()
 
-        # --- Call the internal API function ---
-        response_iterator = _call_gemini_api(
-            model_name=actual_model_name,
-            api_key=api_key,
-            contents=actual_contents,
-            generation_config_params=override_generation_config,
-            safety_settings_params=override_safety_settings,
-            tools=override_tools
-        )
+    def _reset(self):
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._handles: Dict[Path, _OpenLogFile] = {} # Insertion order doubles as LRU order
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._write_lock = threading.Lock() # Serializes write_now() callers
 
-        # --- Process and yield stream, then log assistant response ---
-        accumulated_text_response = ""
-        accumulated_parts_response: List[Part] = []
-        
-        final_summary_data: Optional[Dict[str, Any]] = None
-        error_data: Optional[Dict[str, Any]] = None
-        
-        assistant_turn_metadata = {}
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="gouai-llm-log-writer", daemon=True)
+                self._thread.start()
 
-        for chunk_dict in response_iterator:
-            if chunk_dict.get('is_error'):
-                error_data = chunk_dict # Store error and stop processing normal chunks
-                # Error is already logged by _call_gemini_api before yielding this
-                yield chunk_dict # Forward the error chunk
-                break 
-            elif chunk_dict.get('is_final_summary'):
-                final_summary_data = chunk_dict # Store final summary
-                # Don't yield this immediately, it's for post-stream logging and aggregation
-                # but we need to make sure this doesn't get missed if no chunks were processed.
-                if final_summary_data.get('usage_metadata'):
-                    assistant_turn_metadata['usage_metadata'] = final_summary_data['usage_metadata']
-                if final_summary_data.get('prompt_feedback'):
-                     assistant_turn_metadata['prompt_feedback'] = final_summary_data['prompt_feedback']
-                continue # Don't yield the summary itself, the loop ends, then we log.
-            elif chunk_dict.get('is_chunk'):
-                yield chunk_dict # Yield the actual content chunk
-                accumulated_text_response += chunk_dict.get('text_chunk', '')
-                if chunk_dict.get('parts_chunk'):
-                    # This simple accumulation might not be ideal for all Part types,
-                    # but for text it's okay. For multimodal, caller might need raw parts_chunk.
-                    accumulated_parts_response.extend(chunk_dict.get('parts_chunk', []))
-                
-                # Capture finish_reason and safety_ratings from the last chunk processed,
-                # as these might be updated progressively by some models.
-                if chunk_dict.get('candidate_finish_reason'):
-                    assistant_turn_metadata['finish_reason'] = chunk_dict['candidate_finish_reason']
-                if chunk_dict.get('candidate_safety_ratings'):
-                    assistant_turn_metadata['safety_ratings'] = chunk_dict['candidate_safety_ratings']
-
-
-        # Log Assistant Response or Error
-        if log_file_path:
-            if error_data:
-                _append_turn_to_llm_log(
-                    log_file_path, "Assistant",
-                    f"Error during API call: {error_data.get('error')}\n"
-                    f"Original Exception: {error_data.get('original_exception_type')} - {error_data.get('original_exception_message')}"
-                )
-            elif accumulated_text_response or accumulated_parts_response or final_summary_data : # Log if there was any response
-                # For logging, use accumulated_text_response.
-                # If more complex content, one might choose to log a summary of accumulated_parts_response.
-                _append_turn_to_llm_log(
-                    log_file_path, "Assistant",
-                    accumulated_text_response if accumulated_text_response else "[No text content in response parts]",
-                    turn_metadata=assistant_turn_metadata
-                )
-            # If stream was empty and no error, and no final_summary_data with content, nothing may be logged for assistant.
+    def submit(self, log_file_path: Path, header: str, turn_entry: str, turn_info: Optional[Dict[str, Any]] = None,
+               log_settings: _ConversationLogSettings = _DEFAULT_CONVERSATION_LOG_SETTINGS):
+        """Queues an append. turn_info (timestamp, role, session_id) marks a conversation turn to rotate and index."""
+        self._ensure_started()
+        self._queue.put(('turn', log_file_path, header, turn_entry, turn_info, log_settings))
 
-    except ConfigurationError as e: # Or your actual ConfigurationError
-        _log_error_to_project(f"Configuration error in generate_response_stream for task {task_id}: {e}", e)
-        # Yield an error structure if the function is expected to always yield
-        yield {'error': str(e), 'is_error': True, 'is_configuration_error': True}
-        # And/or re-raise
-        raise
-    except LLMAPICallError: # Already logged by _call_gemini_api if it raised this
-        # This function might have yielded an error dict already from _call_gemini_api
-        # Re-raise to indicate failure to the caller of generate_response_stream
-        raise
-    except ValueError as e: # e.g. if prompt_text and contents are both None
-        _log_error_to_project(f"ValueError in generate_response_stream for task {task_id}: {e}", e)
-        yield {'error': str(e), 'is_error': True, 'is_value_error': True}
-        raise
-    except Exception as e: # Catch-all for other unexpected issues in this function
-        _log_error_to_project(f"Unexpected error in generate_response_stream for task {task_id}: {e}", e)
-        yield {'error': str(e), 'is_error': True, 'is_unexpected_error': True}
-        raise
+    def write_now(self, log_file_path: Path, header: str, turn_entry: str, turn_info: Optional[Dict[str, Any]] = None,
+                  log_settings: _ConversationLogSettings = _DEFAULT_CONVERSATION_LOG_SETTINGS):
+        """Synchronous append through the same rotation / indexing code; no handle stays open afterwards."""
+        with self._write_lock:
+            self._write_batch([('turn', log_file_path, header, turn_entry, turn_info, log_settings), ('stop', threading.Event())])
 
-def generate_response_aggregated(
-    project_root: Optional[str],
-    session_id: str,
-    task_id: str,
-    prompt_text: Optional[str] = None,
-    contents: Optional[Union[str, List[Content]]] = None,
-    override_model_name: Optional[str] = None,
-    override_generation_config: Optional[Dict[str, Any]] = None,
-    override_safety_settings: Optional[List[Dict[str, Any]]] = None,
-    override_tools: Optional[List[Any]] = None
-) -> Dict[str, Any]:
-    """
-    Public function that calls generate_response_stream and aggregates the
-    chunks into a single response dictionary.
-    """
-    full_text_response = []
-    # For simplicity, we'll just aggregate text. A more complex aggregation
-    # might reconstruct a List[Part] or handle multimodal outputs differently.
-    # The last seen 'parts_chunk' from the stream could be returned, or all parts aggregated.
-    
-    final_response_data = {
-        'text': "",
-        'usage_metadata': None,
-        'prompt_feedback': None,
-        'finish_reason': None,
-        'safety_ratings': None,
-        'error_info': None # To store any error encountered
-    }
+    def _send_marker(self, kind: str, timeout: Optional[float]) -> bool:
+        if self._thread is None or not self._thread.is_alive():
+            return True
+        done = threading.Event()
+        self._queue.put((kind, done))
+        return done.wait(timeout)
 
-    try:
-        stream_iterator = generate_response_stream(
-            project_root=project_root,
-            session_id=session_id,
-            task_id=task_id,
-            prompt_text=prompt_text,
-            contents=contents,
-            override_model_name=override_model_name,
-            override_generation_config=override_generation_config,
-            override_safety_settings=override_safety_settings,
-            override_tools=override_tools
-        )
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until every turn queued so far is written and flushed. Returns False on timeout."""
+        return self._send_marker('flush', timeout)
 
-        for chunk in stream_iterator:
-            if chunk.get('is_error'):
-                final_response_data['error_info'] = {
-                    'message': chunk.get('error'),
-                    'type': chunk.get('original_exception_type') or ('ConfigurationError' if chunk.get('is_configuration_error') else 'ValueError' if chunk.get('is_value_error') else 'LLMProcessingError'),
-                    'details': chunk.get('original_exception_message')
-                }
-                # If an error occurs, we might not get further valid data or summary.
-                # The error would have been logged by generate_response_stream or _call_gemini_api.
-                break # Stop aggregation on error
-
-            if chunk.get('is_chunk'):
-                full_text_response.append(chunk.get('text_chunk', ''))
-                # These might be overwritten by later chunks, which is usually fine for streaming
-                if chunk.get('candidate_finish_reason'):
-                    final_response_data['finish_reason'] = chunk.get('candidate_finish_reason')
-                if chunk.get('candidate_safety_ratings'):
-                    final_response_data['safety_ratings'] = chunk.get('candidate_safety_ratings')
-            
-            # The final summary from _call_gemini_api (usage_metadata, prompt_feedback)
-            # is handled by generate_response_stream for logging purposes.
-            # Here we just reconstruct the main parts for the aggregated response.
-            # The internal _call_gemini_api yields 'is_final_summary' which generate_response_stream consumes.
-            # For generate_response_aggregated, the key is the accumulated content and final state.
-            # The final_summary_data is captured by generate_response_stream for logging the assistant turn.
-            # We need to get that info here too.
-            # Let's assume the last non-error, non-chunk item from _call_gemini_api's structure if it was yielded.
-            # However, `generate_response_stream` consumes the final_summary for logging.
-            # This means `generate_response_aggregated` needs to reconstruct it from the assistant log turn,
-            # or `generate_response_stream` needs to return it.
-            # For simplicity, we'll rely on the last chunk's info for finish_reason/safety and
-            # acknowledge that usage_metadata and prompt_feedback are logged but might be harder
-            # to pass cleanly to this aggregated function without changing generate_response_stream's yield.
-
-            # Simpler: generate_response_stream's logging helper captures the usage_metadata.
-            # If this aggregated function needs it, it should be part of the contract of what
-            # generate_response_stream yields, OR this function needs to re-parse the log (bad).
-
-            # Let's refine: generate_response_stream should also yield the final_summary_data if available.
-            # (generate_response_stream was modified to capture final_summary_data in assistant_turn_metadata)
-            # For the aggregated response, we need to get this assistant_turn_metadata.
-            # This is tricky as generate_response_stream is a generator.
-            #
-            # The simplest path for generate_response_aggregated is to call the internal
-            # _call_gemini_api directly again for aggregation if strict separation is hard.
-            # OR, generate_response_stream can be designed to return a tuple: (iterator, function_to_get_summary_after_iteration)
-            # For now, let's assume that the *last values* of finish_reason and safety_ratings are sufficient
-            # and usage_metadata/prompt_feedback will be available in the log.
-            # This is a simplification for the aggregated return.
-            # A more robust solution might involve generate_response_stream returning more comprehensive final data.
+    def close(self, timeout: Optional[float] = _LOG_WRITER_EXIT_TIMEOUT_S):
+        """Writes everything queued, closes all handles and stops the thread (it restarts on the next submit)."""
+        if self._send_marker('stop', timeout) and self._thread is not None:
+            self._thread.join(timeout)
 
-        final_response_data['text'] = "".join(full_text_response)
-        
-        # If no specific error was caught and yielded by the stream,
-        # but the text is empty and there was no clear finish reason,
-        # it might indicate a silent block or empty response.
-        if not final_response_data['error_info'] and not final_response_data['text'] and not final_response_data['finish_reason']:
-            # Check if prompt was blocked (this info is in final_summary_data, which is tricky to get here)
-            # For now, this is a basic check.
-            # If prompt_feedback had a block_reason, that would be the real cause.
-            # This aggregated function is simplified regarding final metadata.
-            pass
+    @staticmethod
+    def _is_current(log_file_path: Path, handle) -> bool:
+        """False once the file was removed or replaced behind our back (then it is reopened)."""
+        try:
+            return os.stat(log_file_path).st_ino == os.fstat(handle.fileno()).st_ino
+        except (OSError, ValueError):
+            return False
 
+    def _handle(self, log_file_path: Path, header: str, log_settings: _ConversationLogSettings) -> _OpenLogFile:
+        open_log = self._handles.pop(log_file_path, None)
+        if open_log is not None and not self._is_current(log_file_path, open_log.handle):
+            open_log.handle.close()
+            open_log = None
+        if open_log is None:
+            is_new_file = not log_file_path.exists()
+            if is_new_file:
+                log_file_path.parent.mkdir(parents=True, exist_ok=True)
+            handle = open(log_file_path, "ab")
+            if is_new_file and header:
+                handle.write(header.encode('utf-8'))
+                handle.flush()
+            open_log = _OpenLogFile(handle, os.fstat(handle.fileno()).st_size)
+            while len(self._handles) >= log_settings.max_open_files:
+                evicted_path = next(iter(self._handles))
+                self._close(evicted_path, self._handles.pop(evicted_path))
+        open_log.fsync_policy = log_settings.fsync_policy
+        self._handles[log_file_path] = open_log
+        return open_log
 
-    except LLMAPICallError as e:
-        final_response_data['error_info'] = {
-            'message': str(e),
-            'type': type(e.original_exception).__name__ if e.original_exception else "LLMAPICallError",
-            'details': str(e.original_exception) if e.original_exception else str(e)
-        }
-    except MockConfigurationError as e: # Or your actual ConfigurationError
-         final_response_data['error_info'] = {
-            'message': str(e),
-            'type': "ConfigurationError"
-        }
-    except ValueError as e:
-         final_response_data['error_info'] = {
-            'message': str(e),
-            'type': "ValueError"
-        }
-    except Exception as e: # Catch-all
-        final_response_data['error_info'] = {
-            'message': str(e),
-            'type': type(e).__name__
-        }
-        _log_error_to_project(f"Unexpected error in generate_response_aggregated for task {task_id}: {e}", e)
+    def _sync(self, log_file_path: Path, open_log: _OpenLogFile):
+        handle = open_log.handle
+        if handle.closed: # Evicted (and so flushed) earlier in this batch
+            return
+        try:
+            handle.flush()
+            if open_log.fsync_policy != "none":
+                os.fsync(handle.fileno())
+        except (OSError, ValueError) as e:
+            _log_error_to_project(f"IOError flushing LLM log '{log_file_path}': {e}", e)
+            self._handles.pop(log_file_path, None)
 
-    # How to get usage_metadata and prompt_feedback here reliably after stream consumption?
-    # The `assistant_turn_metadata` in `generate_response_stream` holds it before logging.
-    # `generate_response_stream` would need to return this info *after* the stream is done.
-    # This is a structural challenge for generators.
-    # For MVP, `generate_response_aggregated` might not include rich `usage_metadata` or `prompt_feedback`
-    # in its direct return, and users would refer to the log file for that detail.
-    # Or, the primary use case is streaming, and aggregation is a simple utility.
+    def _close(self, log_file_path: Path, open_log: _OpenLogFile):
+        self._sync(log_file_path, open_log)
+        open_log.handle.close()
 
-    # To improve: One could pass a list to generate_response_stream to populate with final metadata.
-    # e.g., final_metadata_capture = []
-    # for chunk in generate_response_stream(..., final_metadata_out=final_metadata_capture):
-    # if final_metadata_capture: update final_response_data
+    def _load_segment_state(self, log_file_path: Path, open_log: _OpenLogFile):
+        """Active segment number, and the date of its last indexed turn (for daily rotation)."""
+        open_log.segment = _active_segment_number(log_file_path)
+        index_path = _conversation_log_index_path(log_file_path)
+        if index_path in self._handles:
+            self._handles[index_path].handle.flush()
+        last_records = _read_log_index(index_path, 1) if index_path.exists() else []
+        if last_records and last_records[-1].get('segment') == open_log.segment:
+            open_log.last_turn_date = str(last_records[-1].get('timestamp', ""))[:10]
+
+    @staticmethod
+    def _needs_rotation(open_log: _OpenLogFile, turn_date: str, log_settings: _ConversationLogSettings) -> bool:
+        if log_settings.max_segment_bytes and open_log.size >= log_settings.max_segment_bytes:
+            return True
+        return log_settings.rotate_daily and open_log.last_turn_date is not None and open_log.last_turn_date != turn_date
+
+    def _write_item(self, log_file_path: Path, header: str, turn_entry: str, turn_info: Optional[Dict[str, Any]],
+                    log_settings: _ConversationLogSettings) -> List[tuple]:
+        """Appends one entry (rotating and indexing conversation turns). Returns the (path, _OpenLogFile) pairs written to."""
+        open_log = self._handle(log_file_path, header, log_settings)
+        if turn_info is not None:
+            if open_log.segment is None:
+                self._load_segment_state(log_file_path, open_log)
+            turn_date = str(turn_info.get('timestamp', ""))[:10]
+            if self._needs_rotation(open_log, turn_date, log_settings):
+                segment_number = open_log.segment
+                self._close(log_file_path, self._handles.pop(log_file_path))
+                _archive_conversation_log_segment(log_file_path, segment_number, log_settings.compress_segments)
+                open_log = self._handle(log_file_path, header, log_settings)
+                open_log.segment = segment_number + 1
+            open_log.last_turn_date = turn_date
+
+        entry_bytes = turn_entry.encode('utf-8')
+        offset = open_log.size
+        open_log.handle.write(entry_bytes)
+        open_log.size += len(entry_bytes)
+        written = [(log_file_path, open_log)]
+
+        if turn_info is not None:
+            index_path = _conversation_log_index_path(log_file_path)
+            index_log = self._handle(index_path, "", log_settings)
+            index_record = {'segment': open_log.segment, 'offset': offset, 'length': len(entry_bytes), **turn_info}
+            index_bytes = (json.dumps(index_record, ensure_ascii=False, default=str) + "\n").encode('utf-8')
+            index_log.handle.write(index_bytes)
+            index_log.size += len(index_bytes)
+            written.append((index_path, index_log))
+        return written
+
+    def _write_batch(self, batch: List[tuple]) -> bool:
+        """Writes one batch. Returns True if the batch asked the thread to stop."""
+        touched: Dict[Path, _OpenLogFile] = {}
+        markers = []
+        for item in batch:
+            if item[0] != 'turn':
+                markers.append(item)
+                continue
+            _, log_file_path, header, turn_entry, turn_info, log_settings = item
+            try:
+                for written_path, open_log in self._write_item(log_file_path, header, turn_entry, turn_info, log_settings):
+                    if open_log.fsync_policy == "always":
+                        self._sync(written_path, open_log)
+                    else:
+                        touched[written_path] = open_log
+            except Exception as e:
+                _log_error_to_project(f"IOError appending to LLM log '{log_file_path}': {e}", e)
+                broken_log = self._handles.pop(log_file_path, None)
+                if broken_log is not None:
+                    broken_log.handle.close()
+        for log_file_path, open_log in touched.items():
+            self._sync(log_file_path, open_log)
+
+        stop = any(kind == 'stop' for kind, _ in markers)
+        if stop:
+            for open_log in self._handles.values():
+                open_log.handle.close()
+            self._handles.clear()
+        for _, done in markers:
+            done.set()
+        return stop
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < _LOG_WRITER_MAX_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if self._write_batch(batch):
+                return
+
+_LLM_LOG_WRITER = _LLMLogWriter()
+_SYNC_LOG_WRITER = _LLMLogWriter() # Same rotation and indexing for writes made inline (defer_write=False)
+atexit.register(_LLM_LOG_WRITER.close)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_LLM_LOG_WRITER._reset) # The writer thread does not survive fork
+
+def flush_llm_logs(timeout: Optional[float] = None) -> bool:
+    """Waits until every conversation-log turn queued so far has been written. Returns False on timeout."""
+    return _LLM_LOG_WRITER.flush(timeout)
+
+def _read_log_index(index_path: Path, last_n: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Index records, oldest first. With last_n, only the tail of the index file is read."""
+    with open(index_path, 'rb') as f:
+        if last_n is None:
+            data = f.read()
+        else:
+            end = f.seek(0, os.SEEK_END)
+            start, data = end, b""
+            while start > 0 and data.count(b"\n") <= last_n:
+                start = max(0, start - _LOG_INDEX_TAIL_BLOCK_BYTES)
+                f.seek(start)
+                data = f.read(end - start)
+            if start > 0:
+                data = data[data.index(b"\n") + 1:] # Drop the partial first line
+    records = []
+    for raw_line in data.splitlines():
+        try:
+            records.append(json.loads(raw_line))
+        except ValueError:
+            continue # A line still being written
+    return records[-last_n:] if last_n else records
+
+def _parse_unindexed_log(log_file_path: Path) -> List[Dict[str, Any]]:
+    """Turns of a log written before it had an index, found by their '### Role' / '**Timestamp:**' headings."""
+    try:
+        content = log_file_path.read_text(encoding='utf-8')
+    except OSError:
+        return []
+    turns = []
+    for block in re.split(r"(?m)^(?=### \w+\n\*\*Timestamp:\*\*)", content)[1:]:
+        heading, _, rest = block.partition("\n")
+        timestamp_match = re.match(r"\*\*Timestamp:\*\* (.*)", rest)
+        turns.append({
+            'role': heading[len("### "):].strip(),
+            'timestamp': timestamp_match.group(1).strip() if timestamp_match else None,
+            'session_id': None,
+            'segment': None,
+            'text': block
+        })
+    return turns
+
+def read_llm_log_turns(log_file_path: Union[str, Path], last_n: Optional[int] = None, session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Reads turns from a task's segmented conversation log, oldest first: the last N turns and/or one
+    session's turns. Each turn is {'role', 'timestamp', 'session_id', 'segment', 'text'} where 'text' is
+    the turn's markdown. Only the needed index lines and byte ranges are read.
+    """
+    log_file_path = Path(log_file_path)
+    flush_llm_logs() # Include turns still queued in this process
+    index_path = _conversation_log_index_path(log_file_path)
+    if not index_path.exists():
+        turns = [turn for turn in _parse_unindexed_log(log_file_path) if session_id is None or turn['session_id'] == session_id]
+        return turns[-last_n:] if last_n else turns
+
+    records = _read_log_index(index_path, last_n if session_id is None else None)
+    if session_id is not None:
+        records = [record for record in records if record.get('session_id') == session_id]
+        if last_n:
+            records = records[-last_n:]
+    active_segment = _active_segment_number(log_file_path)
+    segments_dir = _conversation_log_segments_dir(log_file_path)
+    decompressed_segments: Dict[int, bytes] = {}
+    turns = []
+    for record in records:
+        segment, offset, length = record.get('segment'), record.get('offset', 0), record.get('length', 0)
+        try:
+            if segment == active_segment or not (segments_dir / f"{segment:05d}.md.gz").exists():
+                segment_path = log_file_path if segment == active_segment else segments_dir / f"{segment:05d}.md"
+                with open(segment_path, 'rb') as f:
+                    f.seek(offset)
+                    entry_bytes = f.read(length)
+            else:
+                if segment not in decompressed_segments:
+                    with gzip.open(segments_dir / f"{segment:05d}.md.gz", 'rb') as f:
+                        decompressed_segments[segment] = f.read()
+                entry_bytes = decompressed_segments[segment][offset:offset + length]
+        except OSError as e:
+            _log_error_to_project(f"Could not read turn from LLM log segment {segment} of '{log_file_path}': {e}", e)
+            continue
+        turns.append({
+            'role': record.get('role'),
+            'timestamp': record.get('timestamp'),
+            'session_id': record.get('session_id'),
+            'segment': segment,
+            'text': entry_bytes.decode('utf-8', errors='replace')
+        })
+    return turns
+
+
+def _resolve_request_contents(
+    prompt_text: Optional[str],
+    contents: Optional[Union[str, List[Content]]]
+) -> Union[str, List[Any]]:
+    """
+    Resolves the 'contents' actually sent to the LLM from the public prompt_text/contents arguments.
+    A JSON string holding a list of Content-like dicts (e.g. {"role": "user", "parts": [{"text": "Hello"}]})
+    is decoded into that list; any other string is sent as a single prompt.
+    Raises ValueError if neither argument is provided.
+    """
+    if contents is not None:
+        if isinstance(contents, str):
+            try:
+                parsed_json_contents = json.loads(contents)
+            except json.JSONDecodeError:
+                return contents # Not a valid JSON string, treat as a single string prompt.
+            # The Gemini SDK can take a list of dicts directly for `contents` if they match the expected structure.
+            return parsed_json_contents if isinstance(parsed_json_contents, list) else contents
+        return contents # Already structured (e.g. List[Content] or the chat history list of dicts)
+    if prompt_text is not None:
+        return prompt_text
+    raise ValueError("Either 'prompt_text' or 'contents' must be provided.")
+
+def _user_turn_text_for_log(actual_contents: Union[str, List[Any]]) -> str:
+    """Extracts the text of the current user message (the last history item) for the conversation log."""
+    if isinstance(actual_contents, str):
+        # If actual_contents is just a string (e.g., first prime before being wrapped in dict)
+        return actual_contents
+    if isinstance(actual_contents, list) and actual_contents:
+        # The last item in the history is the current user's input (or the initial prime)
+        last_message = actual_contents[-1]
+        if isinstance(last_message, dict) and last_message.get("role") == "user":
+            text_from_parts = []
+            for part in last_message.get("parts", []):
+                if isinstance(part, dict) and "text" in part:
+                    text_from_parts.append(part["text"])
+                elif isinstance(part, str): # If parts can be just strings (less likely for Gemini standard)
+                    text_from_parts.append(part)
+            return "\n".join(text_from_parts)
+        # Fallback: Should not happen if history is built correctly by gouai.py chat
+        return "[Error: Could not extract last user message for log]"
+    return "[Error: Invalid format for actual_contents_for_api for logging]"
+
+
+# --- Content-Addressed Response Cache (opt-in) ---
+# Enabled through the 'response_cache' mapping in .gouai_config.yaml, e.g.:
+#   response_cache:
+#     enabled: true
+#     location: project   # 'project' -> <project_root>/.gouai/cache/responses, 'user' -> ~/.gouai/cache/responses
+#     directory: null     # Optional explicit cache directory (overrides 'location')
+#     max_size_mb: 256    # Least recently used entries are evicted beyond this size
+#     ttl_hours: 168      # Older entries are treated as misses and removed
+# Callers can bypass it per call with cache_policy="off" or force a fresh call with cache_policy="refresh".
+CACHE_POLICY_OFF = "off"
+CACHE_POLICY_REFRESH = "refresh"
+_RESPONSE_CACHE_DEFAULT_MAX_SIZE_MB = 256
+_RESPONSE_CACHE_DEFAULT_TTL_HOURS = 168
+_RESPONSE_CACHES: Dict[str, "_ResponseCache"] = {}
+_RESPONSE_CACHES_LOCK = threading.Lock()
+
+def _normalize_contents_for_key(actual_contents: Union[str, List[Any]]) -> List[Any]:
+    """Normalizes contents to a JSON-compatible list of {'role', 'parts'} dicts for hashing."""
+    if isinstance(actual_contents, str):
+        return [{'role': 'user', 'parts': [{'text': actual_contents}]}]
+    normalized = []
+    for item in actual_contents:
+        if hasattr(item, 'model_dump'): # SDK Content/Part objects
+            item = item.model_dump(mode='json', exclude_none=True)
+        elif isinstance(item, str):
+            item = {'role': 'user', 'parts': [{'text': item}]}
+        normalized.append(item)
+    return normalized
+
+def _compute_request_key(
+    model_name: str,
+    actual_contents: Union[str, List[Any]],
+    generation_config_params: Optional[Dict[str, Any]] = None,
+    safety_settings_params: Optional[List[Dict[str, Any]]] = None
+) -> str:
+    """Returns a stable SHA-256 hex digest identifying an LLM request."""
+    request_identity = {
+        'model': model_name,
+        'contents': _normalize_contents_for_key(actual_contents),
+        'generation_config': generation_config_params or {},
+        'safety_settings': safety_settings_params or [],
+    }
+    canonical = json.dumps(request_identity, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+class _ResponseCache:
+    """
+    One JSON file per entry, sharded by key prefix. An entry's mtime is its last access time
+    (touched on every hit), which drives LRU eviction once the directory exceeds max_bytes.
+    The directory's size is kept as a running total (seeded by one scan, updated on every write
+    and removal), so it is only rescanned when that total passes max_bytes. Entries written by
+    other processes are counted from the next rescan.
+    """
+    def __init__(self, directory: Path, max_bytes: int, ttl_seconds: float):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._total_bytes = sum(size for _, size, _ in self._scan_entries())
+
+    def _entry_path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def _scan_entries(self) -> List[tuple]:
+        """(mtime, size, path) of every entry on disk."""
+        entries = []
+        for entry_path in self.directory.glob("*/*.json"):
+            try:
+                stat_result = entry_path.stat()
+            except OSError:
+                continue
+            entries.append((stat_result.st_mtime, stat_result.st_size, entry_path))
+        return entries
+
+    @staticmethod
+    def _file_size(path: Path) -> int:
+        try:
+            return path.stat().st_size
+        except OSError:
+            return 0
+
+    def _remove(self, entry_path: Path):
+        size = self._file_size(entry_path)
+        try:
+            entry_path.unlink()
+        except OSError:
+            return
+        with self._lock:
+            self._total_bytes -= size
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry.get('created_at', 0) > self.ttl_seconds:
+            self._remove(entry_path)
+            return None
+        try:
+            os.utime(entry_path, None) # Mark as recently used
+        except OSError:
+            pass
+        return entry.get('response')
+
+    def put(self, key: str, response: Dict[str, Any], model_name: str):
+        entry_path = self._entry_path(key)
+        entry = {'key': key, 'model': model_name, 'created_at': time.time(), 'response': response}
+        try:
+            entry_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = entry_path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False, default=str)
+            new_size = self._file_size(tmp_path)
+            replaced_size = self._file_size(entry_path) # Same key written again
+            os.replace(tmp_path, entry_path) # Atomic: readers never see a partial entry
+        except (OSError, TypeError, ValueError) as e:
+            _log_error_to_project(f"Could not write LLM response cache entry '{entry_path}': {e}", e)
+            return
+        with self._lock:
+            self._total_bytes += new_size - replaced_size
+        self._evict_if_needed()
+
+    def _evict_if_needed(self):
+        with self._lock:
+            if self._total_bytes <= self.max_bytes:
+                return
+            entries = self._scan_entries() # Also counts entries written or removed by other processes
+            self._total_bytes = sum(size for _, size, _ in entries)
+            if self._total_bytes <= self.max_bytes:
+                return
+            low_watermark = self.max_bytes * 0.9 # Evict a little extra so the next writes don't rescan right away
+            for _, size, entry_path in sorted(entries):
+                try:
+                    entry_path.unlink()
+                except FileNotFoundError:
+                    pass # Already removed, e.g. by another process
+                except OSError:
+                    continue
+                self._total_bytes -= size
+                if self._total_bytes <= low_watermark:
+                    break
+
+def _get_response_cache(settings: Dict[str, Any], project_root: Optional[str]) -> Optional[_ResponseCache]:
+    """Returns the configured response cache, or None when caching is not enabled."""
+    cache_config = settings.get('response_cache')
+    if not isinstance(cache_config, dict) or not cache_config.get('enabled'):
+        return None
+    if cache_config.get('directory'):
+        cache_dir = Path(cache_config['directory']).expanduser()
+    elif cache_config.get('location', 'project') == 'project' and project_root:
+        cache_dir = Path(project_root).resolve() / ".gouai" / "cache" / "responses"
+    else:
+        cache_dir = _get_user_config_file_path().parent / "cache" / "responses"
+    cache_dir = cache_dir.resolve()
+    with _RESPONSE_CACHES_LOCK:
+        cache = _RESPONSE_CACHES.get(str(cache_dir))
+        if cache is None:
+            max_size_mb = float(cache_config.get('max_size_mb', _RESPONSE_CACHE_DEFAULT_MAX_SIZE_MB))
+            ttl_hours = float(cache_config.get('ttl_hours', _RESPONSE_CACHE_DEFAULT_TTL_HOURS))
+            cache = _ResponseCache(cache_dir, int(max_size_mb * 1024 * 1024), ttl_hours * 3600.0)
+            _RESPONSE_CACHES[str(cache_dir)] = cache
+    return cache
+
+
+# --- Pluggable LLM Backends ---
+# Selected with 'llm_backend' in .gouai_config.yaml (default: gemini), e.g. for a local llama.cpp / vLLM server:
+#   default_model_name: qwen2.5-7b-instruct
+#   llm_backend: openai_compatible
+#   openai_compatible:
+#     base_url: http://localhost:8080/v1
+#     api_key_env: LOCAL_LLM_API_KEY   # Optional; sent as a Bearer token when set
+#     timeout_s: 300
+# or for deterministic, offline runs (tests, benchmarks):
+#   llm_backend: fake
+#   fake_backend:
+#     response_text: "..."             # Optional fixed reply; default echoes the request
+#     chunk_chars: 32
+#     chunk_delay_ms: 0
+# Every backend yields the same dicts as _call_gemini_api: 'is_chunk' dicts, one 'is_final_summary'
+# dict, and on failure an 'is_error' dict followed by LLMAPICallError.
+DEFAULT_LLM_BACKEND = "gemini"
+_OPENAI_COMPATIBLE_DEFAULT_BASE_URL = "http://localhost:8080/v1"
+
+class LLMBackend:
+    """Base class for LLM backends. Subclasses implement stream(); astream() defaults to running it off-loop."""
+    name = "base"
+    requires_gemini_api_key = False
+
+    def stream(
+        self,
+        model_name: str,
+        api_key: Optional[str],
+        contents: Union[str, List[Content]],
+        generation_config_params: Optional[Dict[str, Any]],
+        safety_settings_params: Optional[List[Dict[str, Any]]],
+        tools: Optional[List[Any]],
+        settings: Dict[str, Any]
+    ) -> Iterable[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def create_prefix_cache(
+        self,
+        model_name: str,
+        api_key: Optional[str],
+        prefix_contents: List[Dict[str, Any]],
+        ttl_s: float,
+        settings: Dict[str, Any]
+    ) -> Optional[str]:
+        """
+        Registers prefix_contents with the provider's context cache and returns a handle that stream()
+        receives as generation_config_params['cached_content']. None: no caching, contents stay inline.
+        """
+        return None
+
+    async def astream(self, *args, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        iterator = iter(self.stream(*args, **kwargs))
+        sentinel = object()
+        while True:
+            item = await asyncio.to_thread(next, iterator, sentinel)
+            if item is sentinel:
+                return
+            yield item
+
+class GeminiBackend(LLMBackend):
+    name = "gemini"
+    requires_gemini_api_key = True
+
+    def stream(self, model_name, api_key, contents, generation_config_params, safety_settings_params, tools, settings):
+        return _call_gemini_api(
+            model_name=model_name, api_key=api_key, contents=contents,
+            generation_config_params=generation_config_params, safety_settings_params=safety_settings_params,
+            tools=tools, http_options=settings.get('http_options')
+        )
+
+    def astream(self, model_name, api_key, contents, generation_config_params, safety_settings_params, tools, settings):
+        return _acall_gemini_api(
+            model_name=model_name, api_key=api_key, contents=contents,
+            generation_config_params=generation_config_params, safety_settings_params=safety_settings_params,
+            tools=tools, http_options=settings.get('http_options')
+        )
+
+    def create_prefix_cache(self, model_name, api_key, prefix_contents, ttl_s, settings):
+        client = _get_pooled_client(api_key, settings.get('http_options'))
+        cached_content = client.caches.create(
+            model=model_name,
+            config=types.CreateCachedContentConfig(contents=prefix_contents, ttl=f"{int(ttl_s)}s")
+        )
+        return cached_content.name
+
+class FakeBackend(LLMBackend):
+    """Deterministic in-process backend: the same request always produces the same stream."""
+    name = "fake"
+
+    def __init__(self):
+        self.prefix_caches: Dict[str, List[Dict[str, Any]]] = {} # Local stand-in for a provider context cache
+
+    def create_prefix_cache(self, model_name, api_key, prefix_contents, ttl_s, settings):
+        handle = f"fake-cache/{_compute_request_key(model_name, prefix_contents)[:16]}"
+        self.prefix_caches[handle] = prefix_contents
+        return handle
+
+    def _response_text(self, model_name: str, contents: Union[str, List[Content]], fake_settings: Dict[str, Any]) -> str:
+        if fake_settings.get('response_text') is not None:
+            return str(fake_settings['response_text'])
+        last_user_text = _user_turn_text_for_log(_normalize_contents_for_key(contents))
+        request_digest = _compute_request_key(model_name, contents)[:12]
+        return f"[fake:{model_name}:{request_digest}] {last_user_text[:200]}"
+
+    def stream(self, model_name, api_key, contents, generation_config_params, safety_settings_params, tools, settings):
+        cached_content = (generation_config_params or {}).get('cached_content')
+        if cached_content:
+            if cached_content not in self.prefix_caches:
+                e = KeyError(f"Cached content '{cached_content}' not found (expired or deleted)")
+                yield _gemini_error_chunk(f"Fake backend call failed: {e}", e)
+                raise LLMAPICallError(message=f"Fake backend call failed: {e}", original_exception=e)
+            contents = self.prefix_caches[cached_content] + _normalize_contents_for_key(contents)
+        fake_settings = settings.get('fake_backend') or {}
+        chunk_chars = max(1, int(fake_settings.get('chunk_chars', 32)))
+        chunk_delay_s = float(fake_settings.get('chunk_delay_ms', 0)) / 1000.0
+        response_text = self._response_text(model_name, contents, fake_settings)
+        pieces = [response_text[i:i + chunk_chars] for i in range(0, len(response_text), chunk_chars)] or [""]
+        for index, piece in enumerate(pieces):
+            if chunk_delay_s:
+                time.sleep(chunk_delay_s)
+            yield {
+                'text_chunk': piece,
+                'parts_chunk': [types.Part(text=piece)],
+                'candidate_finish_reason': "STOP" if index == len(pieces) - 1 else None,
+                'candidate_safety_ratings': [],
+                'is_chunk': True
+            }
+        prompt_tokens = _estimate_request_tokens(contents)
+        candidates_tokens = max(1, len(response_text) // _CHARS_PER_TOKEN_ESTIMATE)
+        yield {
+            'usage_metadata': {
+                'prompt_token_count': prompt_tokens,
+                'candidates_token_count': candidates_tokens,
+                'total_token_count': prompt_tokens + candidates_tokens
+            },
+            'prompt_feedback': None,
+            'is_final_summary': True
+        }
+
+class OpenAICompatibleHTTPError(Exception):
+    def __init__(self, status: int, body: str):
+        super().__init__(f"HTTP {status}: {body}")
+        self.code = status
+
+class OpenAICompatibleBackend(LLMBackend):
+    """
+    Streams from any server implementing POST {base_url}/chat/completions with stream=true
+    (llama.cpp server, vLLM, Ollama, LM Studio, ...). Uses only the standard library; finished
+    keep-alive connections go back to a small idle pool shared by all threads.
+    """
+    name = "openai_compatible"
+
+    def __init__(self):
+        self._idle_connections: Dict[tuple, List[http.client.HTTPConnection]] = {}
+        self._idle_lock = threading.Lock()
+
+    def _take_connection(self, parsed_url, timeout_s: float) -> tuple[http.client.HTTPConnection, bool]:
+        """Returns (connection, reused)."""
+        connection_key = (parsed_url.scheme, parsed_url.netloc, timeout_s)
+        with self._idle_lock:
+            idle = self._idle_connections.get(connection_key)
+            if idle:
+                return idle.pop(), True
+        return self._new_connection(parsed_url, timeout_s), False
+
+    @staticmethod
+    def _new_connection(parsed_url, timeout_s: float) -> http.client.HTTPConnection:
+        connection_class = http.client.HTTPSConnection if parsed_url.scheme == 'https' else http.client.HTTPConnection
+        return connection_class(parsed_url.netloc, timeout=timeout_s)
+
+    def _return_connection(self, parsed_url, timeout_s: float, connection: http.client.HTTPConnection):
+        with self._idle_lock:
+            self._idle_connections.setdefault((parsed_url.scheme, parsed_url.netloc, timeout_s), []).append(connection)
+
+    @staticmethod
+    def _messages(contents: Union[str, List[Content]]) -> List[Dict[str, str]]:
+        messages = []
+        for content_item in _normalize_contents_for_key(contents):
+            role = content_item.get('role') or 'user'
+            text = "".join(
+                part['text'] if isinstance(part, dict) and isinstance(part.get('text'), str) else (part if isinstance(part, str) else "")
+                for part in content_item.get('parts', [])
+            )
+            messages.append({'role': 'assistant' if role == 'model' else role, 'content': text})
+        return messages
+
+    @staticmethod
+    def _request_body(model_name: str, contents, generation_config_params: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        body: Dict[str, Any] = {
+            'model': model_name,
+            'messages': OpenAICompatibleBackend._messages(contents),
+            'stream': True,
+            'stream_options': {'include_usage': True}
+        }
+        generation_config_params = generation_config_params or {}
+        for gemini_name, openai_name in (('temperature', 'temperature'), ('top_p', 'top_p'),
+                                         ('max_output_tokens', 'max_tokens'), ('stop_sequences', 'stop'),
+                                         ('seed', 'seed')):
+            if generation_config_params.get(gemini_name) is not None:
+                body[openai_name] = generation_config_params[gemini_name]
+        return body
+
+    def stream(self, model_name, api_key, contents, generation_config_params, safety_settings_params, tools, settings):
+        backend_settings = settings.get('openai_compatible') or {}
+        base_url = str(backend_settings.get('base_url') or _OPENAI_COMPATIBLE_DEFAULT_BASE_URL).rstrip('/')
+        timeout_s = float(backend_settings.get('timeout_s', 300))
+        parsed_url = urllib.parse.urlsplit(base_url + "/chat/completions")
+        headers = {'Content-Type': 'application/json', 'Accept': 'text/event-stream'}
+        bearer_token = os.getenv(backend_settings['api_key_env']) if backend_settings.get('api_key_env') else None
+        if bearer_token:
+            headers['Authorization'] = f"Bearer {bearer_token}"
+        payload = json.dumps(self._request_body(model_name, contents, generation_config_params)).encode('utf-8')
+
+        connection = None
+        try:
+            connection, reused = self._take_connection(parsed_url, timeout_s)
+            try:
+                connection.request('POST', parsed_url.path, body=payload, headers=headers)
+                response = connection.getresponse()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                if not reused:
+                    raise
+                # The server closed our idle keep-alive connection; retry once on a fresh one.
+                connection.close()
+                connection = self._new_connection(parsed_url, timeout_s)
+                connection.request('POST', parsed_url.path, body=payload, headers=headers)
+                response = connection.getresponse()
+            if response.status != 200:
+                error_body = response.read().decode('utf-8', errors='replace')
+                raise OpenAICompatibleHTTPError(response.status, error_body[:500])
+
+            usage_metadata_dict = None
+            for raw_line in response:
+                line = raw_line.decode('utf-8', errors='replace').strip()
+                if not line.startswith('data:'):
+                    continue
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    break
+                event = json.loads(data)
+                if event.get('usage'):
+                    usage = event['usage']
+                    usage_metadata_dict = {
+                        'prompt_token_count': usage.get('prompt_tokens'),
+                        'candidates_token_count': usage.get('completion_tokens'),
+                        'total_token_count': usage.get('total_tokens')
+                    }
+                for choice in event.get('choices') or []:
+                    if choice.get('index', 0) != 0:
+                        continue
+                    text_chunk = (choice.get('delta') or {}).get('content') or ""
+                    finish_reason = choice.get('finish_reason')
+                    if not text_chunk and not finish_reason:
+                        continue
+                    yield {
+                        'text_chunk': text_chunk,
+                        'parts_chunk': [types.Part(text=text_chunk)] if text_chunk else [],
+                        'candidate_finish_reason': finish_reason.upper() if finish_reason else None,
+                        'candidate_safety_ratings': [],
+                        'is_chunk': True
+                    }
+            response.read() # Drain so the keep-alive connection can be reused
+            self._return_connection(parsed_url, timeout_s, connection)
+            connection = None
+            yield {'usage_metadata': usage_metadata_dict, 'prompt_feedback': None, 'is_final_summary': True}
+
+        except Exception as e:
+            error_message = f"OpenAI-compatible backend call to {base_url} failed: {type(e).__name__}: {e}"
+            _log_error_to_project(error_message, e)
+            yield _gemini_error_chunk(error_message, e)
+            raise LLMAPICallError(message=error_message, original_exception=e) from e
+        finally:
+            if connection is not None: # Failed or abandoned mid-stream: not safe to reuse
+                connection.close()
+
+_LLM_BACKENDS: Dict[str, LLMBackend] = {}
+
+def register_llm_backend(backend: LLMBackend):
+    """Makes a backend selectable through 'llm_backend: <backend.name>' in .gouai_config.yaml."""
+    _LLM_BACKENDS[backend.name] = backend
+
+for _backend in (GeminiBackend(), FakeBackend(), OpenAICompatibleBackend()):
+    register_llm_backend(_backend)
+
+def _get_llm_backend(settings: Optional[Dict[str, Any]]) -> LLMBackend:
+    backend_name = (settings or {}).get('llm_backend') or DEFAULT_LLM_BACKEND
+    backend = _LLM_BACKENDS.get(backend_name)
+    if backend is None:
+        raise ConfigurationError(
+            f"GOUAI Configuration Error: Unknown llm_backend '{backend_name}'. "
+            f"Available backends: {', '.join(sorted(_LLM_BACKENDS))}."
+        )
+    return backend
+
+
+# --- Retry, Deadline & Hedged-Request Policy ---
+# Configured with the 'retry_policy' mapping in .gouai_config.yaml (defaults shown):
+#   retry_policy:
+#     max_attempts: 3          # 1 disables retries
+#     initial_backoff_s: 1.0   # Exponential backoff with full jitter: sleep ~ U(0, min(max, initial * multiplier**n))
+#     backoff_multiplier: 2.0
+#     max_backoff_s: 20.0
+#     deadline_s: null         # Overall budget per call, retries included
+#     hedge: false             # Send a duplicate request if the first token is late
+#     hedge_after_s: null      # Fixed hedge threshold; default is the observed p95 time-to-first-token
+#     hedge_min_samples: 20    # TTFT samples needed before the p95 threshold is trusted
+# Only failures before the first streamed item are retried or hedged (429, 503, 504 and timeouts),
+# so a caller never sees duplicated text. Mid-stream failures surface as before.
+_RETRYABLE_STATUS_CODES = {429, 503, 504}
+_TTFT_SAMPLE_WINDOW = 200
+_TTFT_SAMPLES: Dict[tuple, deque] = {}
+_TTFT_SAMPLES_LOCK = threading.Lock()
+
+class LLMDeadlineExceeded(TimeoutError):
+    """Raised (wrapped in LLMAPICallError) when a call exceeds retry_policy.deadline_s."""
+
+class _LLMAttemptError(Exception):
+    """One failed attempt: the error dict its stream yielded plus the exception it raised."""
+    def __init__(self, error_chunk: Dict[str, Any], exception: LLMAPICallError):
+        super().__init__(str(exception))
+        self.error_chunk = error_chunk
+        self.exception = exception
+
+class _RetryPolicy:
+    def __init__(self, policy_config: Optional[Dict[str, Any]] = None):
+        policy_config = policy_config if isinstance(policy_config, dict) else {}
+        self.max_attempts = max(1, int(policy_config.get('max_attempts', 3)))
+        self.initial_backoff_s = float(policy_config.get('initial_backoff_s', 1.0))
+        self.backoff_multiplier = float(policy_config.get('backoff_multiplier', 2.0))
+        self.max_backoff_s = float(policy_config.get('max_backoff_s', 20.0))
+        self.deadline_s = float(policy_config['deadline_s']) if policy_config.get('deadline_s') else None
+        self.hedge = bool(policy_config.get('hedge', False))
+        self.hedge_after_s = float(policy_config['hedge_after_s']) if policy_config.get('hedge_after_s') else None
+        self.hedge_min_samples = int(policy_config.get('hedge_min_samples', 20))
+
+    def backoff_s(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_backoff_s, self.initial_backoff_s * self.backoff_multiplier ** (attempt - 1)))
+
+    def hedge_delay_s(self, ttft_samples: deque) -> Optional[float]:
+        if not self.hedge:
+            return None
+        if self.hedge_after_s:
+            return self.hedge_after_s
+        if len(ttft_samples) < self.hedge_min_samples:
+            return None
+        ordered = sorted(ttft_samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    @property
+    def needs_supervision(self) -> bool:
+        """Deadlines and hedging need attempts to run under a watcher (thread / task) rather than inline."""
+        return self.deadline_s is not None or self.hedge
+
+def _ttft_samples_for(backend_name: str, model_name: str) -> deque:
+    with _TTFT_SAMPLES_LOCK:
+        return _TTFT_SAMPLES.setdefault((backend_name, model_name), deque(maxlen=_TTFT_SAMPLE_WINDOW))
+
+def _is_retryable_llm_error(e: LLMAPICallError) -> bool:
+    original = e.original_exception
+    if original is None:
+        return False
+    if isinstance(original, (_api_core_exceptions.TooManyRequests, _api_core_exceptions.ResourceExhausted,
+                             _api_core_exceptions.ServiceUnavailable, _api_core_exceptions.DeadlineExceeded,
+                             TimeoutError, ConnectionError)):
+        return True
+    if type(original).__name__ in ('ReadTimeout', 'ConnectTimeout', 'PoolTimeout', 'WriteTimeout', 'TimeoutException'): # httpx
+        return True
+    try:
+        return int(getattr(original, 'code', None)) in _RETRYABLE_STATUS_CODES # google.genai.errors.APIError, HTTP errors
+    except (TypeError, ValueError):
+        return False
+
+def _deadline_error(policy: _RetryPolicy) -> _LLMAttemptError:
+    deadline_exception = LLMDeadlineExceeded(f"LLM call exceeded its {policy.deadline_s:g}s deadline.")
+    error_message = f"LLM call aborted: {deadline_exception}"
+    _log_error_to_project(error_message, deadline_exception)
+    return _LLMAttemptError(
+        _gemini_error_chunk(error_message, deadline_exception),
+        LLMAPICallError(message=error_message, original_exception=deadline_exception)
+    )
+
+def _attempt_error_from_exception(e: Exception, error_chunk: Optional[Dict[str, Any]] = None) -> _LLMAttemptError:
+    llm_error = e if isinstance(e, LLMAPICallError) else LLMAPICallError(message=str(e), original_exception=e)
+    return _LLMAttemptError(error_chunk or _gemini_error_chunk(str(llm_error), llm_error.original_exception or llm_error), llm_error)
+
+def _inline_first_item(backend: LLMBackend, call_args: tuple) -> tuple[Optional[Dict[str, Any]], Iterable[Dict[str, Any]]]:
+    """Runs one attempt in the caller's thread up to its first item. Raises _LLMAttemptError if it fails first."""
+    iterator = iter(backend.stream(*call_args))
+    try:
+        for item in iterator:
+            if item.get('is_error'):
+                try:
+                    next(iterator) # Backends raise right after yielding their error dict
+                except StopIteration:
+                    pass
+                except Exception as e:
+                    raise _attempt_error_from_exception(e, item) from e
+                raise _attempt_error_from_exception(LLMAPICallError(item.get('error') or "LLM call failed"), item)
+            return item, iterator
+    except _LLMAttemptError:
+        raise
+    except Exception as e:
+        raise _attempt_error_from_exception(e) from e
+    return None, iter(())
+
+class _SupervisedAttempt:
+    """Runs one backend stream on a daemon thread, pushing (attempt_id, kind, payload) events to a shared queue."""
+    def __init__(self, attempt_id: int, backend: LLMBackend, call_args: tuple, events: "queue.Queue"):
+        self.attempt_id = attempt_id
+        self.cancelled = threading.Event()
+        self._backend = backend
+        self._call_args = call_args
+        self._events = events
+        threading.Thread(target=self._run, name=f"gouai-llm-attempt-{attempt_id}", daemon=True).start()
+
+    def _run(self):
+        iterator = iter(self._backend.stream(*self._call_args))
+        try:
+            for item in iterator:
+                if self.cancelled.is_set():
+                    return
+                self._events.put((self.attempt_id, 'item', item))
+            self._events.put((self.attempt_id, 'done', None))
+        except Exception as e:
+            self._events.put((self.attempt_id, 'exception', e))
+        finally:
+            if self.cancelled.is_set() and hasattr(iterator, 'close'):
+                iterator.close()
+
+def _supervised_first_item(
+    backend: LLMBackend, call_args: tuple, policy: _RetryPolicy, ttft_samples: deque, deadline_at: Optional[float]
+) -> tuple[Optional[Dict[str, Any]], Iterable[Dict[str, Any]]]:
+    """
+    Like _inline_first_item, but enforces the deadline and, if configured, starts a hedge attempt when
+    the first item is later than the hedge threshold. The first attempt to produce an item wins; the
+    other is cancelled.
+    """
+    events: "queue.Queue" = queue.Queue()
+    attempts = {1: _SupervisedAttempt(1, backend, call_args, events)}
+    hedge_at = None
+    hedge_delay_s = policy.hedge_delay_s(ttft_samples)
+    if hedge_delay_s is not None:
+        hedge_at = time.monotonic() + hedge_delay_s
+    error_chunks: Dict[int, Dict[str, Any]] = {}
+    failed: Dict[int, _LLMAttemptError] = {}
+
+    def cancel_all(except_id: Optional[int] = None):
+        for attempt_id, attempt in attempts.items():
+            if attempt_id != except_id:
+                attempt.cancelled.set()
+
+    while True:
+        wake_times = [t for t in (deadline_at, hedge_at) if t is not None]
+        timeout = max(0.0, min(wake_times) - time.monotonic()) if wake_times else None
+        try:
+            attempt_id, kind, payload = events.get(timeout=timeout)
+        except queue.Empty:
+            if hedge_at is not None and time.monotonic() >= hedge_at:
+                attempts[2] = _SupervisedAttempt(2, backend, call_args, events)
+                hedge_at = None
+                continue
+            cancel_all()
+            raise _deadline_error(policy)
+
+        if attempt_id in failed:
+            continue
+        if kind == 'item' and payload.get('is_error'):
+            error_chunks[attempt_id] = payload # Its exception follows
+            continue
+        if kind == 'item':
+            cancel_all(except_id=attempt_id)
+            return payload, _supervised_rest(attempts[attempt_id], events, policy, deadline_at)
+        if kind == 'done' and attempt_id not in error_chunks:
+            cancel_all()
+            return None, iter(()) # Empty but successful stream
+        failure_exception = payload if kind == 'exception' else LLMAPICallError(error_chunks[attempt_id].get('error') or "LLM call failed")
+        failed[attempt_id] = _attempt_error_from_exception(failure_exception, error_chunks.get(attempt_id))
+        if len(failed) == len(attempts):
+            raise failed[attempt_id] # Nothing left in flight; the retry loop decides whether to back off and retry
+        # Otherwise the hedge (or the original) may still succeed.
+
+def _supervised_rest(attempt: _SupervisedAttempt, events: "queue.Queue", policy: _RetryPolicy, deadline_at: Optional[float]) -> Iterable[Dict[str, Any]]:
+    try:
+        while True:
+            timeout = max(0.0, deadline_at - time.monotonic()) if deadline_at is not None else None
+            try:
+                attempt_id, kind, payload = events.get(timeout=timeout)
+            except queue.Empty:
+                deadline_failure = _deadline_error(policy)
+                yield deadline_failure.error_chunk
+                raise deadline_failure.exception
+            if attempt_id != attempt.attempt_id:
+                continue # Leftovers from the cancelled attempt
+            if kind == 'item':
+                yield payload
+            elif kind == 'exception':
+                raise payload
+            else:
+                return
+    finally:
+        attempt.cancelled.set() # Stop the worker if the consumer stops early
+
+def _resilient_stream(backend: LLMBackend, call_args: tuple, settings: Dict[str, Any], on_attempt_failure=None) -> Iterable[Dict[str, Any]]:
+    """backend.stream() under the configured retry/deadline/hedging policy."""
+    policy = _RetryPolicy(settings.get('retry_policy'))
+    ttft_samples = _ttft_samples_for(backend.name, call_args[0])
+    deadline_at = time.monotonic() + policy.deadline_s if policy.deadline_s else None
+    attempt = 1
+    while True:
+        attempt_started = time.monotonic()
+        try:
+            if policy.needs_supervision:
+                first_item, rest = _supervised_first_item(backend, call_args, policy, ttft_samples, deadline_at)
+            else:
+                first_item, rest = _inline_first_item(backend, call_args)
+        except _LLMAttemptError as failure:
+            if on_attempt_failure:
+                on_attempt_failure(failure.exception)
+            wait_s = policy.backoff_s(attempt)
+            out_of_time = deadline_at is not None and time.monotonic() + wait_s >= deadline_at
+            if attempt < policy.max_attempts and not out_of_time and _is_retryable_llm_error(failure.exception):
+                _log_error_to_project(
+                    f"Transient LLM error on attempt {attempt}/{policy.max_attempts}; retrying in {wait_s:.2f}s: {failure.exception}"
+                )
+                time.sleep(wait_s)
+                attempt += 1
+                continue
+            yield failure.error_chunk
+            raise failure.exception
+        if first_item is None:
+            return
+        if first_item.get('is_chunk'):
+            ttft_samples.append(time.monotonic() - attempt_started)
+        yield first_item
+        yield from rest
+        return
+
+async def _ainline_first_item(backend: LLMBackend, call_args: tuple, deadline_at: Optional[float], policy: _RetryPolicy):
+    iterator = backend.astream(*call_args).__aiter__()
+
+    async def next_item():
+        if deadline_at is None:
+            return await iterator.__anext__()
+        try:
+            return await asyncio.wait_for(iterator.__anext__(), max(0.0, deadline_at - time.monotonic()))
+        except asyncio.TimeoutError:
+            await iterator.aclose()
+            raise _deadline_error(policy)
+
+    try:
+        item = await next_item()
+    except StopAsyncIteration:
+        return None, None
+    except _LLMAttemptError:
+        raise
+    except Exception as e:
+        raise _attempt_error_from_exception(e) from e
+    if item.get('is_error'):
+        try:
+            await iterator.__anext__()
+        except StopAsyncIteration:
+            pass
+        except Exception as e:
+            raise _attempt_error_from_exception(e, item) from e
+        raise _attempt_error_from_exception(LLMAPICallError(item.get('error') or "LLM call failed"), item)
+    return item, next_item
+
+async def _aresilient_stream(backend: LLMBackend, call_args: tuple, settings: Dict[str, Any], on_attempt_failure=None) -> AsyncIterator[Dict[str, Any]]:
+    """Async counterpart of _resilient_stream. Hedging launches the duplicate as a competing task."""
+    policy = _RetryPolicy(settings.get('retry_policy'))
+    ttft_samples = _ttft_samples_for(backend.name, call_args[0])
+    deadline_at = time.monotonic() + policy.deadline_s if policy.deadline_s else None
+    attempt = 1
+    while True:
+        attempt_started = time.monotonic()
+        try:
+            first_item, next_item = await _ahedged_first_item(backend, call_args, policy, ttft_samples, deadline_at)
+        except _LLMAttemptError as failure:
+            if on_attempt_failure:
+                on_attempt_failure(failure.exception)
+            wait_s = policy.backoff_s(attempt)
+            out_of_time = deadline_at is not None and time.monotonic() + wait_s >= deadline_at
+            if attempt < policy.max_attempts and not out_of_time and _is_retryable_llm_error(failure.exception):
+                _log_error_to_project(
+                    f"Transient LLM error on attempt {attempt}/{policy.max_attempts}; retrying in {wait_s:.2f}s: {failure.exception}"
+                )
+                await asyncio.sleep(wait_s)
+                attempt += 1
+                continue
+            yield failure.error_chunk
+            raise failure.exception
+        if first_item is None:
+            return
+        if first_item.get('is_chunk'):
+            ttft_samples.append(time.monotonic() - attempt_started)
+        yield first_item
+        while True:
+            try:
+                item = await next_item()
+            except StopAsyncIteration:
+                return
+            except _LLMAttemptError as failure: # Deadline hit mid-stream
+                yield failure.error_chunk
+                raise failure.exception
+            yield item
+
+async def _ahedged_first_item(backend: LLMBackend, call_args: tuple, policy: _RetryPolicy, ttft_samples: deque, deadline_at: Optional[float]):
+    hedge_delay_s = policy.hedge_delay_s(ttft_samples)
+    if hedge_delay_s is None:
+        return await _ainline_first_item(backend, call_args, deadline_at, policy)
+    primary = asyncio.ensure_future(_ainline_first_item(backend, call_args, deadline_at, policy))
+    done, _ = await asyncio.wait({primary}, timeout=hedge_delay_s)
+    if done:
+        return primary.result()
+    hedge = asyncio.ensure_future(_ainline_first_item(backend, call_args, deadline_at, policy))
+    pending = {primary, hedge}
+    last_failure = None
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is None:
+                for other in pending:
+                    other.cancel()
+                return task.result()
+            last_failure = task.exception()
+    raise last_failure
+
+
+# --- Adaptive (AIMD) Concurrency Control ---
+# Every live LLM call holds a slot from a process-wide controller per (backend, model) while it streams.
+# The limit grows additively while calls succeed (+increase_step per limit's worth of successes, i.e.
+# roughly +1 per "round") and is cut multiplicatively on 429 / RESOURCE_EXHAUSTED, at most once per
+# round: throttles from calls started before the last cut are part of the same congestion event.
+# Calls wait for a slot in one of three priority lanes (the 'priority' argument of the public
+# functions): interactive (gouai chat), normal (the default) and bulk (generate_responses_batch).
+# Waiting lanes are served by weighted fair (stride) scheduling, so bulk work still progresses but
+# an interactive call is admitted almost immediately; reserved_interactive slots are never handed
+# to the other lanes (while the limit allows at least one other call).
+# Configured with the 'adaptive_concurrency' mapping in .gouai_config.yaml (defaults shown):
+#   adaptive_concurrency:
+#     enabled: true
+#     initial: 8
+#     min: 1
+#     max: 64
+#     increase_step: 1.0
+#     decrease_factor: 0.5
+#     reserved_interactive: 1
+#     priority_weights: {interactive: 6, normal: 3, bulk: 1}
+# Current state, including per-lane queue wait times, is available from get_llm_concurrency_metrics().
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_NORMAL = "normal"
+PRIORITY_BULK = "bulk"
+LLM_PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_NORMAL, PRIORITY_BULK) # Tie-break order
+_DEFAULT_PRIORITY_WEIGHTS = {PRIORITY_INTERACTIVE: 6.0, PRIORITY_NORMAL: 3.0, PRIORITY_BULK: 1.0}
+_ASYNC_SLOT_POLL_S = 0.01
+_CONCURRENCY_CONTROLLERS: Dict[tuple, "_AIMDConcurrencyController"] = {}
+_CONCURRENCY_CONTROLLERS_LOCK = threading.Lock()
+
+def _resolve_priority(priority: Optional[str]) -> str:
+    if priority is None:
+        return PRIORITY_NORMAL
+    if priority not in LLM_PRIORITIES:
+        raise ValueError(f"Unknown LLM priority '{priority}'. Expected one of: {', '.join(LLM_PRIORITIES)}.")
+    return priority
+
+class _AIMDConcurrencyController:
+    def __init__(self, name: str, initial: float = 8, minimum: float = 1, maximum: float = 64,
+                 increase_step: float = 1.0, decrease_factor: float = 0.5,
+                 reserved_interactive: int = 1, priority_weights: Optional[Dict[str, float]] = None):
+        self.name = name
+        self.minimum = max(1.0, float(minimum))
+        self.maximum = max(self.minimum, float(maximum))
+        self.limit = min(self.maximum, max(self.minimum, float(initial)))
+        self.increase_step = float(increase_step)
+        self.decrease_factor = float(decrease_factor)
+        self.reserved_interactive = max(0, int(reserved_interactive))
+        self.priority_weights = {
+            lane: max(0.01, float((priority_weights or {}).get(lane, _DEFAULT_PRIORITY_WEIGHTS[lane])))
+            for lane in LLM_PRIORITIES
+        }
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.waiting = 0
+        self.epoch = 0 # Bumped on every decrease
+        self.counters = {'succeeded': 0, 'throttled': 0, 'failed': 0, 'increases': 0, 'decreases': 0}
+        self.lanes = {lane: {'in_flight': 0, 'admitted': 0, 'queued': 0, 'wait_total_s': 0.0, 'wait_max_s': 0.0}
+                      for lane in LLM_PRIORITIES}
+        self._queues: Dict[str, deque] = {lane: deque() for lane in LLM_PRIORITIES} # Waiter tokens, FIFO per lane
+        self._lane_pass = {lane: 0.0 for lane in LLM_PRIORITIES} # Stride-scheduling virtual time per lane
+        self._virtual_clock = 0.0
+        self._condition = threading.Condition()
+
+    def _effective_limit(self) -> int:
+        return int(self.limit)
+
+    def _can_admit(self, priority: str) -> bool:
+        limit = self._effective_limit()
+        if priority != PRIORITY_INTERACTIVE:
+            limit -= min(self.reserved_interactive, limit - 1)
+        return self.in_flight < limit
+
+    def _next_waiter(self) -> Optional[object]:
+        """The waiter the weighted scheduler admits next, if any lane with waiters has room."""
+        ready_lanes = [lane for lane in LLM_PRIORITIES if self._queues[lane] and self._can_admit(lane)]
+        if not ready_lanes:
+            return None
+        lane = min(ready_lanes, key=lambda candidate: (self._lane_pass[candidate], LLM_PRIORITIES.index(candidate)))
+        return self._queues[lane][0]
+
+    def _enqueue(self, priority: str) -> object:
+        waiter = object()
+        if not self._queues[priority]: # A lane coming back from idle gets no credit for its idle time
+            self._lane_pass[priority] = max(self._lane_pass[priority], self._virtual_clock)
+        self._queues[priority].append(waiter)
+        self.lanes[priority]['queued'] += 1
+        return waiter
+
+    def _dequeue(self, priority: str, waiter: object):
+        try:
+            self._queues[priority].remove(waiter)
+        except ValueError:
+            pass
+        self.lanes[priority]['queued'] -= 1
+        self._condition.notify_all() # The next waiter may be admissible now
+
+    def _take_slot(self, priority: str = PRIORITY_NORMAL, waited_s: float = 0.0) -> int:
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        self._virtual_clock = self._lane_pass[priority]
+        self._lane_pass[priority] += 1.0 / self.priority_weights[priority]
+        lane = self.lanes[priority]
+        lane['in_flight'] += 1
+        lane['admitted'] += 1
+        lane['wait_total_s'] += waited_s
+        lane['wait_max_s'] = max(lane['wait_max_s'], waited_s)
+        return self.epoch
+
+    def _try_admit(self, priority: str, waiter: object, queued_at: float) -> Optional[int]:
+        if self._next_waiter() is not waiter:
+            return None
+        self._dequeue(priority, waiter)
+        return self._take_slot(priority, time.monotonic() - queued_at)
+
+    def try_acquire(self, priority: str = PRIORITY_NORMAL) -> Optional[int]:
+        """Takes a slot if the scheduler would admit this call now; returns the caller's ticket (current epoch) or None."""
+        with self._condition:
+            waiter = self._enqueue(priority)
+            ticket = self._try_admit(priority, waiter, time.monotonic())
+            if ticket is None:
+                self._dequeue(priority, waiter)
+            return ticket
+
+    def acquire(self, priority: str = PRIORITY_NORMAL) -> int:
+        with self._condition:
+            queued_at = time.monotonic()
+            waiter = self._enqueue(priority)
+            self.waiting += 1
+            try:
+                while True:
+                    ticket = self._try_admit(priority, waiter, queued_at)
+                    if ticket is not None:
+                        return ticket
+                    self._condition.wait()
+            except BaseException:
+                self._dequeue(priority, waiter)
+                raise
+            finally:
+                self.waiting -= 1
+
+    async def aacquire(self, priority: str = PRIORITY_NORMAL) -> int:
+        # Polling keeps event-loop callers off worker threads, which backends may need themselves.
+        # The waiter is queued meanwhile, so async calls take part in the lane scheduling too.
+        with self._condition:
+            queued_at = time.monotonic()
+            waiter = self._enqueue(priority)
+            ticket = self._try_admit(priority, waiter, queued_at)
+            if ticket is not None:
+                return ticket
+            self.waiting += 1
+        try:
+            while True:
+                await asyncio.sleep(_ASYNC_SLOT_POLL_S)
+                with self._condition:
+                    ticket = self._try_admit(priority, waiter, queued_at)
+                    if ticket is not None:
+                        return ticket
+        except BaseException:
+            with self._condition:
+                self._dequeue(priority, waiter)
+            raise
+        finally:
+            with self._condition:
+                self.waiting -= 1
+
+    def record_throttled(self, ticket: int) -> int:
+        """Multiplicative decrease, once per round. Returns the ticket to use for the caller's next attempt."""
+        with self._condition:
+            self.counters['throttled'] += 1
+            if ticket >= self.epoch:
+                self.limit = max(self.minimum, self.limit * self.decrease_factor)
+                self.epoch += 1
+                self.counters['decreases'] += 1
+            return self.epoch
+
+    def release(self, succeeded: Optional[bool], priority: str = PRIORITY_NORMAL):
+        """Frees the slot. succeeded=True grows the limit; False counts a failure; None (abandoned) is neutral."""
+        with self._condition:
+            self.in_flight -= 1
+            self.lanes[priority]['in_flight'] -= 1
+            if succeeded:
+                self.counters['succeeded'] += 1
+                if self.limit < self.maximum:
+                    self.limit = min(self.maximum, self.limit + self.increase_step / max(self.limit, 1.0))
+                    self.counters['increases'] += 1
+            elif succeeded is False:
+                self.counters['failed'] += 1
+            self._condition.notify_all()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                'limit': round(self.limit, 3),
+                'effective_limit': self._effective_limit(),
+                'in_flight': self.in_flight,
+                'peak_in_flight': self.peak_in_flight,
+                'waiting': self.waiting,
+                **self.counters,
+                'lanes': {
+                    lane: {
+                        'in_flight': stats['in_flight'],
+                        'waiting': stats['queued'],
+                        'admitted': stats['admitted'],
+                        'mean_wait_s': round(stats['wait_total_s'] / stats['admitted'], 4) if stats['admitted'] else 0.0,
+                        'max_wait_s': round(stats['wait_max_s'], 4)
+                    }
+                    for lane, stats in self.lanes.items()
+                }
+            }
+
+def _get_concurrency_controller(backend_name: str, model_name: str, settings: Dict[str, Any]) -> Optional[_AIMDConcurrencyController]:
+    controller_config = settings.get('adaptive_concurrency')
+    controller_config = controller_config if isinstance(controller_config, dict) else {}
+    if not controller_config.get('enabled', True):
+        return None
+    controller_key = (backend_name, model_name)
+    with _CONCURRENCY_CONTROLLERS_LOCK:
+        controller = _CONCURRENCY_CONTROLLERS.get(controller_key)
+        if controller is None:
+            controller = _AIMDConcurrencyController(
+                name=f"{backend_name}/{model_name}",
+                initial=controller_config.get('initial', 8),
+                minimum=controller_config.get('min', 1),
+                maximum=controller_config.get('max', 64),
+                increase_step=controller_config.get('increase_step', 1.0),
+                decrease_factor=controller_config.get('decrease_factor', 0.5),
+                reserved_interactive=controller_config.get('reserved_interactive', 1),
+                priority_weights=controller_config.get('priority_weights')
+            )
+            _CONCURRENCY_CONTROLLERS[controller_key] = controller
+    return controller
+
+def _is_throttling_error(e: LLMAPICallError) -> bool:
+    original = e.original_exception
+    if isinstance(original, (_api_core_exceptions.TooManyRequests, _api_core_exceptions.ResourceExhausted)):
+        return True
+    return getattr(original, 'code', None) == 429 or 'RESOURCE_EXHAUSTED' in str(original or "")
+
+def get_llm_concurrency_metrics() -> Dict[str, Dict[str, Any]]:
+    """Snapshot of every adaptive concurrency controller, keyed by '<backend>/<model>'."""
+    with _CONCURRENCY_CONTROLLERS_LOCK:
+        controllers = list(_CONCURRENCY_CONTROLLERS.values())
+    return {controller.name: controller.metrics() for controller in controllers}
+
+
+def _controlled_stream(backend: LLMBackend, call_args: tuple, settings: Dict[str, Any],
+                       priority: str = PRIORITY_NORMAL) -> Iterable[Dict[str, Any]]:
+    """_resilient_stream holding a slot from the adaptive concurrency controller (in the given lane) for its whole duration."""
+    controller = _get_concurrency_controller(backend.name, call_args[0], settings)
+    if controller is None:
+        yield from _resilient_stream(backend, call_args, settings)
+        return
+    call_state = {'ticket': controller.acquire(priority)}
+
+    def on_attempt_failure(e: LLMAPICallError):
+        if _is_throttling_error(e):
+            call_state['ticket'] = controller.record_throttled(call_state['ticket'])
+
+    succeeded = None
+    try:
+        for item in _resilient_stream(backend, call_args, settings, on_attempt_failure):
+            if item.get('is_error'):
+                succeeded = False
+            yield item
+        if succeeded is None:
+            succeeded = True
+    except LLMAPICallError:
+        succeeded = False
+        raise
+    finally:
+        controller.release(succeeded, priority) # None (consumer stopped early) leaves the limit unchanged
+
+async def _acontrolled_stream(backend: LLMBackend, call_args: tuple, settings: Dict[str, Any],
+                              priority: str = PRIORITY_NORMAL) -> AsyncIterator[Dict[str, Any]]:
+    """Async counterpart of _controlled_stream."""
+    controller = _get_concurrency_controller(backend.name, call_args[0], settings)
+    if controller is None:
+        async for item in _aresilient_stream(backend, call_args, settings):
+            yield item
+        return
+    call_state = {'ticket': await controller.aacquire(priority)}
+
+    def on_attempt_failure(e: LLMAPICallError):
+        if _is_throttling_error(e):
+            call_state['ticket'] = controller.record_throttled(call_state['ticket'])
+
+    succeeded = None
+    try:
+        async for item in _aresilient_stream(backend, call_args, settings, on_attempt_failure):
+            if item.get('is_error'):
+                succeeded = False
+            yield item
+        if succeeded is None:
+            succeeded = True
+    except LLMAPICallError:
+        succeeded = False
+        raise
+    finally:
+        controller.release(succeeded, priority)
+
+
+# --- In-Flight Request Coalescing (single-flight) ---
+# Identical requests (same backend and request key: model, contents, generation config, safety
+# settings) issued while one is already streaming join it instead of calling upstream again: the
+# first caller (the leader) pulls the stream and publishes every dict, later callers (followers)
+# replay what was published so far and then follow along. Each caller still logs its own User and
+# Assistant turns. Requests with tools are never coalesced (tools are not part of the request key).
+# On by default; disable with 'single_flight: false' in .gouai_config.yaml.
+# Sync callers coalesce across threads, async callers across tasks of the same event loop.
+_IN_FLIGHT_CALLS: Dict[tuple, "_InFlightCall"] = {}
+_IN_FLIGHT_CALLS_LOCK = threading.Lock()
+
+class _InFlightCall:
+    """The items published so far by one leader stream, with a condition followers wait on."""
+    def __init__(self, owner: Any):
+        self.owner = owner
+        self.items: List[Dict[str, Any]] = []
+        self.done = False
+        self.exception: Optional[BaseException] = None
+        self.followers = 0
+        self._condition = threading.Condition()
+
+    def publish(self, item: Dict[str, Any]):
+        with self._condition:
+            self.items.append(item)
+            self._condition.notify_all()
+
+    def finish(self, exception: Optional[BaseException]):
+        with self._condition:
+            self.done = True
+            self.exception = exception
+            self._condition.notify_all()
+
+    def _next(self, index: int) -> tuple[bool, Optional[Dict[str, Any]]]:
+        """(True, item) for the item at index, (False, None) once the stream is over. Caller holds the condition."""
+        if index < len(self.items):
+            item = self.items[index]
+            if item.get('is_final_summary'):
+                item = {**item, 'coalesced': True} # The leader's call paid for these tokens (see the usage ledger)
+            return True, item
+        if self.exception is not None:
+            raise _follower_exception(self.exception)
+        return False, None
+
+    def follow(self) -> Iterable[Dict[str, Any]]:
+        index = 0
+        while True:
+            with self._condition:
+                while index >= len(self.items) and not self.done:
+                    self._condition.wait()
+                has_item, item = self._next(index)
+            if not has_item:
+                return
+            index += 1
+            yield item
+
+class _AsyncInFlightCall(_InFlightCall):
+    """Event-loop flavour: followers await an asyncio.Event that is replaced after every change."""
+    def __init__(self, owner: Any):
+        super().__init__(owner)
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def publish(self, item: Dict[str, Any]):
+        self.items.append(item)
+        self._notify()
+
+    def finish(self, exception: Optional[BaseException]):
+        self.done = True
+        self.exception = exception
+        self._notify()
+
+    async def afollow(self) -> AsyncIterator[Dict[str, Any]]:
+        index = 0
+        while True:
+            while index >= len(self.items) and not self.done:
+                await self._changed.wait()
+            has_item, item = self._next(index)
+            if not has_item:
+                return
+            index += 1
+            yield item
+
+def _follower_exception(e: BaseException) -> BaseException:
+    # A fresh instance per follower: the leader's exception object is being raised in another thread/task.
+    if isinstance(e, LLMAPICallError):
+        return LLMAPICallError(message=str(e), original_exception=e.original_exception)
+    return e
+
+def _single_flight_key(backend: LLMBackend, request_key: str, tools: Optional[List[Any]], settings: Dict[str, Any]) -> Optional[tuple]:
+    if tools or not settings.get('single_flight', True):
+        return None
+    return (backend.name, request_key)
+
+def _join_flight(flight_key: tuple, owner: Any, flight_class: type) -> tuple[str, Optional[_InFlightCall]]:
+    """Returns ('leader', new flight), ('follower', existing flight) or ('bypass', None)."""
+    with _IN_FLIGHT_CALLS_LOCK:
+        flight = _IN_FLIGHT_CALLS.get(flight_key)
+        if flight is None:
+            flight = _IN_FLIGHT_CALLS[flight_key] = flight_class(owner)
+            return 'leader', flight
+        if flight.owner == owner:
+            return 'bypass', None # The same thread/task interleaving two identical streams would wait on itself
+        flight.followers += 1
+        return 'follower', flight
+
+def _detach_flight(flight_key: tuple, flight: _InFlightCall) -> int:
+    """Stops new callers joining this flight; returns how many followers are still reading it."""
+    with _IN_FLIGHT_CALLS_LOCK:
+        if _IN_FLIGHT_CALLS.get(flight_key) is flight:
+            del _IN_FLIGHT_CALLS[flight_key]
+        return flight.followers
+
+def _leave_flight(flight: _InFlightCall):
+    with _IN_FLIGHT_CALLS_LOCK:
+        flight.followers -= 1
+
+def _single_flight_stream(flight_key: Optional[tuple], upstream_factory) -> Iterable[Dict[str, Any]]:
+    """Yields upstream_factory()'s stream, sharing it with concurrent identical requests."""
+    role, flight = _join_flight(flight_key, threading.get_ident(), _InFlightCall) if flight_key else ('bypass', None)
+    if role == 'bypass':
+        yield from upstream_factory()
+        return
+    if role == 'follower':
+        try:
+            yield from flight.follow()
+        finally:
+            _leave_flight(flight)
+        return
+
+    upstream = iter(upstream_factory())
+    exception = None
+    try:
+        for item in upstream:
+            flight.publish(item)
+            yield item
+    except GeneratorExit:
+        # Our caller stopped reading early; finish the stream for anyone still following it.
+        if _detach_flight(flight_key, flight):
+            try:
+                for item in upstream:
+                    flight.publish(item)
+            except Exception as e:
+                exception = e
+        raise
+    except Exception as e:
+        exception = e
+        raise
+    finally:
+        _detach_flight(flight_key, flight)
+        if hasattr(upstream, 'close'):
+            upstream.close()
+        flight.finish(exception)
+
+async def _asingle_flight_stream(flight_key: Optional[tuple], upstream_factory) -> AsyncIterator[Dict[str, Any]]:
+    """Async counterpart of _single_flight_stream; coalesces requests made on the same event loop."""
+    if flight_key:
+        flight_key = (asyncio.get_running_loop(),) + flight_key
+        role, flight = _join_flight(flight_key, asyncio.current_task(), _AsyncInFlightCall)
+    else:
+        role, flight = 'bypass', None
+    if role == 'bypass':
+        async for item in upstream_factory():
+            yield item
+        return
+    if role == 'follower':
+        try:
+            async for item in flight.afollow():
+                yield item
+        finally:
+            _leave_flight(flight)
+        return
+
+    upstream = upstream_factory()
+    exception = None
+    try:
+        async for item in upstream:
+            flight.publish(item)
+            yield item
+    except GeneratorExit:
+        if _detach_flight(flight_key, flight):
+            try:
+                async for item in upstream:
+                    flight.publish(item)
+            except Exception as e:
+                exception = e
+        raise
+    except Exception as e:
+        exception = e
+        raise
+    finally:
+        _detach_flight(flight_key, flight)
+        if hasattr(upstream, 'aclose'):
+            await upstream.aclose()
+        flight.finish(exception)
+
+
+# --- Provider Prefix (Context) Caching ---
+# A large, stable leading content item (the chat priming prompt), or the registered lead-in of a
+# single prompt (the GOUAI protocol text execute_gouai_p1p2 passes to register_cacheable_prefix), is
+# registered once with the backend's cached-content facility; later requests send only the
+# remaining contents plus the handle. The split is made only once a handle is obtained. Backends without such a facility
+# (create_prefix_cache returns None) get the full contents inline, and a request whose handle the
+# provider rejects (expired, deleted) is retried once inline. Live and record modes only; the
+# response cache, single-flight and cassettes always key on the full contents.
+# Handles are kept until shortly before they expire, in memory and in ~/.gouai/cache/prefix_cache_handles.json
+# (keyed by backend, model, API key digest and prefix digest), so one-shot CLI runs reuse the cached
+# content registered by an earlier run instead of creating a new one each time.
+# Configured with 'prefix_cache' in .gouai_config.yaml (defaults shown):
+#   prefix_cache:
+#     enabled: true
+#     min_tokens: 4096   # Smaller prefixes stay inline (providers reject or don't discount tiny caches)
+#     ttl_s: 3600
+_PREFIX_CACHE_EXPIRY_MARGIN_S = 60 # Stop handing out a handle this long before the provider expires it
+_PREFIX_CACHE_FAILURE_RETRY_S = 600 # After a failed registration, send that prefix inline for this long
+_PREFIX_CACHE_HANDLES: Dict[tuple, tuple[Optional[str], float]] = {} # {(backend, model, key digest, prefix digest): (handle, expires at)}
+_PREFIX_CACHE_LOCK = threading.Lock()
+_CACHEABLE_PREFIX_TEXTS: Dict[str, None] = {} # Registered lead-in texts of single prompts (an ordered set)
+_PREFIX_CACHE_STORE_FILENAME = "prefix_cache_handles.json"
+
+def _supports_prefix_cache(backend: LLMBackend) -> bool:
+    return type(backend).create_prefix_cache is not LLMBackend.create_prefix_cache
+
+def _prefix_cache_config(settings: Dict[str, Any]) -> Dict[str, Any]:
+    prefix_config = settings.get('prefix_cache')
+    return prefix_config if isinstance(prefix_config, dict) else {}
+
+def register_cacheable_prefix(prefix_text: str):
+    """
+    Marks prefix_text as a stable lead-in of single-prompt requests (e.g. the GOUAI protocol definition).
+    A prompt that starts with it may have that part served from the provider's prefix cache; the
+    prompt is otherwise sent unchanged, and backends without a prefix cache never see a split.
+    """
+    if prefix_text:
+        with _PREFIX_CACHE_LOCK:
+            _CACHEABLE_PREFIX_TEXTS[prefix_text] = None
+
+def _single_prompt_text(contents: Union[str, List[Any]]) -> Optional[str]:
+    """The text of a one-turn, one-part user prompt, else None."""
+    if isinstance(contents, str):
+        return contents
+    if not isinstance(contents, list) or len(contents) != 1:
+        return None
+    turn = _normalize_contents_for_key(contents)[0]
+    if not isinstance(turn, dict) or turn.get('role', 'user') != 'user':
+        return None
+    parts = turn.get('parts')
+    if not isinstance(parts, list) or len(parts) != 1:
+        return None
+    return parts[0].get('text') if isinstance(parts[0], dict) else None
+
+def _split_cacheable_prefix(contents: Union[str, List[Any]], prefix_config: Dict[str, Any]) -> Optional[tuple[list, list]]:
+    """
+    (prefix, rest) when the contents lead with something big enough to cache, else None: the first
+    of several content items, or a registered lead-in text (register_cacheable_prefix) of a single prompt.
+    A chat compaction summary appended to the first item (ChatHistoryCompactor) is not part of the
+    prefix; it is sent in rest, so the cached prefix stays the same as the summary is refreshed.
+    """
+    min_tokens = int(prefix_config.get('min_tokens', 4096))
+    if isinstance(contents, list) and len(contents) >= 2:
+        first_item = _normalize_contents_for_key(contents[:1])[0]
+        parts = first_item.get('parts') if isinstance(first_item, dict) else None
+        if not isinstance(parts, list):
+            return None
+        summary_at = next((i for i, part in enumerate(parts) if _is_chat_summary_part(part)), len(parts))
+        prefix = [{**first_item, 'parts': parts[:summary_at]}]
+        if not parts[:summary_at] or estimate_prompt_tokens(prefix) < min_tokens:
+            return None
+        summary_turn = [{**first_item, 'parts': parts[summary_at:]}] if parts[summary_at:] else []
+        return prefix, summary_turn + list(contents[1:])
+    prompt_text = _single_prompt_text(contents)
+    if not prompt_text:
+        return None
+    with _PREFIX_CACHE_LOCK:
+        prefix_texts = sorted(_CACHEABLE_PREFIX_TEXTS, key=len, reverse=True) # Longest match first
+    for prefix_text in prefix_texts:
+        if len(prompt_text) > len(prefix_text) and prompt_text.startswith(prefix_text):
+            prefix = _normalize_contents_for_key(prefix_text)
+            if estimate_prompt_tokens(prefix) < min_tokens:
+                return None
+            return prefix, [{'role': 'user', 'parts': [{'text': prompt_text[len(prefix_text):]}]}]
+    return None
+
+def _prefix_cache_store_path() -> Path:
+    return _get_user_config_file_path().parent / "cache" / _PREFIX_CACHE_STORE_FILENAME
+
+def _read_prefix_cache_store(store_path: Path) -> Dict[str, Dict[str, Any]]:
+    try:
+        with open(store_path, 'r', encoding='utf-8') as f:
+            store = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return store if isinstance(store, dict) else {}
+
+def _update_prefix_cache_store(store_key: str, entry: Optional[Dict[str, Any]]):
+    """Sets (or, with entry=None, removes) one persisted handle, dropping expired ones along the way."""
+    store_path = _prefix_cache_store_path()
+    now = time.time()
+    with _PREFIX_CACHE_LOCK:
+        store = {
+            key: stored for key, stored in _read_prefix_cache_store(store_path).items()
+            if isinstance(stored, dict) and float(stored.get('expires_at', 0)) > now and key != store_key
+        }
+        if entry is not None:
+            store[store_key] = entry
+        tmp_path = store_path.with_name(f"{store_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            store_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(store, f)
+            os.replace(tmp_path, store_path) # Atomic: other processes never read a partial store
+        except OSError as e:
+            _log_error_to_project(f"Could not save prompt prefix cache handles to '{store_path}': {e}", e)
+
+def _persisted_prefix_cache_handle(store_key: str, now: float) -> Optional[tuple[str, float]]:
+    stored = _read_prefix_cache_store(_prefix_cache_store_path()).get(store_key)
+    if not isinstance(stored, dict) or not stored.get('handle'):
+        return None
+    expires_at = float(stored.get('expires_at', 0))
+    return (str(stored['handle']), expires_at) if expires_at > now else None
+
+def _prefix_cache_handle(backend: LLMBackend, model_name: str, api_key: Optional[str], prefix: List[Dict[str, Any]],
+                         prefix_config: Dict[str, Any], settings: Dict[str, Any]) -> Optional[str]:
+    cache_key = (
+        backend.name, model_name,
+        hashlib.sha256((api_key or "").encode('utf-8')).hexdigest()[:16],
+        _compute_request_key(model_name, prefix)
+    )
+    store_key = "|".join(cache_key)
+    now = time.time()
+    with _PREFIX_CACHE_LOCK:
+        entry = _PREFIX_CACHE_HANDLES.get(cache_key)
+    if entry is None or entry[1] <= now:
+        entry = _persisted_prefix_cache_handle(store_key, now) # Registered by an earlier process
+        if entry is not None:
+            with _PREFIX_CACHE_LOCK:
+                _PREFIX_CACHE_HANDLES[cache_key] = entry
+    if entry is not None and entry[1] > now:
+        return entry[0]
+    ttl_s = float(prefix_config.get('ttl_s', 3600))
+    try:
+        handle = backend.create_prefix_cache(model_name, api_key, prefix, ttl_s, settings)
+    except Exception as e:
+        _log_error_to_project(f"Registering a prompt prefix with backend '{backend.name}' failed; sending it inline.", e)
+        handle = None
+    expires_at = now + (max(0.0, ttl_s - _PREFIX_CACHE_EXPIRY_MARGIN_S) if handle else _PREFIX_CACHE_FAILURE_RETRY_S)
+    with _PREFIX_CACHE_LOCK:
+        _PREFIX_CACHE_HANDLES[cache_key] = (handle, expires_at)
+    if handle:
+        _update_prefix_cache_store(store_key, {'handle': handle, 'expires_at': expires_at})
+    return handle
+
+def _forget_prefix_cache_handle(handle: str):
+    with _PREFIX_CACHE_LOCK:
+        forgotten_keys = [key for key, (cached_handle, _) in _PREFIX_CACHE_HANDLES.items() if cached_handle == handle]
+        for cache_key in forgotten_keys:
+            del _PREFIX_CACHE_HANDLES[cache_key]
+    for cache_key in forgotten_keys:
+        _update_prefix_cache_store("|".join(cache_key), None)
+
+def _prefix_cached_call_args(backend: LLMBackend, call_args: tuple, settings: Dict[str, Any]) -> Optional[tuple]:
+    """call_args with the cacheable prefix replaced by its handle, or None to send everything inline."""
+    prefix_config = _prefix_cache_config(settings)
+    if not prefix_config.get('enabled', True) or not _supports_prefix_cache(backend):
+        return None
+    model_name, api_key, contents, generation_config_params, safety_settings_params, tools, _ = call_args
+    split = _split_cacheable_prefix(contents, prefix_config)
+    if split is None:
+        return None
+    handle = _prefix_cache_handle(backend, model_name, api_key, split[0], prefix_config, settings)
+    if handle is None:
+        return None
+    return (model_name, api_key, split[1], {**(generation_config_params or {}), 'cached_content': handle},
+            safety_settings_params, tools, settings)
+
+_PREFIX_CACHE_HANDLE_PATTERN = re.compile(r"cached?[ _]?content", re.IGNORECASE) # CachedContent, cached_content, "cache content"
+_PREFIX_CACHE_GONE_PATTERN = re.compile(r"not[ _]?found|expired", re.IGNORECASE)
+
+def _is_prefix_cache_error(e: LLMAPICallError) -> bool:
+    """True only if the provider reports the cached content behind the handle as not found or expired."""
+    error_text = f"{e} {e.original_exception or ''}"
+    return bool(_PREFIX_CACHE_HANDLE_PATTERN.search(error_text) and _PREFIX_CACHE_GONE_PATTERN.search(error_text))
+
+def _prefix_cached_stream(backend: LLMBackend, call_args: tuple, settings: Dict[str, Any],
+                          priority: str = PRIORITY_NORMAL) -> Iterable[Dict[str, Any]]:
+    """_controlled_stream using a cached prefix where possible, falling back to inline contents."""
+    cached_call_args = _prefix_cached_call_args(backend, call_args, settings)
+    if cached_call_args is None:
+        yield from _controlled_stream(backend, call_args, settings, priority)
+        return
+    held_error = None
+    forwarded_any = False
+    try:
+        for item in _controlled_stream(backend, cached_call_args, settings, priority):
+            if item.get('is_error') and not forwarded_any:
+                held_error = item # Only forwarded if the inline retry is not possible
+                continue
+            forwarded_any = True
+            yield item
+        if held_error is not None:
+            yield held_error
+        return
+    except LLMAPICallError as e:
+        if forwarded_any or not _is_prefix_cache_error(e):
+            if held_error is not None:
+                yield held_error
+            raise
+        _forget_prefix_cache_handle(cached_call_args[3]['cached_content'])
+        _log_error_to_project("Backend rejected the cached prompt prefix; retrying with it inline.", e)
+    yield from _controlled_stream(backend, call_args, settings, priority)
+
+async def _aprefix_cached_stream(backend: LLMBackend, call_args: tuple, settings: Dict[str, Any],
+                                 priority: str = PRIORITY_NORMAL) -> AsyncIterator[Dict[str, Any]]:
+    """Async counterpart of _prefix_cached_stream; registration runs off the event loop."""
+    cached_call_args = None
+    if _prefix_cache_config(settings).get('enabled', True) and _supports_prefix_cache(backend):
+        cached_call_args = await asyncio.to_thread(_prefix_cached_call_args, backend, call_args, settings)
+    if cached_call_args is None:
+        async for item in _acontrolled_stream(backend, call_args, settings, priority):
+            yield item
+        return
+    held_error = None
+    forwarded_any = False
+    try:
+        async for item in _acontrolled_stream(backend, cached_call_args, settings, priority):
+            if item.get('is_error') and not forwarded_any:
+                held_error = item
+                continue
+            forwarded_any = True
+            yield item
+        if held_error is not None:
+            yield held_error
+        return
+    except LLMAPICallError as e:
+        if forwarded_any or not _is_prefix_cache_error(e):
+            if held_error is not None:
+                yield held_error
+            raise
+        _forget_prefix_cache_handle(cached_call_args[3]['cached_content'])
+        _log_error_to_project("Backend rejected the cached prompt prefix; retrying with it inline.", e)
+    async for item in _acontrolled_stream(backend, call_args, settings, priority):
+        yield item
+
+
+# --- Record/Replay Cassettes (GOUAI_LLM_MODE) ---
+# GOUAI_LLM_MODE=record  -> every LLM call goes to the API as usual and its full stream (each yielded
+#                           dict with its time offset, plus any error) is written to a cassette file.
+# GOUAI_LLM_MODE=replay  -> calls are answered from cassettes only; no network, no API key needed.
+#                           A request without a cassette fails with LLMAPICallError.
+# Unset (or 'live')      -> normal behaviour.
+# Cassettes live in GOUAI_CASSETTE_DIR (default ~/.gouai/cassettes), one <request key>.json per request,
+# keyed like the response cache (model, contents, generation config, safety settings).
+# GOUAI_CASSETTE_SPEED scales replayed chunk timing: 1.0 (default) reproduces the recorded pacing,
+# 0 replays instantly, which isolates GOUAI's own (non-LLM) overhead when profiling a pipeline.
+LLM_MODE_ENV_VAR = "GOUAI_LLM_MODE"
+CASSETTE_DIR_ENV_VAR = "GOUAI_CASSETTE_DIR"
+CASSETTE_SPEED_ENV_VAR = "GOUAI_CASSETTE_SPEED"
+LLM_MODE_LIVE = "live"
+LLM_MODE_RECORD = "record"
+LLM_MODE_REPLAY = "replay"
+_REPLAY_PLACEHOLDER_API_KEY = "gouai-replay-mode"
+
+def _get_llm_mode() -> str:
+    mode = (os.getenv(LLM_MODE_ENV_VAR) or LLM_MODE_LIVE).strip().lower()
+    if mode not in (LLM_MODE_LIVE, LLM_MODE_RECORD, LLM_MODE_REPLAY):
+        raise ConfigurationError(
+            f"GOUAI Configuration Error: {LLM_MODE_ENV_VAR}='{mode}' is not valid. "
+            f"Use '{LLM_MODE_RECORD}', '{LLM_MODE_REPLAY}' or leave it unset."
+        )
+    return mode
+
+def _get_cassette_dir() -> Path:
+    configured_dir = os.getenv(CASSETTE_DIR_ENV_VAR)
+    if configured_dir:
+        return Path(configured_dir).expanduser()
+    return _get_user_config_file_path().parent / "cassettes"
+
+def _get_cassette_speed() -> float:
+    try:
+        return max(0.0, float(os.getenv(CASSETTE_SPEED_ENV_VAR, "1.0")))
+    except ValueError:
+        return 1.0
+
+def _cassette_path(request_key: str) -> Path:
+    return _get_cassette_dir() / f"{request_key}.json"
+
+def _encode_cassette_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    encoded = dict(item)
+    if encoded.get('parts_chunk'):
+        encoded['parts_chunk'] = [
+            part.model_dump(mode='json', exclude_none=True) if hasattr(part, 'model_dump') else part
+            for part in encoded['parts_chunk']
+        ]
+    return encoded
+
+def _decode_cassette_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    decoded = dict(item)
+    if decoded.get('parts_chunk'):
+        decoded['parts_chunk'] = [types.Part.model_validate(part) for part in decoded['parts_chunk']]
+    return decoded
+
+class _CassetteRecorder:
+    """Collects a live stream's dicts with their time offsets and writes them out as one cassette."""
+    def __init__(self, request_key: str, model_name: str):
+        self.request_key = request_key
+        self.model_name = model_name
+        self.started_at = time.monotonic()
+        self.events: List[Dict[str, Any]] = []
+        self.exception: Optional[Dict[str, Any]] = None
+
+    def add(self, item: Dict[str, Any]):
+        self.events.append({'offset_s': round(time.monotonic() - self.started_at, 6), 'item': _encode_cassette_item(item)})
+
+    def fail(self, e: LLMAPICallError):
+        self.exception = {'message': str(e)}
+
+    def save(self):
+        cassette_file = _cassette_path(self.request_key)
+        cassette = {
+            'request_key': self.request_key,
+            'model': self.model_name,
+            'recorded_at': datetime.now().isoformat(timespec="seconds"),
+            'events': self.events,
+            'exception': self.exception
+        }
+        try:
+            cassette_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = cassette_file.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(cassette, f, ensure_ascii=False, indent=1, default=str)
+            os.replace(tmp_path, cassette_file)
+        except (OSError, TypeError, ValueError) as e:
+            _log_error_to_project(f"Could not write LLM cassette '{cassette_file}': {e}", e)
+
+def _load_cassette(request_key: str, model_name: str) -> Dict[str, Any]:
+    cassette_file = _cassette_path(request_key)
+    try:
+        with open(cassette_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        error_message = (
+            f"{LLM_MODE_ENV_VAR}={LLM_MODE_REPLAY}: no usable cassette for this {model_name} request "
+            f"(expected '{cassette_file}'). Record it first with {LLM_MODE_ENV_VAR}={LLM_MODE_RECORD}."
+        )
+        _log_error_to_project(error_message, e)
+        raise LLMAPICallError(message=error_message, original_exception=e) from e
+
+def _replay_delays(cassette: Dict[str, Any]) -> Iterable[tuple[float, Dict[str, Any]]]:
+    """Yields (seconds to wait, decoded item) pairs reproducing the recorded pacing at the configured speed."""
+    speed = _get_cassette_speed()
+    previous_offset = 0.0
+    for event in cassette.get('events', []):
+        offset = float(event.get('offset_s', 0.0))
+        yield max(0.0, offset - previous_offset) * speed, _decode_cassette_item(event['item'])
+        previous_offset = offset
+
+def _call_llm(
+    model_name: str,
+    api_key: str,
+    contents: Union[str, List[Content]],
+    generation_config_params: Optional[Dict[str, Any]] = None,
+    safety_settings_params: Optional[List[Dict[str, Any]]] = None,
+    tools: Optional[List[Any]] = None,
+    settings: Optional[Dict[str, Any]] = None,
+    priority: str = PRIORITY_NORMAL
+) -> Iterable[Dict[str, Any]]:
+    """Streams from the configured backend, or its record/replay wrapper when GOUAI_LLM_MODE asks for one."""
+    settings = settings or {}
+    backend = _get_llm_backend(settings)
+    call_args = (model_name, api_key, contents, generation_config_params, safety_settings_params, tools, settings)
+    mode = _get_llm_mode()
+    request_key = _compute_request_key(model_name, contents, generation_config_params, safety_settings_params)
+    flight_key = _single_flight_key(backend, request_key, tools, settings)
+    if mode == LLM_MODE_LIVE:
+        yield from _single_flight_stream(flight_key, lambda: _prefix_cached_stream(backend, call_args, settings, priority))
+        return
+
+    if mode == LLM_MODE_REPLAY:
+        try:
+            cassette = _load_cassette(request_key, model_name)
+        except LLMAPICallError as e:
+            yield _gemini_error_chunk(str(e), e.original_exception or e)
+            raise
+        for delay_s, item in _replay_delays(cassette):
+            if delay_s:
+                time.sleep(delay_s)
+            yield item
+        if cassette.get('exception'):
+            raise LLMAPICallError(message=cassette['exception']['message'])
+        return
+
+    recorder = _CassetteRecorder(request_key, model_name)
+    try:
+        for item in _single_flight_stream(flight_key, lambda: _prefix_cached_stream(backend, call_args, settings, priority)):
+            recorder.add(item)
+            yield item
+    except LLMAPICallError as e:
+        recorder.fail(e)
+        raise
+    finally:
+        recorder.save() # Also on early close: whatever the caller consumed is what a replay will see
+
+async def _acall_llm(
+    model_name: str,
+    api_key: str,
+    contents: Union[str, List[Content]],
+    generation_config_params: Optional[Dict[str, Any]] = None,
+    safety_settings_params: Optional[List[Dict[str, Any]]] = None,
+    tools: Optional[List[Any]] = None,
+    settings: Optional[Dict[str, Any]] = None,
+    priority: str = PRIORITY_NORMAL
+) -> AsyncIterator[Dict[str, Any]]:
+    """Async counterpart of _call_llm."""
+    settings = settings or {}
+    backend = _get_llm_backend(settings)
+    call_args = (model_name, api_key, contents, generation_config_params, safety_settings_params, tools, settings)
+    mode = _get_llm_mode()
+    request_key = _compute_request_key(model_name, contents, generation_config_params, safety_settings_params)
+    flight_key = _single_flight_key(backend, request_key, tools, settings)
+    if mode == LLM_MODE_LIVE:
+        async for item in _asingle_flight_stream(flight_key, lambda: _aprefix_cached_stream(backend, call_args, settings, priority)):
+            yield item
+        return
+
+    if mode == LLM_MODE_REPLAY:
+        try:
+            cassette = _load_cassette(request_key, model_name)
+        except LLMAPICallError as e:
+            yield _gemini_error_chunk(str(e), e.original_exception or e)
+            raise
+        for delay_s, item in _replay_delays(cassette):
+            if delay_s:
+                await asyncio.sleep(delay_s)
+            yield item
+        if cassette.get('exception'):
+            raise LLMAPICallError(message=cassette['exception']['message'])
+        return
+
+    recorder = _CassetteRecorder(request_key, model_name)
+    try:
+        async for item in _asingle_flight_stream(flight_key, lambda: _aprefix_cached_stream(backend, call_args, settings, priority)):
+            recorder.add(item)
+            yield item
+    except LLMAPICallError as e:
+        recorder.fail(e)
+        raise
+    finally:
+        recorder.save()
+
+
+# --- Call Metrics (llm_metrics.jsonl) ---
+# Every generate_response_stream / agenerate_response_stream call (and so every aggregated call)
+# measures request start, time to first chunk, inter-chunk gaps, total duration, token counts and
+# throughput. The record is returned through the 'final_metadata_out' dict (and as 'metrics' in the
+# aggregated response), and appended as one JSON line to <project_root>/.gouai/llm_metrics.jsonl.
+# 'script' and 'request_key' identify the calling script and the prompt, so wall-clock time can be
+# grouped by either. File output is disabled with 'llm_metrics: false' in .gouai_config.yaml.
+LLM_METRICS_FILENAME = "llm_metrics.jsonl"
+_LLM_METRICS_LOCK = threading.Lock()
+
+class _LLMCallMetrics:
+    def __init__(self, session_id: str, task_id: str):
+        self.started_at = datetime.now()
+        self._start = time.monotonic()
+        self.session_id = session_id
+        self.task_id = task_id
+        self.script = Path(sys.argv[0]).name if sys.argv and sys.argv[0] else None
+        self.model_name: Optional[str] = None
+        self.backend_name: Optional[str] = None
+        self.request_key: Optional[str] = None
+        self.prompt_chars: Optional[int] = None
+        self.priority = PRIORITY_NORMAL
+        self.write_enabled = True
+        self.first_chunk_s: Optional[float] = None
+        self.last_chunk_s: Optional[float] = None
+        self.chunk_count = 0
+        self.gap_total_s = 0.0
+        self.gap_max_s = 0.0
+        self.usage_metadata: Optional[Dict[str, Any]] = None
+        self.errored = False
+        self.completed = False
+
+    def describe_request(self, settings: Dict[str, Any], model_name: str, actual_contents: Union[str, List[Any]],
+                         priority: Optional[str] = None):
+        self.priority = _resolve_priority(priority)
+        self.model_name = model_name
+        self.backend_name = settings.get('llm_backend') or DEFAULT_LLM_BACKEND
+        self.request_key = _compute_request_key(model_name, actual_contents)[:16]
+        self.prompt_chars = len(json.dumps(_normalize_contents_for_key(actual_contents), ensure_ascii=False, default=str))
+        self.write_enabled = bool(settings.get('llm_metrics', True))
+
+    def observe(self, chunk_dict: Dict[str, Any]):
+        if chunk_dict.get('is_error'):
+            self.errored = True
+        elif chunk_dict.get('is_final_summary'):
+            self.usage_metadata = chunk_dict.get('usage_metadata')
+        elif chunk_dict.get('is_chunk'):
+            now_s = time.monotonic() - self._start
+            if self.first_chunk_s is None:
+                self.first_chunk_s = now_s
+            else:
+                gap_s = now_s - self.last_chunk_s
+                self.gap_total_s += gap_s
+                self.gap_max_s = max(self.gap_max_s, gap_s)
+            self.last_chunk_s = now_s
+            self.chunk_count += 1
+
+    def as_record(self) -> Dict[str, Any]:
+        duration_s = time.monotonic() - self._start
+        usage = self.usage_metadata or {}
+        response_tokens = usage.get('candidates_token_count')
+        generation_s = duration_s - self.first_chunk_s if self.first_chunk_s is not None else None
+        return {
+            'timestamp': self.started_at.isoformat(timespec="milliseconds"),
+            'script': self.script,
+            'session_id': self.session_id,
+            'task_id': self.task_id,
+            'model': self.model_name,
+            'backend': self.backend_name,
+            'request_key': self.request_key,
+            'prompt_chars': self.prompt_chars,
+            'priority': self.priority,
+            'outcome': "error" if self.errored else ("ok" if self.completed else "abandoned"),
+            'duration_s': round(duration_s, 4),
+            'ttft_s': round(self.first_chunk_s, 4) if self.first_chunk_s is not None else None,
+            'chunk_count': self.chunk_count,
+            'mean_inter_chunk_gap_s': round(self.gap_total_s / (self.chunk_count - 1), 4) if self.chunk_count > 1 else None,
+            'max_inter_chunk_gap_s': round(self.gap_max_s, 4) if self.chunk_count > 1 else None,
+            'chunks_per_s': round(self.chunk_count / duration_s, 3) if duration_s > 0 else None,
+            'prompt_tokens': usage.get('prompt_token_count'),
+            'response_tokens': response_tokens,
+            'total_tokens': usage.get('total_token_count'),
+            'response_tokens_per_s': round(response_tokens / generation_s, 3) if response_tokens and generation_s else None,
+        }
+
+def _llm_metrics_path(project_root: Optional[str]) -> Optional[Path]:
+    if not project_root or not Path(project_root).is_dir():
+        return None
+    return Path(project_root) / ".gouai" / LLM_METRICS_FILENAME
+
+def _append_llm_metrics(metrics_path: Path, record: Dict[str, Any]):
+    try:
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with _LLM_METRICS_LOCK:
+            metrics_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(metrics_path, 'a', encoding='utf-8') as f:
+                f.write(line)
+    except (OSError, TypeError, ValueError) as e:
+        _log_error_to_project(f"Could not append LLM metrics to '{metrics_path}': {e}", e)
+
+def _finish_call_metrics(
+    project_root: Optional[str],
+    call_metrics: _LLMCallMetrics,
+    recorder: Optional["_AssistantTurnRecorder"],
+    final_metadata_out: Optional[Dict[str, Any]]
+):
+    """Writes the call's metrics line and fills final_metadata_out for the caller."""
+    record = call_metrics.as_record()
+    if call_metrics.write_enabled:
+        metrics_path = _llm_metrics_path(project_root)
+        if metrics_path:
+            _append_llm_metrics(metrics_path, record)
+    if final_metadata_out is not None:
+        turn_metadata = recorder.assistant_turn_metadata if recorder else {}
+        final_metadata_out.update({
+            'usage_metadata': turn_metadata.get('usage_metadata'),
+            'prompt_feedback': turn_metadata.get('prompt_feedback'),
+            'finish_reason': turn_metadata.get('finish_reason'),
+            'metrics': record
+        })
+
+
+# --- Token & Cost Ledger ---
+# Each call's final usage_metadata is appended as one JSON line to two append-only ledgers:
+#   <task_dir>/llm_usage_ledger.jsonl              -> the task's own history, next to llm_conversation_log.md
+#   <project_root>/.gouai/llm_usage_ledger.jsonl   -> every task's calls, with the task's directory relative to the root
+# get_llm_usage_totals() answers per-task, per-subtree and per-project totals from the project ledger,
+# reading only the lines appended since its previous call. Calls answered by joining an identical
+# in-flight request (single-flight) are recorded as 'coalesced' and do not add to token or cost totals.
+# Costs use the 'model_pricing' table in .gouai_config.yaml (USD per million tokens), e.g.:
+#   model_pricing:
+#     gemini-2.5-pro: {input_per_million: 1.25, output_per_million: 10.0}
+#     gemini-2.5-flash: {input_per_million: 0.30, output_per_million: 2.50}
+# Models missing from the table are recorded with cost_estimate null and counted as 'unpriced_calls'.
+LLM_USAGE_LEDGER_FILENAME = "llm_usage_ledger.jsonl"
+_USAGE_TOTAL_FIELDS = ('calls', 'coalesced_calls', 'unpriced_calls', 'prompt_tokens', 'response_tokens', 'total_tokens', 'cost_estimate')
+_USAGE_TOTALS: Dict[Path, "_UsageTotals"] = {}
+_USAGE_TOTALS_LOCK = threading.Lock()
+
+def _estimate_call_cost(model_name: str, usage_metadata: Dict[str, Any], settings: Dict[str, Any]) -> Optional[float]:
+    model_pricing = (settings.get('model_pricing') or {}).get(model_name)
+    if not isinstance(model_pricing, dict):
+        return None
+    input_cost = (usage_metadata.get('prompt_token_count') or 0) * float(model_pricing.get('input_per_million', 0))
+    output_cost = (usage_metadata.get('candidates_token_count') or 0) * float(model_pricing.get('output_per_million', 0))
+    return round((input_cost + output_cost) / 1_000_000, 8)
+
+def _project_usage_ledger_path(project_root: Optional[str]) -> Optional[Path]:
+    if not project_root or not Path(project_root).is_dir():
+        return None
+    return Path(project_root).resolve() / ".gouai" / LLM_USAGE_LEDGER_FILENAME
+
+def _append_ledger_line(ledger_path: Path, line: str, log_settings: _ConversationLogSettings):
+    if log_settings.background_writer:
+        _LLM_LOG_WRITER.submit(ledger_path, "", line, log_settings=log_settings)
+        return
+    try:
+        ledger_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(ledger_path, 'a', encoding='utf-8') as f:
+            f.write(line)
+    except OSError as e:
+        _log_error_to_project(f"Could not append to usage ledger '{ledger_path}': {e}", e)
+
+def _record_llm_usage(
+    project_root: Optional[str],
+    log_file_path: Optional[Path],
+    session_id: str,
+    task_id: str,
+    model_name: str,
+    settings: Dict[str, Any],
+    final_summary_data: Optional[Dict[str, Any]]
+):
+    """Appends the call's usage to the task and project ledgers. Calls without usage_metadata are skipped."""
+    usage_metadata = (final_summary_data or {}).get('usage_metadata')
+    if not usage_metadata:
+        return
+    task_dir = log_file_path.parent if log_file_path else None
+    project_ledger_path = _project_usage_ledger_path(project_root)
+    relative_task_dir = None
+    if task_dir and project_ledger_path:
+        try:
+            relative_task_dir = task_dir.resolve().relative_to(project_ledger_path.parent.parent).as_posix()
+        except ValueError:
+            relative_task_dir = None
+    record = {
+        'timestamp': datetime.now().isoformat(timespec="seconds"),
+        'session_id': session_id,
+        'task_id': task_id,
+        'task_dir': relative_task_dir,
+        'model': model_name,
+        'prompt_tokens': usage_metadata.get('prompt_token_count'),
+        'response_tokens': usage_metadata.get('candidates_token_count'),
+        'total_tokens': usage_metadata.get('total_token_count'),
+        'cost_estimate': _estimate_call_cost(model_name, usage_metadata, settings),
+        'coalesced': bool(final_summary_data.get('coalesced'))
+    }
+    line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+    log_settings = _conversation_log_settings(settings.get('conversation_log'))
+    if task_dir:
+        _append_ledger_line(task_dir / LLM_USAGE_LEDGER_FILENAME, line, log_settings)
+    if project_ledger_path:
+        _append_ledger_line(project_ledger_path, line, log_settings)
+
+class _UsageTotals:
+    """Running totals per task directory, folded in from the project ledger's new lines on each refresh."""
+    def __init__(self, ledger_path: Path):
+        self.ledger_path = ledger_path
+        self.offset = 0
+        self.by_task_dir: Dict[Optional[str], Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def _add(self, record: Dict[str, Any]):
+        totals = self.by_task_dir.setdefault(record.get('task_dir'), dict.fromkeys(_USAGE_TOTAL_FIELDS, 0))
+        totals['calls'] += 1
+        if record.get('coalesced'):
+            totals['coalesced_calls'] += 1
+            return
+        for field in ('prompt_tokens', 'response_tokens', 'total_tokens'):
+            totals[field] += record.get(field) or 0
+        if record.get('cost_estimate') is None:
+            totals['unpriced_calls'] += 1
+        else:
+            totals['cost_estimate'] += record['cost_estimate']
+
+    def refresh(self):
+        with self._lock:
+            try:
+                ledger_size = os.path.getsize(self.ledger_path)
+            except OSError:
+                return
+            if ledger_size < self.offset: # Truncated or replaced: start over
+                self.offset = 0
+                self.by_task_dir.clear()
+            if ledger_size == self.offset:
+                return
+            with open(self.ledger_path, 'rb') as f:
+                f.seek(self.offset)
+                new_bytes = f.read(ledger_size - self.offset)
+            complete_bytes = new_bytes[:new_bytes.rfind(b"\n") + 1] # A partially written last line waits for the next refresh
+            self.offset += len(complete_bytes)
+            for raw_line in complete_bytes.splitlines():
+                try:
+                    self._add(json.loads(raw_line))
+                except ValueError:
+                    continue
+
+    def totals(self, task_dir: Optional[str] = None, include_subtasks: bool = True) -> Dict[str, float]:
+        result = dict.fromkeys(_USAGE_TOTAL_FIELDS, 0)
+        with self._lock:
+            for recorded_dir, totals in self.by_task_dir.items():
+                if task_dir is None or task_dir == ".":
+                    matches = include_subtasks or recorded_dir == "."
+                elif recorded_dir is None:
+                    matches = False
+                else:
+                    matches = recorded_dir == task_dir or (include_subtasks and recorded_dir.startswith(task_dir + "/"))
+                if matches:
+                    for field in _USAGE_TOTAL_FIELDS:
+                        result[field] += totals[field]
+        result['cost_estimate'] = round(result['cost_estimate'], 6)
+        return result
+
+def get_llm_usage_totals(project_root: str, task_id: Optional[str] = None, include_subtasks: bool = True) -> Optional[Dict[str, float]]:
+    """
+    Token and cost totals from the project's usage ledger: for the whole project (task_id=None), or for
+    one task, by default including every task below it. Returns None if the task cannot be found.
+    """
+    ledger_path = _project_usage_ledger_path(project_root)
+    if ledger_path is None:
+        return None
+    task_dir = None
+    if task_id is not None:
+        resolved_task_dir = _find_task_dir_cached(ledger_path.parent.parent, task_id)
+        if resolved_task_dir is None:
+            return None
+        task_dir = resolved_task_dir.resolve().relative_to(ledger_path.parent.parent).as_posix()
+    flush_llm_logs() # Include calls whose ledger lines are still queued
+    with _USAGE_TOTALS_LOCK:
+        usage_totals = _USAGE_TOTALS.get(ledger_path)
+        if usage_totals is None:
+            usage_totals = _USAGE_TOTALS[ledger_path] = _UsageTotals(ledger_path)
+    usage_totals.refresh()
+    return usage_totals.totals(task_dir, include_subtasks)
+
+
+# --- Shared Request / Response Plumbing (used by the sync and async public functions) ---
+def _prepare_llm_request(
+    project_root: Optional[str],
+    session_id: str,
+    task_id: str,
+    prompt_text: Optional[str],
+    contents: Optional[Union[str, List[Content]]],
+    override_model_name: Optional[str],
+    log_file_path: Optional[Path]
+) -> tuple[Dict[str, Any], str, Union[str, List[Any]]]:
+    """
+    Resolves settings, model name and request contents, and logs the User turn.
+    Returns (settings, actual_model_name, actual_contents).
+    Raises ConfigurationError or ValueError (including PromptBudgetExceededError) exactly as
+    generate_response_stream documents.
+    """
+    settings = get_llm_provider_settings(project_root) #
+    api_key = settings.get('api_key')
+    if not api_key and _get_llm_backend(settings).requires_gemini_api_key:
+        # This case should be handled by get_llm_provider_settings raising ConfigurationError
+        # for empty GEMINI_API_KEY
+        raise ConfigurationError("API key not found in settings.")
+
+    actual_model_name = override_model_name or settings.get('default_model_name')
+    if not actual_model_name:
+        # This case should be handled by get_llm_provider_settings (via load_api_config_settings)
+        # raising ConfigurationError if default_model_name is missing
+        raise ConfigurationError("LLM model name not configured.")
+
+    actual_contents = _resolve_request_contents(prompt_text, contents)
+    _preflight_prompt_budget(settings, actual_model_name, actual_contents)
+
+    # Log User Prompt
+    if log_file_path:
+        _append_turn_to_llm_log(
+            log_file_path,
+            "User",
+            _user_turn_text_for_log(actual_contents), # Log only the current user/system message
+            model_name_for_session=actual_model_name,
+            session_id_for_session=session_id,
+            task_id_for_session=task_id,
+            defer_write=True,
+            log_settings=_conversation_log_settings(settings.get('conversation_log'))
+        )
+    return settings, actual_model_name, actual_contents
+
+class _AssistantTurnRecorder:
+    """
+    Accumulates the dicts coming out of _call_gemini_api / _acall_gemini_api and logs the
+    Assistant turn (or the error) once the stream is over.
+    """
+    def __init__(self, log_settings: _ConversationLogSettings = _DEFAULT_CONVERSATION_LOG_SETTINGS):
+        self.log_settings = log_settings
+        self.accumulated_text_response = ""
+        self.accumulated_parts_response: List[Part] = []
+        self.final_summary_data: Optional[Dict[str, Any]] = None
+        self.error_data: Optional[Dict[str, Any]] = None
+        self.assistant_turn_metadata: Dict[str, Any] = {}
+
+    def consume(self, chunk_dict: Dict[str, Any]) -> bool:
+        """Records one internal dict. Returns True if it should be forwarded to the caller."""
+        if chunk_dict.get('is_error'):
+            self.error_data = chunk_dict # Store error and stop processing normal chunks
+            # Error is already logged by _call_gemini_api before yielding this
+            return True # Forward the error chunk
+        if chunk_dict.get('is_final_summary'):
+            self.final_summary_data = chunk_dict # Store final summary
+            # Don't yield this, it's for post-stream logging and aggregation.
+            if chunk_dict.get('usage_metadata'):
+                self.assistant_turn_metadata['usage_metadata'] = chunk_dict['usage_metadata']
+            if chunk_dict.get('prompt_feedback'):
+                 self.assistant_turn_metadata['prompt_feedback'] = chunk_dict['prompt_feedback']
+            return False
+        if chunk_dict.get('is_chunk'):
+            self.accumulated_text_response += chunk_dict.get('text_chunk', '')
+            if chunk_dict.get('parts_chunk'):
+                # This simple accumulation might not be ideal for all Part types,
+                # but for text it's okay. For multimodal, caller might need raw parts_chunk.
+                self.accumulated_parts_response.extend(chunk_dict.get('parts_chunk', []))
+
+            # Capture finish_reason and safety_ratings from the last chunk processed,
+            # as these might be updated progressively by some models.
+            if chunk_dict.get('candidate_finish_reason'):
+                self.assistant_turn_metadata['finish_reason'] = chunk_dict['candidate_finish_reason']
+            if chunk_dict.get('candidate_safety_ratings'):
+                self.assistant_turn_metadata['safety_ratings'] = chunk_dict['candidate_safety_ratings']
+            return True # Yield the actual content chunk
+        return False
+
+    def log_assistant_turn(self, log_file_path: Optional[Path]):
+        """Log Assistant Response or Error."""
+        if not log_file_path:
+            return
+        if self.error_data:
+            _append_turn_to_llm_log(
+                log_file_path, "Assistant",
+                f"Error during API call: {self.error_data.get('error')}\n"
+                f"Original Exception: {self.error_data.get('original_exception_type')} - {self.error_data.get('original_exception_message')}",
+                defer_write=True,
+                log_settings=self.log_settings
+            )
+        elif self.accumulated_text_response or self.accumulated_parts_response or self.final_summary_data: # Log if there was any response
+            # For logging, use accumulated_text_response.
+            # If more complex content, one might choose to log a summary of accumulated_parts_response.
+            _append_turn_to_llm_log(
+                log_file_path, "Assistant",
+                self.accumulated_text_response if self.accumulated_text_response else "[No text content in response parts]",
+                turn_metadata=self.assistant_turn_metadata,
+                defer_write=True,
+                log_settings=self.log_settings
+            )
+        # If stream was empty and no error, and no final_summary_data with content, nothing may be logged for assistant.
+
+def _stream_error_chunk(e: Exception, task_id: str, function_name: str) -> Optional[Dict[str, Any]]:
+    """
+    Logs an exception raised inside a public stream function and returns the error dict to yield
+    before re-raising. LLMAPICallError returns None: _call_gemini_api already logged and yielded it.
+    """
+    if isinstance(e, LLMAPICallError):
+        return None
+    if isinstance(e, ConfigurationError):
+        _log_error_to_project(f"Configuration error in {function_name} for task {task_id}: {e}", e)
+        return {'error': str(e), 'is_error': True, 'is_configuration_error': True}
+    if isinstance(e, ValueError): # e.g. if prompt_text and contents are both None
+        _log_error_to_project(f"ValueError in {function_name} for task {task_id}: {e}", e)
+        return {'error': str(e), 'is_error': True, 'is_value_error': True}
+    _log_error_to_project(f"Unexpected error in {function_name} for task {task_id}: {e}", e)
+    return {'error': str(e), 'is_error': True, 'is_unexpected_error': True}
+
+def _new_aggregated_response() -> Dict[str, Any]:
+    return {
+        'text': "",
+        'usage_metadata': None,
+        'prompt_feedback': None,
+        'finish_reason': None,
+        'safety_ratings': None,
+        'error_info': None, # To store any error encountered
+        'cache_hit': False,
+        'metrics': None # Timing / throughput of the call (None on a cache hit)
+    }
+
+def _apply_final_metadata(final_response_data: Dict[str, Any], final_metadata: Dict[str, Any]):
+    """Copies what the stream reported through final_metadata_out into the aggregated response."""
+    for key in ('usage_metadata', 'prompt_feedback', 'metrics'):
+        if final_metadata.get(key) is not None:
+            final_response_data[key] = final_metadata[key]
+
+def _aggregate_chunk(final_response_data: Dict[str, Any], full_text_response: List[str], chunk: Dict[str, Any]) -> bool:
+    """Folds one yielded chunk into the aggregated response. Returns False once aggregation should stop."""
+    if chunk.get('is_error'):
+        final_response_data['error_info'] = {
+            'message': chunk.get('error'),
+            'type': chunk.get('original_exception_type') or ('ConfigurationError' if chunk.get('is_configuration_error') else 'ValueError' if chunk.get('is_value_error') else 'LLMProcessingError'),
+            'details': chunk.get('original_exception_message')
+        }
+        # If an error occurs, we might not get further valid data or summary.
+        # The error would have been logged by generate_response_stream or _call_gemini_api.
+        return False # Stop aggregation on error
+
+    if chunk.get('is_chunk'):
+        full_text_response.append(chunk.get('text_chunk', ''))
+        # These might be overwritten by later chunks, which is usually fine for streaming
+        if chunk.get('candidate_finish_reason'):
+            final_response_data['finish_reason'] = chunk.get('candidate_finish_reason')
+        if chunk.get('candidate_safety_ratings'):
+            final_response_data['safety_ratings'] = chunk.get('candidate_safety_ratings')
+
+    # The final summary from _call_gemini_api (usage_metadata, prompt_feedback)
+    # is consumed by generate_response_stream for logging the assistant turn; it is not
+    # part of what the stream yields. For the aggregated return we rely on the last
+    # chunk's finish_reason / safety_ratings, and usage_metadata / prompt_feedback stay
+    # available in the log.
+    # To improve: One could pass a list to generate_response_stream to populate with final metadata.
+    # e.g., final_metadata_capture = []
+    # for chunk in generate_response_stream(..., final_metadata_out=final_metadata_capture):
+    # if final_metadata_capture: update final_response_data
+    return True
+
+def _aggregated_error_info(e: Exception, task_id: str, function_name: str) -> Dict[str, Any]:
+    if isinstance(e, LLMAPICallError):
+        return {
+            'message': str(e),
+            'type': type(e.original_exception).__name__ if e.original_exception else "LLMAPICallError",
+            'details': str(e.original_exception) if e.original_exception else str(e)
+        }
+    if isinstance(e, ConfigurationError):
+        return {'message': str(e), 'type': "ConfigurationError"}
+    if isinstance(e, ValueError):
+        return {'message': str(e), 'type': "ValueError"}
+    _log_error_to_project(f"Unexpected error in {function_name} for task {task_id}: {e}", e) # Catch-all
+    return {'message': str(e), 'type': type(e).__name__}
+
+def _lookup_aggregated_cache(
+    project_root: Optional[str],
+    session_id: str,
+    task_id: str,
+    prompt_text: Optional[str],
+    contents: Optional[Union[str, List[Content]]],
+    override_model_name: Optional[str],
+    override_generation_config: Optional[Dict[str, Any]],
+    override_safety_settings: Optional[List[Dict[str, Any]]],
+    cache_policy: Optional[str]
+) -> tuple[Optional[tuple], Optional[Dict[str, Any]]]:
+    """
+    Returns (cache_slot, cached_result). cache_slot is (cache, key, model_name) when the response
+    should be stored after a fresh call; cached_result is the full aggregated result on a hit
+    (already logged to the task's conversation log).
+    """
+    if cache_policy == CACHE_POLICY_OFF:
+        return None, None
+    try:
+        cache_settings = get_llm_provider_settings(project_root)
+        response_cache = _get_response_cache(cache_settings, project_root)
+        if not response_cache:
+            return None, None
+        cache_model_name = override_model_name or cache_settings.get('default_model_name')
+        cache_contents = _resolve_request_contents(prompt_text, contents)
+        cache_key = _compute_request_key(cache_model_name, cache_contents, override_generation_config, override_safety_settings)
+    except (ConfigurationError, ValueError):
+        return None, None # Reported with the usual error_info by the uncached path
+    cache_slot = (response_cache, cache_key, cache_model_name)
+    if cache_policy == CACHE_POLICY_REFRESH:
+        return cache_slot, None
+    cached_response = response_cache.get(cache_key)
+    if cached_response is None:
+        return cache_slot, None
+    log_file_path = _get_task_llm_log_path(project_root, task_id)
+    if log_file_path:
+        log_settings = _conversation_log_settings(cache_settings.get('conversation_log'))
+        _append_turn_to_llm_log(
+            log_file_path, "User", _user_turn_text_for_log(cache_contents),
+            model_name_for_session=cache_model_name,
+            session_id_for_session=session_id,
+            task_id_for_session=task_id,
+            defer_write=True,
+            log_settings=log_settings
+        )
+        _append_turn_to_llm_log(
+            log_file_path, "Assistant", cached_response.get('text') or "[No text content in response parts]",
+            turn_metadata={'finish_reason': cached_response.get('finish_reason'), 'cache_hit': True},
+            defer_write=True,
+            log_settings=log_settings
+        )
+    return cache_slot, {**_new_aggregated_response(), **cached_response, 'cache_hit': True}
+
+def _store_aggregated_in_cache(cache_slot: Optional[tuple], final_response_data: Dict[str, Any]):
+    if cache_slot and not final_response_data['error_info'] and final_response_data['text']:
+        response_cache, cache_key, cache_model_name = cache_slot
+        response_cache.put(
+            cache_key,
+            {key: value for key, value in final_response_data.items() if key not in ('cache_hit', 'metrics')},
+            cache_model_name
+        )
+
+
+# --- Public API Functions ---
+def generate_response_stream(
+    project_root: Optional[str], # Needed for config and potentially log path finding
+    session_id: str,
+    task_id: str,
+    prompt_text: Optional[str] = None,
+    contents: Optional[Union[str, List[Content]]] = None,
+    override_model_name: Optional[str] = None,
+    override_generation_config: Optional[Dict[str, Any]] = None,
+    override_safety_settings: Optional[List[Dict[str, Any]]] = None,
+    override_tools: Optional[List[Any]] = None,
+    final_metadata_out: Optional[Dict[str, Any]] = None,
+    priority: Optional[str] = None
+) -> Iterable[Dict[str, Any]]:
+    """
+    Public function to get a streaming response from the configured LLM (Gemini for MVP).
+    Handles configuration, API key, logging, and calls the core API function.
+    Logs user prompt before call, and assistant response after stream completion.
+    If final_metadata_out is given, it is filled once the stream ends with 'usage_metadata',
+    'prompt_feedback', 'finish_reason' and 'metrics' (timing and throughput, see llm_metrics.jsonl).
+    priority picks the concurrency lane the call waits in: "interactive", "normal" (default) or "bulk".
+    """
+    if not project_root and "~" not in str(Path().home()): # Check if we can even resolve user config without project root
+        # This check is a bit simplistic; load_api_config_settings handles None project_root
+        # by only trying user-level. But for logging path, project_root is more critical.
+        # If user-level config is the only source, and task_id implies a non-project specific context,
+        # logging path becomes ambiguous.
+        # For now, we'll proceed, but _get_task_llm_log_path might return None.
+        pass
+
+    log_file_path = _get_task_llm_log_path(project_root, task_id)
+    call_metrics = _LLMCallMetrics(session_id, task_id)
+    recorder = None
+
+    try:
+        settings, actual_model_name, actual_contents = _prepare_llm_request(
+            project_root, session_id, task_id, prompt_text, contents, override_model_name, log_file_path
+        )
+        call_metrics.describe_request(settings, actual_model_name, actual_contents, priority)
+
+        # --- Call the internal API function ---
+        response_iterator = _call_llm(
+            model_name=actual_model_name,
+            api_key=settings.get('api_key'),
+            contents=actual_contents,
+            generation_config_params=override_generation_config,
+            safety_settings_params=override_safety_settings,
+            tools=override_tools,
+            settings=settings,
+            priority=call_metrics.priority
+        )
+
+        # --- Process and yield stream, then log assistant response ---
+        recorder = _AssistantTurnRecorder(_conversation_log_settings(settings.get('conversation_log')))
+        for chunk_dict in response_iterator:
+            call_metrics.observe(chunk_dict)
+            if recorder.consume(chunk_dict):
+                yield chunk_dict
+            if recorder.error_data:
+                break
+        call_metrics.completed = True
+        recorder.log_assistant_turn(log_file_path)
+        _record_llm_usage(project_root, log_file_path, session_id, task_id, actual_model_name, settings, recorder.final_summary_data)
+
+    except Exception as e:
+        # ConfigurationError / ValueError / unexpected errors are logged and yielded as an error dict;
+        # LLMAPICallError was already logged and yielded by _call_gemini_api. All are re-raised.
+        call_metrics.errored = True
+        error_chunk = _stream_error_chunk(e, task_id, "generate_response_stream")
+        if error_chunk:
+            yield error_chunk
+        raise
+    finally:
+        _finish_call_metrics(project_root, call_metrics, recorder, final_metadata_out)
+
+
+def generate_response_aggregated(
+    project_root: Optional[str],
+    session_id: str,
+    task_id: str,
+    prompt_text: Optional[str] = None,
+    contents: Optional[Union[str, List[Content]]] = None,
+    override_model_name: Optional[str] = None,
+    override_generation_config: Optional[Dict[str, Any]] = None,
+    override_safety_settings: Optional[List[Dict[str, Any]]] = None,
+    override_tools: Optional[List[Any]] = None,
+    cache_policy: Optional[str] = None,
+    priority: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Public function that calls generate_response_stream and aggregates the
+    chunks into a single response dictionary.
+
+    When 'response_cache' is enabled in the configuration, identical requests (same model,
+    contents, generation config and safety settings) are answered from the on-disk cache.
+    cache_policy="off" bypasses the cache entirely; cache_policy="refresh" skips the lookup
+    but stores the fresh response. priority is passed on to generate_response_stream.
+    """
+    # For simplicity, we'll just aggregate text. A more complex aggregation
+    # might reconstruct a List[Part] or handle multimodal outputs differently.
+    full_text_response: List[str] = []
+    final_response_data = _new_aggregated_response()
+    final_metadata: Dict[str, Any] = {}
+
+    cache_slot, cached_result = _lookup_aggregated_cache(
+        project_root, session_id, task_id, prompt_text, contents,
+        override_model_name, override_generation_config, override_safety_settings, cache_policy
+    )
+    if cached_result is not None:
+        return cached_result
+
+    try:
+        stream_iterator = generate_response_stream(
+            project_root=project_root,
+            session_id=session_id,
+            task_id=task_id,
+            prompt_text=prompt_text,
+            contents=contents,
+            override_model_name=override_model_name,
+            override_generation_config=override_generation_config,
+            override_safety_settings=override_safety_settings,
+            override_tools=override_tools,
+            final_metadata_out=final_metadata,
+            priority=priority
+        )
+
+        for chunk in stream_iterator:
+            if not _aggregate_chunk(final_response_data, full_text_response, chunk):
+                break
+        if hasattr(stream_iterator, 'close'):
+            stream_iterator.close() # Runs the stream's cleanup now (after a break), which fills final_metadata
+
+        final_response_data['text'] = "".join(full_text_response)
+
+        # If no specific error was caught and yielded by the stream,
+        # but the text is empty and there was no clear finish reason,
+        # it might indicate a silent block or empty response.
+        # (prompt_feedback's block_reason would be the real cause; it is in the conversation log.)
+
+    except Exception as e:
+        final_response_data['error_info'] = _aggregated_error_info(e, task_id, "generate_response_aggregated")
+
+    _apply_final_metadata(final_response_data, final_metadata)
+    _store_aggregated_in_cache(cache_slot, final_response_data)
+    return final_response_data
+
+
+# --- Async Public API Functions ---
+# Same logging, caching and error semantics as the sync functions above, but on the SDK's async
+# client, so orchestration scripts can fan out many calls on one event loop, e.g.:
+#   results = await asyncio.gather(*(agenerate_response_aggregated(root, sid, tid, prompt_text=p) for p in prompts))
+# Conversation-log writes are small local appends and are done inline.
+async def agenerate_response_stream(
+    project_root: Optional[str],
+    session_id: str,
+    task_id: str,
+    prompt_text: Optional[str] = None,
+    contents: Optional[Union[str, List[Content]]] = None,
+    override_model_name: Optional[str] = None,
+    override_generation_config: Optional[Dict[str, Any]] = None,
+    override_safety_settings: Optional[List[Dict[str, Any]]] = None,
+    override_tools: Optional[List[Any]] = None,
+    final_metadata_out: Optional[Dict[str, Any]] = None,
+    priority: Optional[str] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """Async generator counterpart of generate_response_stream (use with 'async for')."""
+    log_file_path = _get_task_llm_log_path(project_root, task_id)
+    call_metrics = _LLMCallMetrics(session_id, task_id)
+    recorder = None
+
+    try:
+        settings, actual_model_name, actual_contents = _prepare_llm_request(
+            project_root, session_id, task_id, prompt_text, contents, override_model_name, log_file_path
+        )
+        call_metrics.describe_request(settings, actual_model_name, actual_contents, priority)
+
+        response_iterator = _acall_llm(
+            model_name=actual_model_name,
+            api_key=settings.get('api_key'),
+            contents=actual_contents,
+            generation_config_params=override_generation_config,
+            safety_settings_params=override_safety_settings,
+            tools=override_tools,
+            settings=settings,
+            priority=call_metrics.priority
+        )
+
+        recorder = _AssistantTurnRecorder(_conversation_log_settings(settings.get('conversation_log')))
+        async for chunk_dict in response_iterator:
+            call_metrics.observe(chunk_dict)
+            if recorder.consume(chunk_dict):
+                yield chunk_dict
+            if recorder.error_data:
+                break
+        call_metrics.completed = True
+        recorder.log_assistant_turn(log_file_path)
+        _record_llm_usage(project_root, log_file_path, session_id, task_id, actual_model_name, settings, recorder.final_summary_data)
+
+    except Exception as e:
+        call_metrics.errored = True
+        error_chunk = _stream_error_chunk(e, task_id, "agenerate_response_stream")
+        if error_chunk:
+            yield error_chunk
+        raise
+    finally:
+        _finish_call_metrics(project_root, call_metrics, recorder, final_metadata_out)
+
+
+async def agenerate_response_aggregated(
+    project_root: Optional[str],
+    session_id: str,
+    task_id: str,
+    prompt_text: Optional[str] = None,
+    contents: Optional[Union[str, List[Content]]] = None,
+    override_model_name: Optional[str] = None,
+    override_generation_config: Optional[Dict[str, Any]] = None,
+    override_safety_settings: Optional[List[Dict[str, Any]]] = None,
+    override_tools: Optional[List[Any]] = None,
+    cache_policy: Optional[str] = None,
+    priority: Optional[str] = None
+) -> Dict[str, Any]:
+    """Async counterpart of generate_response_aggregated; returns the same response dictionary."""
+    full_text_response: List[str] = []
+    final_response_data = _new_aggregated_response()
+    final_metadata: Dict[str, Any] = {}
+
+    cache_slot, cached_result = _lookup_aggregated_cache(
+        project_root, session_id, task_id, prompt_text, contents,
+        override_model_name, override_generation_config, override_safety_settings, cache_policy
+    )
+    if cached_result is not None:
+        return cached_result
+
+    try:
+        stream_iterator = agenerate_response_stream(
+            project_root=project_root,
+            session_id=session_id,
+            task_id=task_id,
+            prompt_text=prompt_text,
+            contents=contents,
+            override_model_name=override_model_name,
+            override_generation_config=override_generation_config,
+            override_safety_settings=override_safety_settings,
+            override_tools=override_tools,
+            final_metadata_out=final_metadata,
+            priority=priority
+        )
+
+        async for chunk in stream_iterator:
+            if not _aggregate_chunk(final_response_data, full_text_response, chunk):
+                break
+        if hasattr(stream_iterator, 'aclose'):
+            await stream_iterator.aclose()
+
+        final_response_data['text'] = "".join(full_text_response)
+
+    except Exception as e:
+        final_response_data['error_info'] = _aggregated_error_info(e, task_id, "agenerate_response_aggregated")
+
+    _apply_final_metadata(final_response_data, final_metadata)
+    _store_aggregated_in_cache(cache_slot, final_response_data)
+    return final_response_data
+
+
+# --- Concurrent Batch Entry Point & Per-Project Rate Limiting ---
+# Limits are read from the 'rate_limits' mapping in .gouai_config.yaml (project overrides user), e.g.:
+#   rate_limits:
+#     rpm: 60               # Requests per minute, shared by every batch running against this project
+#     tpm: 1000000          # Tokens per minute (prompt tokens estimated before the call, corrected with usage_metadata after)
+#     max_concurrency: 8    # Worker threads per batch
+# Explicit arguments to generate_responses_batch override the configured values.
+_DEFAULT_BATCH_MAX_CONCURRENCY = 4
+_CHARS_PER_TOKEN_ESTIMATE = 4
+_RATE_LIMITERS: Dict[tuple, "_ProjectRateLimiter"] = {}
+_RATE_LIMITERS_LOCK = threading.Lock()
+
+def _estimate_request_tokens(actual_contents: Union[str, List[Any]]) -> int:
+    """Cheap prompt-size estimate (~4 characters per token) used before the real count is known."""
+    total_chars = 0
+    for content_item in _normalize_contents_for_key(actual_contents):
+        for part in content_item.get('parts', []) if isinstance(content_item, dict) else []:
+            if isinstance(part, dict) and isinstance(part.get('text'), str):
+                total_chars += len(part['text'])
+            elif isinstance(part, str):
+                total_chars += len(part)
+    return max(1, total_chars // _CHARS_PER_TOKEN_ESTIMATE)
+
+class _TokenBucket:
+    """
+    Classic token bucket holding at most one minute's allowance, refilled continuously.
+    try_acquire() never blocks and returns how long to wait; acquire() blocks until granted.
+    """
+    def __init__(self, per_minute: float, clock=None):
+        self.capacity = float(per_minute)
+        self.refill_per_second = self.capacity / 60.0
+        self.available = self.capacity
+        self._clock = clock or time.monotonic
+        self._updated_at = self._clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self.available = min(self.capacity, self.available + (now - self._updated_at) * self.refill_per_second)
+        self._updated_at = now
+
+    def try_acquire(self, amount: float) -> float:
+        """Takes 'amount' if available and returns 0.0, otherwise returns the seconds until it will be."""
+        amount = min(float(amount), self.capacity) # An oversized request waits for a full bucket, not forever
+        with self._lock:
+            self._refill()
+            if self.available >= amount:
+                self.available -= amount
+                return 0.0
+            return (amount - self.available) / self.refill_per_second
+
+    def acquire(self, amount: float):
+        while True:
+            wait_seconds = self.try_acquire(amount)
+            if wait_seconds <= 0:
+                return
+            time.sleep(wait_seconds)
+
+    def adjust(self, delta: float):
+        """Corrects a previous estimate: positive delta takes more tokens (the balance may go negative)."""
+        with self._lock:
+            self._refill()
+            self.available = min(self.capacity, self.available - delta)
+
+class _ProjectRateLimiter:
+    def __init__(self, rpm: Optional[float], tpm: Optional[float]):
+        self.request_bucket = _TokenBucket(rpm) if rpm else None
+        self.token_bucket = _TokenBucket(tpm) if tpm else None
+
+    def acquire(self, estimated_tokens: int):
+        if self.request_bucket:
+            self.request_bucket.acquire(1)
+        if self.token_bucket:
+            self.token_bucket.acquire(estimated_tokens)
+
+    def record_actual_tokens(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        if self.token_bucket and actual_tokens is not None:
+            self.token_bucket.adjust(actual_tokens - estimated_tokens)
+
+def _get_project_rate_limiter(project_root: Optional[str], rpm: Optional[float], tpm: Optional[float]) -> Optional[_ProjectRateLimiter]:
+    """Returns the process-wide limiter for (project, rpm, tpm), so concurrent batches share one budget."""
+    if not rpm and not tpm:
+        return None
+    limiter_key = (str(Path(project_root).resolve()) if project_root else None, rpm, tpm)
+    with _RATE_LIMITERS_LOCK:
+        limiter = _RATE_LIMITERS.get(limiter_key)
+        if limiter is None:
+            limiter = _ProjectRateLimiter(rpm, tpm)
+            _RATE_LIMITERS[limiter_key] = limiter
+    return limiter
+
+def _configured_setting(project_root: Optional[str], key: str) -> Any:
+    try:
+        return get_llm_provider_settings(project_root).get(key)
+    except ConfigurationError:
+        return None # The request itself will report the configuration problem
+
+def _configured_rate_limits(project_root: Optional[str]) -> Dict[str, Any]:
+    rate_limits = _configured_setting(project_root, 'rate_limits')
+    return rate_limits if isinstance(rate_limits, dict) else {}
+
+def generate_responses_batch(
+    requests: List[Dict[str, Any]],
+    max_concurrency: Optional[int] = None,
+    rpm: Optional[float] = None,
+    tpm: Optional[float] = None
+) -> List[Dict[str, Any]]:
+    """
+    Runs many generate_response_aggregated calls concurrently on a bounded thread pool.
+
+    Each item of 'requests' is a dict of generate_response_aggregated keyword arguments
+    (project_root, session_id, task_id, prompt_text/contents, overrides, cache_policy).
+    Calls against the same project share a requests-per-minute and tokens-per-minute budget
+    (arguments here, else 'rate_limits' from that project's configuration). Unless max_concurrency
+    is fixed (argument or rate_limits.max_concurrency), the number of calls in flight is left to
+    the adaptive concurrency controller. Requests wait in the "bulk" priority lane unless they
+    set 'priority' themselves.
+
+    Returns one aggregated response dict per request, in the same order. A failing request
+    only sets its own 'error_info'; the rest of the batch still runs.
+    """
+    if not requests:
+        return []
+    first_project_root = requests[0].get('project_root')
+    configured_limits = _configured_rate_limits(first_project_root)
+    pool_size = max_concurrency or configured_limits.get('max_concurrency')
+    if not pool_size:
+        # Without a fixed limit, size the pool for the adaptive controller's ceiling and let it decide
+        # how many calls are actually in flight.
+        adaptive_config = _configured_setting(first_project_root, 'adaptive_concurrency')
+        adaptive_config = adaptive_config if isinstance(adaptive_config, dict) else {}
+        pool_size = adaptive_config.get('max', 64) if adaptive_config.get('enabled', True) else _DEFAULT_BATCH_MAX_CONCURRENCY
+    pool_size = int(pool_size)
+    pool_size = max(1, min(pool_size, len(requests)))
+
+    def run_one(request_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        task_id = request_kwargs.get('task_id')
+        try:
+            project_root = request_kwargs.get('project_root')
+            project_limits = configured_limits if project_root == first_project_root else _configured_rate_limits(project_root)
+            limiter = _get_project_rate_limiter(project_root, rpm or project_limits.get('rpm'), tpm or project_limits.get('tpm'))
+            estimated_tokens = 0
+            if limiter:
+                estimated_tokens = _estimate_request_tokens(
+                    _resolve_request_contents(request_kwargs.get('prompt_text'), request_kwargs.get('contents'))
+                )
+                limiter.acquire(estimated_tokens)
+            result = generate_response_aggregated(**{'priority': PRIORITY_BULK, **request_kwargs})
+            if limiter and not result.get('cache_hit'):
+                usage_metadata = result.get('usage_metadata') or {}
+                limiter.record_actual_tokens(estimated_tokens, usage_metadata.get('total_token_count'))
+            return result
+        except Exception as e: # e.g. a malformed request dict; generate_response_aggregated itself never raises
+            final_response_data = _new_aggregated_response()
+            final_response_data['error_info'] = _aggregated_error_info(e, task_id, "generate_responses_batch")
+            return final_response_data
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="gouai-llm-batch") as executor:
+        return list(executor.map(run_one, requests))
+
+
+# --- Prompt Token Budget: Preflight & Fitting ---
+# Every call is checked against a prompt token budget before it is sent, and prompt builders that
+# concatenate file content (the chat prime, compose-wsod, project reports) fit their sections into
+# it with fit_prompt_sections. Configured with 'prompt_budget' in .gouai_config.yaml (defaults shown):
+#   prompt_budget:
+#     max_prompt_tokens: 1000000   # Or per model: {default: 1000000, qwen2.5-7b-instruct: 32000}
+#     exact_count: false           # Ask the Gemini count_tokens endpoint when a prompt is near the budget
+#     strategy: truncate           # truncate | summarize (an extra LLM call per section, truncation as fallback)
+#     on_overflow: warn            # What the preflight does with an over-budget prompt: warn | error
+# Token counts are the local ~4 characters/token estimate unless exact counting is enabled and available
+# (gemini backend, not replaying, API key set); any count_tokens failure falls back to the estimate.
+DEFAULT_MAX_PROMPT_TOKENS = 1_000_000
+PROMPT_FIT_TRUNCATE = "truncate"
+PROMPT_FIT_SUMMARIZE = "summarize"
+_EXACT_COUNT_THRESHOLD = 0.75 # Fraction of the budget above which an estimate is worth an exact count
+_SUMMARY_PROMPT_OVERHEAD_TOKENS = 256 # The summary instructions, inside the same prompt budget as the material
+_TRIMMED_SECTION_MARKER = "\n[... {omitted_chars} characters omitted to fit the prompt token budget ...]\n"
+
+class PromptBudgetExceededError(ValueError):
+    def __init__(self, prompt_tokens: int, budget_tokens: int, model_name: str):
+        super().__init__(
+            f"Prompt of ~{prompt_tokens} tokens exceeds the {budget_tokens}-token prompt budget for model '{model_name}'."
+        )
+        self.prompt_tokens = prompt_tokens
+        self.budget_tokens = budget_tokens
+
+def _prompt_budget_config(settings: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    budget_config = (settings or {}).get('prompt_budget')
+    return budget_config if isinstance(budget_config, dict) else {}
+
+def _prompt_budget_tokens(budget_config: Dict[str, Any], model_name: Optional[str]) -> int:
+    max_prompt_tokens = budget_config.get('max_prompt_tokens', DEFAULT_MAX_PROMPT_TOKENS)
+    if isinstance(max_prompt_tokens, dict):
+        max_prompt_tokens = max_prompt_tokens.get(model_name, max_prompt_tokens.get('default', DEFAULT_MAX_PROMPT_TOKENS))
+    return max(1, int(max_prompt_tokens))
+
+def _estimate_text_tokens(text: str) -> int:
+    return len(text) // _CHARS_PER_TOKEN_ESTIMATE
+
+def estimate_prompt_tokens(contents: Union[str, List[Any]]) -> int:
+    """Fast local token estimate for a prompt string or contents list; no network access."""
+    return _estimate_request_tokens(contents)
+
+def _count_tokens_exact(settings: Dict[str, Any], model_name: str, contents: Union[str, List[Any]]) -> Optional[int]:
+    """Gemini count_tokens, or None where exact counting is not possible."""
+    api_key = settings.get('api_key')
+    if (not api_key or _get_llm_mode() == LLM_MODE_REPLAY
+            or not _get_llm_backend(settings).requires_gemini_api_key):
+        return None
+    try:
+        client = _get_pooled_client(api_key, settings.get('http_options'))
+        response = client.models.count_tokens(model=model_name, contents=_normalize_contents_for_key(contents))
+        return int(response.total_tokens)
+    except Exception as e:
+        _log_error_to_project(f"count_tokens failed for model '{model_name}'; using the local estimate.", e)
+        return None
+
+def count_prompt_tokens(project_root: Optional[str], contents: Union[str, List[Any]], model_name: Optional[str] = None) -> int:
+    """
+    Token count for a prompt: exact (Gemini count_tokens) when prompt_budget.exact_count is enabled
+    and the API is reachable, otherwise the local estimate.
+    """
+    try:
+        settings = get_llm_provider_settings(project_root)
+    except ConfigurationError:
+        return estimate_prompt_tokens(contents)
+    exact_tokens = None
+    if _prompt_budget_config(settings).get('exact_count', False):
+        exact_tokens = _count_tokens_exact(settings, model_name or settings.get('default_model_name'), contents)
+    return exact_tokens if exact_tokens is not None else estimate_prompt_tokens(contents)
+
+def get_prompt_token_budget(project_root: Optional[str], model_name: Optional[str] = None) -> int:
+    """The configured prompt token budget for model_name (default: the project's default model)."""
+    try:
+        settings = get_llm_provider_settings(project_root)
+    except ConfigurationError:
+        settings = {}
+    return _prompt_budget_tokens(_prompt_budget_config(settings), model_name or settings.get('default_model_name'))
+
+def _preflight_prompt_budget(settings: Dict[str, Any], model_name: str, contents: Union[str, List[Any]]):
+    """Warns about (or, with on_overflow: error, rejects) a prompt over the budget before it is sent."""
+    budget_config = _prompt_budget_config(settings)
+    budget_tokens = _prompt_budget_tokens(budget_config, model_name)
+    prompt_tokens = estimate_prompt_tokens(contents)
+    if prompt_tokens < budget_tokens * _EXACT_COUNT_THRESHOLD:
+        return # Comfortably within budget; not worth an exact count
+    if budget_config.get('exact_count', False):
+        exact_tokens = _count_tokens_exact(settings, model_name, contents)
+        prompt_tokens = exact_tokens if exact_tokens is not None else prompt_tokens
+    if prompt_tokens <= budget_tokens:
+        return
+    error = PromptBudgetExceededError(prompt_tokens, budget_tokens, model_name)
+    if budget_config.get('on_overflow', 'warn') == 'error':
+        raise error
+    _log_error_to_project(f"{error} Sending it anyway (prompt_budget.on_overflow: warn).")
+
+def _truncate_section_text(text: str, keep_tokens: int) -> str:
+    keep_chars = max(0, keep_tokens) * _CHARS_PER_TOKEN_ESTIMATE
+    if len(text) <= keep_chars:
+        return text
+    marker_chars = len(_TRIMMED_SECTION_MARKER.format(omitted_chars=len(text)))
+    head = text[:max(0, keep_chars - marker_chars)]
+    newline_at = head.rfind("\n")
+    if newline_at >= len(head) // 2: # Prefer cutting at a line boundary if it costs little
+        head = head[:newline_at]
+    return head + _TRIMMED_SECTION_MARKER.format(omitted_chars=len(text) - len(head))
+
+def _summarize_section_text(project_root: Optional[str], task_id: Optional[str], section_name: str, text: str,
+                            keep_tokens: int, budget_tokens: int) -> Optional[str]:
+    """
+    An LLM summary of a section in about keep_tokens, or None when truncating is the better choice: the
+    target is too small for a useful summary, or the budget leaves no more of the material to summarize
+    than truncation would keep anyway. The summary call is logged and costed under task_id (unattributed
+    to any task when it is None).
+    """
+    material_tokens = budget_tokens - _SUMMARY_PROMPT_OVERHEAD_TOKENS
+    if keep_tokens < 32 or material_tokens <= keep_tokens:
+        return None
+    summary_prompt = (
+        f"Summarize the following '{section_name}' material in at most {keep_tokens * 3 // 4} words. Preserve "
+        "concrete facts, decisions, open questions, identifiers and numbers; omit boilerplate.\n\n"
+        + _truncate_section_text(text, material_tokens)
+    )
+    response_data = generate_response_aggregated(
+        project_root=project_root,
+        session_id=f"prompt_fit_{datetime.now().strftime('%Y%m%d%H%M%S%f')}",
+        task_id=task_id,
+        prompt_text=summary_prompt
+    )
+    summary_text = (response_data.get('text') or "").strip()
+    if response_data.get('error_info') or not summary_text:
+        return None
+    return f"[Summary, fitted to the prompt token budget]\n{_truncate_section_text(summary_text, keep_tokens)}"
+
+def fit_prompt_sections(
+    sections: List[Dict[str, Any]],
+    project_root: Optional[str] = None,
+    model_name: Optional[str] = None,
+    max_prompt_tokens: Optional[int] = None,
+    task_id: Optional[str] = None
+) -> List[str]:
+    """
+    Fits prompt sections into the prompt token budget and returns their texts in the original order.
+
+    Each section is a dict: {'name': str, 'text': str, 'priority': int (default 0), 'required': bool,
+    'min_tokens': int}. When the joined sections exceed the budget (max_prompt_tokens, else
+    prompt_budget from the project's configuration), the lowest-priority sections are reduced first;
+    sections sharing a priority give up tokens in proportion to their size, never below min_tokens.
+    Required sections are never touched. Reduction truncates (with a visible marker) or, with
+    prompt_budget.strategy: summarize, replaces the section with an LLM summary. Pass the task_id the
+    prompt is for so those summary calls are logged and costed under it.
+    """
+    try:
+        settings = get_llm_provider_settings(project_root)
+    except ConfigurationError:
+        settings = {}
+    budget_config = _prompt_budget_config(settings)
+    model_name = model_name or settings.get('default_model_name')
+    budget_tokens = max_prompt_tokens or _prompt_budget_tokens(budget_config, model_name)
+
+    fitted_texts = [str(section.get('text') or "") for section in sections]
+    section_tokens = [_estimate_text_tokens(text) for text in fitted_texts]
+    estimated_total = sum(section_tokens)
+    if estimated_total >= budget_tokens * _EXACT_COUNT_THRESHOLD and budget_config.get('exact_count', False):
+        # The budget is in real tokens; rescale it into estimate units with one exact count.
+        exact_total = _count_tokens_exact(settings, model_name, "\n".join(fitted_texts)) if model_name else None
+        if exact_total:
+            budget_tokens = int(budget_tokens * max(estimated_total, 1) / exact_total)
+    overflow = estimated_total - budget_tokens
+    if overflow <= 0:
+        return fitted_texts
+
+    summarize = budget_config.get('strategy', PROMPT_FIT_TRUNCATE) == PROMPT_FIT_SUMMARIZE
+    priorities = sorted({int(section.get('priority', 0)) for section in sections if not section.get('required')})
+    for priority in priorities:
+        if overflow <= 0:
+            break
+        group = [i for i, section in enumerate(sections)
+                 if not section.get('required') and int(section.get('priority', 0)) == priority]
+        reducible = {i: max(0, section_tokens[i] - int(sections[i].get('min_tokens', 0))) for i in group}
+        reducible_total = sum(reducible.values())
+        if reducible_total <= 0:
+            continue
+        for i in group:
+            if not reducible[i]:
+                continue
+            cut_tokens = reducible[i] if reducible_total <= overflow else -(-overflow * reducible[i] // reducible_total)
+            keep_tokens = section_tokens[i] - min(reducible[i], cut_tokens)
+            section_name = str(sections[i].get('name') or f"section {i + 1}")
+            reduced_text = None
+            if summarize:
+                reduced_text = _summarize_section_text(project_root, task_id, section_name, fitted_texts[i], keep_tokens, budget_tokens)
+            if reduced_text is None:
+                reduced_text = _truncate_section_text(fitted_texts[i], keep_tokens)
+            fitted_texts[i] = reduced_text
+        new_tokens = {i: _estimate_text_tokens(fitted_texts[i]) for i in group}
+        overflow -= sum(section_tokens[i] - new_tokens[i] for i in group)
+        section_tokens = [new_tokens.get(i, tokens) for i, tokens in enumerate(section_tokens)]
+    if overflow > 0:
+        _log_error_to_project(
+            f"Prompt still ~{overflow} tokens over its {budget_tokens}-token budget after fitting; "
+            "only required sections remain."
+        )
+    return fitted_texts
+
+
+# --- Chat History Compaction ---
+# Long chat sessions resend the whole history (priming prompt included) on every turn. With compaction
+# the prime stays pinned, the most recent turns are sent verbatim and everything older is folded into
+# a running LLM summary, refreshed on a background thread so no turn waits for it. Configured with
+# 'chat_compaction' in .gouai_config.yaml (defaults shown; `gouai chat --compact` also enables it):
+#   chat_compaction:
+#     enabled: false
+#     trigger_tokens: 24000      # Refresh the summary once the turns after it exceed this
+#     keep_last_turns: 6         # Messages always sent verbatim
+#     summary_max_tokens: 2000
+#     hard_limit_tokens: 48000   # Above this, a turn waits for a pending refresh instead of sending everything
+_CHAT_SUMMARY_HEADER = "[Summary of the earlier conversation in this session]\n"
+
+def _is_chat_summary_part(part: Any) -> bool:
+    return isinstance(part, dict) and str(part.get('text') or "").startswith(_CHAT_SUMMARY_HEADER)
+
+class ChatHistoryCompactor:
+    """
+    Builds the contents sent for each chat turn from the full conversation history.
+
+    history[0] is the pinned priming prompt; the running summary is appended to it as a second part,
+    so user/model turns keep alternating (the provider prefix cache caches the prime without it). Call contents_for(history) before each request and
+    after_turn(history) once the model's reply has been appended.
+    """
+    def __init__(self, project_root: Optional[str], session_id: str, task_id: str,
+                 config: Optional[Dict[str, Any]] = None, enabled: Optional[bool] = None):
+        if config is None:
+            config = _configured_setting(project_root, 'chat_compaction')
+        config = config if isinstance(config, dict) else {}
+        self.project_root = project_root
+        self.session_id = session_id
+        self.task_id = task_id
+        self.enabled = bool(config.get('enabled', False)) if enabled is None else enabled
+        self.trigger_tokens = int(config.get('trigger_tokens', 24000))
+        self.keep_last_turns = max(2, int(config.get('keep_last_turns', 6)))
+        self.summary_max_tokens = int(config.get('summary_max_tokens', 2000))
+        self.hard_limit_tokens = int(config.get('hard_limit_tokens', self.trigger_tokens * 2))
+        self.summary_text = ""
+        self.summarized_upto = 1 # history[1:summarized_upto] is covered by summary_text
+        self.refreshes = 0
+        self._lock = threading.Lock()
+        self._pending: Optional[concurrent.futures.Future] = None
+        self._executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+
+    def _window_tokens(self, history: List[Dict[str, Any]]) -> int:
+        with self._lock:
+            start = self.summarized_upto
+        return estimate_prompt_tokens(history[start:]) if len(history) > start else 0
+
+    def contents_for(self, history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """The contents to send for the next request: pinned prime (+ summary) and the unsummarized turns."""
+        if not self.enabled or len(history) < 2:
+            return history
+        if self._refresh_pending() and self._window_tokens(history) > self.hard_limit_tokens:
+            self.wait()
+        with self._lock:
+            summary_text, start = self.summary_text, min(self.summarized_upto, len(history))
+        if not summary_text:
+            return history
+        prime = history[0]
+        pinned = {'role': prime.get('role', 'user'),
+                  'parts': list(prime.get('parts', [])) + [{'text': _CHAT_SUMMARY_HEADER + summary_text}]}
+        return [pinned] + history[start:]
+
+    def after_turn(self, history: List[Dict[str, Any]]):
+        """Schedules a background summary refresh once the unsummarized turns exceed trigger_tokens."""
+        if not self.enabled or self._refresh_pending():
+            return
+        if self._window_tokens(history) <= self.trigger_tokens:
+            return
+        with self._lock:
+            start, previous_summary = self.summarized_upto, self.summary_text
+        cut = len(history) - self.keep_last_turns
+        while cut > start and history[cut].get('role') != 'model':
+            cut -= 1 # The verbatim window starts with a model turn, right after the pinned user prime
+        if cut <= start:
+            return
+        turns_to_fold = [dict(turn) for turn in history[start:cut]]
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="gouai-chat-compaction")
+        self._pending = self._executor.submit(self._refresh_summary, previous_summary, turns_to_fold, cut)
+
+    def _refresh_pending(self) -> bool:
+        return self._pending is not None and not self._pending.done()
+
+    def _refresh_summary(self, previous_summary: str, turns_to_fold: List[Dict[str, Any]], cut: int):
+        transcript = "\n\n".join(
+            f"{'User' if turn.get('role') == 'user' else 'Assistant'}: "
+            + "".join(part.get('text', '') for part in turn.get('parts', []) if isinstance(part, dict))
+            for turn in turns_to_fold
+        )
+        summary_prompt = (
+            f"Update the running summary of a working session in at most {self.summary_max_tokens * 3 // 4} words. "
+            "Keep decisions, facts established, open questions, commitments and any identifiers, file names "
+            "or numbers that later turns may refer to. Reply with the summary only.\n\n"
+            f"--- Current summary ---\n{previous_summary or '(none yet)'}\n\n"
+            f"--- Turns to fold in ---\n{transcript}"
+        )
+        response_data = generate_response_aggregated(
+            project_root=self.project_root,
+            session_id=f"{self.session_id}_compaction",
+            task_id=self.task_id,
+            prompt_text=summary_prompt
+        )
+        summary_text = (response_data.get('text') or "").strip()
+        if response_data.get('error_info') or not summary_text:
+            _log_error_to_project(f"Chat compaction summary failed; history is sent uncompacted for now: {response_data.get('error_info')}")
+            return
+        with self._lock:
+            self.summary_text = summary_text
+            self.summarized_upto = cut
+            self.refreshes += 1
+
+    def wait(self, timeout: Optional[float] = None):
+        """Blocks until a pending summary refresh (if any) has finished."""
+        pending = self._pending
+        if pending is not None:
+            concurrent.futures.wait([pending], timeout=timeout)
 
-    return final_response_data
\ No newline at end of file
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# gouai_project_tree.py
+"""
+In-memory model of a GOUAI project, shared by the tools that look at more than one task
+(compile_gouai_hlgs, gouai_report_builder, gouai_context_handler, gouai_compose_wsod).
+
+ProjectTree loads the project in one walk: one TaskNode per directory, linked to its parent and
+children, reading only the frontmatter of each task_definition.md. TaskNode uses __slots__ and
+keeps just the fields the tools use (id, type, status, summaries, parent ID) and the file mtimes.
+Markdown bodies are read when asked for (TaskNode.body() / TaskNode.section()) and kept in a small
+LRU cache keyed by (path, mtime_ns, size), so memory stays bounded however many tasks a project
+has. Directories the task index skips (outputs/, context_packages/, dot-directories) are skipped
+here too.
+
+get_project_tree() shares one tree per project root within a process and reloads it when a
+directory or task definition has changed since it was loaded.
+"""
+
+import functools
+import os
+import re
+import threading
+from pathlib import Path
+
+from gouai_frontmatter import strip_frontmatter
+from gouai_task_index import TASK_DEFINITION_FILENAME, read_task_frontmatter, is_skipped_dir, file_signature
+
+# --- Constants ---
+LIVING_DOCUMENT_FILENAME = "living_document.md"
+_BODY_CACHE_SIZE = 64 # Markdown bodies kept in memory at once, across all trees
+
+# --- Helper Functions ---
+
+@functools.lru_cache(maxsize=_BODY_CACHE_SIZE)
+def _read_markdown_body(path_str: str, mtime_ns: int, size: int) -> str:
+    """The Markdown after a file's YAML frontmatter. mtime_ns and size only key the cache."""
+    try:
+        content = Path(path_str).read_text(encoding='utf-8')
+    except (OSError, UnicodeDecodeError):
+        return ""
+    return strip_frontmatter(content).strip()
+
+def extract_md_section(markdown_text: str, section_heading_text: str, heading_level: str = "##") -> str:
+    """
+    Text of the section headed '<heading_level> <section_heading_text>' (case-insensitive), up to
+    the next heading of the same or a higher level. Returns "" if there is no such section.
+    """
+    start_re = re.compile(rf"^{re.escape(heading_level)}\s*{re.escape(section_heading_text.strip())}\s*$", re.IGNORECASE)
+    higher_or_same_markers = [f"^{re.escape('#' * i)}\\s+" for i in range(1, len(heading_level) + 1)]
+    end_re = re.compile(r"^(?:" + "|".join(higher_or_same_markers) + r")")
+
+    content_lines = []
+    in_section = False
+    for line_text in markdown_text.splitlines(keepends=True):
+        stripped_line_text = line_text.strip()
+        if not in_section:
+            in_section = bool(start_re.match(stripped_line_text))
+            continue
+        is_another_target_start = start_re.match(stripped_line_text)
+        if is_another_target_start and content_lines: # Same heading again: the first section ends here
+            break
+        if end_re.match(line_text) and not is_another_target_start:
+            break
+        content_lines.append(line_text)
+    return "".join(content_lines).strip()
+
+def _text_or_none(value) -> str | None:
+    return None if value is None else str(value)
+
+
+# --- Task Nodes ---
+
+class TaskNode:
+    """
+    One directory of a project. is_task is True when it holds a task_definition.md; the frontmatter
+    fields are None for plain directories and for fields the frontmatter does not set.
+    """
+    __slots__ = (
+        'path', 'rel_dir', 'parent', 'children',
+        'task_id', 'task_type', 'status', 'hlg_summary', 'wsod_summary', 'one_line_description', 'parent_task_id',
+        'dir_mtime_ns', 'definition_mtime_ns', 'living_document_mtime_ns'
+    )
+
+    def __init__(self, path: Path, rel_dir: str, parent: "TaskNode | None" = None):
+        self.path = path
+        self.rel_dir = rel_dir # Relative to the project root, '/'-separated; "" for the root itself
+        self.parent = parent
+        self.children: list[TaskNode] = [] # Sub-directories, sorted by name
+        self.task_id = None
+        self.task_type = None
+        self.status = None
+        self.hlg_summary = None
+        self.wsod_summary = None
+        self.one_line_description = None
+        self.parent_task_id = None
+        self.dir_mtime_ns = None
+        self.definition_mtime_ns = None
+        self.living_document_mtime_ns = None
+
+    def __repr__(self) -> str:
+        return f"TaskNode({self.task_id or '(not a task)'!s}, {self.rel_dir or '.'!r})"
+
+    @property
+    def name(self) -> str:
+        return self.path.name
+
+    @property
+    def is_task(self) -> bool:
+        return self.definition_mtime_ns is not None
+
+    @property
+    def definition_path(self) -> Path:
+        return self.path / TASK_DEFINITION_FILENAME
+
+    @property
+    def living_document_path(self) -> Path:
+        return self.path / LIVING_DOCUMENT_FILENAME
+
+    @property
+    def depth(self) -> int:
+        depth = 0
+        node = self.parent
+        while node is not None:
+            depth += 1
+            node = node.parent
+        return depth
+
+    def _read_task_files(self, definition_mtime_ns: int | None, living_document_mtime_ns: int | None):
+        """Records the file mtimes and, for a task, the frontmatter fields (one frontmatter read)."""
+        self.definition_mtime_ns = definition_mtime_ns
+        self.living_document_mtime_ns = living_document_mtime_ns
+        if definition_mtime_ns is None:
+            return
+        frontmatter = read_task_frontmatter(self.definition_path) or {}
+        self.task_id = _text_or_none(frontmatter.get('task_id'))
+        self.task_type = _text_or_none(frontmatter.get('task_type'))
+        self.status = _text_or_none(frontmatter.get('status'))
+        self.hlg_summary = _text_or_none(frontmatter.get('HLG_summary'))
+        self.wsod_summary = _text_or_none(frontmatter.get('WSOD_summary'))
+        self.one_line_description = _text_or_none(frontmatter.get('one_line_description'))
+        self.parent_task_id = _text_or_none(frontmatter.get('parent_task_id'))
+
+    def task_children(self) -> list["TaskNode"]:
+        """The nearest tasks below this directory (looking through plain directories), in directory order."""
+        found = []
+        pending = list(reversed(self.children))
+        while pending:
+            node = pending.pop()
+            if node.is_task:
+                found.append(node)
+            else:
+                pending.extend(reversed(node.children))
+        return found
+
+    def walk(self):
+        """This node and every directory below it, depth-first in directory order."""
+        pending = [self]
+        while pending:
+            node = pending.pop()
+            yield node
+            pending.extend(reversed(node.children))
+
+    def body(self) -> str:
+        """The Markdown of task_definition.md after its frontmatter, read on demand ("" if there is none)."""
+        if not self.is_task:
+            return ""
+        signature = file_signature(self.definition_path)
+        if signature is None:
+            return ""
+        return _read_markdown_body(str(self.definition_path), *signature)
+
+    def section(self, section_heading_text: str, heading_level: str = "##") -> str:
+        """A section of task_definition.md (see extract_md_section)."""
+        return extract_md_section(self.body(), section_heading_text, heading_level)
+
+
+def _file_mtime_ns(path: Path) -> int | None:
+    signature = file_signature(path)
+    return signature[0] if signature and os.path.isfile(path) else None
+
+def load_task_node(task_dir: Path | str) -> TaskNode:
+    """A TaskNode for a single directory, without parent or children (for tools that need one task only)."""
+    task_dir = Path(task_dir).resolve()
+    node = TaskNode(task_dir, "", None)
+    node.dir_mtime_ns = file_signature(task_dir)[0] if os.path.isdir(task_dir) else None
+    node._read_task_files(_file_mtime_ns(node.definition_path), _file_mtime_ns(node.living_document_path))
+    return node
+
+
+# --- Project Tree ---
+
+class ProjectTree:
+    """The directories and tasks of one project, loaded in one walk. Use get_project_tree() to share one per project."""
+
+    def __init__(self, project_root: Path | str):
+        self.project_root = Path(project_root).resolve()
+        self._nodes_by_task_id: dict[str, TaskNode] = {}
+        self._nodes_by_rel_dir: dict[str, TaskNode] = {}
+        self.root = self._load()
+
+    def _load(self) -> TaskNode:
+        root = TaskNode(self.project_root, "", None)
+        visited_dirs = set()
+        pending = [root]
+        while pending:
+            node = pending.pop()
+            self._scan_dir(node, visited_dirs)
+            self._nodes_by_rel_dir[node.rel_dir] = node
+            if node.task_id is not None:
+                self._nodes_by_task_id.setdefault(node.task_id, node) # Duplicate IDs: the first in directory order wins
+            pending.extend(reversed(node.children))
+        return root
+
+    def _scan_dir(self, node: TaskNode, visited_dirs: set):
+        """Lists one directory: its sub-directories become child nodes and its task files are read."""
+        try:
+            dir_stat = os.stat(node.path)
+        except OSError:
+            return
+        dir_key = (dir_stat.st_dev, dir_stat.st_ino)
+        if dir_key in visited_dirs: # Symlink loop
+            return
+        visited_dirs.add(dir_key)
+        node.dir_mtime_ns = dir_stat.st_mtime_ns
+
+        sub_dir_names = []
+        file_mtimes = {}
+        try:
+            with os.scandir(node.path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir():
+                            if not is_skipped_dir(entry.name):
+                                sub_dir_names.append(entry.name)
+                        elif entry.name in (TASK_DEFINITION_FILENAME, LIVING_DOCUMENT_FILENAME) and entry.is_file():
+                            file_mtimes[entry.name] = entry.stat().st_mtime_ns
+                    except OSError:
+                        continue
+        except OSError:
+            pass
+
+        node._read_task_files(file_mtimes.get(TASK_DEFINITION_FILENAME), file_mtimes.get(LIVING_DOCUMENT_FILENAME))
+        for sub_dir_name in sorted(sub_dir_names):
+            rel_dir = f"{node.rel_dir}/{sub_dir_name}" if node.rel_dir else sub_dir_name
+            node.children.append(TaskNode(node.path / sub_dir_name, rel_dir, node))
+
+    def __len__(self) -> int:
+        return len(self._nodes_by_task_id)
+
+    def node(self, task_id: str) -> TaskNode | None:
+        """The node of a task, by task_id."""
+        return self._nodes_by_task_id.get(task_id)
+
+    def node_at(self, path: Path | str) -> TaskNode | None:
+        """The node of a directory inside the project, by path."""
+        try:
+            rel_dir = Path(path).resolve().relative_to(self.project_root).as_posix()
+        except ValueError:
+            return None
+        return self._nodes_by_rel_dir.get("" if rel_dir == "." else rel_dir)
+
+    def tasks(self):
+        """Every task node, depth-first in directory order."""
+        return (node for node in self.root.walk() if node.is_task)
+
+    def is_current(self) -> bool:
+        """False if a directory or task file changed since the tree was loaded (one stat per directory and task file)."""
+        for node in self.root.walk():
+            dir_signature = file_signature(node.path)
+            if (dir_signature[0] if dir_signature else None) != node.dir_mtime_ns:
+                return False
+            if node.is_task and _file_mtime_ns(node.definition_path) != node.definition_mtime_ns:
+                return False
+        return True
+
+
+_PROJECT_TREES: dict[Path, ProjectTree] = {}
+_PROJECT_TREES_LOCK = threading.Lock()
+
+def get_project_tree(project_root: Path | str) -> ProjectTree:
+    """The process-wide ProjectTree for a project root, reloaded if the project changed since it was loaded."""
+    root_path = Path(project_root).resolve()
+    with _PROJECT_TREES_LOCK:
+        project_tree = _PROJECT_TREES.get(root_path)
+        if project_tree is None or not project_tree.is_current():
+            project_tree = ProjectTree(root_path)
+            _PROJECT_TREES[root_path] = project_tree
+    return project_tree
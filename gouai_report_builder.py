@@ -5,8 +5,9 @@ import argparse
 import os
 import sys
 from datetime import datetime
-import yaml # Assuming PyYAML is used as per KIRQ_Impl_3 and common Python practice
-import re 
+
+from gouai_task_index import get_task_index
+from gouai_project_tree import load_task_node
 
 # Placeholder for actual gouai_llm_api.py import
 # Ensure gouai_llm_api.py is in PYTHONPATH or same directory
@@ -85,21 +86,7 @@ def load_file_content(file_path):
         print(f"Error reading file {file_path}: {e}", file=sys.stderr)
         return None
 
-def get_direct_child_task_dirs(parent_task_path):
-    """Finds direct child task directories (heuristic: starts with ST, T, or similar GOUAI task patterns)."""
-    child_dirs = []
-    if not os.path.isdir(parent_task_path):
-        return child_dirs
-    for item in os.listdir(parent_task_path):
-        item_path = os.path.join(parent_task_path, item)
-        # Basic heuristic: GOUAI task directories might have a recognizable pattern
-        # This might need refinement based on actual GOUAI task ID/directory naming conventions
-        if os.path.isdir(item_path) and (item.startswith("ST") or item.startswith("T") or "_ST" in item or "_TASK" in item):
-            child_dirs.append(item_path)
-    return child_dirs
-
-
-def generate_project_status_summary(project_id_path_str: str, llm_api_module): # llm_api_module is the imported gouai_llm_api
+def generate_project_status_summary(project_id_path_str: str, llm_api_module, cache_policy: str | None = None): # llm_api_module is the imported gouai_llm_api
     """Generates the Project Status Summary report."""
     print(f"Generating Project Status Summary for project at: {project_id_path_str}", file=sys.stderr)
     project_root_for_api = project_id_path_str # Used for LLM API config path
@@ -111,52 +98,50 @@ def generate_project_status_summary(project_id_path_str: str, llm_api_module): #
         print(f"Error: Could not load root task definition from {root_td_path}", file=sys.stderr)
         return None
 
-    # Prepare the full content for the LLM
-    full_prompt_parts = [PROJECT_STATUS_SUMMARY_PROMPT] # The main instruction prompt
-    full_prompt_parts.append("\n\n--- Context from Task Definition Files ---")
+    # Prepare the full content for the LLM. Headers are required; file contents are fitted into the
+    # prompt token budget, child definitions (lowest priority) first.
+    prompt_sections = [{'name': "instructions", 'text': PROJECT_STATUS_SUMMARY_PROMPT, 'required': True}] # The main instruction prompt
+    prompt_sections.append({'name': "context header", 'text': "\n\n--- Context from Task Definition Files ---", 'required': True})
     
-    full_prompt_parts.append(f"\n\n## Content from: {root_td_path}\n")
-    full_prompt_parts.append(root_td_content)
-
-    # 2. Load direct child tasks' task_definition.md
-    child_task_dirs = get_direct_child_task_dirs(project_id_path_str)
+    prompt_sections.append({'name': "root header", 'text': f"\n\n## Content from: {root_td_path}\n", 'required': True})
+    prompt_sections.append({'name': root_td_path, 'text': root_td_content, 'priority': 1})
+
+    # 2. Load direct child tasks' task_definition.md (the root task's sub-tasks, from the task index)
+    root_task_id = load_task_node(project_id_path_str).task_id
+    child_task_dirs = []
+    if root_task_id:
+        task_index = get_task_index(project_id_path_str)
+        task_trie = task_index.id_trie()
+        child_task_dirs = [str(task_index.project_root / task_trie.entry(child_task_id)['dir'])
+                           for child_task_id in task_trie.children(root_task_id)]
     loaded_child_td_count = 0
     for child_dir_path in child_task_dirs:
         child_td_path = os.path.join(child_dir_path, TASK_DEFINITION_MD)
         child_td_content = load_file_content(child_td_path)
         if child_td_content:
-            full_prompt_parts.append(f"\n\n## Content from: {child_td_path}\n")
-            full_prompt_parts.append(child_td_content)
+            prompt_sections.append({'name': "child header", 'text': f"\n\n## Content from: {child_td_path}\n", 'required': True})
+            prompt_sections.append({'name': child_td_path, 'text': child_td_content, 'priority': 0})
             loaded_child_td_count +=1
         else:
             print(f"Warning: Could not load task definition from child task at {child_td_path}", file=sys.stderr)
 
+    # Determine task_id for logging (usually the project root task_id from its YAML)
+    project_task_id_for_log = root_task_id or os.path.basename(os.path.normpath(project_id_path_str)) # Fallback
+
+    full_prompt_parts = llm_api_module.fit_prompt_sections(prompt_sections, project_root=project_root_for_api, task_id=project_task_id_for_log)
     final_llm_content_input = "\n".join(full_prompt_parts)
     
     print(f"Invoking LLM for Project Status Summary. Root context + {loaded_child_td_count} child contexts.", file=sys.stderr)
     
     session_id = f"report_pss_{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
-    
-    # Determine task_id for logging (usually the project root task_id from its YAML)
-    project_task_id_for_log = os.path.basename(os.path.normpath(project_id_path_str)) # Fallback
-    try:
-        # Extract task_id from YAML frontmatter of the root task_definition.md
-        # Assuming '---' delimiters for YAML frontmatter
-        yaml_match = re.search(r"^---\s*\n(.*?)\n---\s*\n", root_td_content, re.DOTALL | re.MULTILINE)
-        if yaml_match:
-            root_yaml_frontmatter = yaml.safe_load(yaml_match.group(1))
-            if isinstance(root_yaml_frontmatter, dict):
-                 project_task_id_for_log = root_yaml_frontmatter.get('task_id', project_task_id_for_log)
-    except Exception as e:
-        print(f"Warning: Could not parse task_id from root task_definition.md YAML: {e}", file=sys.stderr)
-        pass
 
     # Call the actual function from gouai_llm_api module
     response_data = llm_api_module.generate_response_aggregated(
         project_root=project_root_for_api,    # For API config loading
         session_id=session_id,
         task_id=project_task_id_for_log,      # For LLM conversation logging
-        contents=final_llm_content_input      # The full prompt including context
+        contents=final_llm_content_input,     # The full prompt including context
+        cache_policy=cache_policy             # None, CACHE_POLICY_OFF (--no-cache) or CACHE_POLICY_REFRESH (--refresh)
     )
 
     if response_data and response_data.get('error_info'):
@@ -195,14 +180,8 @@ def generate_task_uncertainty_list(task_id_path, llm_api_instance):
 
     # Create a unique session ID
     session_id = f"report_tul_{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
-    target_task_id_for_log = os.path.basename(os.path.normpath(task_id_path))
-
-    # Attempt to parse task_id from td_content YAML frontmatter
-    try:
-        yaml_frontmatter = yaml.safe_load(td_content.split("---")[1])
-        target_task_id_for_log = yaml_frontmatter.get('task_id', target_task_id_for_log)
-    except Exception:
-        pass # Stick with directory name if parsing fails
+    # task_id from the YAML frontmatter, or the directory name if it names none
+    target_task_id_for_log = load_task_node(task_id_path).task_id or os.path.basename(os.path.normpath(task_id_path))
 
     print(f"Invoking LLM for Task Uncertainty List. Context items: {len(context_texts)}", file=sys.stderr)
     report_content = llm_api_instance.execute_llm_call(
@@ -223,6 +202,9 @@ def main():
                              "or the specific GOUAI task directory (for TaskUncertaintyList).")
     parser.add_argument("--output_file", help="Optional. Path to save the Markdown report. "
                                              "If not provided, prints to standard output.")
+    cache_group = parser.add_mutually_exclusive_group()
+    cache_group.add_argument("--no-cache", action="store_true", help="Bypass the LLM response cache for this run (no lookup, no store).")
+    cache_group.add_argument("--refresh", action="store_true", help="Ignore cached LLM responses for this run, but store the fresh ones.")
 
     args = parser.parse_args()
 
@@ -238,7 +220,8 @@ def main():
 
     report_content = None
     if args.report_type == "ProjectStatusSummary":
-        report_content = generate_project_status_summary(args.id, llm_api)
+        cache_policy = llm_api.CACHE_POLICY_OFF if args.no_cache else (llm_api.CACHE_POLICY_REFRESH if args.refresh else None)
+        report_content = generate_project_status_summary(args.id, llm_api, cache_policy=cache_policy)
     elif args.report_type == "TaskUncertaintyList":
         report_content = generate_task_uncertainty_list(args.id, llm_api)
     else:
@@ -0,0 +1,473 @@
+#!/usr/bin/env python3
+# gouai_task_index.py
+"""
+Persistent task index for a GOUAI project, stored in <project_root>/.gouai/index.
+
+The index maps every task_id to its directory (relative to the project root) plus a few
+frontmatter fields of its task_definition.md, so finding a task is a dictionary lookup and one
+stat instead of a walk over the whole project tree. It also records the mtime of every directory
+it scanned. Creating, removing or renaming a sub-directory changes its parent's mtime, so when a
+task_id is not in the index (or its directory is gone), the directory encoded in the ID itself is
+tried first (task_id_rel_dir: one stat and one frontmatter read), and only if the layout was edited
+by hand are the directories whose mtime changed rescanned. Rewriting a task_definition.md in place
+(say, with a new task_id) leaves its directory's mtime alone, so that rescan also re-reads every
+indexed task_definition.md whose mtime or size changed. create_task() updates the index of the
+project it creates a task in.
+
+Subtree queries (children, descendants and ancestors of a task) are answered in memory by a
+TaskIdTrie built from the index (TaskIndex.id_trie()).
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+import time
+from pathlib import Path
+
+from gouai_frontmatter import load_frontmatter
+
+# --- Constants ---
+TASK_INDEX_DIRNAME = ".gouai"
+TASK_INDEX_FILENAME = "index"
+TASK_INDEX_VERSION = 1
+TASK_DEFINITION_FILENAME = "task_definition.md"
+INDEXED_FRONTMATTER_FIELDS = ("parent_task_id", "task_type", "status", "version")
+_SKIPPED_DIR_NAMES = {"outputs", "context_packages", "__pycache__"} # Dot-directories (.git, .venv, .gouai) are skipped too
+_LEGACY_ID_SCAN_LINES = 15
+_TASK_ID_SEGMENT_PATTERN = re.compile(r"_ST(\d+)-(\d+)") # As generated by gouai_task_mgmt._generate_task_id_and_dir_name
+# A directory modified this recently may change again within the same mtime tick; it is stored
+# as unverified and relisted on the next refresh instead of being trusted.
+_RACY_MTIME_WINDOW_NS = 2_000_000_000
+
+# --- Helper Functions ---
+
+def is_skipped_dir(name: str) -> bool:
+    """True for directories never searched for tasks (outputs/, context_packages/, dot-directories)."""
+    return name in _SKIPPED_DIR_NAMES or name.startswith('.')
+
+def _parent_rel(rel_dir: str) -> str | None:
+    if not rel_dir:
+        return None
+    return rel_dir.rpartition('/')[0]
+
+def _dir_depth(rel_dir: str) -> int:
+    """Directory levels below the project root: 0 for the root (""), 1 for 'ST1-1', 2 for 'ST1-1/ST2-1'."""
+    return rel_dir.count('/') + 1 if rel_dir else 0
+
+def _directory_mtime_ns(path: Path) -> int | None:
+    try:
+        path_stat = os.stat(path)
+    except OSError:
+        return None
+    return path_stat.st_mtime_ns if os.path.isdir(path) else None
+
+def _listed_mtime_ns(mtime_ns: int) -> int | None:
+    """The mtime to store for a directory just listed (None if too recent to trust, see _RACY_MTIME_WINDOW_NS)."""
+    return mtime_ns if time.time_ns() - mtime_ns > _RACY_MTIME_WINDOW_NS else None
+
+def file_signature(path: Path) -> list | None:
+    """[mtime_ns, size] of a file or directory, or None if it cannot be stat'ed."""
+    try:
+        path_stat = os.stat(path)
+    except OSError:
+        return None
+    return [path_stat.st_mtime_ns, path_stat.st_size]
+
+def _json_safe(value):
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+def split_task_id(task_id: str) -> list[str]:
+    """
+    Splits a task ID into its root task ID and one segment per sub-task level: a sub-task ID is
+    '<parent_id>_<dir_name>' with dir_name 'ST<level>-<index>[_Simple][_<suffix>]', so
+    'Proj_ROOT_ST1-2_Research_ST2-1' -> ['Proj_ROOT', 'ST1-2_Research', 'ST2-1'].
+    An ID without a root part in front of its first ST segment is returned whole.
+    """
+    segment_starts = [segment_match.start() for segment_match in _TASK_ID_SEGMENT_PATTERN.finditer(task_id)]
+    if not segment_starts or segment_starts[0] == 0:
+        return [task_id]
+    boundaries = [0] + segment_starts + [len(task_id)]
+    return [task_id[start:end].lstrip('_') if start else task_id[:end] for start, end in zip(boundaries, boundaries[1:])]
+
+def _segment_level(segment: str) -> int | None:
+    level_match = re.match(r"ST(\d+)-\d+", segment)
+    return int(level_match.group(1)) if level_match else None
+
+def task_id_rel_dir(task_id: str) -> str | None:
+    """
+    The task's directory relative to the project root, as encoded in its ID (see split_task_id):
+    each sub-task segment is one directory level, so 'Proj_ROOT_ST1-2_Research_ST2-1' lives in
+    'ST1-2_Research/ST2-1' and an ID without ST segments maps to the root ("").
+    Returns None if the ID does not follow the scheme.
+    """
+    if '/' in task_id or '\\' in task_id:
+        return None
+    segments = split_task_id(task_id)
+    if len(segments) == 1:
+        return None if _TASK_ID_SEGMENT_PATTERN.search(task_id) else ""
+    if any(_segment_level(segment) != level for level, segment in enumerate(segments[1:], start=1)):
+        return None
+    return "/".join(segments[1:])
+
+def _segment_sort_key(segment: str) -> tuple:
+    """Orders ST2-10 after ST2-9 (numeric level and index), other names after them."""
+    segment_match = re.match(r"ST(\d+)-(\d+)(.*)", segment)
+    if segment_match:
+        return (0, int(segment_match.group(1)), int(segment_match.group(2)), segment_match.group(3))
+    return (1, 0, 0, segment)
+
+def read_task_frontmatter(task_def_path: Path) -> dict | None:
+    """
+    Reads only the YAML frontmatter block of a task_definition.md (not the body; see gouai_frontmatter).
+    Returns None if the file cannot be read or names no task_id.
+    """
+    try:
+        frontmatter = load_frontmatter(task_def_path)
+    except (OSError, UnicodeDecodeError):
+        return None
+    if frontmatter.data.get('task_id'):
+        return dict(frontmatter.data)
+    # Malformed or missing frontmatter: fall back to the task_id line near the top of the file
+    id_match = re.search(r"task_id:\s*([^\s]+)", "".join(frontmatter.head.splitlines(keepends=True)[:_LEGACY_ID_SCAN_LINES]))
+    if not id_match:
+        return None
+    return {'task_id': id_match.group(1).strip().strip('"').strip("'")}
+
+
+# --- Task ID Trie ---
+
+class _TrieNode:
+    __slots__ = ('segment', 'parent', 'children', 'task_id', 'entry')
+
+    def __init__(self, segment: str, parent: "_TrieNode | None"):
+        self.segment = segment
+        self.parent = parent
+        self.children: dict[str, _TrieNode] = {}
+        self.task_id: str | None = None # Set when a task has exactly this ID
+        self.entry: dict | None = None
+
+class TaskIdTrie:
+    """
+    Task IDs arranged by their segments (split_task_id), so a child's node sits under its parent's.
+    Queries cost O(depth + size of the answer) and never touch the filesystem. A level with no task
+    of its own (e.g. a parent missing from the project) is passed through: the children of a task are
+    its nearest task descendants.
+    """
+
+    def __init__(self, entries: dict[str, dict] | None = None):
+        self._root = _TrieNode("", None)
+        self._nodes: dict[str, _TrieNode] = {}
+        for task_id, entry in (entries or {}).items():
+            self.insert(task_id, entry)
+
+    def insert(self, task_id: str, entry: dict | None = None):
+        node = self._root
+        for segment in split_task_id(task_id):
+            child = node.children.get(segment)
+            if child is None:
+                child = node.children[segment] = _TrieNode(segment, node)
+            node = child
+        node.task_id = task_id
+        node.entry = entry
+        self._nodes[task_id] = node
+
+    def __contains__(self, task_id: str) -> bool:
+        return task_id in self._nodes
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def entry(self, task_id: str) -> dict | None:
+        node = self._nodes.get(task_id)
+        return node.entry if node is not None else None
+
+    @staticmethod
+    def _sorted_children(node: _TrieNode) -> list[_TrieNode]:
+        return [node.children[segment] for segment in sorted(node.children, key=_segment_sort_key)]
+
+    def _task_descendants(self, node: _TrieNode, nearest_only: bool) -> list[str]:
+        found = []
+        stack = list(reversed(self._sorted_children(node)))
+        while stack:
+            current = stack.pop()
+            if current.task_id is not None:
+                found.append(current.task_id)
+                if nearest_only:
+                    continue
+            stack.extend(reversed(self._sorted_children(current)))
+        return found
+
+    def children(self, task_id: str) -> list[str]:
+        """IDs of the direct sub-tasks of task_id, in ST index order."""
+        node = self._nodes.get(task_id)
+        return self._task_descendants(node, nearest_only=True) if node is not None else []
+
+    def descendants(self, task_id: str) -> list[str]:
+        """IDs of every task below task_id, depth first in ST index order."""
+        node = self._nodes.get(task_id)
+        return self._task_descendants(node, nearest_only=False) if node is not None else []
+
+    def ancestors(self, task_id: str) -> list[str]:
+        """IDs of the tasks above task_id, root first."""
+        node = self._nodes.get(task_id)
+        found = []
+        while node is not None and node.parent is not None:
+            node = node.parent
+            if node.task_id is not None:
+                found.append(node.task_id)
+        return found[::-1]
+
+
+# --- Task Index ---
+
+class TaskIndex:
+    """The task index of one project. Thread-safe; use get_task_index() to share one instance per project."""
+
+    def __init__(self, project_root: Path):
+        self.project_root = Path(project_root).resolve()
+        self.index_path = self.project_root / TASK_INDEX_DIRNAME / TASK_INDEX_FILENAME
+        self._tasks: dict[str, dict] = {}         # task_id -> {'dir', 'definition', <frontmatter fields>}
+        self._dirs: dict[str, int | None] = {}    # Relative dir -> mtime_ns when listed (None: relist on next refresh)
+        self._dir_tasks: dict[str, str] = {}      # Relative dir -> task_id defined there
+        self._loaded = False
+        self._dirty = False
+        self._generation = 0 # Bumped whenever a task entry changes
+        self._trie: tuple[int, TaskIdTrie] | None = None
+        self._lock = threading.RLock()
+
+    def _abs(self, rel_dir: str) -> Path:
+        return self.project_root / rel_dir if rel_dir else self.project_root
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                payload = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Warning: ignoring unreadable task index '{self.index_path}': {e}", file=sys.stderr)
+            return
+        if not isinstance(payload, dict) or payload.get('version') != TASK_INDEX_VERSION:
+            return
+        self._tasks = payload.get('tasks') or {}
+        self._dirs = payload.get('dirs') or {}
+        self._dir_tasks = {entry['dir']: task_id for task_id, entry in self._tasks.items()}
+
+    def _save_if_dirty(self):
+        if not self._dirty:
+            return
+        payload = {'version': TASK_INDEX_VERSION, 'tasks': self._tasks, 'dirs': self._dirs}
+        tmp_path = self.index_path.with_name(f"{self.index_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            self._make_index_dir() # May update self._dirs (the payload's 'dirs')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(payload, f, ensure_ascii=False)
+            os.replace(tmp_path, self.index_path) # Atomic: other processes never read a partial index
+            self._dirty = False
+        except OSError as e:
+            print(f"Warning: could not write task index '{self.index_path}': {e}", file=sys.stderr)
+
+    def _make_index_dir(self):
+        """
+        Creates .gouai/ on the first save, never on reads. That changes the project root's mtime; if the
+        root was unchanged since it was listed, its new mtime is recorded as if just listed, so .gouai/
+        is not mistaken for a change to the project.
+        """
+        index_dir = self.index_path.parent
+        if index_dir.is_dir():
+            return
+        root_mtime_ns = _directory_mtime_ns(self.project_root)
+        index_dir.mkdir(parents=True, exist_ok=True)
+        if root_mtime_ns is not None and self._dirs.get("") == root_mtime_ns:
+            self._dirs[""] = _listed_mtime_ns(_directory_mtime_ns(self.project_root))
+
+    def _forget_dir_task(self, rel_dir: str):
+        task_id = self._dir_tasks.pop(rel_dir, None)
+        if task_id is not None and self._tasks.get(task_id, {}).get('dir') == rel_dir:
+            del self._tasks[task_id]
+            self._generation += 1
+
+    def _index_task_definition(self, rel_dir: str):
+        definition_path = self._abs(rel_dir) / TASK_DEFINITION_FILENAME
+        signature = file_signature(definition_path)
+        current_id = self._dir_tasks.get(rel_dir)
+        if current_id is not None and signature is not None and self._tasks[current_id]['definition'] == signature:
+            return # Unchanged since it was read
+        self._forget_dir_task(rel_dir)
+        self._dirty = True
+        frontmatter = read_task_frontmatter(definition_path) if signature is not None else None
+        if not frontmatter:
+            return
+        task_id = str(frontmatter['task_id'])
+        existing = self._tasks.get(task_id)
+        if existing is not None and _dir_depth(existing['dir']) < _dir_depth(rel_dir) and existing['dir'] in self._dirs:
+            return # Duplicate task_id: the task closest to the project root wins
+        if existing is not None:
+            self._dir_tasks.pop(existing['dir'], None)
+        self._tasks[task_id] = {
+            'dir': rel_dir,
+            'definition': signature,
+            **{field: _json_safe(frontmatter.get(field)) for field in INDEXED_FRONTMATTER_FIELDS}
+        }
+        self._dir_tasks[rel_dir] = task_id
+        self._generation += 1
+
+    def _drop_subtree(self, rel_dir: str):
+        prefix = f"{rel_dir}/" if rel_dir else ""
+        for known_dir in [d for d in self._dirs if d == rel_dir or d.startswith(prefix)]:
+            del self._dirs[known_dir]
+        for task_dir in [d for d in self._dir_tasks if d == rel_dir or d.startswith(prefix)]: # Incl. ID-derived entries
+            self._forget_dir_task(task_dir)
+        self._dirty = True
+
+    def _refresh_dir(self, rel_dir: str, known: bool = True):
+        """(Re)lists one directory: its own task_definition.md, vanished sub-directories and new ones (scanned in full)."""
+        path = self._abs(rel_dir)
+        mtime_ns = _directory_mtime_ns(path)
+        if mtime_ns is None:
+            self._drop_subtree(rel_dir)
+            return
+        self._dirs[rel_dir] = _listed_mtime_ns(mtime_ns)
+        self._dirty = True
+        self._index_task_definition(rel_dir)
+
+        current_children = set()
+        try:
+            for item in path.iterdir():
+                if not is_skipped_dir(item.name) and item.is_dir():
+                    current_children.add(f"{rel_dir}/{item.name}" if rel_dir else item.name)
+        except OSError:
+            pass
+        known_children = {d for d in self._dirs if d and _parent_rel(d) == rel_dir} if known else set()
+        for vanished_dir in known_children - current_children:
+            self._drop_subtree(vanished_dir)
+        for new_dir in sorted(current_children - known_children):
+            self._refresh_dir(new_dir, known=False)
+
+    def _refresh(self) -> bool:
+        """
+        Rescans the directories modified since they were listed, then re-reads every indexed
+        task_definition.md whose signature changed (rewriting a file in place, e.g. with a new
+        task_id, leaves its directory's mtime alone). Returns whether anything had changed.
+        """
+        if not self._dirs:
+            self._refresh_dir("", known=False)
+            return True
+        changed_dirs = [
+            rel_dir for rel_dir, mtime_ns in self._dirs.items()
+            if mtime_ns is None or _directory_mtime_ns(self._abs(rel_dir)) != mtime_ns
+        ]
+        for rel_dir in sorted(changed_dirs, key=_dir_depth): # Parents first
+            if rel_dir in self._dirs: # Not dropped along with a vanished parent
+                self._refresh_dir(rel_dir)
+        changed_definitions = [
+            rel_dir for rel_dir, task_id in self._dir_tasks.items()
+            if file_signature(self._abs(rel_dir) / TASK_DEFINITION_FILENAME) != self._tasks[task_id]['definition']
+        ] # One stat per task
+        for rel_dir in changed_definitions:
+            self._index_task_definition(rel_dir)
+        return bool(changed_dirs or changed_definitions)
+
+    def _current_entry(self, task_id: str) -> dict | None:
+        entry = self._tasks.get(task_id)
+        if entry is None:
+            return None
+        if file_signature(self._abs(entry['dir']) / TASK_DEFINITION_FILENAME) != entry['definition']:
+            self._index_task_definition(entry['dir'])
+            entry = self._tasks.get(task_id)
+        return entry
+
+    def _derived_entry(self, task_id: str) -> dict | None:
+        """Indexes the directory the ID itself points to (see task_id_rel_dir) if it defines task_id."""
+        rel_dir = task_id_rel_dir(task_id)
+        if rel_dir is None or not os.path.isfile(self._abs(rel_dir) / TASK_DEFINITION_FILENAME):
+            return None
+        was_dirty = self._dirty
+        self._index_task_definition(rel_dir)
+        self._dirty = was_dirty # Cheap to derive again; not worth rewriting the index file for
+        entry = self._tasks.get(task_id)
+        return entry if entry is not None and entry['dir'] == rel_dir else None
+
+    def lookup(self, task_id: str) -> dict | None:
+        """
+        The index entry of task_id (relative 'dir' plus frontmatter fields). On a miss, the directory
+        encoded in the ID is tried, then the directories changed since they were indexed are rescanned
+        and the indexed task definitions changed since they were read are re-read.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._current_entry(task_id)
+            if entry is None:
+                entry = self._derived_entry(task_id)
+            if entry is None and self._refresh():
+                entry = self._current_entry(task_id)
+            self._save_if_dirty()
+            return dict(entry) if entry is not None else None
+
+    def find_task_dir(self, task_id: str) -> Path | None:
+        entry = self.lookup(task_id)
+        return self._abs(entry['dir']) if entry is not None else None
+
+    def task_ids(self) -> list[str]:
+        """Every task_id in the project, after bringing the index up to date."""
+        with self._lock:
+            self._ensure_loaded()
+            self._refresh()
+            self._save_if_dirty()
+            return list(self._tasks)
+
+    def id_trie(self) -> TaskIdTrie:
+        """A TaskIdTrie over every task in the project (entries as in lookup()), rebuilt only when tasks changed."""
+        with self._lock:
+            self._ensure_loaded()
+            self._refresh()
+            self._save_if_dirty()
+            if self._trie is None or self._trie[0] != self._generation:
+                self._trie = (self._generation, TaskIdTrie({task_id: dict(entry) for task_id, entry in self._tasks.items()}))
+            return self._trie[1]
+
+    def record_task_dir(self, task_dir: Path):
+        """Adds a newly created task directory (and anything else new next to it) to the index."""
+        with self._lock:
+            self._ensure_loaded()
+            rel_dir = Path(task_dir).resolve().relative_to(self.project_root).as_posix()
+            parent_dir = _parent_rel(rel_dir)
+            if parent_dir is not None and parent_dir in self._dirs:
+                self._refresh_dir(parent_dir)
+            else:
+                self._refresh()
+            self._save_if_dirty()
+
+
+# --- Public API ---
+_TASK_INDEXES: dict[Path, TaskIndex] = {}
+_TASK_INDEXES_LOCK = threading.Lock()
+
+def get_task_index(project_root: Path | str) -> TaskIndex:
+    """The process-wide TaskIndex for a project root."""
+    root_path = Path(project_root).resolve()
+    with _TASK_INDEXES_LOCK:
+        task_index = _TASK_INDEXES.get(root_path)
+        if task_index is None:
+            task_index = _TASK_INDEXES[root_path] = TaskIndex(root_path)
+    return task_index
+
+def find_task_dir(project_root: Path | str, task_id: str) -> Path | None:
+    """Absolute path of the directory defining task_id within the project, or None."""
+    return get_task_index(project_root).find_task_dir(task_id)
+
+def record_new_task_dir(task_dir: Path | str):
+    """Updates every index (on disk or loaded in this process) of a project containing task_dir."""
+    task_dir = Path(task_dir).resolve()
+    for ancestor in task_dir.parents:
+        with _TASK_INDEXES_LOCK:
+            indexed = ancestor in _TASK_INDEXES
+        if indexed or (ancestor / TASK_INDEX_DIRNAME / TASK_INDEX_FILENAME).is_file():
+            get_task_index(ancestor).record_task_dir(task_dir)
@@ -8,6 +8,9 @@ from datetime import datetime
 import re
 import yaml # For parsing parent task_definition.md YAML
 
+from gouai_frontmatter import load_frontmatter
+from gouai_task_index import find_task_dir, record_new_task_dir
+
 # --- Constants based on WSOD_TaskMgmt ---
 TASK_STATUS_NOT_STARTED = "Not Started"
 TASK_VERSION_DEFAULT = "1.0"
@@ -48,23 +51,19 @@ def _parse_parent_task_def(parent_task_def_path: Path) -> tuple[str, str, str]:
     if not parent_task_def_path.is_file():
         raise FileNotFoundError(f"Parent task definition file not found: {parent_task_def_path}")
 
-    with open(parent_task_def_path, 'r', encoding='utf-8') as f:
-        content = f.read()
-
-    frontmatter_match = re.search(r"^---\s*\n(.*?)\n---\s*\n", content, re.DOTALL | re.MULTILINE)
-    if not frontmatter_match:
+    frontmatter = load_frontmatter(parent_task_def_path)
+    if not frontmatter.found:
         # Attempt to parse as full YAML if no frontmatter delimiters found (less likely for task_def)
         try:
-            data = yaml.safe_load(content)
+            data = yaml.safe_load(parent_task_def_path.read_text(encoding='utf-8'))
             if not isinstance(data, dict): # Ensure it's a map (dictionary)
                  raise ValueError(f"Content of {parent_task_def_path} is not a YAML map.")
         except yaml.YAMLError as e_yaml: # Catch YAML parsing errors
              raise ValueError(f"Could not parse YAML content in {parent_task_def_path}: {e_yaml}")
+    elif frontmatter.error:
+        raise ValueError(f"Error parsing YAML frontmatter in {parent_task_def_path}: {frontmatter.error}")
     else:
-        try:
-            data = yaml.safe_load(frontmatter_match.group(1))
-        except yaml.YAMLError as e_yaml:
-            raise ValueError(f"Error parsing YAML frontmatter in {parent_task_def_path}: {e_yaml}")
+        data = frontmatter.data
 
     if not isinstance(data, dict):
         raise ValueError(f"Parsed YAML from {parent_task_def_path} is not a dictionary.")
@@ -353,6 +352,7 @@ def create_task(
         print(f"Error creating stub files for task '{new_task_id}' in '{new_task_path}': {e}")
         # Consider cleanup logic here for a more robust script
         sys.exit(1)
+    record_new_task_dir(new_task_path) # Keep the project's task index (.gouai/index) current
 
     print(f"\nSuccessfully created GOUAI task '{new_task_id}'.")
     print(f"Location: {new_task_path.resolve()}")
@@ -365,46 +365,18 @@ def create_task(
 
 def find_task_dir_path_from_id(current_search_path: Path, target_task_id: str, project_root_path: Path) -> Path | None:
     """
-    Recursively searches for a task directory by its task_id.
-    It checks task_definition.md in `current_search_path` and its subdirectories (excluding common non-task dirs).
+    Finds a task directory by its task_id through the project's persistent task index
+    (.gouai/index, see gouai_task_index.py). Only directories modified since the index was last
+    updated are rescanned. Returns None unless the task lies within `current_search_path`.
     """
-    # Check current directory
-    task_def_path = current_search_path / "task_definition.md"
-    if task_def_path.is_file():
-        try:
-            # Only read the task_id from YAML to speed up search
-            with open(task_def_path, 'r', encoding='utf-8') as f:
-                # Quick check for task_id in the first few lines to avoid full parse if not necessary
-                # This is an optimization; full parse is safer if YAML is complex
-                file_content_head = "".join(f.readline() for _ in range(15)) # Read first 15 lines
-            
-            id_match = re.search(r"task_id:\s*([^\s]+)", file_content_head)
-            if id_match and id_match.group(1).strip().strip('"').strip("'") == target_task_id:
-                return current_search_path
-        except Exception:
-            # If parsing fails for any reason, this directory doesn't match.
-            print('parsing failed')
-            pass # Continue search
-
-    # Recursively check subdirectories, only if current_search_path is a directory
-    if current_search_path.is_dir():
-        for item in current_search_path.iterdir():
-            if item.is_dir():
-                # Avoid recursing into known non-task or output directories
-                if item.name in ["outputs", "context_packages", ".git", ".venv", "__pycache__"] or item.name.startswith('.'):
-                    continue
-                
-                # Prevent going "up" or outside project boundaries for safety, though Pathlib handles '.' and '..'
-                # Ensure we are still within the project_root_path
-                try:
-                    item.relative_to(project_root_path)
-                except ValueError: # Item is outside project_root_path
-                    continue
-
-                found_path = find_task_dir_path_from_id(item, target_task_id, project_root_path)
-                if found_path:
-                    return found_path
-    return None
+    task_dir = find_task_dir(project_root_path, target_task_id)
+    if task_dir is None:
+        return None
+    try:
+        task_dir.relative_to(Path(current_search_path).resolve())
+    except ValueError:
+        return None
+    return task_dir
 
 
 def main():
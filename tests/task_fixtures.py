@@ -0,0 +1,12 @@
+from pathlib import Path
+
+
+def write_task(task_dir: Path, task_id: str, parent_task_id: str = "null", status: str = "Not Started",
+               body: str = "## High-Level Goal(s) (HLG)\n\nBody\n"):
+    """Writes a minimal task_definition.md (creating task_dir) for tests that build a project tree on disk."""
+    task_dir.mkdir(parents=True, exist_ok=True)
+    (task_dir / "task_definition.md").write_text(
+        f"---\ntask_id: {task_id}\nparent_task_id: {parent_task_id}\nstatus: \"{status}\"\n"
+        f"task_type: \"full_GOUAI_task\"\nHLG_summary: \"Goal of {task_id}\"\nWSOD_summary: \"Output of {task_id}\"\n---\n{body}",
+        encoding='utf-8'
+    )
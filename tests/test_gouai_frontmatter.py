@@ -0,0 +1,76 @@
+import unittest
+import shutil
+import tempfile
+from pathlib import Path
+
+import yaml
+
+import gouai_frontmatter
+from gouai_frontmatter import load_frontmatter, read_frontmatter, strip_frontmatter, clear_frontmatter_cache
+from gouai_project_tree import ProjectTree
+from gouai_task_index import TaskIndex, _TASK_INDEXES
+
+
+class TestFrontmatterReader(unittest.TestCase):
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp()).resolve()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        clear_frontmatter_cache()
+        self.addCleanup(clear_frontmatter_cache)
+
+    def _write(self, name: str, text: str) -> Path:
+        path = self.root / name
+        path.write_text(text, encoding='utf-8')
+        return path
+
+    def test_reads_only_up_to_the_closing_delimiter(self):
+        path = self.root / "task_definition.md"
+        path.write_bytes(b"\xef\xbb\xbf\n---\ntask_id: T_ROOT\nstatus: Open\n---\n" + b"Body line\n" * 5000 + b"\xff\xfe not UTF-8\n")
+        frontmatter = load_frontmatter(path)
+        self.assertEqual(frontmatter.data, {'task_id': "T_ROOT", 'status': "Open"})
+        self.assertTrue(frontmatter.found)
+        self.assertIsNone(frontmatter.error)
+
+    def test_missing_and_malformed_blocks(self):
+        no_block = load_frontmatter(self._write("plain.md", "# Title\ntask_id: Legacy\n"))
+        self.assertEqual((no_block.data, no_block.found), ({}, False))
+        self.assertIn("task_id: Legacy", no_block.head)
+        malformed = load_frontmatter(self._write("bad.md", "---\ntask_id: [unclosed\n---\nBody\n"))
+        self.assertEqual((malformed.data, malformed.found), ({}, True))
+        self.assertTrue(malformed.error.startswith("Invalid YAML"))
+        self.assertIn("is a YAML list", load_frontmatter(self._write("list.md", "---\n- a\n---\n")).error)
+        self.assertEqual(read_frontmatter(self.root / "missing.md"), {})
+
+    def test_parses_each_file_version_once(self):
+        path = self._write("task_definition.md", "---\ntask_id: T_ROOT\n---\nBody\n")
+        first = read_frontmatter(path)
+        first['task_id'] = "Changed by the caller"
+        self.assertEqual(read_frontmatter(path), {'task_id': "T_ROOT"})
+        self.assertEqual(gouai_frontmatter._load_frontmatter_cached.cache_info().misses, 1)
+
+        self._write("task_definition.md", "---\ntask_id: T_ROOT\nstatus: Done\n---\nBody\n")
+        self.assertEqual(read_frontmatter(path)['status'], "Done")
+        self.assertEqual(gouai_frontmatter._load_frontmatter_cached.cache_info().misses, 2)
+
+    def test_uses_the_libyaml_loader_when_available(self):
+        self.assertIs(gouai_frontmatter._YAML_LOADER, getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+
+    def test_strip_frontmatter(self):
+        self.assertEqual(strip_frontmatter("---\na: 1\n---\n## Body\n"), "## Body\n")
+        self.assertEqual(strip_frontmatter("## No block\n"), "## No block\n")
+
+    def test_whole_project_scans_parse_each_file_once(self):
+        _TASK_INDEXES.clear()
+        self.addCleanup(_TASK_INDEXES.clear)
+        for rel_dir, task_id in (("", "P_ROOT"), ("ST1-1", "P_ROOT_ST1-1"), ("ST1-1/ST2-1", "P_ROOT_ST1-1_ST2-1")):
+            task_dir = self.root / rel_dir
+            task_dir.mkdir(parents=True, exist_ok=True)
+            (task_dir / "task_definition.md").write_text(f"---\ntask_id: {task_id}\n---\nBody\n", encoding='utf-8')
+        TaskIndex(self.root).task_ids()
+        ProjectTree(self.root)
+        ProjectTree(self.root)
+        self.assertEqual(gouai_frontmatter._load_frontmatter_cached.cache_info().misses, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,6 +4,14 @@ import os
 from pathlib import Path
 import tempfile
 from datetime import datetime
+import asyncio
+import json
+import subprocess
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import time
+from collections import deque
 import yaml # For yaml.YAMLError and potentially for mock_safe_load if needed by type hints
 
 # --- Import the Google API core exceptions if your code specifically catches them by type ---
@@ -16,6 +24,7 @@ import google.api_core.exceptions
 # This allows Python to find `gouai_llm_api` as a top-level module.
 
 # If `gouai_llm_api.py` is directly in `gouai_project_root/`:
+from benchmarks.bench_import_time import IMPORT_TIME_BUDGETS_MS, SDK_MODULE_PREFIXES
 from gouai_llm_api import (
     # Config and API Key related
     load_api_config_settings,
@@ -25,10 +34,14 @@ from gouai_llm_api import (
     _get_api_key_from_env,
     get_llm_provider_settings,
     _CACHED_SETTINGS, # Global variable used in one test for reset
+    _CONFIG_FILE_CACHE,
 
     # Core API call related
+    _LazyModule,
     _call_gemini_api,
     LLMAPICallError,
+    _get_pooled_client,
+    _clear_client_pool,
     # Note: 'genai' itself is patched at the class/method level using 'gouai_llm_api.genai'
     # so a direct import here might not be needed unless you're type-hinting with genai types.
 
@@ -38,9 +51,85 @@ from gouai_llm_api import (
     # _get_task_llm_log_path is used as a patch target if testing its callers directly
     # _format_prompt_content_for_log if you add tests for it
 
+    # Response cache related
+    _ResponseCache,
+    _compute_request_key,
+    CACHE_POLICY_OFF,
+    CACHE_POLICY_REFRESH,
+
+    # Batch / rate limiting related
+    _TokenBucket,
+    _RATE_LIMITERS,
+
+    # Record/replay cassettes
+    _call_llm,
+    LLM_MODE_ENV_VAR,
+    CASSETTE_DIR_ENV_VAR,
+    CASSETTE_SPEED_ENV_VAR,
+
+    # Backend registry
+    register_llm_backend,
+    LLMBackend,
+    _LLM_BACKENDS,
+
+    # Retry / deadline / hedging
+    _RetryPolicy,
+    _is_retryable_llm_error,
+    _TTFT_SAMPLES,
+
+    # Adaptive concurrency
+    _AIMDConcurrencyController,
+    _CONCURRENCY_CONTROLLERS,
+    get_llm_concurrency_metrics,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_NORMAL,
+    PRIORITY_BULK,
+
+    # Single-flight
+    _IN_FLIGHT_CALLS,
+
+    # Prefix (context) caching
+    _PREFIX_CACHE_HANDLES,
+    _is_prefix_cache_error,
+    register_cacheable_prefix,
+    _CACHEABLE_PREFIX_TEXTS,
+
+    # Call metrics
+    LLM_METRICS_FILENAME,
+
+    # Task directory memoization
+    _get_task_llm_log_path,
+    _TASK_DIR_CACHE,
+    invalidate_task_dir_cache,
+
+    # Usage ledger
+    LLM_USAGE_LEDGER_FILENAME,
+    _UsageTotals,
+    _USAGE_TOTALS,
+    get_llm_usage_totals,
+
+    # Background log writer / segmented logs
+    _LLMLogWriter,
+    _conversation_log_settings,
+    read_llm_log_turns,
+    _LLM_LOG_WRITER,
+    flush_llm_logs,
+
+    # Prompt token budget
+    fit_prompt_sections,
+    estimate_prompt_tokens,
+    count_prompt_tokens,
+    PromptBudgetExceededError,
+
+    # Chat history compaction
+    ChatHistoryCompactor,
+
     # Public stream/aggregation functions
-    generate_response_stream
-    # generate_response_aggregated if you add tests for it
+    generate_response_stream,
+    generate_response_aggregated,
+    agenerate_response_stream,
+    agenerate_response_aggregated,
+    generate_responses_batch
 )
 
 # If you need specific types from google.generativeai for your mock classes,
@@ -166,6 +255,44 @@ class TestAPIKeyLoading(unittest.TestCase):
         
         _CACHED_SETTINGS = None # Clean up
 
+class TestProjectAwareSettingsCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir_obj = tempfile.TemporaryDirectory()
+        self.temp_root = Path(self.temp_dir_obj.name).resolve()
+        self.project_a = self.temp_root / "project_a"
+        self.project_b = self.temp_root / "project_b"
+        for project_root, model_name in ((self.project_a, "model-a"), (self.project_b, "model-b")):
+            project_root.mkdir()
+            (project_root / ".gouai_config.yaml").write_text(f"default_model_name: {model_name}\n")
+        for patcher in (
+            patch('gouai_llm_api._get_user_config_file_path', return_value=self.temp_root / "no_user_config.yaml"),
+            patch.dict(os.environ, {_API_KEY_ENV_VAR: "test_key"}),
+            patch('gouai_llm_api._CACHED_SETTINGS', None)
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        _CONFIG_FILE_CACHE.clear()
+        self.temp_dir_obj.cleanup()
+
+    def test_settings_are_cached_per_project_root(self):
+        with patch('gouai_llm_api.yaml.safe_load', wraps=yaml.safe_load) as mock_safe_load:
+            for _ in range(3):
+                self.assertEqual(get_llm_provider_settings(str(self.project_a))['default_model_name'], "model-a")
+                self.assertEqual(get_llm_provider_settings(str(self.project_b))['default_model_name'], "model-b")
+            self.assertEqual(mock_safe_load.call_count, 2) # Each project's file parsed once
+
+    def test_edited_config_invalidates_cache(self):
+        config_path = self.project_a / ".gouai_config.yaml"
+        first = get_llm_provider_settings(str(self.project_a))
+        self.assertIs(get_llm_provider_settings(str(self.project_a)), first)
+
+        config_path.write_text("default_model_name: model-a-v2\n")
+        stat_result = config_path.stat()
+        os.utime(config_path, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns + 1_000_000_000))
+        self.assertEqual(get_llm_provider_settings(str(self.project_a))['default_model_name'], "model-a-v2")
+
 # Mock chunk and response objects for Gemini
 class MockGeminiPart:
     def __init__(self, text=None):
@@ -287,6 +414,59 @@ class TestGeminiAPICall(unittest.TestCase):
     # Add more tests for safety_settings parsing, different error types, empty stream etc.
 
 
+class TestLazySDKImport(unittest.TestCase):
+    def test_lazy_module_imports_on_first_attribute_access(self):
+        lazy_module = _LazyModule("json")
+        self.assertIn("not loaded", repr(lazy_module))
+        self.assertEqual(lazy_module.dumps([1]), "[1]")
+        self.assertIn("(loaded)", repr(lazy_module))
+
+    def test_entry_points_do_not_import_the_sdk(self):
+        # Import time itself is only reported by benchmarks/bench_import_time.py; here a fresh
+        # interpreter checks which modules each entry point leaves loaded.
+        for module_name in IMPORT_TIME_BUDGETS_MS:
+            with self.subTest(module=module_name):
+                completed = subprocess.run(
+                    [sys.executable, "-c",
+                     f"import sys, {module_name}; print('\\n'.join(name for name in sys.modules if name.startswith({SDK_MODULE_PREFIXES!r})))"],
+                    cwd=Path(__file__).resolve().parent.parent, capture_output=True, text=True, check=True
+                )
+                self.assertEqual(completed.stdout.split(), [])
+
+@patch('gouai_llm_api.genai')
+class TestGeminiClientPool(unittest.TestCase):
+
+    def setUp(self):
+        _clear_client_pool()
+
+    def tearDown(self):
+        _clear_client_pool()
+
+    def test_same_key_and_options_reuse_one_client(self, mock_genai_module):
+        mock_genai_module.Client.side_effect = lambda **kwargs: MagicMock()
+        client1 = _get_pooled_client("key1", {'timeout': 30000})
+        client2 = _get_pooled_client("key1", {'timeout': 30000})
+        self.assertIs(client1, client2)
+        mock_genai_module.Client.assert_called_once()
+
+    def test_different_key_or_options_get_separate_clients(self, mock_genai_module):
+        mock_genai_module.Client.side_effect = lambda **kwargs: MagicMock()
+        base = _get_pooled_client("key1")
+        self.assertIsNot(base, _get_pooled_client("key2"))
+        self.assertIsNot(base, _get_pooled_client("key1", {'base_url': 'http://localhost:9'}))
+        self.assertEqual(mock_genai_module.Client.call_count, 3)
+
+    def test_concurrent_first_use_builds_single_client(self, mock_genai_module):
+        import threading
+        mock_genai_module.Client.side_effect = lambda **kwargs: MagicMock()
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(_get_pooled_client("shared"))) for _ in range(8)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        self.assertEqual(len({id(c) for c in results}), 1)
+        mock_genai_module.Client.assert_called_once()
+
+
     # In a TestClass inheriting from unittest.TestCase
 class TestInteractionLogging(unittest.TestCase):
     # Assume _append_turn_to_llm_log is imported
@@ -408,4 +588,1667 @@ class TestGenerateResponseStream(unittest.TestCase):
         self.assertEqual(result_chunks[0]['text_chunk'], 'Chunk1 text')
         self.assertEqual(result_chunks[1]['text_chunk'], 'Chunk2 text')
 
-        # Add tests for error handling within generate_response_stream (e.g., ConfigurationError)
\ No newline at end of file
+        # Add tests for error handling within generate_response_stream (e.g., ConfigurationError)
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir_obj = tempfile.TemporaryDirectory()
+        self.cache_dir = Path(self.temp_dir_obj.name) / "responses"
+
+    def tearDown(self):
+        self.temp_dir_obj.cleanup()
+
+    def test_request_key_is_stable_and_input_sensitive(self):
+        key_a = _compute_request_key("m1", "Hello", {"temperature": 0.2, "top_p": 0.9})
+        key_b = _compute_request_key("m1", [{"role": "user", "parts": [{"text": "Hello"}]}], {"top_p": 0.9, "temperature": 0.2})
+        self.assertEqual(key_a, key_b) # String prompt == equivalent single user turn; dict order is irrelevant
+        self.assertNotEqual(key_a, _compute_request_key("m2", "Hello", {"temperature": 0.2, "top_p": 0.9}))
+        self.assertNotEqual(key_a, _compute_request_key("m1", "Hello!", {"temperature": 0.2, "top_p": 0.9}))
+        self.assertNotEqual(key_a, _compute_request_key("m1", "Hello", {"temperature": 0.3, "top_p": 0.9}))
+
+    def test_miss_then_hit(self):
+        cache = _ResponseCache(self.cache_dir, max_bytes=1024 * 1024, ttl_seconds=3600)
+        key = _compute_request_key("m1", "Hello")
+        self.assertIsNone(cache.get(key))
+        cache.put(key, {"text": "Hi there", "finish_reason": "STOP"}, "m1")
+        self.assertEqual(cache.get(key), {"text": "Hi there", "finish_reason": "STOP"})
+
+    def test_expired_entry_is_a_miss(self):
+        cache = _ResponseCache(self.cache_dir, max_bytes=1024 * 1024, ttl_seconds=60)
+        key = _compute_request_key("m1", "Hello")
+        with patch('gouai_llm_api.time.time', return_value=1000.0):
+            cache.put(key, {"text": "old"}, "m1")
+        with patch('gouai_llm_api.time.time', return_value=1061.0):
+            self.assertIsNone(cache.get(key))
+        self.assertFalse(cache._entry_path(key).exists())
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = _ResponseCache(self.cache_dir, max_bytes=10 * 1024 * 1024, ttl_seconds=3600)
+        keys = [_compute_request_key("m1", f"prompt {i}") for i in range(3)]
+        for i, key in enumerate(keys):
+            cache.put(key, {"text": "x" * 400}, "m1")
+            os.utime(cache._entry_path(key), (1000 + i, 1000 + i))
+        os.utime(cache._entry_path(keys[0]), (2000, 2000)) # keys[0] is now the most recently used
+        entry_size = cache._entry_path(keys[0]).stat().st_size
+        cache.max_bytes = entry_size * 2 + entry_size // 2 # Room for two entries only
+        cache._evict_if_needed()
+        self.assertTrue(cache._entry_path(keys[0]).exists())
+        self.assertFalse(cache._entry_path(keys[1]).exists())
+        self.assertTrue(cache._entry_path(keys[2]).exists())
+
+    def test_size_is_tracked_without_rescanning(self):
+        keys = [_compute_request_key("m1", f"prompt {i}") for i in range(3)]
+        _ResponseCache(self.cache_dir, max_bytes=1024 * 1024, ttl_seconds=3600).put(keys[0], {"text": "seed"}, "m1")
+        cache = _ResponseCache(self.cache_dir, max_bytes=1024 * 1024, ttl_seconds=60) # Seeded from the entry on disk
+        disk_bytes = lambda: sum(entry_path.stat().st_size for entry_path in self.cache_dir.glob("*/*.json"))
+        self.assertEqual(cache._total_bytes, disk_bytes())
+        with patch.object(_ResponseCache, '_scan_entries', side_effect=AssertionError("no rescan below max_bytes")):
+            with patch('gouai_llm_api.time.time', return_value=1000.0):
+                cache.put(keys[1], {"text": "x" * 400}, "m1")
+                cache.put(keys[1], {"text": "y" * 40}, "m1") # Overwrite with a smaller entry
+                cache.put(keys[2], {"text": "z" * 100}, "m1")
+                self.assertEqual(cache._total_bytes, disk_bytes())
+            with patch('gouai_llm_api.time.time', return_value=1061.0):
+                self.assertIsNone(cache.get(keys[2])) # Expired and removed
+            self.assertEqual(cache._total_bytes, disk_bytes())
+
+
+class TestGenerateResponseAggregatedCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir_obj = tempfile.TemporaryDirectory()
+        self.temp_dir = self.temp_dir_obj.name
+        self.settings = {
+            'default_model_name': 'test_model', 'api_key': 'fake_key',
+            'response_cache': {'enabled': True, 'directory': str(Path(self.temp_dir) / "cache")}
+        }
+
+    def tearDown(self):
+        self.temp_dir_obj.cleanup()
+
+    def _aggregate(self, **kwargs):
+        return generate_response_aggregated(
+            project_root=self.temp_dir, session_id="s1", task_id="t1", prompt_text="User prompt", **kwargs
+        )
+
+    @patch('gouai_llm_api._get_task_llm_log_path', return_value=None)
+    @patch('gouai_llm_api.generate_response_stream')
+    @patch('gouai_llm_api.get_llm_provider_settings')
+    def test_cache_hit_refresh_and_off(self, mock_get_settings, mock_stream, mock_get_log_path):
+        mock_get_settings.return_value = self.settings
+        mock_stream.side_effect = lambda **kwargs: iter([
+            {'is_chunk': True, 'text_chunk': 'Fresh answer', 'candidate_finish_reason': 'STOP', 'candidate_safety_ratings': []}
+        ])
+
+        first = self._aggregate()
+        self.assertEqual(first['text'], 'Fresh answer')
+        self.assertFalse(first['cache_hit'])
+
+        second = self._aggregate()
+        self.assertEqual(second['text'], 'Fresh answer')
+        self.assertEqual(second['finish_reason'], 'STOP')
+        self.assertTrue(second['cache_hit'])
+        self.assertEqual(mock_stream.call_count, 1)
+
+        refreshed = self._aggregate(cache_policy=CACHE_POLICY_REFRESH)
+        self.assertFalse(refreshed['cache_hit'])
+        self.assertEqual(mock_stream.call_count, 2)
+
+        uncached = self._aggregate(cache_policy=CACHE_POLICY_OFF)
+        self.assertFalse(uncached['cache_hit'])
+        self.assertEqual(mock_stream.call_count, 3)
+
+    @patch('gouai_llm_api._get_task_llm_log_path', return_value=None)
+    @patch('gouai_llm_api.generate_response_stream')
+    @patch('gouai_llm_api.get_llm_provider_settings')
+    def test_errors_are_not_cached(self, mock_get_settings, mock_stream, mock_get_log_path):
+        mock_get_settings.return_value = self.settings
+        mock_stream.side_effect = lambda **kwargs: iter([{'is_error': True, 'error': 'Quota exceeded'}])
+
+        self.assertIsNotNone(self._aggregate()['error_info'])
+        self.assertIsNotNone(self._aggregate()['error_info'])
+        self.assertEqual(mock_stream.call_count, 2)
+
+
+class MockAsyncGeminiResponseStream:
+    """Async iterator over MockGeminiChunk objects, like the one returned by client.aio.models.generate_content_stream."""
+    def __init__(self, chunks_data, delay_s=0.0, error=None):
+        self.chunks = iter(MockGeminiResponseStream(chunks_data))
+        self.delay_s = delay_s
+        self.error = error
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await asyncio.sleep(self.delay_s)
+        if self.error:
+            raise self.error
+        try:
+            return next(self.chunks)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+@patch('gouai_llm_api.genai')
+class TestAsyncGenerateResponse(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir_obj = tempfile.TemporaryDirectory()
+        self.temp_dir = self.temp_dir_obj.name
+        self.log_file = Path(self.temp_dir) / "llm_conversation_log.md"
+        _clear_client_pool()
+
+    def tearDown(self):
+        _clear_client_pool()
+        self.temp_dir_obj.cleanup()
+
+    def _set_stream(self, mock_genai, **stream_kwargs):
+        async def fake_generate_content_stream(model, contents, config):
+            return MockAsyncGeminiResponseStream(
+                [{"text_parts": ["Hello "]}, {"text_parts": [f"from {model}"], "finish_reason": "STOP"}],
+                **stream_kwargs
+            )
+        mock_genai.Client.return_value.aio.models.generate_content_stream.side_effect = fake_generate_content_stream
+
+    @patch('gouai_llm_api._get_task_llm_log_path')
+    @patch('gouai_llm_api.get_llm_provider_settings')
+    def test_async_stream_yields_chunks_and_logs(self, mock_get_settings, mock_get_log_path, mock_genai):
+        mock_get_settings.return_value = {'default_model_name': 'test_model', 'api_key': 'test_key'}
+        mock_get_log_path.return_value = self.log_file
+        self._set_stream(mock_genai)
+
+        async def collect():
+            return [chunk async for chunk in agenerate_response_stream(self.temp_dir, "s1", "t1", prompt_text="User prompt")]
+
+        chunks = asyncio.run(collect())
+        self.assertEqual([c['text_chunk'] for c in chunks], ["Hello ", "from test_model"])
+        self.assertTrue(flush_llm_logs(timeout=5))
+        log_text = self.log_file.read_text(encoding='utf-8')
+        self.assertIn("### User", log_text)
+        self.assertIn("User prompt", log_text)
+        self.assertIn("### Assistant", log_text)
+        self.assertIn("Hello from test_model", log_text)
+
+    @patch('gouai_llm_api._get_task_llm_log_path', return_value=None)
+    @patch('gouai_llm_api.get_llm_provider_settings')
+    def test_aggregated_calls_run_concurrently_on_one_client(self, mock_get_settings, mock_get_log_path, mock_genai):
+        mock_get_settings.return_value = {'default_model_name': 'test_model', 'api_key': 'test_key',
+                                          'adaptive_concurrency': {'enabled': False}, 'retry_policy': {'max_attempts': 1}}
+        call_count = 20
+        in_flight = {'now': 0, 'peak': 0}
+        all_started = asyncio.Event()
+
+        async def fake_generate_content_stream(model, contents, config):
+            in_flight['now'] += 1
+            in_flight['peak'] = max(in_flight['peak'], in_flight['now'])
+            if in_flight['now'] == call_count:
+                all_started.set()
+            await asyncio.wait_for(all_started.wait(), timeout=5) # Barrier: calls made one at a time never get past it
+            in_flight['now'] -= 1
+            return MockAsyncGeminiResponseStream(
+                [{"text_parts": ["Hello "]}, {"text_parts": [f"from {model}"], "finish_reason": "STOP"}]
+            )
+        mock_genai.Client.return_value.aio.models.generate_content_stream.side_effect = fake_generate_content_stream
+
+        async def fan_out():
+            return await asyncio.gather(*(
+                agenerate_response_aggregated(self.temp_dir, "s1", "t1", prompt_text=f"Prompt {i}") for i in range(call_count)
+            ))
+
+        results = asyncio.run(fan_out())
+
+        self.assertEqual(len(results), call_count)
+        for result in results:
+            self.assertIsNone(result['error_info'])
+            self.assertEqual(result['text'], "Hello from test_model")
+            self.assertEqual(result['finish_reason'], "STOP")
+        self.assertEqual(in_flight['peak'], call_count)
+        self.assertEqual(mock_genai.Client.call_count, 1)
+
+    @patch('gouai_llm_api._log_error_to_project')
+    @patch('gouai_llm_api._get_task_llm_log_path', return_value=None)
+    @patch('gouai_llm_api.get_llm_provider_settings')
+    def test_async_api_error_is_reported_like_sync(self, mock_get_settings, mock_get_log_path, mock_log_error, mock_genai):
+        mock_get_settings.return_value = {'default_model_name': 'test_model', 'api_key': 'test_key', 'retry_policy': {'max_attempts': 1}}
+        self._set_stream(mock_genai, error=google.api_core.exceptions.ResourceExhausted("Quota exceeded"))
+
+        result = asyncio.run(agenerate_response_aggregated(self.temp_dir, "s1", "t1", prompt_text="Hi"))
+        self.assertEqual(result['error_info']['type'], "ResourceExhausted")
+        self.assertIn("Quota exceeded", result['error_info']['details'])
+        mock_log_error.assert_called()
+
+    @patch('gouai_llm_api.get_llm_provider_settings')
+    def test_async_configuration_error_is_yielded_then_raised(self, mock_get_settings, mock_genai):
+        mock_get_settings.side_effect = ConfigurationError("GEMINI_API_KEY is not set")
+
+        async def consume():
+            seen = []
+            with self.assertRaises(ConfigurationError):
+                async for chunk in agenerate_response_stream(None, "s1", "t1", prompt_text="Hi"):
+                    seen.append(chunk)
+            return seen
+
+        with patch('gouai_llm_api._log_error_to_project'):
+            seen = asyncio.run(consume())
+        self.assertTrue(seen[0]['is_configuration_error'])
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst_then_refill(self):
+        now = [100.0]
+        bucket = _TokenBucket(per_minute=60, clock=lambda: now[0]) # 1 token per second, burst of 60
+        self.assertEqual(bucket.try_acquire(60), 0.0)
+        self.assertAlmostEqual(bucket.try_acquire(1), 1.0)
+        now[0] += 0.5
+        self.assertAlmostEqual(bucket.try_acquire(1), 0.5)
+        now[0] += 0.5
+        self.assertEqual(bucket.try_acquire(1), 0.0)
+
+    def test_oversized_request_waits_for_full_bucket_only(self):
+        now = [0.0]
+        bucket = _TokenBucket(per_minute=60, clock=lambda: now[0])
+        self.assertEqual(bucket.try_acquire(500), 0.0) # Capped to capacity instead of blocking forever
+
+    def test_adjust_corrects_estimate(self):
+        now = [0.0]
+        bucket = _TokenBucket(per_minute=60, clock=lambda: now[0])
+        bucket.try_acquire(10)
+        bucket.adjust(40) # Actual usage was 50, not 10
+        self.assertAlmostEqual(bucket.available, 10)
+        bucket.adjust(-100)
+        self.assertAlmostEqual(bucket.available, 60) # Never above capacity
+
+
+class TestGenerateResponsesBatch(unittest.TestCase):
+    def setUp(self):
+        _RATE_LIMITERS.clear()
+
+    def tearDown(self):
+        _RATE_LIMITERS.clear()
+
+    @patch('gouai_llm_api.get_llm_provider_settings', return_value={'default_model_name': 'm', 'api_key': 'k'})
+    @patch('gouai_llm_api.generate_response_aggregated')
+    def test_results_in_order_with_bounded_concurrency(self, mock_aggregated, mock_get_settings):
+        import threading, time
+        in_flight = [0]
+        peak = [0]
+        lock = threading.Lock()
+
+        def fake_aggregated(**kwargs):
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            time.sleep(0.02)
+            with lock:
+                in_flight[0] -= 1
+            if kwargs['prompt_text'] == "boom":
+                return {'text': "", 'error_info': {'message': "failed", 'type': "LLMAPICallError"}}
+            return {'text': kwargs['prompt_text'].upper(), 'error_info': None}
+
+        mock_aggregated.side_effect = fake_aggregated
+        prompts = [f"p{i}" for i in range(10)] + ["boom"] + [f"q{i}" for i in range(5)]
+        results = generate_responses_batch(
+            [{'project_root': None, 'session_id': "s", 'task_id': "t", 'prompt_text': p} for p in prompts],
+            max_concurrency=3
+        )
+
+        self.assertEqual([r['text'] for r in results], [p.upper() if p != "boom" else "" for p in prompts])
+        self.assertIsNotNone(results[10]['error_info'])
+        self.assertTrue(all(r['error_info'] is None for i, r in enumerate(results) if i != 10))
+        self.assertLessEqual(peak[0], 3)
+        self.assertGreater(peak[0], 1)
+
+    @patch('gouai_llm_api.get_llm_provider_settings', return_value={'default_model_name': 'm', 'api_key': 'k'})
+    @patch('gouai_llm_api.generate_response_aggregated', return_value={'text': "ok", 'error_info': None})
+    def test_malformed_request_only_fails_itself(self, mock_aggregated, mock_get_settings):
+        results = generate_responses_batch([
+            {'project_root': None, 'session_id': "s", 'task_id': "t", 'prompt_text': "fine"},
+            {'project_root': None, 'session_id': "s", 'task_id': "t", 'prompt_txt': "typo", 'rpm': 5},
+        ], max_concurrency=2, rpm=600)
+        self.assertEqual(results[0]['text'], "ok")
+        self.assertEqual(results[1]['error_info']['type'], "ValueError") # Neither prompt_text nor contents
+
+    @patch('gouai_llm_api.generate_response_aggregated', return_value={'text': "ok", 'error_info': None})
+    @patch('gouai_llm_api.get_llm_provider_settings')
+    def test_configured_rpm_throttles_requests(self, mock_get_settings, mock_aggregated):
+        mock_get_settings.return_value = {'default_model_name': 'm', 'api_key': 'k', 'rate_limits': {'rpm': 2}}
+        now = [0.0]
+        slept = []
+
+        def fake_sleep(seconds):
+            slept.append(seconds)
+            now[0] += seconds
+
+        with patch('gouai_llm_api.time.monotonic', side_effect=lambda: now[0]), \
+             patch('gouai_llm_api.time.sleep', side_effect=fake_sleep):
+            results = generate_responses_batch(
+                [{'project_root': None, 'session_id': "s", 'task_id': "t", 'prompt_text': f"p{i}"} for i in range(5)],
+                max_concurrency=1
+            )
+
+        self.assertEqual(len(results), 5)
+        self.assertAlmostEqual(sum(slept), 90.0) # Burst of 2, then one request every 30s
+
+
+class TestCassetteRecordReplay(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir_obj = tempfile.TemporaryDirectory()
+        self.env = {CASSETTE_DIR_ENV_VAR: self.temp_dir_obj.name, CASSETTE_SPEED_ENV_VAR: "1.0"}
+        self.call_kwargs = dict(model_name="m1", api_key="k", contents="Hello", generation_config_params={"temperature": 0})
+
+    def tearDown(self):
+        self.temp_dir_obj.cleanup()
+
+    def _live_stream(self, **kwargs):
+        from google.genai import types as genai_types
+        yield {'text_chunk': "Hel", 'parts_chunk': [genai_types.Part(text="Hel")], 'candidate_finish_reason': None,
+               'candidate_safety_ratings': [], 'is_chunk': True}
+        yield {'text_chunk': "lo", 'parts_chunk': [genai_types.Part(text="lo")], 'candidate_finish_reason': "STOP",
+               'candidate_safety_ratings': [], 'is_chunk': True}
+        yield {'usage_metadata': {'total_token_count': 7}, 'prompt_feedback': None, 'is_final_summary': True}
+
+    def test_record_then_replay_reproduces_stream_and_timing(self):
+        with patch.dict(os.environ, {**self.env, LLM_MODE_ENV_VAR: "record"}), \
+             patch('gouai_llm_api._call_gemini_api', side_effect=self._live_stream):
+            recorded = list(_call_llm(**self.call_kwargs))
+        self.assertEqual(len(list(Path(self.temp_dir_obj.name).glob("*.json"))), 1)
+
+        with patch.dict(os.environ, {**self.env, LLM_MODE_ENV_VAR: "replay"}), \
+             patch('gouai_llm_api._call_gemini_api', side_effect=AssertionError("network used in replay")), \
+             patch('gouai_llm_api.time.sleep') as mock_sleep:
+            replayed = list(_call_llm(**self.call_kwargs))
+
+        self.assertEqual([r['text_chunk'] for r in replayed if r.get('is_chunk')], ["Hel", "lo"])
+        self.assertEqual(replayed[1]['parts_chunk'][0].text, "lo")
+        self.assertEqual(replayed[2], recorded[2])
+        self.assertEqual(replayed[1]['candidate_finish_reason'], "STOP")
+        self.assertLessEqual(mock_sleep.call_count, 3) # Recorded offsets are replayed (zero gaps are skipped)
+
+    def test_replay_speed_zero_never_sleeps(self):
+        with patch.dict(os.environ, {**self.env, LLM_MODE_ENV_VAR: "record"}), \
+             patch('gouai_llm_api._call_gemini_api', side_effect=self._live_stream):
+            list(_call_llm(**self.call_kwargs))
+        with patch.dict(os.environ, {**self.env, LLM_MODE_ENV_VAR: "replay", CASSETTE_SPEED_ENV_VAR: "0"}), \
+             patch('gouai_llm_api.time.sleep') as mock_sleep:
+            list(_call_llm(**self.call_kwargs))
+        mock_sleep.assert_not_called()
+
+    @patch('gouai_llm_api._log_error_to_project')
+    def test_replay_without_cassette_fails_like_an_api_error(self, mock_log_error):
+        with patch.dict(os.environ, {**self.env, LLM_MODE_ENV_VAR: "replay"}):
+            stream = _call_llm(**self.call_kwargs)
+            first = next(stream)
+            self.assertTrue(first['is_error'])
+            with self.assertRaises(LLMAPICallError):
+                next(stream)
+
+    def test_replay_does_not_require_api_key(self):
+        import gouai_llm_api
+        env = {**self.env, LLM_MODE_ENV_VAR: "replay"}
+        with patch.dict(os.environ, env), patch.dict(os.environ, {_API_KEY_ENV_VAR: ""}), \
+             patch('gouai_llm_api.load_api_config_settings', return_value={'default_model_name': 'm1'}), \
+             patch.object(gouai_llm_api, '_CACHED_SETTINGS', None):
+            settings = get_llm_provider_settings(None)
+        self.assertTrue(settings['api_key'])
+
+    def test_invalid_mode_is_a_configuration_error(self):
+        with patch.dict(os.environ, {LLM_MODE_ENV_VAR: "offline"}):
+            with self.assertRaises(ConfigurationError):
+                list(_call_llm(**self.call_kwargs))
+
+
+class _FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    received_bodies = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        _FakeOpenAIHandler.received_bodies.append((self.path, body))
+        if body['model'] == "missing-model":
+            payload = b'{"error": "model not found"}'
+            self.send_response(404)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+        events = [
+            {"choices": [{"index": 0, "delta": {"role": "assistant", "content": "Local "}}]},
+            {"choices": [{"index": 0, "delta": {"content": "answer"}, "finish_reason": "stop"}]},
+            {"choices": [], "usage": {"prompt_tokens": 5, "completion_tokens": 2, "total_tokens": 7}},
+        ]
+        stream = "".join(f"data: {json.dumps(e)}\n\n" for e in events) + "data: [DONE]\n\n"
+        payload = stream.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class TestLLMBackends(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeOpenAIHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}/v1"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def _aggregate_with(self, settings, **kwargs):
+        with patch('gouai_llm_api.get_llm_provider_settings', return_value=settings), \
+             patch('gouai_llm_api._get_task_llm_log_path', return_value=None):
+            return generate_response_aggregated(None, "s1", "t1", **kwargs)
+
+    def test_fake_backend_is_deterministic_and_needs_no_api_key(self):
+        settings = {'default_model_name': 'fake-model', 'api_key': None, 'llm_backend': 'fake', 'fake_backend': {'chunk_chars': 5}}
+        first = self._aggregate_with(settings, prompt_text="Summarize the project")
+        second = self._aggregate_with(settings, prompt_text="Summarize the project")
+        other = self._aggregate_with(settings, prompt_text="Something else")
+        self.assertIsNone(first['error_info'])
+        self.assertEqual(first['text'], second['text'])
+        self.assertNotEqual(first['text'], other['text'])
+        self.assertIn("Summarize the project", first['text'])
+        self.assertEqual(first['finish_reason'], "STOP")
+
+    def test_openai_compatible_backend_streams_from_local_server(self):
+        _FakeOpenAIHandler.received_bodies.clear()
+        settings = {'default_model_name': 'local-model', 'api_key': None, 'llm_backend': 'openai_compatible',
+                    'openai_compatible': {'base_url': self.base_url}}
+        history = [
+            {"role": "user", "parts": [{"text": "Hi"}]},
+            {"role": "model", "parts": [{"text": "Hello"}]},
+            {"role": "user", "parts": [{"text": "Status?"}]},
+        ]
+        result = self._aggregate_with(settings, contents=history, override_generation_config={'temperature': 0.1, 'max_output_tokens': 64})
+        self.assertIsNone(result['error_info'])
+        self.assertEqual(result['text'], "Local answer")
+        self.assertEqual(result['finish_reason'], "STOP")
+
+        path, body = _FakeOpenAIHandler.received_bodies[-1]
+        self.assertEqual(path, "/v1/chat/completions")
+        self.assertEqual([m['role'] for m in body['messages']], ["user", "assistant", "user"])
+        self.assertEqual(body['max_tokens'], 64)
+        self.assertTrue(body['stream'])
+
+        again = self._aggregate_with(settings, prompt_text="Reuse the connection")
+        self.assertEqual(again['text'], "Local answer")
+
+    @patch('gouai_llm_api._log_error_to_project')
+    def test_openai_compatible_http_error_becomes_error_info(self, mock_log_error):
+        settings = {'default_model_name': 'missing-model', 'api_key': None, 'llm_backend': 'openai_compatible',
+                    'openai_compatible': {'base_url': self.base_url}}
+        result = self._aggregate_with(settings, prompt_text="Hi")
+        self.assertEqual(result['error_info']['type'], "OpenAICompatibleHTTPError")
+        self.assertIn("404", result['error_info']['details'])
+
+    @patch('gouai_llm_api._log_error_to_project')
+    def test_unknown_backend_is_a_configuration_error(self, mock_log_error):
+        settings = {'default_model_name': 'm', 'api_key': 'k', 'llm_backend': 'no-such-backend'}
+        result = self._aggregate_with(settings, prompt_text="Hi")
+        self.assertEqual(result['error_info']['type'], "ConfigurationError")
+
+    def test_registered_backend_is_selectable(self):
+        class EchoBackend(LLMBackend):
+            name = "echo_for_test"
+
+            def stream(self, model_name, api_key, contents, generation_config_params, safety_settings_params, tools, settings):
+                yield {'text_chunk': f"echo:{contents}", 'parts_chunk': [], 'candidate_finish_reason': "STOP",
+                       'candidate_safety_ratings': [], 'is_chunk': True}
+
+        register_llm_backend(EchoBackend())
+        try:
+            result = self._aggregate_with({'default_model_name': 'm', 'api_key': None, 'llm_backend': 'echo_for_test'}, prompt_text="ping")
+            self.assertEqual(result['text'], "echo:ping")
+            async_result = asyncio.run(self._aaggregate_with({'default_model_name': 'm', 'api_key': None, 'llm_backend': 'echo_for_test'}, prompt_text="pong"))
+            self.assertEqual(async_result['text'], "echo:pong")
+        finally:
+            _LLM_BACKENDS.pop("echo_for_test", None)
+
+    async def _aaggregate_with(self, settings, **kwargs):
+        with patch('gouai_llm_api.get_llm_provider_settings', return_value=settings), \
+             patch('gouai_llm_api._get_task_llm_log_path', return_value=None):
+            return await agenerate_response_aggregated(None, "s1", "t1", **kwargs)
+
+
+class FaultInjectingBackend(LLMBackend):
+    """
+    Local stub whose attempts follow a script, e.g. ["503", "503", "ok"]:
+      "ok"            -> streams "Hello world" in two chunks
+      "<status>"      -> fails before the first chunk with that HTTP status (yields an error dict, then raises)
+      "blocked"       -> waits for release before the first chunk, then streams like "ok"
+      "midstream"     -> streams one chunk, then fails with 503
+    finished_attempts lists the attempts (1-based) that streamed to the end.
+    """
+    name = "fault_injecting_for_test"
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.attempts = 0
+        self.finished_attempts = []
+        self.release = threading.Event()
+        self._lock = threading.Lock()
+
+    def _fail(self, status):
+        error = google.api_core.exceptions.from_http_status(int(status), f"injected {status}")
+        yield {'error': f"injected {status}", 'original_exception_type': type(error).__name__,
+               'original_exception_message': str(error), 'is_error': True}
+        raise LLMAPICallError(message=f"injected {status}", original_exception=error)
+
+    def stream(self, model_name, api_key, contents, generation_config_params, safety_settings_params, tools, settings):
+        with self._lock:
+            behaviour = self.script[min(self.attempts, len(self.script) - 1)]
+            self.attempts += 1
+            attempt = self.attempts
+        if behaviour.isdigit():
+            yield from self._fail(behaviour)
+            return
+        if behaviour == "blocked":
+            self.release.wait(5)
+        yield {'text_chunk': "Hello ", 'parts_chunk': [], 'candidate_finish_reason': None, 'candidate_safety_ratings': [], 'is_chunk': True}
+        if behaviour == "midstream":
+            yield from self._fail("503")
+            return
+        yield {'text_chunk': "world", 'parts_chunk': [], 'candidate_finish_reason': "STOP", 'candidate_safety_ratings': [], 'is_chunk': True}
+        yield {'usage_metadata': {'total_token_count': 3}, 'prompt_feedback': None, 'is_final_summary': True}
+        self.finished_attempts.append(attempt)
+
+
+class TestRetryDeadlineHedging(unittest.TestCase):
+    def setUp(self):
+        _TTFT_SAMPLES.clear()
+        self.log_error_patcher = patch('gouai_llm_api._log_error_to_project')
+        self.mock_log_error = self.log_error_patcher.start()
+
+    def tearDown(self):
+        self.log_error_patcher.stop()
+        _LLM_BACKENDS.pop(FaultInjectingBackend.name, None)
+        _TTFT_SAMPLES.clear()
+
+    def _run(self, script, retry_policy, use_async=False):
+        """Returns (result, attempts made, attempts finished when the call returned). Blocked attempts are then released."""
+        backend = FaultInjectingBackend(script)
+        register_llm_backend(backend)
+        settings = {'default_model_name': 'm', 'api_key': None, 'llm_backend': backend.name, 'retry_policy': retry_policy}
+        with patch('gouai_llm_api.get_llm_provider_settings', return_value=settings), \
+             patch('gouai_llm_api._get_task_llm_log_path', return_value=None):
+            if use_async:
+                async def call():
+                    # Released inside the loop: asyncio.run() also waits for the abandoned attempt's worker thread
+                    result = await agenerate_response_aggregated(None, "s1", "t1", prompt_text="Hi")
+                    finished_attempts = list(backend.finished_attempts)
+                    backend.release.set()
+                    return result, finished_attempts
+                result, finished_attempts = asyncio.run(call())
+            else:
+                result = generate_response_aggregated(None, "s1", "t1", prompt_text="Hi")
+                finished_attempts = list(backend.finished_attempts)
+                backend.release.set()
+            return result, backend.attempts, finished_attempts
+
+    @patch('gouai_llm_api.time.sleep')
+    def test_transient_errors_are_retried_with_backoff(self, mock_sleep):
+        result, attempts, _ = self._run(["503", "429", "ok"], {'max_attempts': 4, 'initial_backoff_s': 1.0})
+        self.assertIsNone(result['error_info'])
+        self.assertEqual(result['text'], "Hello world")
+        self.assertEqual(attempts, 3)
+        self.assertEqual(mock_sleep.call_count, 2)
+        first_backoff, second_backoff = (c.args[0] for c in mock_sleep.call_args_list)
+        self.assertLessEqual(first_backoff, 1.0) # Full jitter within the exponential cap
+        self.assertLessEqual(second_backoff, 2.0)
+
+    @patch('gouai_llm_api.time.sleep')
+    def test_exhausted_retries_surface_the_last_error(self, mock_sleep):
+        result, attempts, _ = self._run(["503"], {'max_attempts': 3})
+        self.assertEqual(attempts, 3)
+        self.assertEqual(result['error_info']['type'], "ServiceUnavailable")
+
+    @patch('gouai_llm_api.time.sleep')
+    def test_non_retryable_errors_fail_immediately(self, mock_sleep):
+        result, attempts, _ = self._run(["400", "ok"], {'max_attempts': 3})
+        self.assertEqual(attempts, 1)
+        self.assertEqual(result['error_info']['type'], "BadRequest")
+        mock_sleep.assert_not_called()
+
+    @patch('gouai_llm_api.time.sleep')
+    def test_midstream_failures_are_not_retried(self, mock_sleep):
+        result, attempts, _ = self._run(["midstream", "ok"], {'max_attempts': 3})
+        self.assertEqual(attempts, 1) # Retrying would duplicate "Hello " for the caller
+        self.assertEqual(result['error_info']['type'], "ServiceUnavailable")
+
+    def test_deadline_aborts_slow_call(self):
+        result, attempts, finished_attempts = self._run(["blocked"], {'deadline_s': 0.2})
+        self.assertEqual(result['error_info']['type'], "LLMDeadlineExceeded")
+        self.assertEqual(finished_attempts, []) # Returned while the attempt was still blocked
+
+    def test_hedged_request_wins_when_first_is_slow(self):
+        result, attempts, finished_attempts = self._run(["blocked", "ok"], {'hedge': True, 'hedge_after_s': 0.05})
+        self.assertIsNone(result['error_info'])
+        self.assertEqual(result['text'], "Hello world")
+        self.assertEqual(attempts, 2)
+        self.assertEqual(finished_attempts, [2]) # The hedge produced the result; the first attempt was still blocked
+
+    def test_async_retry_and_hedge(self):
+        result, attempts, _ = self._run(["429", "ok"], {'max_attempts': 2, 'initial_backoff_s': 0.01}, use_async=True)
+        self.assertIsNone(result['error_info'])
+        self.assertEqual(attempts, 2)
+
+        result, attempts, finished_attempts = self._run(["blocked", "ok"], {'hedge': True, 'hedge_after_s': 0.05}, use_async=True)
+        self.assertEqual(result['text'], "Hello world")
+        self.assertEqual(finished_attempts, [2])
+
+        result, attempts, finished_attempts = self._run(["blocked"], {'deadline_s': 0.2}, use_async=True)
+        self.assertEqual(result['error_info']['type'], "LLMDeadlineExceeded")
+        self.assertEqual(finished_attempts, [])
+
+    def test_hedge_threshold_is_observed_p95_ttft(self):
+        policy = _RetryPolicy({'hedge': True, 'hedge_min_samples': 20})
+        samples = deque([i / 100 for i in range(1, 101)]) # 0.01 .. 1.00 s
+        self.assertAlmostEqual(policy.hedge_delay_s(samples), 0.96)
+        self.assertIsNone(policy.hedge_delay_s(deque([0.5] * 5))) # Too few samples to trust
+        self.assertIsNone(_RetryPolicy({}).hedge_delay_s(samples)) # Hedging is opt-in
+
+    def test_retryable_classification(self):
+        from google.genai import errors as genai_errors
+        retryable = [
+            google.api_core.exceptions.TooManyRequests("x"),
+            google.api_core.exceptions.ServiceUnavailable("x"),
+            genai_errors.ClientError(429, {'error': {'code': 429, 'message': 'quota', 'status': 'RESOURCE_EXHAUSTED'}}),
+            genai_errors.ServerError(503, {'error': {'code': 503, 'message': 'busy', 'status': 'UNAVAILABLE'}}),
+            TimeoutError("read timed out"),
+        ]
+        for original in retryable:
+            self.assertTrue(_is_retryable_llm_error(LLMAPICallError("e", original)), original)
+        self.assertFalse(_is_retryable_llm_error(LLMAPICallError("e", google.api_core.exceptions.InvalidArgument("x"))))
+        self.assertFalse(_is_retryable_llm_error(LLMAPICallError("e")))
+
+
+class QuotaLimitedBackend(LLMBackend):
+    """Stub server that answers 429 whenever more than 'capacity' calls are in flight at once."""
+    name = "quota_limited_for_test"
+
+    def __init__(self, capacity, call_s=0.02):
+        self.capacity = capacity
+        self.call_s = call_s
+        self.in_flight = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def stream(self, model_name, api_key, contents, generation_config_params, safety_settings_params, tools, settings):
+        with self._lock:
+            self.in_flight += 1
+            over_quota = self.in_flight > self.capacity
+            if over_quota:
+                self.throttled += 1
+        try:
+            if over_quota:
+                error = google.api_core.exceptions.ResourceExhausted("RESOURCE_EXHAUSTED: quota")
+                yield {'error': str(error), 'original_exception_type': type(error).__name__,
+                       'original_exception_message': str(error), 'is_error': True}
+                raise LLMAPICallError(message=str(error), original_exception=error)
+            time.sleep(self.call_s)
+            yield {'text_chunk': "ok", 'parts_chunk': [], 'candidate_finish_reason': "STOP", 'candidate_safety_ratings': [], 'is_chunk': True}
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+class TestAdaptiveConcurrency(unittest.TestCase):
+    def setUp(self):
+        _CONCURRENCY_CONTROLLERS.clear()
+
+    def tearDown(self):
+        _CONCURRENCY_CONTROLLERS.clear()
+        _LLM_BACKENDS.pop(QuotaLimitedBackend.name, None)
+
+    def test_additive_increase_multiplicative_decrease(self):
+        controller = _AIMDConcurrencyController("b/m", initial=4, minimum=1, maximum=6, increase_step=1.0, decrease_factor=0.5)
+        expected_limit = 4.0
+        for _ in range(4): # One full round of successes adds ~increase_step
+            self.assertIsNotNone(controller.try_acquire())
+            controller.release(True)
+            expected_limit += 1.0 / expected_limit
+        self.assertAlmostEqual(controller.limit, expected_limit)
+        self.assertEqual(controller.metrics()['effective_limit'], 4)
+
+        stale_ticket = controller.try_acquire()
+        fresh_ticket = controller.record_throttled(stale_ticket)
+        limit_after_cut = controller.limit
+        self.assertAlmostEqual(limit_after_cut, expected_limit / 2)
+        controller.record_throttled(stale_ticket) # Same congestion event: ignored
+        self.assertEqual(controller.limit, limit_after_cut)
+        controller.record_throttled(fresh_ticket) # A call started after the cut: cut again
+        self.assertAlmostEqual(controller.limit, limit_after_cut / 2)
+        for _ in range(5):
+            controller.record_throttled(controller.epoch)
+        self.assertEqual(controller.limit, 1.0) # Never below the floor
+        controller.release(None)
+        self.assertEqual(controller.metrics()['decreases'], 7)
+
+    def test_acquire_blocks_at_limit(self):
+        controller = _AIMDConcurrencyController("b/m", initial=1)
+        controller.acquire()
+        acquired = threading.Event()
+        waiter = threading.Thread(target=lambda: (controller.acquire(), acquired.set()))
+        waiter.start()
+        self.assertFalse(acquired.wait(0.1))
+        self.assertEqual(controller.metrics()['waiting'], 1)
+        controller.release(True)
+        self.assertTrue(acquired.wait(1.0))
+        waiter.join()
+
+    def test_batch_converges_below_server_quota(self):
+        backend = QuotaLimitedBackend(capacity=6)
+        register_llm_backend(backend)
+        settings = {
+            'default_model_name': 'm', 'api_key': None, 'llm_backend': backend.name,
+            'adaptive_concurrency': {'initial': 2, 'max': 32},
+            'retry_policy': {'max_attempts': 8, 'initial_backoff_s': 0.01, 'max_backoff_s': 0.05}
+        }
+        with patch('gouai_llm_api.get_llm_provider_settings', return_value=settings), \
+             patch('gouai_llm_api._get_task_llm_log_path', return_value=None), \
+             patch('gouai_llm_api._log_error_to_project'):
+            results = generate_responses_batch(
+                [{'project_root': None, 'session_id': "s", 'task_id': "t", 'prompt_text': f"p{i}"} for i in range(150)]
+            )
+
+        self.assertTrue(all(r['error_info'] is None for r in results))
+        metrics = get_llm_concurrency_metrics()[f"{backend.name}/m"]
+        self.assertEqual(metrics['in_flight'], 0)
+        self.assertGreaterEqual(metrics['peak_in_flight'], 4) # Grew from 2 while calls succeeded
+        if backend.throttled:
+            self.assertGreaterEqual(metrics['decreases'], 1)
+        self.assertLessEqual(metrics['limit'], 12) # Kept near the server's capacity, far from the ceiling of 32
+
+    @patch('gouai_llm_api._log_error_to_project')
+    def test_disabled_controller_is_not_created(self, mock_log_error):
+        backend = QuotaLimitedBackend(capacity=100)
+        register_llm_backend(backend)
+        settings = {'default_model_name': 'm', 'api_key': None, 'llm_backend': backend.name, 'adaptive_concurrency': {'enabled': False}}
+        with patch('gouai_llm_api.get_llm_provider_settings', return_value=settings), \
+             patch('gouai_llm_api._get_task_llm_log_path', return_value=None):
+            self.assertEqual(generate_response_aggregated(None, "s", "t", prompt_text="x")['text'], "ok")
+        self.assertEqual(get_llm_concurrency_metrics(), {})
+
+
+class CountingBackend(LLMBackend):
+    """Stub backend that counts upstream calls; streams two chunks, optionally pausing between them."""
+    name = "counting_for_test"
+
+    def __init__(self, delay_s=0.1, fail=False):
+        self.delay_s = delay_s
+        self.fail = fail
+        self.calls = 0
+        self.between_chunks = None # Optional threading.Event the second chunk waits for
+        self._lock = threading.Lock()
+
+    def stream(self, model_name, api_key, contents, generation_config_params, safety_settings_params, tools, settings):
+        with self._lock:
+            self.calls += 1
+        yield {'text_chunk': "Hello ", 'parts_chunk': [], 'candidate_finish_reason': None, 'candidate_safety_ratings': [], 'is_chunk': True}
+        if self.between_chunks is not None:
+            self.between_chunks.wait(2.0)
+        time.sleep(self.delay_s)
+        if self.fail:
+            error = ValueError("bad request")
+            yield {'error': "bad request", 'original_exception_type': "ValueError", 'original_exception_message': "bad request", 'is_error': True}
+            raise LLMAPICallError(message="bad request", original_exception=error)
+        yield {'text_chunk': "world", 'parts_chunk': [], 'candidate_finish_reason': "STOP", 'candidate_safety_ratings': [], 'is_chunk': True}
+        yield {'usage_metadata': None, 'prompt_feedback': None, 'is_final_summary': True}
+
+
+class TestSingleFlight(unittest.TestCase):
+    def setUp(self):
+        self.backend = CountingBackend()
+        register_llm_backend(self.backend)
+        self.settings = {
+            'default_model_name': 'm', 'api_key': None, 'llm_backend': self.backend.name,
+            'retry_policy': {'max_attempts': 1}
+        }
+        patchers = [
+            patch('gouai_llm_api.get_llm_provider_settings', side_effect=lambda *_: self.settings),
+            patch('gouai_llm_api._get_task_llm_log_path', side_effect=lambda root, task_id: Path(f"/logs/{task_id}.md")),
+            patch('gouai_llm_api._append_turn_to_llm_log'),
+            patch('gouai_llm_api._log_error_to_project'),
+        ]
+        self.mock_append_log = patchers[2].start()
+        for patcher in patchers[:2] + patchers[3:]:
+            patcher.start()
+        for patcher in patchers:
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        _LLM_BACKENDS.pop(CountingBackend.name, None)
+        _IN_FLIGHT_CALLS.clear()
+
+    def _run_concurrently(self, prompts):
+        results = [None] * len(prompts)
+        def worker(i):
+            results[i] = generate_response_aggregated(None, "s", f"task{i}", prompt_text=prompts[i])
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(prompts))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def _assistant_logs(self):
+        return {c.args[0]: c.args[2] for c in self.mock_append_log.call_args_list if c.args[1] == "Assistant"}
+
+    def test_concurrent_identical_requests_share_one_upstream_call(self):
+        results = self._run_concurrently(["same prompt"] * 5)
+
+        self.assertEqual(self.backend.calls, 1)
+        self.assertEqual([r['text'] for r in results], ["Hello world"] * 5)
+        self.assertTrue(all(r['finish_reason'] == "STOP" for r in results))
+        # Every waiter logged its own turns to its own task log
+        self.assertEqual(self._assistant_logs(), {Path(f"/logs/task{i}.md"): "Hello world" for i in range(5)})
+        self.assertEqual(_IN_FLIGHT_CALLS, {})
+
+    def test_different_requests_are_not_coalesced(self):
+        self._run_concurrently(["prompt A", "prompt B", "prompt A"])
+        self.assertEqual(self.backend.calls, 2)
+
+    def test_can_be_disabled(self):
+        self.settings['single_flight'] = False
+        self._run_concurrently(["same prompt"] * 3)
+        self.assertEqual(self.backend.calls, 3)
+
+    def test_errors_fan_out_to_every_waiter(self):
+        self.backend.fail = True
+        results = self._run_concurrently(["same prompt"] * 3)
+
+        self.assertEqual(self.backend.calls, 1)
+        for result in results:
+            self.assertEqual(result['error_info']['message'], "bad request")
+        self.assertEqual(_IN_FLIGHT_CALLS, {})
+
+    def test_followers_finish_when_leader_stops_early(self):
+        self.backend.between_chunks = threading.Event()
+        self.backend.delay_s = 0
+        leader = generate_response_stream(None, "s", "leader", prompt_text="same prompt")
+        self.assertEqual(next(leader)['text_chunk'], "Hello ")
+
+        follower_result = {}
+        follower = threading.Thread(target=lambda: follower_result.update(
+            generate_response_aggregated(None, "s", "follower", prompt_text="same prompt")))
+        follower.start()
+        for _ in range(200):
+            if any(flight.followers for flight in list(_IN_FLIGHT_CALLS.values())):
+                break
+            time.sleep(0.01)
+        self.backend.between_chunks.set()
+        leader.close()
+        follower.join(2.0)
+
+        self.assertEqual(follower_result.get('text'), "Hello world")
+        self.assertEqual(self.backend.calls, 1)
+
+    def test_async_callers_on_one_loop_share_one_upstream_call(self):
+        async def main():
+            return await asyncio.gather(*(
+                agenerate_response_aggregated(None, "s", f"task{i}", prompt_text="same prompt") for i in range(4)
+            ))
+        results = asyncio.run(main())
+
+        self.assertEqual(self.backend.calls, 1)
+        self.assertEqual([r['text'] for r in results], ["Hello world"] * 4)
+        self.assertEqual(len(self._assistant_logs()), 4)
+
+
+class TestCallMetrics(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir_obj = tempfile.TemporaryDirectory()
+        self.project_root = self.temp_dir_obj.name
+        self.metrics_path = Path(self.project_root) / ".gouai" / LLM_METRICS_FILENAME
+        self.settings = {
+            'default_model_name': 'fake-model', 'api_key': None, 'llm_backend': 'fake',
+            'fake_backend': {'response_text': "abcdefghij", 'chunk_chars': 2, 'chunk_delay_ms': 20}
+        }
+        for patcher in (
+            patch('gouai_llm_api.get_llm_provider_settings', side_effect=lambda *_: self.settings),
+            patch('gouai_llm_api._get_task_llm_log_path', return_value=None),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        flush_llm_logs(timeout=5) # Usage-ledger lines for the project are written in the background
+        self.temp_dir_obj.cleanup()
+
+    def _metrics_lines(self):
+        with open(self.metrics_path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def test_stream_reports_timing_through_final_metadata_out_and_jsonl(self):
+        final_metadata = {}
+        chunks = list(generate_response_stream(self.project_root, "s1", "T1", prompt_text="Hi", final_metadata_out=final_metadata))
+
+        self.assertEqual(len(chunks), 5)
+        metrics = final_metadata['metrics']
+        self.assertEqual(final_metadata['finish_reason'], "STOP")
+        self.assertEqual(final_metadata['usage_metadata']['candidates_token_count'], metrics['response_tokens'])
+        self.assertEqual(metrics['outcome'], "ok")
+        self.assertEqual(metrics['chunk_count'], 5)
+        self.assertEqual((metrics['task_id'], metrics['model'], metrics['backend']), ("T1", "fake-model", "fake"))
+        self.assertGreaterEqual(metrics['ttft_s'], 0.015)
+        self.assertGreaterEqual(metrics['duration_s'], 0.09)
+        self.assertGreaterEqual(metrics['mean_inter_chunk_gap_s'], 0.015)
+        self.assertGreaterEqual(metrics['max_inter_chunk_gap_s'], metrics['mean_inter_chunk_gap_s'])
+        self.assertGreater(metrics['chunks_per_s'], 0)
+        self.assertIsNotNone(metrics['prompt_tokens'])
+        self.assertEqual(len(metrics['request_key']), 16)
+
+        self.assertEqual(self._metrics_lines(), [metrics])
+
+    def test_aggregated_response_includes_metrics_and_usage(self):
+        result = generate_response_aggregated(self.project_root, "s1", "T1", prompt_text="Hi")
+        async_result = asyncio.run(agenerate_response_aggregated(self.project_root, "s1", "T2", prompt_text="Hi"))
+
+        for aggregated in (result, async_result):
+            self.assertEqual(aggregated['text'], "abcdefghij")
+            self.assertEqual(aggregated['metrics']['outcome'], "ok")
+            self.assertEqual(aggregated['usage_metadata']['candidates_token_count'], aggregated['metrics']['response_tokens'])
+        self.assertEqual([line['task_id'] for line in self._metrics_lines()], ["T1", "T2"])
+
+    @patch('gouai_llm_api._log_error_to_project')
+    def test_errors_are_recorded_with_error_outcome(self, mock_log_error):
+        self.settings['llm_backend'] = 'no_such_backend'
+        result = generate_response_aggregated(self.project_root, "s1", "T1", prompt_text="Hi")
+
+        self.assertEqual(result['error_info']['type'], "ConfigurationError")
+        self.assertEqual(result['metrics']['outcome'], "error")
+        self.assertIsNone(result['metrics']['ttft_s'])
+        self.assertEqual(self._metrics_lines()[0]['outcome'], "error")
+
+    def test_file_output_can_be_disabled(self):
+        self.settings['llm_metrics'] = False
+        result = generate_response_aggregated(self.project_root, "s1", "T1", prompt_text="Hi")
+
+        self.assertEqual(result['metrics']['outcome'], "ok")
+        self.assertFalse(self.metrics_path.exists())
+
+
+class TestBackgroundLogWriter(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir_obj = tempfile.TemporaryDirectory()
+        self.log_dir = Path(self.temp_dir_obj.name)
+        self.writer = _LLMLogWriter()
+
+    def tearDown(self):
+        self.writer.close()
+        self.temp_dir_obj.cleanup()
+
+    def _submit(self, log_file_path, text, log_config=None):
+        self.writer.submit(log_file_path, "HEADER\n", f"{text}\n", log_settings=_conversation_log_settings(log_config))
+
+    def test_turns_are_written_in_order_with_one_header(self):
+        log_a, log_b = self.log_dir / "A" / "log.md", self.log_dir / "B" / "log.md"
+        for i in range(3):
+            self._submit(log_a, f"a{i}")
+            self._submit(log_b, f"b{i}")
+        self.assertTrue(self.writer.flush(timeout=5))
+
+        self.assertEqual(log_a.read_text(), "HEADER\na0\na1\na2\n")
+        self.assertEqual(log_b.read_text(), "HEADER\nb0\nb1\nb2\n")
+
+    def test_existing_file_gets_no_header_and_lru_limit_is_respected(self):
+        log_a, log_b = self.log_dir / "a.md", self.log_dir / "b.md"
+        log_a.write_text("existing\n")
+        for i in range(3):
+            self._submit(log_a, f"a{i}", {'max_open_files': 1})
+            self._submit(log_b, f"b{i}", {'max_open_files': 1})
+            self.writer.flush(timeout=5)
+            self.assertLessEqual(len(self.writer._handles), 1)
+
+        self.assertEqual(log_a.read_text(), "existing\na0\na1\na2\n")
+        self.assertEqual(log_b.read_text(), "HEADER\nb0\nb1\nb2\n")
+
+    def test_replaced_file_is_reopened(self):
+        log_file = self.log_dir / "log.md"
+        self._submit(log_file, "first")
+        self.writer.flush(timeout=5)
+        log_file.rename(self.log_dir / "rotated.md")
+        self._submit(log_file, "second")
+        self.writer.flush(timeout=5)
+
+        self.assertEqual(log_file.read_text(), "HEADER\nsecond\n")
+        self.assertEqual((self.log_dir / "rotated.md").read_text(), "HEADER\nfirst\n")
+
+    def test_fsync_policy(self):
+        log_file = self.log_dir / "log.md"
+        for policy, expected_fsyncs in (("none", 0), ("batch", 1), ("always", 3)):
+            # No writer thread: the three turns are written here as one batch
+            with patch.object(self.writer, '_ensure_started'), patch('gouai_llm_api.os.fsync') as mock_fsync:
+                for i in range(3):
+                    self._submit(log_file, f"{policy}{i}", {'fsync': policy})
+                self.writer._write_batch([self.writer._queue.get_nowait() for _ in range(3)])
+            self.assertEqual(mock_fsync.call_count, expected_fsyncs, policy)
+
+    def test_close_writes_pending_turns_and_writer_restarts(self):
+        log_file = self.log_dir / "log.md"
+        for i in range(50):
+            self._submit(log_file, f"t{i}")
+        self.writer.close()
+
+        self.assertFalse(self.writer._thread.is_alive())
+        self.assertEqual(log_file.read_text().count("\n"), 51)
+        self._submit(log_file, "after close")
+        self.assertTrue(self.writer.flush(timeout=5))
+        self.assertTrue(log_file.read_text().endswith("after close\n"))
+
+    def test_request_path_does_not_wait_for_log_writes(self):
+        log_file = self.log_dir / "llm_conversation_log.md"
+        settings = {'default_model_name': 'fake-model', 'api_key': None, 'llm_backend': 'fake', 'fake_backend': {'response_text': "Hi!"}}
+        writes_released = threading.Event()
+        real_handle = _LLM_LOG_WRITER._handle
+        def gated_handle(*args):
+            writes_released.wait(5)
+            return real_handle(*args)
+
+        with patch('gouai_llm_api.get_llm_provider_settings', return_value=settings), \
+             patch('gouai_llm_api._get_task_llm_log_path', return_value=log_file), \
+             patch.object(_LLM_LOG_WRITER, '_handle', side_effect=gated_handle):
+            result = generate_response_aggregated(str(self.log_dir), "s1", "T1", prompt_text="Hello")
+            written_before_release = log_file.exists()
+            writes_released.set()
+            self.assertTrue(flush_llm_logs(timeout=5))
+
+        self.assertEqual(result['text'], "Hi!")
+        self.assertFalse(written_before_release) # The call returned while the writer was still held back
+        log_text = log_file.read_text()
+        self.assertLess(log_text.index("### User"), log_text.index("### Assistant"))
+        self.assertIn("session_id: s1", log_text)
+
+    def test_background_writer_can_be_disabled(self):
+        log_file = self.log_dir / "llm_conversation_log.md"
+        settings = {'default_model_name': 'fake-model', 'api_key': None, 'llm_backend': 'fake',
+                    'conversation_log': {'background_writer': False}}
+        with patch('gouai_llm_api.get_llm_provider_settings', return_value=settings), \
+             patch('gouai_llm_api._get_task_llm_log_path', return_value=log_file):
+            generate_response_aggregated(str(self.log_dir), "s1", "T1", prompt_text="Hello")
+        self.assertIn("### Assistant", log_file.read_text()) # Written synchronously, no flush needed
+
+    def test_each_turn_is_written_with_its_own_projects_settings(self):
+        log_a, log_b = self.log_dir / "A" / "log.md", self.log_dir / "B" / "log.md"
+        turn_info = {'timestamp': "2025-05-20 12:00:00", 'role': "User", 'session_id': "s1"}
+        rotating, unrotated = _conversation_log_settings({'max_segment_kb': 1, 'compress_segments': False}), _conversation_log_settings({'max_segment_kb': 0})
+        with patch.object(self.writer, '_ensure_started'): # No writer thread: everything is written here as one batch
+            for i in range(6):
+                self.writer.submit(log_a, "HEADER\n", f"a{i} " + "x" * 600 + "\n", turn_info, rotating)
+                self.writer.submit(log_b, "HEADER\n", f"b{i} " + "x" * 600 + "\n", turn_info, unrotated)
+            self.writer._write_batch([self.writer._queue.get_nowait() for _ in range(12)])
+
+        self.assertGreaterEqual(len(list((self.log_dir / "A" / "log.segments").iterdir())), 2)
+        self.assertFalse((self.log_dir / "B" / "log.segments").exists())
+        self.assertEqual(log_b.read_text().count(" xxx"), 6)
+
+
+class TestTaskLogPathMemoization(unittest.TestCase):
+    def setUp(self):
+        _TASK_DIR_CACHE.clear()
+        self.temp_dir_obj = tempfile.TemporaryDirectory()
+        self.project_root = Path(self.temp_dir_obj.name).resolve()
+        self.task_dir = self.project_root / "ST1-1_Research"
+        self.task_dir.mkdir()
+        self.current_task_dir = self.task_dir
+        patcher = patch('gouai_llm_api.find_task_dir_path_from_id', side_effect=lambda *_: self.current_task_dir)
+        self.mock_find = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        _TASK_DIR_CACHE.clear()
+        self.temp_dir_obj.cleanup()
+
+    def test_tree_is_scanned_once_per_task(self):
+        for _ in range(3):
+            self.assertEqual(_get_task_llm_log_path(str(self.project_root), "P_ROOT_ST1-1"), self.task_dir / "llm_conversation_log.md")
+        self.assertEqual(self.mock_find.call_count, 1)
+
+        _get_task_llm_log_path(str(self.project_root), "P_ROOT_ST1-2")
+        self.assertEqual(self.mock_find.call_count, 2) # Cached per task id
+
+    def test_moved_task_is_found_again(self):
+        _get_task_llm_log_path(str(self.project_root), "P_ROOT_ST1-1")
+        moved_dir = self.project_root / "ST2-1_Parent" / "ST1-1_Research"
+        moved_dir.parent.mkdir()
+        self.task_dir.rename(moved_dir)
+        self.current_task_dir = moved_dir
+
+        self.assertEqual(_get_task_llm_log_path(str(self.project_root), "P_ROOT_ST1-1"), moved_dir / "llm_conversation_log.md")
+        self.assertEqual(self.mock_find.call_count, 2)
+
+    def test_directory_replaced_at_the_same_path_is_rescanned(self):
+        _get_task_llm_log_path(str(self.project_root), "P_ROOT_ST1-1")
+        self.task_dir.rename(self.project_root / "old")
+        self.task_dir.mkdir()
+
+        _get_task_llm_log_path(str(self.project_root), "P_ROOT_ST1-1")
+        self.assertEqual(self.mock_find.call_count, 2)
+
+    @patch('gouai_llm_api._log_error_to_project')
+    def test_misses_are_not_cached(self, mock_log_error):
+        self.current_task_dir = None
+        self.assertIsNone(_get_task_llm_log_path(str(self.project_root), "P_ROOT_ST9-9"))
+        self.current_task_dir = self.task_dir
+        self.assertIsNotNone(_get_task_llm_log_path(str(self.project_root), "P_ROOT_ST9-9"))
+        self.assertEqual(self.mock_find.call_count, 2)
+
+    def test_invalidate(self):
+        _get_task_llm_log_path(str(self.project_root), "P_ROOT_ST1-1")
+        invalidate_task_dir_cache(str(self.project_root), "P_ROOT_ST1-1")
+        _get_task_llm_log_path(str(self.project_root), "P_ROOT_ST1-1")
+        invalidate_task_dir_cache()
+        _get_task_llm_log_path(str(self.project_root), "P_ROOT_ST1-1")
+        self.assertEqual(self.mock_find.call_count, 3)
+
+
+class TestUsageLedger(unittest.TestCase):
+    def setUp(self):
+        _TASK_DIR_CACHE.clear()
+        _USAGE_TOTALS.clear()
+        self.temp_dir_obj = tempfile.TemporaryDirectory()
+        self.project_root = Path(self.temp_dir_obj.name).resolve()
+        self.task_dirs = {
+            "P_ROOT": self.project_root,
+            "P_ROOT_ST1": self.project_root / "ST1_Plan",
+            "P_ROOT_ST1-1": self.project_root / "ST1_Plan" / "ST1-1_Draft",
+            "P_ROOT_ST2": self.project_root / "ST2_Review",
+        }
+        for task_dir in self.task_dirs.values():
+            task_dir.mkdir(parents=True, exist_ok=True)
+        self.settings = {
+            'default_model_name': 'fake-model', 'api_key': None, 'llm_backend': 'fake',
+            'fake_backend': {'response_text': "x" * 40},
+            'model_pricing': {'fake-model': {'input_per_million': 1.0, 'output_per_million': 4.0}}
+        }
+        for patcher in (
+            patch('gouai_llm_api.get_llm_provider_settings', side_effect=lambda *_: self.settings),
+            patch('gouai_llm_api.find_task_dir_path_from_id', side_effect=lambda root, task_id, search_root: self.task_dirs.get(task_id)),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        flush_llm_logs(timeout=5)
+        _TASK_DIR_CACHE.clear()
+        _USAGE_TOTALS.clear()
+        self.temp_dir_obj.cleanup()
+
+    def _call(self, task_id, prompt="Hello"):
+        result = generate_response_aggregated(str(self.project_root), "s1", task_id, prompt_text=prompt)
+        self.assertIsNone(result['error_info'])
+        return result
+
+    def test_task_sidecar_and_project_totals(self):
+        first = self._call("P_ROOT_ST1")
+        self._call("P_ROOT_ST1")
+        self._call("P_ROOT_ST1-1")
+        self._call("P_ROOT_ST2")
+
+        project_totals = get_llm_usage_totals(str(self.project_root))
+        self.assertEqual(project_totals['calls'], 4)
+        usage = first['usage_metadata']
+        expected_cost = (usage['prompt_token_count'] * 1.0 + usage['candidates_token_count'] * 4.0) / 1_000_000
+        self.assertAlmostEqual(project_totals['cost_estimate'], 4 * expected_cost)
+        self.assertEqual(project_totals['total_tokens'], 4 * usage['total_token_count'])
+
+        self.assertEqual(get_llm_usage_totals(str(self.project_root), "P_ROOT_ST1")['calls'], 3) # Includes ST1-1
+        self.assertEqual(get_llm_usage_totals(str(self.project_root), "P_ROOT_ST1", include_subtasks=False)['calls'], 2)
+        self.assertEqual(get_llm_usage_totals(str(self.project_root), "P_ROOT_ST1-1")['calls'], 1)
+        self.assertEqual(get_llm_usage_totals(str(self.project_root), "P_ROOT")['calls'], 4)
+        self.assertEqual(get_llm_usage_totals(str(self.project_root), "P_ROOT", include_subtasks=False)['calls'], 0)
+        self.assertIsNone(get_llm_usage_totals(str(self.project_root), "P_ROOT_ST9"))
+
+        sidecar_lines = (self.task_dirs["P_ROOT_ST1"] / LLM_USAGE_LEDGER_FILENAME).read_text().splitlines()
+        self.assertEqual(len(sidecar_lines), 2)
+        sidecar_record = json.loads(sidecar_lines[0])
+        self.assertEqual((sidecar_record['task_id'], sidecar_record['task_dir'], sidecar_record['model']), ("P_ROOT_ST1", "ST1_Plan", "fake-model"))
+        self.assertFalse(sidecar_record['coalesced'])
+
+    def test_totals_are_updated_incrementally(self):
+        self._call("P_ROOT_ST2")
+        self.assertEqual(get_llm_usage_totals(str(self.project_root))['calls'], 1)
+        ledger_totals = _USAGE_TOTALS[self.project_root / ".gouai" / LLM_USAGE_LEDGER_FILENAME]
+        offset_after_first = ledger_totals.offset
+
+        self.settings['default_model_name'] = 'unpriced-model'
+        self._call("P_ROOT_ST2")
+        totals = get_llm_usage_totals(str(self.project_root), "P_ROOT_ST2")
+        self.assertEqual((totals['calls'], totals['unpriced_calls']), (2, 1))
+        self.assertGreater(ledger_totals.offset, offset_after_first)
+
+    def test_cache_hits_are_not_recorded(self):
+        self.settings['response_cache'] = {'enabled': True, 'directory': str(self.project_root / "cache")}
+        self._call("P_ROOT_ST2")
+        self.assertTrue(self._call("P_ROOT_ST2")['cache_hit'])
+        self.assertEqual(get_llm_usage_totals(str(self.project_root))['calls'], 1)
+
+    def test_partial_lines_and_coalesced_calls(self):
+        ledger_path = self.project_root / "ledger.jsonl"
+        records = [
+            {'task_dir': "ST1_Plan", 'prompt_tokens': 10, 'response_tokens': 5, 'total_tokens': 15, 'cost_estimate': 0.5, 'coalesced': False},
+            {'task_dir': "ST1_Plan", 'prompt_tokens': 10, 'response_tokens': 5, 'total_tokens': 15, 'cost_estimate': 0.5, 'coalesced': True},
+        ]
+        ledger_path.write_text("".join(json.dumps(r) + "\n" for r in records) + '{"task_dir": "ST2')
+        usage_totals = _UsageTotals(ledger_path)
+        usage_totals.refresh()
+
+        totals = usage_totals.totals("ST1_Plan")
+        self.assertEqual((totals['calls'], totals['coalesced_calls'], totals['total_tokens'], totals['cost_estimate']), (2, 1, 15, 0.5))
+        with open(ledger_path, 'a') as f:
+            f.write('_Review", "total_tokens": 7, "cost_estimate": null}\n')
+        usage_totals.refresh()
+        self.assertEqual(usage_totals.totals("ST2_Review")['total_tokens'], 7)
+        self.assertEqual(usage_totals.totals()['calls'], 3)
+
+
+class TestSegmentedConversationLog(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir_obj = tempfile.TemporaryDirectory()
+        self.log_file = Path(self.temp_dir_obj.name) / "llm_conversation_log.md"
+        self.segments_dir = Path(self.temp_dir_obj.name) / "llm_conversation_log.segments"
+
+    def tearDown(self):
+        flush_llm_logs(timeout=5)
+        self.temp_dir_obj.cleanup()
+
+    def _log_turns(self, count, session_for=lambda i: f"s{i % 2}", defer_write=False, log_config=None):
+        for i in range(count):
+            _append_turn_to_llm_log(
+                self.log_file, "User" if i % 2 == 0 else "Assistant", f"turn {i} " + "x" * 200,
+                session_id_for_session=session_for(i), defer_write=defer_write,
+                log_settings=_conversation_log_settings(log_config)
+            )
+
+    def test_size_rotation_compresses_segments_and_reads_across_them(self):
+        self._log_turns(20, log_config={'max_segment_kb': 1, 'compress_segments': True})
+
+        archived = sorted(p.name for p in self.segments_dir.iterdir())
+        self.assertGreaterEqual(len(archived), 3)
+        self.assertTrue(all(name.endswith(".md.gz") for name in archived))
+        self.assertLess(self.log_file.stat().st_size, 1024 + 400)
+        self.assertTrue(self.log_file.read_text().startswith("---\nsession_id:")) # Each segment has its own header
+
+        all_turns = read_llm_log_turns(self.log_file)
+        self.assertEqual([t['text'].split("\n\n", 1)[1].split(" ")[1] for t in all_turns], [str(i) for i in range(20)])
+        self.assertEqual(all_turns[0]['role'], "User")
+        self.assertTrue(all_turns[0]['text'].startswith("### User\n**Timestamp:**"))
+        self.assertEqual(all_turns[0]['segment'], 1)
+
+        last_three = read_llm_log_turns(self.log_file, last_n=3)
+        self.assertEqual(last_three, all_turns[-3:])
+        session_turns = read_llm_log_turns(self.log_file, session_id="s1")
+        self.assertEqual([t['text'] for t in session_turns], [t['text'] for t in all_turns[1::2]])
+        self.assertEqual(read_llm_log_turns(self.log_file, last_n=2, session_id="s0"), all_turns[-4::2][-2:])
+
+    def test_background_writer_rotates_and_indexes_too(self):
+        self._log_turns(12, defer_write=True, log_config={'max_segment_kb': 1, 'compress_segments': False})
+        self.assertTrue(flush_llm_logs(timeout=5))
+
+        self.assertTrue(all(p.suffix == ".md" for p in self.segments_dir.iterdir()))
+        turns = read_llm_log_turns(self.log_file)
+        self.assertEqual(len(turns), 12)
+        self.assertTrue(turns[-1]['text'].startswith("### Assistant"))
+        self.assertIn("turn 11 ", turns[-1]['text'])
+
+    @patch('gouai_llm_api.datetime')
+    def test_daily_rotation(self, mock_datetime):
+        for day in (1, 1, 2, 3, 3):
+            mock_datetime.now.return_value = datetime(2025, 5, day, 12, 0, 0)
+            self._log_turns(1, log_config={'max_segment_kb': 0, 'rotate_daily': True})
+
+        self.assertEqual(len(list(self.segments_dir.iterdir())), 2)
+        self.assertEqual([t['segment'] for t in read_llm_log_turns(self.log_file)], [1, 1, 2, 3, 3])
+
+    def test_index_tail_is_read_without_the_whole_index(self):
+        self._log_turns(50, log_config={'max_segment_kb': 0})
+        with patch('gouai_llm_api._LOG_INDEX_TAIL_BLOCK_BYTES', 200):
+            tail = read_llm_log_turns(self.log_file, last_n=4)
+        self.assertEqual([t['text'].split("\n\n", 1)[1].split(" ")[1] for t in tail], ["46", "47", "48", "49"])
+
+    def test_unindexed_legacy_log_is_parsed(self):
+        self.log_file.write_text(
+            "---\nsession_id: null\n---\n## LLM Conversation Log\n\n"
+            "### User\n**Timestamp:** 2025-05-20 12:00:00\n\nHello\n\n---\n"
+            "### Assistant\n**Timestamp:** 2025-05-20 12:00:05\n\nHi\n\n---\n"
+        )
+        turns = read_llm_log_turns(self.log_file, last_n=1)
+        self.assertEqual(len(turns), 1)
+        self.assertEqual((turns[0]['role'], turns[0]['timestamp']), ("Assistant", "2025-05-20 12:00:05"))
+        self.assertIn("Hi", turns[0]['text'])
+
+
+class TestPromptTokenBudget(unittest.TestCase):
+    def setUp(self):
+        self.settings = {'default_model_name': 'fake-model', 'api_key': None, 'llm_backend': 'fake', 'prompt_budget': {}}
+        patcher = patch('gouai_llm_api.get_llm_provider_settings', side_effect=lambda *_: self.settings)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _sections(self):
+        return [
+            {'name': "instructions", 'text': "I" * 400, 'required': True},
+            {'name': "task definition", 'text': "T" * 800, 'priority': 2},
+            {'name': "file A", 'text': "A" * 4000, 'priority': 1},
+            {'name': "file B", 'text': "B" * 2000, 'priority': 1},
+        ]
+
+    def test_sections_within_budget_are_unchanged(self):
+        sections = self._sections()
+        self.assertEqual(fit_prompt_sections(sections, max_prompt_tokens=10_000), [section['text'] for section in sections])
+
+    def test_lowest_priority_sections_are_trimmed_proportionally(self):
+        fitted = fit_prompt_sections(self._sections(), max_prompt_tokens=1000)
+
+        self.assertLessEqual(sum(len(text) for text in fitted) // 4, 1000)
+        self.assertEqual(fitted[0], "I" * 400) # Required
+        self.assertEqual(fitted[1], "T" * 800) # Higher priority survives intact
+        self.assertIn("characters omitted to fit the prompt token budget", fitted[2])
+        self.assertAlmostEqual(fitted[2].count("A") / fitted[3].count("B"), 2.0, delta=0.3)
+
+    def test_summarize_strategy_replaces_section_with_summary(self):
+        self.settings['prompt_budget'] = {'strategy': 'summarize', 'max_prompt_tokens': 1000}
+        summary_response = {'text': "Short summary.", 'error_info': None}
+        with patch('gouai_llm_api.generate_response_aggregated', return_value=summary_response) as mock_generate:
+            fitted = fit_prompt_sections(self._sections()[:3], task_id="P_ROOT_ST1-1")
+        self.assertEqual(mock_generate.call_count, 1)
+        self.assertEqual(mock_generate.call_args.kwargs['task_id'], "P_ROOT_ST1-1")
+        self.assertIn("Short summary.", fitted[2])
+
+    def test_summarize_strategy_truncates_when_the_budget_leaves_no_room_for_material(self):
+        self.settings['prompt_budget'] = {'strategy': 'summarize', 'max_prompt_tokens': 300}
+        sections = [{'name': "instructions", 'text': "I" * 400, 'required': True}, {'name': "file A", 'text': "A" * 4000}]
+        with patch('gouai_llm_api.generate_response_aggregated') as mock_generate:
+            fitted = fit_prompt_sections(sections)
+        mock_generate.assert_not_called()
+        self.assertIn("characters omitted to fit the prompt token budget", fitted[1])
+
+    def test_exact_count_used_near_budget(self):
+        self.settings.update({'api_key': "k", 'llm_backend': 'gemini', 'prompt_budget': {'exact_count': True}})
+        mock_client = MagicMock()
+        mock_client.models.count_tokens.return_value = MagicMock(total_tokens=1234)
+        with patch('gouai_llm_api._get_pooled_client', return_value=mock_client):
+            self.assertEqual(count_prompt_tokens(None, "hello world"), 1234)
+        self.settings['prompt_budget'] = {}
+        self.assertEqual(count_prompt_tokens(None, "x" * 400), 100)
+
+    @patch('gouai_llm_api._get_task_llm_log_path', return_value=None)
+    def test_preflight_warns_or_rejects_over_budget_prompts(self, _mock_log_path):
+        self.settings['prompt_budget'] = {'max_prompt_tokens': 10}
+        with patch('gouai_llm_api._log_error_to_project') as mock_log_error:
+            result = generate_response_aggregated(None, "s1", "t1", prompt_text="x" * 400)
+        self.assertIsNone(result['error_info'])
+        self.assertTrue(any("prompt budget" in call.args[0] for call in mock_log_error.call_args_list))
+
+        self.settings['prompt_budget']['on_overflow'] = 'error'
+        result = generate_response_aggregated(None, "s1", "t1", prompt_text="x" * 400)
+        self.assertEqual(result['error_info']['type'], "ValueError")
+        self.assertIn("exceeds the 10-token prompt budget", result['error_info']['message'])
+        with self.assertRaises(PromptBudgetExceededError):
+            list(generate_response_stream(None, "s1", "t1", prompt_text="x" * 400))
+
+
+class TestChatHistoryCompaction(unittest.TestCase):
+    def setUp(self):
+        self.config = {'enabled': True, 'trigger_tokens': 100, 'keep_last_turns': 2}
+        self.history = [{'role': 'user', 'parts': [{'text': "PRIME " * 50}]}]
+        for i in range(6):
+            self.history.append({'role': 'model', 'parts': [{'text': f"answer {i} " + "a" * 200}]})
+            self.history.append({'role': 'user', 'parts': [{'text': f"question {i} " + "q" * 200}]})
+        self.history.append({'role': 'model', 'parts': [{'text': "latest answer"}]})
+
+    @patch('gouai_llm_api.generate_response_aggregated', return_value={'text': "SUMMARY", 'error_info': None})
+    def test_old_turns_are_folded_into_background_summary(self, mock_generate):
+        compactor = ChatHistoryCompactor(None, "s1", "t1", config=self.config)
+        self.assertIs(compactor.contents_for(self.history), self.history) # No summary yet
+
+        compactor.after_turn(self.history)
+        compactor.wait(timeout=5)
+        contents = compactor.contents_for(self.history)
+        compactor.close()
+
+        self.assertEqual(mock_generate.call_count, 1)
+        self.assertEqual(mock_generate.call_args.kwargs['session_id'], "s1_compaction")
+        self.assertEqual(contents[0]['parts'][0], self.history[0]['parts'][0]) # Prime stays pinned
+        self.assertIn("SUMMARY", contents[0]['parts'][1]['text'])
+        self.assertEqual(contents[1:], self.history[-3:]) # Verbatim window starts at a model turn
+        self.assertEqual([turn['role'] for turn in contents], ['user', 'model', 'user', 'model'])
+        self.assertLess(estimate_prompt_tokens(contents), estimate_prompt_tokens(self.history))
+
+    @patch('gouai_llm_api.generate_response_aggregated')
+    def test_disabled_or_failed_summary_sends_full_history(self, mock_generate):
+        compactor = ChatHistoryCompactor(None, "s1", "t1", config={**self.config, 'enabled': False})
+        compactor.after_turn(self.history)
+        self.assertIs(compactor.contents_for(self.history), self.history)
+        mock_generate.assert_not_called()
+
+        mock_generate.return_value = {'text': None, 'error_info': {'message': "boom"}}
+        compactor = ChatHistoryCompactor(None, "s1", "t1", config=self.config)
+        with patch('gouai_llm_api._log_error_to_project'):
+            compactor.after_turn(self.history)
+            compactor.wait(timeout=5)
+        self.assertIs(compactor.contents_for(self.history), self.history)
+        compactor.close()
+
+
+class TestPrefixCache(unittest.TestCase):
+    def setUp(self):
+        _PREFIX_CACHE_HANDLES.clear()
+        self.fake_backend = _LLM_BACKENDS['fake']
+        self.fake_backend.prefix_caches.clear()
+        self.settings = {'default_model_name': 'fake-model', 'api_key': None, 'llm_backend': 'fake',
+                         'prefix_cache': {'min_tokens': 100}}
+        self.contents = [
+            {'role': 'user', 'parts': [{'text': "PRIME " * 200}]},
+            {'role': 'model', 'parts': [{'text': "Ready."}]},
+            {'role': 'user', 'parts': [{'text': "What next?"}]}
+        ]
+        self.temp_dir_obj = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir_obj.cleanup)
+        self.store_path = Path(self.temp_dir_obj.name) / "prefix_cache_handles.json"
+        for patcher in (patch('gouai_llm_api.get_llm_provider_settings', side_effect=lambda *_: self.settings),
+                        patch('gouai_llm_api._get_task_llm_log_path', return_value=None),
+                        patch('gouai_llm_api._prefix_cache_store_path', return_value=self.store_path)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        _PREFIX_CACHE_HANDLES.clear()
+        self.fake_backend.prefix_caches.clear()
+
+    def _call(self):
+        return generate_response_aggregated(None, "s1", "t1", contents=self.contents, cache_policy=CACHE_POLICY_OFF)
+
+    def test_prefix_registered_once_and_response_matches_inline(self):
+        with patch.object(self.fake_backend, 'create_prefix_cache', wraps=self.fake_backend.create_prefix_cache) as mock_create:
+            first, second = self._call(), self._call()
+        self.assertEqual(mock_create.call_count, 1)
+        self.assertEqual(mock_create.call_args.args[2], self.contents[:1]) # Only the leading item is cached
+        self.settings['prefix_cache'] = {'enabled': False}
+        inline = self._call()
+        self.assertIsNone(first['error_info'])
+        self.assertEqual(first['text'], inline['text'])
+        self.assertEqual(second['text'], inline['text'])
+
+    def test_handles_are_reused_by_later_processes(self):
+        self._call()
+        stored = json.loads(self.store_path.read_text(encoding='utf-8'))
+        self.assertEqual([entry['handle'] for entry in stored.values()], list(self.fake_backend.prefix_caches))
+        _PREFIX_CACHE_HANDLES.clear() # A new process: only the persisted handle is left
+        with patch.object(self.fake_backend, 'create_prefix_cache', wraps=self.fake_backend.create_prefix_cache) as mock_create:
+            self.assertIsNone(self._call()['error_info'])
+        mock_create.assert_not_called()
+
+        for entry in stored.values():
+            entry['expires_at'] = time.time() - 1
+        self.store_path.write_text(json.dumps(stored), encoding='utf-8')
+        _PREFIX_CACHE_HANDLES.clear()
+        with patch.object(self.fake_backend, 'create_prefix_cache', wraps=self.fake_backend.create_prefix_cache) as mock_create:
+            self._call()
+        self.assertEqual(mock_create.call_count, 1) # Expired handles are registered again
+
+    def test_rejected_handle_retries_inline_and_reregisters(self):
+        self._call()
+        self.fake_backend.prefix_caches.clear() # Provider expired the cache
+        with patch('gouai_llm_api._log_error_to_project'):
+            result = self._call()
+        self.assertIsNone(result['error_info'])
+        self.assertEqual(len(_PREFIX_CACHE_HANDLES), 0)
+        self.assertEqual(json.loads(self.store_path.read_text(encoding='utf-8')), {}) # Forgotten by other processes too
+        self._call()
+        self.assertEqual(len(self.fake_backend.prefix_caches), 1)
+
+    def test_other_errors_with_a_handle_are_not_retried_inline(self):
+        self._call()
+        real_stream = self.fake_backend.stream
+        calls = []
+
+        def failing_stream(*call_args):
+            calls.append(call_args[3])
+            if (call_args[3] or {}).get('cached_content'):
+                raise LLMAPICallError(message="400 INVALID_ARGUMENT: Request contains an invalid argument.")
+            yield from real_stream(*call_args)
+
+        with patch.object(self.fake_backend, 'stream', side_effect=failing_stream), \
+             patch('gouai_llm_api._log_error_to_project'):
+            result = self._call()
+        self.assertIn("INVALID_ARGUMENT", result['error_info']['message'])
+        self.assertEqual(len(calls), 1) # No second, inline call
+        self.assertEqual(len(_PREFIX_CACHE_HANDLES), 1) # The handle is still good
+
+    def test_only_missing_or_expired_cached_content_counts_as_a_cache_miss(self):
+        self.assertTrue(_is_prefix_cache_error(LLMAPICallError("403 PERMISSION_DENIED. CachedContent not found (or permission denied)")))
+        self.assertTrue(_is_prefix_cache_error(LLMAPICallError("400 INVALID_ARGUMENT. Cache content 123 is expired.")))
+        self.assertFalse(_is_prefix_cache_error(LLMAPICallError("404 NOT_FOUND. models/gemini-unknown is not found.")))
+        self.assertFalse(_is_prefix_cache_error(LLMAPICallError("403 PERMISSION_DENIED. The caller does not have permission.")))
+        self.assertFalse(_is_prefix_cache_error(LLMAPICallError("400 Invalid response_cache setting")))
+
+    def test_registered_lead_in_of_a_single_prompt_is_split_only_for_a_handle(self):
+        protocol_text = "PROTOCOL " * 200
+        prompt = f"{protocol_text}\n\nTask specifics"
+        register_cacheable_prefix(protocol_text)
+        self.addCleanup(_CACHEABLE_PREFIX_TEXTS.clear)
+        sent_contents = []
+        real_stream = self.fake_backend.stream
+
+        def recording_stream(*call_args):
+            sent_contents.append(call_args[2])
+            yield from real_stream(*call_args)
+
+        with patch.object(self.fake_backend, 'stream', side_effect=recording_stream):
+            generate_response_aggregated(None, "s1", "t1", contents=prompt, cache_policy=CACHE_POLICY_OFF)
+            self.settings['prefix_cache'] = {'enabled': False}
+            generate_response_aggregated(None, "s1", "t1", contents=prompt, cache_policy=CACHE_POLICY_OFF)
+        self.assertEqual(list(self.fake_backend.prefix_caches.values()), [[{'role': 'user', 'parts': [{'text': protocol_text}]}]])
+        self.assertEqual(sent_contents[0], [{'role': 'user', 'parts': [{'text': "\n\nTask specifics"}]}])
+        self.assertEqual(sent_contents[1], prompt) # No handle: the caller's single prompt, unchanged
+
+    def test_compacted_chat_keeps_one_cached_prefix_per_session(self):
+        compactor = ChatHistoryCompactor(None, "s1", "t1", config={'enabled': True, 'trigger_tokens': 150, 'keep_last_turns': 2})
+        self.addCleanup(compactor.close)
+        history = [self.contents[0]]
+        for i in range(8):
+            history.append({'role': 'model', 'parts': [{'text': f"answer {i} " + "a" * 300}]})
+            history.append({'role': 'user', 'parts': [{'text': f"question {i} " + "q" * 300}]})
+            result = generate_response_aggregated(None, "s1", "t1", contents=compactor.contents_for(history), cache_policy=CACHE_POLICY_OFF)
+            self.assertIsNone(result['error_info'])
+            compactor.after_turn(history)
+            compactor.wait(timeout=5)
+        self.assertGreaterEqual(compactor.refreshes, 2) # The summary changed between requests
+        self.assertEqual(list(self.fake_backend.prefix_caches.values()), [self.contents[:1]])
+
+    def test_small_prefix_and_unsupported_backend_stay_inline(self):
+        self.settings['prefix_cache'] = {'min_tokens': 10_000}
+        self._call()
+        self.assertEqual(self.fake_backend.prefix_caches, {})
+
+        counting_backend = CountingBackend(delay_s=0)
+        register_llm_backend(counting_backend)
+        self.addCleanup(_LLM_BACKENDS.pop, counting_backend.name, None)
+        self.settings.update({'llm_backend': counting_backend.name, 'prefix_cache': {'min_tokens': 1}})
+        self.assertIsNone(self._call()['error_info'])
+        self.assertEqual(len(_PREFIX_CACHE_HANDLES), 0)
+
+
+class TestPriorityLanes(unittest.TestCase):
+    def setUp(self):
+        _CONCURRENCY_CONTROLLERS.clear()
+
+    def tearDown(self):
+        _CONCURRENCY_CONTROLLERS.clear()
+
+    def test_interactive_overtakes_queued_bulk(self):
+        controller = _AIMDConcurrencyController("b/m", initial=1, reserved_interactive=0)
+        controller.acquire()
+        admitted = []
+
+        def call(priority):
+            controller.acquire(priority)
+            admitted.append(priority)
+            controller.release(True, priority)
+
+        threads = [threading.Thread(target=call, args=(PRIORITY_BULK,)) for _ in range(3)]
+        threads.append(threading.Thread(target=call, args=(PRIORITY_INTERACTIVE,)))
+        for thread in threads:
+            thread.start()
+            time.sleep(0.02) # Bulk calls queue first
+        deadline = time.monotonic() + 1.0
+        while controller.metrics()['waiting'] < 4 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        controller.release(None)
+        for thread in threads:
+            thread.join(timeout=2.0)
+        self.assertEqual(admitted[0], PRIORITY_INTERACTIVE)
+        self.assertEqual(len(admitted), 4)
+
+    def test_reserved_slot_is_kept_for_interactive(self):
+        controller = _AIMDConcurrencyController("b/m", initial=3, reserved_interactive=1)
+        self.assertIsNotNone(controller.try_acquire(PRIORITY_BULK))
+        self.assertIsNotNone(controller.try_acquire(PRIORITY_NORMAL))
+        self.assertIsNone(controller.try_acquire(PRIORITY_BULK))
+        self.assertIsNotNone(controller.try_acquire(PRIORITY_INTERACTIVE))
+
+        single_slot = _AIMDConcurrencyController("b/m", initial=1, reserved_interactive=1)
+        self.assertIsNotNone(single_slot.try_acquire(PRIORITY_BULK)) # The reservation never takes the last slot
+
+    def test_waiting_lanes_share_slots_by_weight(self):
+        controller = _AIMDConcurrencyController("b/m", initial=1, reserved_interactive=0,
+                                                priority_weights={'normal': 3, 'bulk': 1})
+        with controller._condition:
+            for _ in range(20):
+                controller._enqueue(PRIORITY_NORMAL)
+                controller._enqueue(PRIORITY_BULK)
+            admitted = []
+            for _ in range(8):
+                waiter = controller._next_waiter()
+                lane = next(lane for lane, queue in controller._queues.items() if queue and queue[0] is waiter)
+                controller._dequeue(lane, waiter)
+                controller._take_slot(lane)
+                controller.in_flight -= 1 # Each admitted call finishes before the next grant
+                admitted.append(lane)
+        self.assertEqual(admitted.count(PRIORITY_NORMAL), 6)
+        self.assertEqual(admitted.count(PRIORITY_BULK), 2)
+
+    def test_priority_is_reported_per_call_and_per_lane(self):
+        settings = {'default_model_name': 'fake-model', 'api_key': None, 'llm_backend': 'fake'}
+        with patch('gouai_llm_api.get_llm_provider_settings', return_value=settings), \
+             patch('gouai_llm_api._get_task_llm_log_path', return_value=None), \
+             patch('gouai_llm_api._log_error_to_project'):
+            interactive = generate_response_aggregated(None, "s", "t", prompt_text="hi", priority=PRIORITY_INTERACTIVE)
+            generate_responses_batch([{'project_root': None, 'session_id': "s", 'task_id': "t", 'prompt_text': f"p{i}"}
+                                      for i in range(3)])
+            unknown = generate_response_aggregated(None, "s", "t", prompt_text="hi", priority="urgent")
+
+        self.assertEqual(interactive['metrics']['priority'], PRIORITY_INTERACTIVE)
+        self.assertIn("Unknown LLM priority", unknown['error_info']['message'])
+        lanes = get_llm_concurrency_metrics()["fake/fake-model"]['lanes']
+        self.assertEqual(lanes[PRIORITY_INTERACTIVE]['admitted'], 1)
+        self.assertEqual(lanes[PRIORITY_BULK]['admitted'], 3)
+        self.assertEqual(lanes[PRIORITY_NORMAL]['admitted'], 0)
+        self.assertIn('mean_wait_s', lanes[PRIORITY_BULK])
@@ -0,0 +1,96 @@
+import unittest
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import gouai_project_tree
+from gouai_project_tree import (
+    ProjectTree,
+    get_project_tree,
+    load_task_node,
+    extract_md_section,
+    _PROJECT_TREES,
+)
+from compile_gouai_hlgs import compile_hlgs_and_outputs
+from gouai_context_handler import _parse_task_definition_md
+from tests.task_fixtures import write_task
+
+
+class TestProjectTree(unittest.TestCase):
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp()).resolve()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        _PROJECT_TREES.clear()
+        self.addCleanup(_PROJECT_TREES.clear)
+        gouai_project_tree._read_markdown_body.cache_clear()
+        write_task(self.root, "Proj_ROOT")
+        write_task(self.root / "ST1-1", "Proj_ROOT_ST1-1", "Proj_ROOT",
+                    body="## High-Level Goal(s) (HLG)\n\nFind things\n### Detail\nMore\n## WSOD Assessment (Initial)\n\nLooks fine\n")
+        write_task(self.root / "ST1-1" / "ST2-1", "Proj_ROOT_ST1-1_ST2-1", "Proj_ROOT_ST1-1", status="Completed")
+        write_task(self.root / "Tools" / "ST1-2", "Proj_ROOT_ST1-2", "Proj_ROOT") # Under a plain directory
+        (self.root / "ST1-1" / "living_document.md").write_text("## Notes\n", encoding='utf-8')
+        write_task(self.root / "ST1-1" / "outputs", "Decoy_In_Outputs") # Never loaded
+
+    def test_loads_directories_and_frontmatter_in_one_walk(self):
+        project_tree = ProjectTree(self.root)
+        self.assertEqual(len(project_tree), 4)
+        self.assertEqual([node.rel_dir for node in project_tree.root.walk()], ["", "ST1-1", "ST1-1/ST2-1", "Tools", "Tools/ST1-2"])
+        node = project_tree.node("Proj_ROOT_ST1-1")
+        self.assertEqual((node.status, node.task_type, node.hlg_summary, node.wsod_summary, node.parent_task_id),
+                         ("Not Started", "full_GOUAI_task", "Goal of Proj_ROOT_ST1-1", "Output of Proj_ROOT_ST1-1", "Proj_ROOT"))
+        self.assertIs(node.parent, project_tree.root)
+        self.assertIsNotNone(node.living_document_mtime_ns)
+        self.assertFalse(project_tree.node_at(self.root / "Tools").is_task)
+        self.assertIsNone(project_tree.node("Decoy_In_Outputs"))
+        self.assertEqual(gouai_project_tree._read_markdown_body.cache_info().currsize, 0) # Bodies are only read on demand
+        self.assertFalse(hasattr(node, '__dict__'))
+
+    def test_task_children_look_through_plain_directories(self):
+        project_tree = ProjectTree(self.root)
+        self.assertEqual([node.task_id for node in project_tree.root.task_children()], ["Proj_ROOT_ST1-1", "Proj_ROOT_ST1-2"])
+        self.assertEqual(project_tree.node("Proj_ROOT_ST1-2").depth, 2)
+
+    def test_sections_are_read_lazily_and_cached(self):
+        node = ProjectTree(self.root).node("Proj_ROOT_ST1-1")
+        self.assertEqual(node.section("High-Level Goal(s) (HLG)"), "Find things\n### Detail\nMore")
+        self.assertEqual(node.section("WSOD Assessment (Initial)"), "Looks fine")
+        self.assertEqual(node.section("Missing"), "")
+        self.assertEqual(gouai_project_tree._read_markdown_body.cache_info().misses, 1)
+
+    def test_get_project_tree_reloads_only_when_the_project_changed(self):
+        project_tree = get_project_tree(self.root)
+        self.assertIs(get_project_tree(self.root), project_tree)
+        write_task(self.root / "ST1-1", "Proj_ROOT_ST1-1", "Proj_ROOT", status="In Progress")
+        os.utime(self.root / "ST1-1" / "task_definition.md", ns=(0, 0)) # Rewritten within the same mtime tick otherwise
+        reloaded_tree = get_project_tree(self.root)
+        self.assertIsNot(reloaded_tree, project_tree)
+        self.assertEqual(reloaded_tree.node("Proj_ROOT_ST1-1").status, "In Progress")
+
+    def test_load_task_node(self):
+        node = load_task_node(self.root / "ST1-1")
+        self.assertEqual(node.task_id, "Proj_ROOT_ST1-1")
+        self.assertEqual(node.children, [])
+        self.assertFalse(load_task_node(self.root / "Tools").is_task)
+
+    def test_extract_md_section(self):
+        text = "# Title\n## A\none\n### A.1\ntwo\n## B\nthree\n"
+        self.assertEqual(extract_md_section(text, "a"), "one\n### A.1\ntwo")
+        self.assertEqual(extract_md_section(text, "A.1", "###"), "two")
+
+    def test_tools_share_the_tree(self):
+        with contextlib.redirect_stderr(io.StringIO()):
+            report = compile_hlgs_and_outputs(self.root)
+            task_def_data = _parse_task_definition_md(self.root / "ST1-1" / "task_definition.md")
+        self.assertIn("**Task ID:** `Proj_ROOT_ST1-1`", report)
+        self.assertNotIn("Proj_ROOT_ST1-1_ST2-1", report) # Completed tasks are left out
+        self.assertIn("- **Directory:** `Tools/` (Not a GOUAI Task Directory)", report)
+        self.assertEqual(task_def_data['wsod_assessment_initial'], "Looks fine")
+        self.assertEqual(task_def_data['task_hlg_full_text'], "Find things\n### Detail\nMore")
+        self.assertEqual(gouai_project_tree._read_markdown_body.cache_info().misses, 3) # One read per reported task, shared by both tools
+
+
+if __name__ == '__main__':
+    unittest.main()
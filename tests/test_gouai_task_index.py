@@ -0,0 +1,185 @@
+import unittest
+from unittest.mock import patch
+import contextlib
+import io
+import json
+import shutil
+import tempfile
+from pathlib import Path
+
+import gouai_task_index
+from gouai_task_index import (
+    TaskIndex,
+    get_task_index,
+    find_task_dir,
+    task_id_rel_dir,
+    split_task_id,
+    TaskIdTrie,
+    _TASK_INDEXES,
+)
+from gouai_task_mgmt import create_task, find_task_dir_path_from_id, FULL_GOUAI_TASK_TYPE
+from tests.task_fixtures import write_task
+
+
+class TestTaskIndex(unittest.TestCase):
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp()).resolve()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        _TASK_INDEXES.clear()
+        self.addCleanup(_TASK_INDEXES.clear)
+        write_task(self.root, "Proj_ROOT")
+        write_task(self.root / "ST1-1", "Proj_ROOT_ST1-1", "Proj_ROOT")
+        write_task(self.root / "ST1-1" / "ST2-1", "Proj_ROOT_ST1-1_ST2-1", "Proj_ROOT_ST1-1", status="Complete")
+        write_task(self.root / "ST1-1" / "outputs", "Decoy_In_Outputs") # Never indexed
+        self.reads = []
+        real_read = gouai_task_index.read_task_frontmatter
+        patcher = patch('gouai_task_index.read_task_frontmatter',
+                        side_effect=lambda path: (self.reads.append(Path(path)), real_read(path))[1])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_first_lookup_builds_persistent_index(self):
+        entry = TaskIndex(self.root).lookup("Proj_ROOT_ST1-1_ST2-1")
+        self.assertEqual(entry['dir'], "ST1-1/ST2-1")
+        self.assertEqual(entry['parent_task_id'], "Proj_ROOT_ST1-1")
+        self.assertEqual(entry['status'], "Complete")
+        self.assertIsNone(TaskIndex(self.root).lookup("Decoy_In_Outputs"))
+
+        payload = json.loads((self.root / ".gouai" / "index").read_text(encoding='utf-8'))
+        self.assertEqual(set(payload['tasks']), {"Proj_ROOT", "Proj_ROOT_ST1-1", "Proj_ROOT_ST1-1_ST2-1"})
+
+    def test_reads_do_not_create_the_index_directory(self):
+        self.assertEqual(TaskIndex(self.root).find_task_dir("Proj_ROOT_ST1-1"), self.root / "ST1-1") # ID-derived, no scan
+        self.assertFalse((self.root / ".gouai").exists())
+
+    def test_creating_the_index_directory_does_not_mark_the_root_modified(self):
+        with patch('gouai_task_index._RACY_MTIME_WINDOW_NS', -1): # Trust every mtime, however recent
+            TaskIndex(self.root).task_ids()
+            self.assertTrue((self.root / ".gouai" / "index").is_file())
+            with patch.object(TaskIndex, '_refresh_dir', side_effect=AssertionError("no directory should be relisted")):
+                reloaded = TaskIndex(self.root)
+                reloaded._ensure_loaded()
+                self.assertFalse(reloaded._refresh())
+
+    def test_lookups_from_a_saved_index_read_no_task_definitions(self):
+        TaskIndex(self.root).task_ids()
+        self.reads.clear()
+        reloaded = TaskIndex(self.root)
+        self.assertEqual(reloaded.find_task_dir("Proj_ROOT_ST1-1"), self.root / "ST1-1")
+        self.assertEqual(reloaded.find_task_dir("Proj_ROOT"), self.root)
+        self.assertEqual(self.reads, [])
+
+    def test_stale_index_rescans_only_changed_directories(self):
+        task_index = TaskIndex(self.root)
+        task_index.task_ids()
+        self.reads.clear()
+        write_task(self.root / "ST1-1" / "ST2-2", "Proj_ROOT_ST1-1_ST2-2", "Proj_ROOT_ST1-1")
+        self.assertEqual(task_index.find_task_dir("Proj_ROOT_ST1-1_ST2-2"), self.root / "ST1-1" / "ST2-2")
+        self.assertEqual(self.reads, [self.root / "ST1-1" / "ST2-2" / "task_definition.md"])
+
+        shutil.rmtree(self.root / "ST1-1")
+        self.assertIsNone(task_index.find_task_dir("Proj_ROOT_ST1-1_ST2-1"))
+        self.assertIsNone(task_index.find_task_dir("Proj_ROOT_ST1-1"))
+        self.assertEqual(task_index.task_ids(), ["Proj_ROOT"])
+
+    def test_edited_frontmatter_is_picked_up(self):
+        task_index = TaskIndex(self.root)
+        self.assertEqual(task_index.lookup("Proj_ROOT_ST1-1")['status'], "Not Started")
+        write_task(self.root / "ST1-1", "Proj_ROOT_ST1-1", "Proj_ROOT", status="In Progress plus more")
+        self.assertEqual(task_index.lookup("Proj_ROOT_ST1-1")['status'], "In Progress plus more")
+
+    def test_task_id_rewritten_in_place_is_picked_up(self):
+        with patch('gouai_task_index._RACY_MTIME_WINDOW_NS', -1): # Trust every mtime, so only the file signature can tell
+            task_index = TaskIndex(self.root)
+            task_index.task_ids()
+            write_task(self.root / "ST1-1" / "ST2-1", "Renamed_By_Hand", "Proj_ROOT_ST1-1")
+            self.assertEqual(task_index.find_task_dir("Renamed_By_Hand"), self.root / "ST1-1" / "ST2-1")
+            self.assertIsNone(task_index.find_task_dir("Proj_ROOT_ST1-1_ST2-1"))
+
+    def test_duplicate_task_id_closest_to_the_root_wins(self):
+        write_task(self.root / "ST1-2", "Proj_ROOT") # Copied by hand, task_id left unchanged
+        task_index = TaskIndex(self.root)
+        task_index.task_ids()
+        self.assertEqual(task_index.find_task_dir("Proj_ROOT"), self.root)
+
+    def test_create_task_updates_the_index(self):
+        self.assertEqual(find_task_dir(self.root, "Proj_ROOT_ST1-1"), self.root / "ST1-1")
+        with contextlib.redirect_stdout(io.StringIO()):
+            new_task_id, new_task_path = create_task(str(self.root / "ST1-1"), FULL_GOUAI_TASK_TYPE, "Find things", "Research")
+        self.assertEqual(new_task_id, "Proj_ROOT_ST1-1_ST2-2_Research")
+        self.reads.clear()
+        with patch.object(TaskIndex, '_refresh', side_effect=AssertionError("index should already be current")):
+            self.assertEqual(get_task_index(self.root).find_task_dir(new_task_id), new_task_path.resolve())
+            self.assertEqual(TaskIndex(self.root).find_task_dir(new_task_id), new_task_path.resolve())
+        self.assertEqual(self.reads, [])
+
+    def test_find_task_dir_path_from_id_respects_search_path(self):
+        self.assertEqual(find_task_dir_path_from_id(self.root, "Proj_ROOT_ST1-1_ST2-1", self.root), self.root / "ST1-1" / "ST2-1")
+        self.assertIsNone(find_task_dir_path_from_id(self.root / "ST1-1" / "ST2-1", "Proj_ROOT_ST1-1", self.root))
+        self.assertIsNone(find_task_dir_path_from_id(self.root, "Unknown_Task", self.root))
+
+    def test_id_derived_directory_resolves_without_a_scan(self):
+        write_task(self.root / "ST1-2_Simple_Data_Prep" / "ST2-1", "Proj_ROOT_ST1-2_Simple_Data_Prep_ST2-1", "Proj_ROOT_ST1-2_Simple_Data_Prep")
+        with patch.object(TaskIndex, '_refresh', side_effect=AssertionError("no scan expected")):
+            task_index = TaskIndex(self.root)
+            self.assertEqual(task_index.find_task_dir("Proj_ROOT_ST1-2_Simple_Data_Prep_ST2-1"),
+                             self.root / "ST1-2_Simple_Data_Prep" / "ST2-1")
+            self.assertEqual(task_index.find_task_dir("Proj_ROOT"), self.root)
+        self.assertEqual(len(self.reads), 2) # One frontmatter read per lookup
+
+    def test_hand_edited_layout_falls_back_to_a_scan(self):
+        (self.root / "ST1-1").rename(self.root / "renamed_by_hand")
+        self.assertEqual(TaskIndex(self.root).find_task_dir("Proj_ROOT_ST1-1_ST2-1"), self.root / "renamed_by_hand" / "ST2-1")
+
+    def test_task_id_rel_dir(self):
+        self.assertEqual(task_id_rel_dir("Proj_ROOT"), "")
+        self.assertEqual(task_id_rel_dir("Proj_ROOT_ST1-2_Research_ST2-1"), "ST1-2_Research/ST2-1")
+        self.assertEqual(task_id_rel_dir("Proj_ROOT_ST1-3_Simple_ST2-10_More_Words"), "ST1-3_Simple/ST2-10_More_Words")
+        self.assertIsNone(task_id_rel_dir("Proj_ROOT_ST2-1")) # Levels must start at 1 and increase by one
+        self.assertIsNone(task_id_rel_dir("_ST1-1_Orphan"))
+        self.assertIsNone(task_id_rel_dir("Proj_ROOT_ST1-1/../x"))
+
+
+class TestTaskIdTrie(unittest.TestCase):
+    def setUp(self):
+        self.trie = TaskIdTrie({task_id: {'dir': task_id} for task_id in (
+            "P_ROOT", "P_ROOT_ST1-1", "P_ROOT_ST1-10_Simple", "P_ROOT_ST1-2_Research",
+            "P_ROOT_ST1-1_ST2-1", "P_ROOT_ST1-1_ST2-1_ST3-1_Deep", "P_ROOT_ST1-2_Research_ST2-1"
+        )})
+
+    def test_split_task_id(self):
+        self.assertEqual(split_task_id("P_ROOT_ST1-2_Research_ST2-1"), ["P_ROOT", "ST1-2_Research", "ST2-1"])
+        self.assertEqual(split_task_id("P_ROOT"), ["P_ROOT"])
+
+    def test_children_descendants_and_ancestors(self):
+        self.assertEqual(self.trie.children("P_ROOT"), ["P_ROOT_ST1-1", "P_ROOT_ST1-2_Research", "P_ROOT_ST1-10_Simple"])
+        self.assertEqual(self.trie.children("P_ROOT_ST1-1"), ["P_ROOT_ST1-1_ST2-1"]) # Not ST1-10, despite the shared prefix
+        self.assertEqual(self.trie.descendants("P_ROOT_ST1-1"), ["P_ROOT_ST1-1_ST2-1", "P_ROOT_ST1-1_ST2-1_ST3-1_Deep"])
+        self.assertEqual(self.trie.ancestors("P_ROOT_ST1-1_ST2-1_ST3-1_Deep"), ["P_ROOT", "P_ROOT_ST1-1", "P_ROOT_ST1-1_ST2-1"])
+        self.assertEqual(self.trie.children("Unknown"), [])
+        self.assertEqual(len(self.trie), 7)
+
+    def test_missing_level_is_passed_through(self):
+        trie = TaskIdTrie({"P_ROOT": {}, "P_ROOT_ST1-1_ST2-1": {}})
+        self.assertEqual(trie.children("P_ROOT"), ["P_ROOT_ST1-1_ST2-1"])
+        self.assertEqual(trie.ancestors("P_ROOT_ST1-1_ST2-1"), ["P_ROOT"])
+
+    def test_index_trie_is_rebuilt_only_when_tasks_change(self):
+        root = Path(tempfile.mkdtemp()).resolve()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        _TASK_INDEXES.clear()
+        self.addCleanup(_TASK_INDEXES.clear)
+        write_task(root, "Proj_ROOT")
+        write_task(root / "ST1-1", "Proj_ROOT_ST1-1", "Proj_ROOT")
+        (root / "Tools").mkdir() # Not a task; the old name heuristic picked it up
+        task_index = get_task_index(root)
+        first_trie = task_index.id_trie()
+        self.assertIs(task_index.id_trie(), first_trie)
+        self.assertEqual(first_trie.children("Proj_ROOT"), ["Proj_ROOT_ST1-1"])
+
+        write_task(root / "ST1-2", "Proj_ROOT_ST1-2", "Proj_ROOT")
+        self.assertEqual(task_index.id_trie().children("Proj_ROOT"), ["Proj_ROOT_ST1-1", "Proj_ROOT_ST1-2"])
+
+
+if __name__ == '__main__':
+    unittest.main()